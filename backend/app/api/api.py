@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.endpoints import session, chat, submission, content, config, progress, knowledge_graph, behavior
+from app.api.endpoints import session, chat, submission, content, config, progress, knowledge_graph, behavior, admin, health
 
 api_router = APIRouter()
 api_router.include_router(session.router, prefix="/session", tags=["session"])
@@ -9,4 +9,6 @@ api_router.include_router(content.router, tags=["learning-content", "test-tasks"
 api_router.include_router(config.router, prefix="/config", tags=["config"])
 api_router.include_router(progress.router, prefix="/progress", tags=["progress"])
 api_router.include_router(knowledge_graph.router, prefix="/knowledge-graph", tags=["knowledge-graph"])
-api_router.include_router(behavior.router, prefix="/behavior", tags=["behavior"])
\ No newline at end of file
+api_router.include_router(behavior.router, prefix="/behavior", tags=["behavior"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(health.router, prefix="/health", tags=["health"])
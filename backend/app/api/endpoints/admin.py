@@ -0,0 +1,168 @@
+# backend/app/api/endpoints/admin.py
+"""
+管理接口：知识库热更新、内容重新加载、批量检索、缓存统计等运维操作。
+
+所有接口都需要请求头 ``X-Admin-Token`` 与配置 ``ADMIN_API_TOKEN`` 一致；
+未配置令牌时管理接口整体禁用。
+"""
+import asyncio
+import hmac
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from app.core.config import settings
+from app.config.dependency_injection import (
+    get_rag_service, get_prompt_fragment_cache, get_llm_gateway, get_dynamic_controller, get_sentiment_analysis_service,
+    get_event_buffer, get_event_bus
+)
+from app.services.result_cache import all_cache_stats
+from app.schemas.admin import (
+    KnowledgeBaseStatus,
+    KnowledgeBaseReloadRequest,
+    KnowledgeBaseReloadResponse,
+    ContentReloadResponse,
+    BatchRetrieveRequest,
+    BatchRetrieveResponse,
+)
+from app.schemas.response import StandardResponse
+
+router = APIRouter()
+
+
+def verify_admin_token(x_admin_token: str = Header(None)):
+    """校验管理令牌"""
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+
+def _require_rag_service():
+    rag_service = get_rag_service()
+    if rag_service is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="RAG service is not available")
+    return rag_service
+
+
+@router.get("/kb/status", response_model=StandardResponse[KnowledgeBaseStatus], dependencies=[Depends(verify_admin_token)])
+def get_knowledge_base_status():
+    """
+    获取当前生效的知识库版本信息。
+    """
+    rag_service = _require_rag_service()
+    return StandardResponse(data=KnowledgeBaseStatus(**rag_service.knowledge_base.status()))
+
+
+@router.post("/kb/reload", response_model=StandardResponse[KnowledgeBaseReloadResponse], dependencies=[Depends(verify_admin_token)])
+async def reload_knowledge_base(reload_in: KnowledgeBaseReloadRequest = KnowledgeBaseReloadRequest()):
+    """
+    加载新发布的知识库版本并原子切换。
+
+    - 新版本在工作线程中加载，期间查询继续使用旧版本。
+    - 旧版本在最后一个在途查询结束后解除内存映射。
+    """
+    rag_service = _require_rag_service()
+    previous_version = rag_service.kb_version
+    try:
+        switched = await asyncio.to_thread(rag_service.reload, reload_in.version, reload_in.force)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    return StandardResponse(
+        message="Knowledge base reloaded" if switched else "Knowledge base already up to date",
+        data=KnowledgeBaseReloadResponse(
+            switched=switched,
+            previous_version=previous_version,
+            status=KnowledgeBaseStatus(**rag_service.knowledge_base.status())
+        )
+    )
+
+
+@router.post("/content/reload", response_model=StandardResponse[ContentReloadResponse], dependencies=[Depends(verify_admin_token)])
+async def reload_content():
+    """
+    重新加载学习内容与测试任务：清空内容缓存并重新渲染全部提示词片段。
+
+    内容文件的修改时间变化时片段也会自动失效，此接口用于部署后立即预热。
+    """
+    fragment_cache = get_prompt_fragment_cache()
+    fragment_cache.invalidate()
+    rendered = await asyncio.to_thread(fragment_cache.warm)
+    return StandardResponse(
+        message="Content reloaded",
+        data=ContentReloadResponse(rendered=rendered, fragments=fragment_cache.stats())
+    )
+
+
+@router.get("/cache/stats", response_model=StandardResponse[Dict[str, Dict[str, Any]]], dependencies=[Depends(verify_admin_token)])
+def get_cache_stats():
+    """
+    获取各结果缓存（翻译、检索等）的命中率与容量统计。
+    """
+    return StandardResponse(data=all_cache_stats())
+
+
+@router.get("/llm/stats", response_model=StandardResponse[Dict[str, Any]], dependencies=[Depends(verify_admin_token)])
+def get_llm_stats():
+    """
+    获取 LLM 网关的准入控制指标：在途数、队列深度、排队等待与上游延迟分位数、熔断状态。
+    """
+    return StandardResponse(data=get_llm_gateway().status())
+
+
+@router.get("/chat/stats", response_model=StandardResponse[Dict[str, Dict[str, Any]]], dependencies=[Depends(verify_admin_token)])
+def get_chat_stats():
+    """
+    获取聊天流水线各阶段（profile、sentiment、retrieval、content、prompt、llm、log）耗时的 p50/p95/p99。
+    """
+    return StandardResponse(data=get_dynamic_controller().stage_metrics.stats())
+
+
+@router.get("/sentiment/stats", response_model=StandardResponse[Dict[str, Any]], dependencies=[Depends(verify_admin_token)])
+def get_sentiment_stats():
+    """
+    获取情感分析各层（cache、lexicon、model、fallback）处理的消息数与占比，用于核对快速层是否让实验数据产生偏差。
+    """
+    sentiment_service = get_sentiment_analysis_service()
+    if sentiment_service is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sentiment analysis is disabled")
+    return StandardResponse(data=sentiment_service.stats())
+
+
+@router.get("/events/stats", response_model=StandardResponse[Dict[str, Any]], dependencies=[Depends(verify_admin_token)])
+def get_event_buffer_stats():
+    """
+    获取行为事件写后缓冲的指标：批大小、写入延迟 p50/p95/max、队列深度、背压拒绝数、写入失败数。
+    """
+    event_buffer = get_event_buffer()
+    if event_buffer is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event buffer is disabled")
+    return StandardResponse(data=event_buffer.stats())
+
+
+@router.get("/events/bus/stats", response_model=StandardResponse[Dict[str, Any]], dependencies=[Depends(verify_admin_token)])
+def get_event_bus_stats():
+    """
+    获取行为事件解释总线的指标：队列积压、排队延迟 p50/p95/max、按事件类型统计的解释耗时、解释失败数。
+    """
+    event_bus = get_event_bus()
+    if event_bus is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event bus is disabled")
+    return StandardResponse(data=event_bus.stats())
+
+
+@router.post("/rag/retrieve-batch", response_model=StandardResponse[BatchRetrieveResponse], dependencies=[Depends(verify_admin_token)])
+async def retrieve_batch(batch_in: BatchRetrieveRequest):
+    """
+    批量检索，用于离线评估和预计算各主题常见问题的上下文（同时预热检索缓存）。
+
+    查询按批获取embedding并并行搜索，结果与 queries 顺序一一对应。
+    """
+    rag_service = _require_rag_service()
+    kb_version = rag_service.kb_version
+    try:
+        results = await asyncio.to_thread(rag_service.retrieve_many, batch_in.queries, batch_in.k)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+
+    return StandardResponse(data=BatchRetrieveResponse(kb_version=kb_version, results=results))
@@ -3,46 +3,147 @@
 API端点，用于接收和处理前端发送的行为事件。
 """
 import logging
-from fastapi import APIRouter, Depends, status, BackgroundTasks
+from datetime import datetime, UTC
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Body, Depends, HTTPException, status, BackgroundTasks
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 from app.schemas.behavior import BehaviorEvent
 from app.crud.crud_event import event as crud_event
+from app.services.event_buffer import EventBufferFullError
+from app.services.event_bus import EventBusFullError
 from app.services.user_state_service import UserStateService
 from app.services.behavior_interpreter_service import behavior_interpreter_service
-from app.config.dependency_injection import get_db, get_user_state_service
+from app.config.dependency_injection import get_db, get_user_state_service, get_event_buffer, get_event_bus
+from app.core.config import settings
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+
+def _buffer_full(participant_id: str, e: Exception) -> HTTPException:
+    logger.warning(f"Event buffer full, rejecting events for participant {participant_id}: {e}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Event buffer is full, please retry",
+        headers={"Retry-After": "1"}
+    )
+
+
+def _interpret(event_in: BehaviorEvent, user_state_service: UserStateService, event_buffer):
+    try:
+        # 与解释总线的处理函数相同：提交事件先 flush 写后缓冲，不使用请求的数据库会话
+        behavior_interpreter_service.interpret_persisted(
+            event_in, user_state_service=user_state_service, event_buffer=event_buffer
+        )
+    except Exception as e:
+        logger.error(f"Error interpreting event for participant {event_in.participant_id}: {e}", exc_info=True)
+        # 即使解释失败，事件也已记录，所以不改变响应状态
+
+
+def _dispatch(events: List[BehaviorEvent], event_bus, event_buffer, user_state_service: UserStateService):
+    """把事件交给解释总线异步处理；未启用总线或总线积压时在请求中同步解释（两条路径解释结果相同）"""
+    if event_bus is not None:
+        try:
+            event_bus.publish_many(events)
+            return
+        except EventBusFullError as e:
+            # 事件已经持久化，不能返回 503 让前端重试（会重复写入）；退回同步解释，代价是请求变慢
+            logger.warning(f"Event bus full, interpreting {len(events)} events inline: {e}")
+    for event_in in events:
+        _interpret(event_in, user_state_service, event_buffer)
+
+
 @router.post("/log", status_code=status.HTTP_202_ACCEPTED, summary="记录行为事件")
 def log_behavior(
     event_in: BehaviorEvent,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    user_state_service: UserStateService = Depends(get_user_state_service)
+    user_state_service: UserStateService = Depends(get_user_state_service),
+    event_buffer=Depends(get_event_buffer),
+    event_bus=Depends(get_event_bus)
 ):
     """
     接收、持久化并解释单个行为事件。
 
-    - **异步持久化**: 立即将原始事件加入后台任务队列，写入数据库。
-    - **同步解释**: 将事件交给行为解释服务进行实时分析和处理。
-    - **快速响应**: 立即返回 `202 Accepted`，不等待后台任务完成。
+    - **批量持久化**: 原始事件进入写后缓冲，与其他事件一起在一个事务中写入数据库
+      （未启用缓冲时加入后台任务逐条写入）；缓冲区满时返回 `503`，前端稍后重试。
+    - **异步解释**: 事件进入按参与者保序的解释总线，由解释线程交给行为解释服务处理
+      （未启用总线时在请求中同步解释）。
+    - **快速响应**: 立即返回 `202 Accepted`，不等待写入和解释完成。
     """
-    # 任务1: 异步持久化原始事件
-    background_tasks.add_task(crud_event.create_from_behavior, db=db, obj_in=event_in)
+    # 任务1: 持久化原始事件
+    if event_buffer is not None:
+        try:
+            event_buffer.submit(crud_event.behavior_to_row(event_in))
+        except EventBufferFullError as e:
+            raise _buffer_full(event_in.participant_id, e)
+    else:
+        background_tasks.add_task(crud_event.create_from_behavior, db=db, obj_in=event_in)
 
-    # 任务2: 同步调用行为解释服务处理事件
-    try:
-        behavior_interpreter_service.interpret_event(
-            event=event_in,
-            user_state_service=user_state_service,
-            db_session=db
-        )
-    except Exception as e:
-        logger.error(f"Error interpreting event for participant {event_in.participant_id}: {e}", exc_info=True)
-        # 即使解释失败，事件也已记录，所以不改变响应状态
+    # 任务2: 交给行为解释服务处理事件
+    _dispatch([event_in], event_bus, event_buffer, user_state_service)
 
     return {"status": "Event received for processing"}
+
+
+@router.post("/log-batch", status_code=status.HTTP_202_ACCEPTED, summary="批量记录行为事件")
+def log_behavior_batch(
+    background_tasks: BackgroundTasks,
+    events_in: List[Dict[str, Any]] = Body(..., description="BehaviorEvent 数组"),
+    db: Session = Depends(get_db),
+    user_state_service: UserStateService = Depends(get_user_state_service),
+    event_buffer=Depends(get_event_buffer),
+    event_bus=Depends(get_event_bus)
+):
+    """
+    接收前端 behavior_tracker 攒批上报的一组行为事件。
+
+    - **逐条校验**: 一次遍历校验所有事件，不合法的事件在 `rejected` 中返回下标和原因，不影响其余事件。
+    - **一次持久化**: 合法事件整体进入写后缓冲（未启用缓冲时作为一个后台任务在一个事务中写入）；
+      缓冲区满时整批返回 `503`，前端稍后重试整批，不会重复写入。
+    - **按时间解释**: 按事件时间戳（相同时保持上报顺序）整批进入解释总线，同一参与者的事件依次处理
+      （未启用总线时在请求中依次解释；解释提交事件前先 flush 写后缓冲，挫败检测看到的历史包含这次提交）。
+    """
+    if len(events_in) > settings.BEHAVIOR_BATCH_MAX_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"At most {settings.BEHAVIOR_BATCH_MAX_EVENTS} events per batch"
+        )
+
+    received_at = datetime.now(UTC)
+    accepted: List[BehaviorEvent] = []
+    rejected = []
+    for index, raw in enumerate(events_in):
+        try:
+            event_in = BehaviorEvent.model_validate(raw)
+        except ValidationError as e:
+            rejected.append({"index": index, "errors": e.errors(include_url=False, include_context=False)})
+            continue
+        if event_in.timestamp is None:
+            event_in.timestamp = received_at
+        accepted.append(event_in)
+
+    # sorted 是稳定排序：时间戳相同的事件保持上报顺序；带时区的时间戳统一换算到 UTC 再比较
+    def _sort_key(event_in: BehaviorEvent):
+        ts = event_in.timestamp
+        return ts.astimezone(UTC).replace(tzinfo=None) if ts.tzinfo is not None else ts
+    accepted.sort(key=_sort_key)
+
+    if accepted:
+        rows = [crud_event.behavior_to_row(event_in) for event_in in accepted]
+        if event_buffer is not None:
+            try:
+                event_buffer.submit_many(rows)
+            except EventBufferFullError as e:
+                raise _buffer_full(accepted[0].participant_id, e)
+        else:
+            background_tasks.add_task(crud_event.create_many, db=db, rows=rows)
+
+        _dispatch(accepted, event_bus, event_buffer, user_state_service)
+
+    return {"status": "Events received for processing", "accepted": len(accepted), "rejected": rejected}
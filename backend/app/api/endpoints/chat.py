@@ -1,10 +1,15 @@
+import json
+
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.config.dependency_injection import get_db, get_dynamic_controller
+from app.db.database import SessionLocal
 from app.schemas.chat import ChatRequest, ChatResponse
 from app.schemas.response import StandardResponse
 from app.services.dynamic_controller import DynamicController
+from app.services.chat_concurrency import ChatBusyError, ChatSupersededError
 
 router = APIRouter()
 
@@ -51,9 +56,66 @@ async def chat_with_ai(
         
     except HTTPException:
         raise
+    except ChatBusyError as e:
+        # 同一参与者已有请求在生成，且无法继续排队
+        raise HTTPException(status_code=429, detail=str(e))
+    except ChatSupersededError as e:
+        # cancel 策略下同一参与者发送了新消息，本请求不再生成回复
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"Error in chat_with_ai: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.post("/ai/chat/stream")
+async def chat_with_ai_stream(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    controller: DynamicController = Depends(get_dynamic_controller)
+) -> StreamingResponse:
+    """
+    与AI进行对话（流式）
+
+    以 NDJSON（每行一个 JSON 对象）逐段返回回复：
+    - {"type": "delta", "content": "..."}：增量文本
+    - {"type": "done", "ai_response": "...", "ttft_ms": ...}：完整回复，流结束
+    - {"type": "error", "ai_response": "..."}：发生错误（或该参与者已有请求在生成），流结束
+    - {"type": "superseded", "ai_response": "..."}：被同一参与者的新消息取代，流结束
+
+    聊天记录在流结束后由后台任务写入，内容与 /ai/chat 相同。
+    重复提交的相同请求不会重复生成，而是等待原请求完成后整段返回。
+
+    生成器在端点返回之后才执行，不能使用请求作用域的 get_db 会话（FastAPI 0.118 之前该会话此时已关闭），
+    因此在生成器内自行创建会话。
+    """
+    if not request.participant_id:
+        raise HTTPException(status_code=400, detail="participant_id is required")
+
+    if not request.user_message:
+        raise HTTPException(status_code=400, detail="user_message is required")
+
+    async def event_lines():
+        db = SessionLocal()
+        try:
+            async for event in controller.stream_adaptive_response(
+                request=request,
+                db=db,
+                background_tasks=background_tasks
+            ):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            db.close()
+            # 聊天记录由流结束后的后台任务用同一会话写入（关闭后的会话可以继续使用），写完后再关闭一次释放连接
+            background_tasks.add_task(db.close)
+
+    return StreamingResponse(
+        event_lines(),
+        media_type="application/x-ndjson",
+        # 关闭反向代理缓冲，保证增量立即送达浏览器
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
+
@@ -0,0 +1,65 @@
+# backend/app/api/endpoints/health.py
+"""
+健康检查与就绪探针。
+"""
+from fastapi import APIRouter, Response, status
+
+from app.config.dependency_injection import get_rag_service_loader, registry
+from app.schemas.health import ReadinessStatus
+from app.schemas.response import StandardResponse
+from app.services.llm_scheduler import CIRCUIT_CLOSED
+from app.services.rag_warmup import RAGWarmupState
+
+router = APIRouter()
+
+
+@router.get("/live", response_model=StandardResponse[dict])
+def liveness():
+    """
+    存活探针：进程能够处理请求即返回 200。
+    """
+    return StandardResponse(data={"status": "alive"})
+
+
+@router.get("/ready", response_model=StandardResponse[ReadinessStatus])
+def readiness(response: Response):
+    """
+    就绪探针：报告后台初始化（RAG 加载与预热）的状态。
+
+    - RAG 首次加载/预热时返回 503，聊天请求此时会降级为不检索。
+    - RAG 已就绪、已禁用或初始化失败（降级运行，后台按退避重试）时返回 200。
+    - LLM 后端熔断时仍返回 200（请求会转移到其他后端或快速得到兜底回复），只在组件状态中标记 degraded。
+    - 探针不会构建任何服务：LLM 网关尚未构建时报告 built=False。
+    """
+    components = {}
+    ready = True
+
+    loader = get_rag_service_loader()
+    if loader is None:
+        components["rag"] = {"state": "disabled"}
+    else:
+        components["rag"] = loader.status()
+        if loader.state == RAGWarmupState.READY:
+            pass
+        elif loader.failures:
+            # 失败后的重试期间保持就绪（降级运行），避免重试时探针在 200/503 之间来回切换
+            components["rag"]["degraded"] = True
+        else:
+            ready = False
+
+    gateway = registry.peek("llm_gateway")
+    if gateway is None:
+        components["llm"] = {"built": False}
+    else:
+        circuits = gateway.router.circuit_states
+        components["llm"] = {"built": True, "circuits": circuits}
+        if any(state != CIRCUIT_CLOSED for state in circuits.values()):
+            components["llm"]["degraded"] = True
+
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return StandardResponse(
+        code=response.status_code or status.HTTP_200_OK,
+        message="ready" if ready else "warming up",
+        data=ReadinessStatus(ready=ready, components=components)
+    )
@@ -3,10 +3,9 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import Any
 from app.schemas.submission import TestSubmissionRequest, TestSubmissionResponse
-from app.services.sandbox_service import sandbox_service
 from app.services.user_state_service import UserStateService
 from app.services.content_loader import load_json_content
-from app.config.dependency_injection import get_user_state_service, get_db
+from app.config.dependency_injection import get_user_state_service, get_db, get_submission_sandbox_service
 from app.crud.crud_progress import progress as crud_progress
 from app.schemas.user_progress import UserProgressCreate
 from app.schemas.response import StandardResponse
@@ -19,7 +18,8 @@ def submit_test(
     db: Session = Depends(get_db),
     background_tasks: BackgroundTasks,
     submission_in: TestSubmissionRequest,
-    user_state_service: UserStateService = Depends(get_user_state_service)
+    user_state_service: UserStateService = Depends(get_user_state_service),
+    sandbox_service=Depends(get_submission_sandbox_service)
 ) -> Any:
     """
     接收用户代码提交，进行评测，更新BKT模型，并返回结果。
@@ -40,8 +40,7 @@ def submit_test(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
     # 2. 执行代码评测
-    # 注意：这里的sandbox_service是直接导入的单例，如果未来需要更复杂的依赖管理，
-    # 也可以像user_state_service一样通过Depends注入。
+    # sandbox_service 由服务注册表在首次提交时构建（启动时不导入 Playwright）
     evaluation_result = sandbox_service.run_evaluation(
         user_code=submission_in.code.model_dump(),
         checkpoints=checkpoints
@@ -1,8 +1,8 @@
-from app.services.sandbox_service import SandboxService, DefaultPlaywrightManager
+import asyncio
+import os
+
+from app.config.service_registry import ServiceRegistry
 from app.services.user_state_service import UserStateService
-from app.services.sentiment_analysis_service import sentiment_analysis_service
-from app.services.llm_gateway import llm_gateway
-from app.services.prompt_generator import prompt_generator
 from app.db.database import get_db
 
 
@@ -10,6 +10,7 @@ class ProductionConfig:
     """生产环境配置"""
     @staticmethod
     def create_sandbox_service():
+        from app.services.sandbox_service import SandboxService, DefaultPlaywrightManager
         return SandboxService(
             playwright_manager=DefaultPlaywrightManager(),
             headless=True
@@ -20,6 +21,7 @@ class DevelopmentConfig:
     """开发环境配置"""
     @staticmethod
     def create_sandbox_service():
+        from app.services.sandbox_service import SandboxService, DefaultPlaywrightManager
         return SandboxService(
             playwright_manager=DefaultPlaywrightManager(),
             headless=False  # 开发环境使用有头模式便于调试
@@ -30,6 +32,7 @@ class TestingConfig:
     """测试环境配置"""
     @staticmethod
     def create_sandbox_service(mock_playwright_manager):
+        from app.services.sandbox_service import SandboxService
         return SandboxService(
             playwright_manager=mock_playwright_manager,
             headless=True
@@ -37,8 +40,6 @@ class TestingConfig:
 
 
 # 应用启动时根据环境选择配置
-import os
-
 def get_sandbox_service():
     """根据环境变量获取合适的沙箱服务实例"""
     env = os.getenv('APP_ENV', 'production')
@@ -52,6 +53,126 @@ def get_sandbox_service():
         return ProductionConfig.create_sandbox_service()
 
 
+# --- 重量级服务注册表 ---
+# 导入本模块不会创建这些服务：首次使用时构建，或由 lifespan 在后台线程中预热（SERVICE_WARMUP）
+
+def _build_sentiment_analysis_service():
+    from app.services.sentiment_analysis_service import SentimentAnalysisService
+    return SentimentAnalysisService()
+
+
+def _build_llm_gateway():
+    from app.services.llm_gateway import LLMGateway
+    return LLMGateway()
+
+
+def _build_prompt_generator():
+    from app.services.prompt_generator import PromptGenerator
+    return PromptGenerator()
+
+
+def _build_submission_sandbox():
+    from app.services.sandbox_service import SandboxService
+    return SandboxService()
+
+
+def _build_event_buffer():
+    from app.core.config import settings
+    from app.crud.crud_event import event as crud_event
+    from app.db.database import SessionLocal
+    from app.services.event_buffer import EventWriteBuffer
+
+    def write_batch(rows):
+        db = SessionLocal()
+        try:
+            crud_event.create_many(db, rows=rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    return EventWriteBuffer(
+        write_batch,
+        flush_interval_ms=settings.EVENT_BUFFER_FLUSH_INTERVAL_MS,
+        max_batch_size=settings.EVENT_BUFFER_MAX_BATCH_SIZE,
+        max_pending=settings.EVENT_BUFFER_MAX_PENDING,
+        put_timeout_seconds=settings.EVENT_BUFFER_PUT_TIMEOUT_SECONDS
+    )
+
+
+def _build_event_bus():
+    from app.core.config import settings
+    from app.services.behavior_interpreter_service import behavior_interpreter_service
+    from app.services.event_bus import OrderedEventBus
+
+    def interpret(event):
+        # 与请求内同步解释走同一个入口（提交事件先 flush 写后缓冲，不使用请求的数据库会话）
+        behavior_interpreter_service.interpret_persisted(
+            event, user_state_service=get_user_state_service(), event_buffer=registry.peek("event_buffer")
+        )
+
+    return OrderedEventBus(
+        interpret,
+        key=lambda event: event.participant_id,
+        kind=lambda event: getattr(event.event_type, "value", event.event_type),
+        workers=settings.EVENT_BUS_WORKERS,
+        max_pending=settings.EVENT_BUS_MAX_PENDING,
+        put_timeout_seconds=settings.EVENT_BUS_PUT_TIMEOUT_SECONDS,
+        name="event-interpreter"
+    )
+
+
+def _event_bus_enabled() -> bool:
+    from app.core.config import settings
+    return settings.EVENT_BUS_ENABLED
+
+
+def _event_buffer_enabled() -> bool:
+    from app.core.config import settings
+    return settings.EVENT_BUFFER_ENABLED
+
+
+def _sentiment_enabled() -> bool:
+    from app.core.config import settings
+    return settings.ENABLE_SENTIMENT_ANALYSIS
+
+
+registry = ServiceRegistry()
+registry.register("sentiment", _build_sentiment_analysis_service, enabled=_sentiment_enabled,
+                  close=lambda service: service.close())
+registry.register("llm_gateway", _build_llm_gateway, close=lambda gateway: gateway.aclose())
+registry.register("prompt_generator", _build_prompt_generator)
+registry.register("sandbox", _build_submission_sandbox)
+# 关闭时写完缓冲区中剩余的事件（在线程中等待，不阻塞事件循环）
+registry.register("event_buffer", _build_event_buffer, enabled=_event_buffer_enabled,
+                  close=lambda buffer: asyncio.to_thread(buffer.close))
+# 解释事件时可能 flush 写后缓冲：总线在缓冲之后构建，按逆序先于缓冲关闭
+registry.register("event_bus", _build_event_bus, enabled=_event_bus_enabled,
+                  close=lambda bus: asyncio.to_thread(bus.close))
+
+
+def get_submission_sandbox_service():
+    """
+    获取代码评测使用的沙箱服务（首次提交时才导入 Playwright）
+    """
+    return registry.get("sandbox")
+
+
+def get_event_buffer():
+    """
+    获取行为事件的写后缓冲（EVENT_BUFFER_ENABLED 关闭时返回 None，事件逐条写入）
+    """
+    return registry.get("event_buffer")
+
+
+def get_event_bus():
+    """
+    获取行为事件解释总线（EVENT_BUS_ENABLED 关闭时返回 None，事件在请求中同步解释）
+    """
+    return registry.get("event_bus")
+
+
 # UserStateService 单例实例
 _user_state_service_instance = None
 
@@ -70,51 +191,186 @@ def get_user_state_service() -> UserStateService:
 
 def get_sentiment_analysis_service():
     """
-    获取情感分析服务实例
+    获取情感分析服务实例（ENABLE_SENTIMENT_ANALYSIS 关闭时返回 None，且不会加载模型）
     """
-    from app.core.config import settings
-    if not settings.ENABLE_SENTIMENT_ANALYSIS:
-        return None
-    return sentiment_analysis_service
+    return registry.get("sentiment")
 
 
 def get_llm_gateway():
     """
     获取LLM网关服务实例
     """
-    return llm_gateway
+    return registry.get("llm_gateway")
 
 
 def get_prompt_generator():
     """
     获取提示词生成器实例
     """
-    return prompt_generator
+    return registry.get("prompt_generator")
 
 
-def get_rag_service():
+def _create_result_caches(settings):
+    """创建翻译缓存和检索缓存（共用同一个 SQLite 文件）"""
+    if not settings.ENABLE_RESULT_CACHE:
+        return None, None
+    from app.services.result_cache import TieredCache
+    translation_cache = TieredCache(
+        namespace="translation",
+        max_entries=settings.TRANSLATION_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.TRANSLATION_CACHE_TTL_SECONDS,
+        db_path=settings.RESULT_CACHE_DB_PATH,
+    )
+    retrieval_cache = TieredCache(
+        namespace="retrieval",
+        max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+        db_path=settings.RESULT_CACHE_DB_PATH,
+    )
+    return translation_cache, retrieval_cache
+
+
+def _build_rag_service():
+    """构建 RAGService（在后台初始化线程中调用）"""
+    from app.core.config import settings
+    from app.services.rag_service import RAGService
+    translation_cache, retrieval_cache = _create_result_caches(settings)
+    # 根据配置决定是否提供翻译服务
+    translation_service = None
+    if settings.ENABLE_TRANSLATION_SERVICE:
+        try:
+            from app.services.translation_service import TranslationService
+            translation_service = TranslationService(cache=translation_cache)
+        except Exception as e:
+            print(f"Warning: Translation service initialization failed: {e}")
+
+    return RAGService(translation_service, retrieval_cache=retrieval_cache)
+
+
+# RAGService 后台加载器单例（知识库版本通过 reload() 原子热切换，无需重建实例）
+_rag_service_loader = None
+
+def get_rag_service_loader():
     """
-    获取RAG服务实例
+    获取RAG服务加载器。RAG服务在后台构建和预热，未就绪时检索降级为空结果。
     """
+    global _rag_service_loader
     from app.core.config import settings
     if not settings.ENABLE_RAG_SERVICE:
         return None
-    
-    try:
-        from app.services.rag_service import RAGService
-        # 根据配置决定是否提供翻译服务
-        translation_service = None
-        if settings.ENABLE_TRANSLATION_SERVICE:
-            try:
-                from app.services.translation_service import TranslationService
-                translation_service = TranslationService()
-            except Exception as e:
-                print(f"Warning: Translation service initialization failed: {e}")
-        
-        return RAGService(translation_service)
-    except Exception as e:
-        print(f"Warning: RAG service initialization failed: {e}")
+    if _rag_service_loader is None:
+        from app.services.rag_warmup import RAGServiceLoader
+        _rag_service_loader = RAGServiceLoader(
+            factory=_build_rag_service,
+            warmup_queries=settings.RAG_WARMUP_QUERIES,
+            prefault=settings.RAG_PREFAULT_INDEX,
+            max_retries=settings.RAG_WARMUP_MAX_RETRIES,
+            retry_base_seconds=settings.RAG_WARMUP_RETRY_BASE_SECONDS,
+            retry_max_seconds=settings.RAG_WARMUP_RETRY_MAX_SECONDS
+        )
+    return _rag_service_loader
+
+
+def get_rag_service():
+    """
+    获取RAG服务实例（不阻塞）；尚未完成初始化或已禁用时返回 None
+    """
+    loader = get_rag_service_loader()
+    if loader is None:
+        return None
+    return loader.get()
+
+
+# 语义回复缓存单例
+_semantic_response_cache = None
+
+def get_semantic_response_cache():
+    """
+    获取语义回复缓存（默认关闭；问题 embedding 复用 RAG 服务，RAG 未启用时也不可用）
+    """
+    global _semantic_response_cache
+    from app.core.config import settings
+    if not settings.ENABLE_SEMANTIC_RESPONSE_CACHE:
         return None
+    loader = get_rag_service_loader()
+    if loader is None:
+        return None
+    if _semantic_response_cache is None:
+        from app.services.response_cache import SemanticResponseCache
+        _semantic_response_cache = SemanticResponseCache(
+            embed_fn=loader.embed_query,
+            similarity_threshold=settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+            ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+            max_entries_per_topic=settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_TOPIC
+        )
+    return _semantic_response_cache
+
+
+# 提示词片段缓存单例（启动时预渲染，内容文件变化时自动失效）
+_prompt_fragment_cache = None
+
+def get_prompt_fragment_cache():
+    """
+    获取提示词片段缓存实例
+    """
+    global _prompt_fragment_cache
+    if _prompt_fragment_cache is None:
+        from app.services.prompt_fragments import PromptFragmentCache
+        _prompt_fragment_cache = PromptFragmentCache(get_prompt_generator())
+    return _prompt_fragment_cache
+
+
+# 服务端对话记忆单例
+_conversation_memory = None
+
+def get_conversation_memory():
+    """
+    获取服务端对话记忆实例
+    """
+    global _conversation_memory
+    if _conversation_memory is None:
+        from app.core.config import settings
+        from app.services.conversation_memory import ConversationMemory
+        _conversation_memory = ConversationMemory(
+            max_messages=settings.CONVERSATION_HISTORY_MAX_MESSAGES,
+            max_conversations=settings.CONVERSATION_MEMORY_MAX_CONVERSATIONS
+        )
+    return _conversation_memory
+
+
+def get_conversation_summarizer():
+    """
+    获取会话滚动摘要服务（未启用时返回 None）
+    """
+    from app.core.config import settings
+    if not settings.ENABLE_CONVERSATION_SUMMARY:
+        return None
+    from app.db.database import SessionLocal
+    from app.services.conversation_summarizer import ConversationSummarizer
+    return ConversationSummarizer(
+        llm_gateway=get_llm_gateway(),
+        session_factory=SessionLocal,
+        conversation_memory=get_conversation_memory(),
+        token_counter=get_prompt_generator().token_counter,
+        trigger_tokens=settings.CONVERSATION_SUMMARY_TRIGGER_TOKENS,
+        keep_recent_messages=settings.CONVERSATION_SUMMARY_KEEP_RECENT_MESSAGES,
+        max_summary_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS
+    )
+
+
+def _create_chat_concurrency_controls():
+    """创建重复请求合并器和参与者并发闸门"""
+    from app.core.config import settings
+    from app.services.chat_concurrency import InFlightCoalescer, ParticipantGate
+    coalescer = None
+    if settings.CHAT_COALESCE_REQUESTS:
+        coalescer = InFlightCoalescer(recent_ttl_seconds=settings.CHAT_COALESCE_RECENT_SECONDS)
+    participant_gate = ParticipantGate(
+        policy=settings.CHAT_PARTICIPANT_CONCURRENCY_POLICY,
+        max_waiting=settings.CHAT_PARTICIPANT_MAX_WAITING,
+        wait_timeout_seconds=settings.CHAT_PARTICIPANT_WAIT_TIMEOUT_SECONDS
+    )
+    return coalescer, participant_gate
 
 
 def create_dynamic_controller():
@@ -123,12 +379,19 @@ def create_dynamic_controller():
     """
     from app.services.dynamic_controller import DynamicController
 
+    coalescer, participant_gate = _create_chat_concurrency_controls()
     return DynamicController(
         user_state_service=get_user_state_service(),
         sentiment_service=get_sentiment_analysis_service(),
-        rag_service=get_rag_service(),
+        rag_service=get_rag_service_loader(),
         prompt_generator=get_prompt_generator(),
-        llm_gateway=get_llm_gateway()
+        llm_gateway=get_llm_gateway(),
+        response_cache=get_semantic_response_cache(),
+        prompt_fragments=get_prompt_fragment_cache(),
+        conversation_memory=get_conversation_memory(),
+        conversation_summarizer=get_conversation_summarizer(),
+        coalescer=coalescer,
+        participant_gate=participant_gate
     )
 
 
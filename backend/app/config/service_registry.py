@@ -0,0 +1,144 @@
+# backend/app/config/service_registry.py
+"""
+延迟构建的服务注册表
+
+重量级服务（情感分析模型、LLM 网关、代码评测沙箱等）只注册工厂函数，导入 app 时不创建实例：
+
+- 首次 get() 时在调用线程中构建（同一服务只构建一次，并发调用方等待同一次构建）
+- 应用 lifespan 启动时可以在后台线程中预先构建（warm_up），不阻塞启动
+- 未启用的服务（enabled 返回 False）永远不会调用工厂，也就不会导入其依赖（torch、Playwright 等）
+- lifespan 结束时按构建的逆序调用各服务的关闭函数
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _ServiceSpec:
+    factory: Callable[[], Any]
+    enabled: Callable[[], bool]
+    close: Optional[Callable[[Any], Any]]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ServiceRegistry:
+    """按名称注册工厂函数，首次使用时构建单例"""
+
+    def __init__(self):
+        self._specs: Dict[str, _ServiceSpec] = {}
+        self._instances: Dict[str, Any] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._order: List[str] = []
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        enabled: Optional[Callable[[], bool]] = None,
+        close: Optional[Callable[[Any], Any]] = None,
+    ):
+        """
+        Args:
+            name: 服务名称
+            factory: 构建实例的函数（在其中导入重量级依赖）
+            enabled: 每次 get() 时检查，返回 False 时 get() 返回 None 且不构建
+            close: 关闭实例的函数，可以是协程函数
+        """
+        self._specs[name] = _ServiceSpec(factory=factory, enabled=enabled or (lambda: True), close=close)
+
+    def is_enabled(self, name: str) -> bool:
+        return self._specs[name].enabled()
+
+    def get(self, name: str) -> Any:
+        """返回服务实例（首次调用时构建）；服务未启用时返回 None"""
+        spec = self._specs[name]
+        if not spec.enabled():
+            return None
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with spec.lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                try:
+                    self._instances[name] = spec.factory()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._build_seconds[name] = time.perf_counter() - started
+                self._errors.pop(name, None)
+                self._order.append(name)
+                logger.info(f"服务 {name} 构建完成，用时 {self._build_seconds[name]:.2f}s")
+            return self._instances[name]
+
+    def peek(self, name: str) -> Any:
+        """返回已构建的实例，不触发构建"""
+        return self._instances.get(name)
+
+    def override(self, name: str, instance: Any):
+        """用给定实例替换服务（测试和脚本中注入替身）"""
+        with self._specs[name].lock:
+            self._instances[name] = instance
+            self._build_seconds.pop(name, None)
+            if name not in self._order:
+                self._order.append(name)
+
+    def reset(self, name: str):
+        """丢弃已构建的实例，下次 get() 时重新构建（不调用关闭函数）"""
+        with self._specs[name].lock:
+            self._instances.pop(name, None)
+            self._build_seconds.pop(name, None)
+            if name in self._order:
+                self._order.remove(name)
+
+    def warm_up(self, names: Iterable[str]) -> Dict[str, float]:
+        """
+        依次构建给定的服务（在后台线程中调用）；单个服务构建失败只记录日志
+
+        Returns:
+            dict: 本次构建的各服务用时（秒）；未启用、已构建或失败的服务不在其中
+        """
+        timings = {}
+        for name in names:
+            if name not in self._specs or name in self._instances or not self.is_enabled(name):
+                continue
+            try:
+                self.get(name)
+                timings[name] = self._build_seconds.get(name, 0.0)
+            except Exception as e:
+                logger.warning(f"服务 {name} 预热失败: {e}")
+        return timings
+
+    async def aclose(self):
+        """按构建的逆序关闭所有已构建的服务"""
+        for name in reversed(list(self._order)):
+            spec, instance = self._specs[name], self._instances.get(name)
+            if spec.close is None or instance is None:
+                continue
+            try:
+                result = spec.close(instance)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"关闭服务 {name} 失败: {e}")
+        self._instances.clear()
+        self._order.clear()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """各服务的启用状态、是否已构建、构建用时和最近一次构建错误"""
+        return {
+            name: {
+                "enabled": spec.enabled(),
+                "built": name in self._instances,
+                "build_seconds": round(self._build_seconds[name], 3) if name in self._build_seconds else None,
+                "error": self._errors.get(name),
+            }
+            for name, spec in self._specs.items()
+        }
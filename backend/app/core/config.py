@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import Any, Dict, List
 
 class Settings(BaseSettings):
     """
@@ -52,15 +52,152 @@ class Settings(BaseSettings):
     KB_ANN_FILENAME: str = "kb.ann"
     KB_CHUNKS_FILENAME: str = "kb_chunks.json"
 
+    # 知识库热更新：>0 时按该间隔（秒）轮询 vector_store 下新发布的版本，0 表示只能通过管理接口触发
+    KB_WATCH_INTERVAL_SECONDS: int = 0
+
+    # RAG 启动预热：应用启动时在后台构建 RAGService，并执行若干合成查询
+    RAG_WARMUP_ON_STARTUP: bool = True
+    RAG_PREFAULT_INDEX: bool = False
+    # 初始化失败后按指数退避重试（BASE、2*BASE、4*BASE……，最多等待 MAX 秒），最多重试 MAX_RETRIES 次
+    RAG_WARMUP_MAX_RETRIES: int = 6
+    RAG_WARMUP_RETRY_BASE_SECONDS: float = 5.0
+    RAG_WARMUP_RETRY_MAX_SECONDS: float = 300.0
+    RAG_WARMUP_QUERIES: List[str] = [
+        "What is a CSS selector?",
+        "How do I center an element with flexbox?",
+        "How to add an event listener in JavaScript?",
+    ]
+
+    # 批量检索：每次 embedding 请求的最大条数，以及并行搜索线程数
+    RAG_EMBEDDING_BATCH_SIZE: int = 32
+    RAG_SEARCH_WORKERS: int = 4
+
+    # 翻译/检索结果缓存（内存 LRU + SQLite 磁盘层，重启后仍然有效）
+    ENABLE_RESULT_CACHE: bool = True
+    RESULT_CACHE_DB_PATH: str = "./app/data/cache/result_cache.db"
+    TRANSLATION_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    TRANSLATION_CACHE_MAX_ENTRIES: int = 2048
+    RETRIEVAL_CACHE_TTL_SECONDS: int = 24 * 3600
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 4096
+
+    # 聊天请求各阶段的截止时间（秒）：超时的阶段使用默认结果（中性情感/不检索/不加载内容）
+    CHAT_SENTIMENT_TIMEOUT_SECONDS: float = 1.0
+    CHAT_RETRIEVAL_TIMEOUT_SECONDS: float = 3.0
+    CHAT_CONTENT_TIMEOUT_SECONDS: float = 2.0
+    # 情感分析线程数，也是在途推理的上限：超时的推理仍占用线程，占满时新请求不再排队，直接使用降级的中性结果
+    SENTIMENT_EXECUTOR_WORKERS: int = 2
+
+    # 情感分析微批处理：并发请求最多等待若干毫秒凑成一批，在专用线程中按批内最长文本填充后一次推理
+    SENTIMENT_BATCHING_ENABLED: bool = True
+    SENTIMENT_BATCH_MAX_SIZE: int = 16
+    SENTIMENT_BATCH_MAX_WAIT_MS: float = 5.0
+    SENTIMENT_INFERENCE_THREADS: int = 2  # 推理计算线程数（torch / ONNX Runtime intra-op），0 表示使用默认值
+
+    # 情感分析推理后端："torch"（全精度，SENTIMENT_MODEL_DIR）或 "onnx"（动态 int8 量化，SENTIMENT_ONNX_DIR，
+    # 由 scripts/export_sentiment_onnx.py 导出）
+    SENTIMENT_BACKEND: str = "torch"
+    SENTIMENT_MODEL_DIR: str = "models/sentiment_bert"
+    SENTIMENT_ONNX_DIR: str = "models/sentiment_bert_onnx"
+
+    # 情感分析快速层：规范化文本 -> 模型结果的 LRU 缓存（0 表示关闭）；短消息或线索明确的消息由词典规则直接判断
+    SENTIMENT_CACHE_MAX_ENTRIES: int = 4096
+    SENTIMENT_LEXICON_ENABLED: bool = True
+    SENTIMENT_LEXICON_MAX_CHARS: int = 24
+
+    # 聊天并发控制：合并重复请求（双击、重试）；每个参与者同时只生成一个回复
+    CHAT_COALESCE_REQUESTS: bool = True
+    CHAT_COALESCE_RECENT_SECONDS: float = 5.0
+    CHAT_PARTICIPANT_CONCURRENCY_POLICY: str = "queue"  # "queue" 排队 / "cancel" 取消旧请求
+    CHAT_PARTICIPANT_MAX_WAITING: int = 2
+    CHAT_PARTICIPANT_WAIT_TIMEOUT_SECONDS: float = 120.0
+
+    # 语义回复缓存（默认关闭）：测试模式下相似问题直接复用历史回答，不同实验分组之间不共享
+    ENABLE_SEMANTIC_RESPONSE_CACHE: bool = False
+    SEMANTIC_CACHE_MODES: List[str] = ["test"]
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_TTL_SECONDS: int = 6 * 3600
+    SEMANTIC_CACHE_MAX_ENTRIES_PER_TOPIC: int = 200
+
+    # 服务端对话记忆：每个会话保留的最近消息数，以及内存中最多缓存的会话数
+    CONVERSATION_HISTORY_MAX_MESSAGES: int = 20
+    CONVERSATION_MEMORY_MAX_CONVERSATIONS: int = 2000
+
+    # 会话滚动摘要：未摘要的消息超过阈值时，回复发送后在后台把较早的消息压缩成摘要
+    ENABLE_CONVERSATION_SUMMARY: bool = True
+    CONVERSATION_SUMMARY_TRIGGER_TOKENS: int = 3000
+    CONVERSATION_SUMMARY_KEEP_RECENT_MESSAGES: int = 6
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 600
+
+    # 提示词 token 预算：系统提示词 + 消息的总上限与各部分上限；超出时先丢最早的历史，再丢排名靠后的检索片段
+    PROMPT_TOKEN_BUDGET: int = 24000
+    PROMPT_SECTION_BUDGETS: Dict[str, int] = {
+        "content_data": 6000,
+        "student_info": 400,
+        "conversation_summary": 800,
+        "reference_knowledge": 3000,
+        "test_results": 1500,
+        "current_message": 6000,
+        "history": 8000,
+    }
+    # 与对话模型一致的 HuggingFace tokenizer 目录；不存在时按字符估算
+    PROMPT_TOKENIZER_DIR: str = "models/prompt_tokenizer"
+
+    # 管理接口令牌（请求头 X-Admin-Token）；为空时管理接口禁用
+    ADMIN_API_TOKEN: str = ""
+
     # LLM Settings
     LLM_MAX_TOKENS: int = 65536
     LLM_TEMPERATURE: float = 0.7
 
+    # LLM 连接池与并发：所有请求共享一个异步连接池，并发上限由准入调度器控制
+    LLM_MAX_CONCURRENT_REQUESTS: int = 32
+    LLM_MAX_CONNECTIONS: int = 64
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 32
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    LLM_READ_TIMEOUT_SECONDS: float = 300.0
+    LLM_WRITE_TIMEOUT_SECONDS: float = 30.0
+    LLM_POOL_TIMEOUT_SECONDS: float = 30.0
+    # 准入控制：排队截止时间；连续失败 N 次后熔断，熔断期间快速失败，M 秒后放行探测请求
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    # 客户端自动重试次数（重试期间仍占用名额，熔断器只在重试全部失败后计一次失败）
+    LLM_MAX_RETRIES: int = 2
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+    # 多后端路由：OpenAI 兼容后端列表，每项 {"name", "api_base", "api_key", "model", "fallback"}，
+    # 为空时只使用 TUTOR_OPENAI_*。请求发往最快的健康后端；hedge 延迟内未返回时向下一个后端对冲（0 关闭）；
+    # 全局负载达到阈值时，优先级数值不小于 LLM_FALLBACK_MIN_PRIORITY 的请求发往 fallback（较小）模型
+    LLM_BACKENDS: List[Dict[str, Any]] = []
+    LLM_HEDGE_DELAY_SECONDS: float = 0.0
+    LLM_FALLBACK_LOAD_THRESHOLD: float = 0.8
+    LLM_FALLBACK_MIN_PRIORITY: int = 1
+
     # Module enable/disable flags
     ENABLE_RAG_SERVICE: bool = True
     ENABLE_SENTIMENT_ANALYSIS: bool = True
     ENABLE_TRANSLATION_SERVICE: bool = False
 
+    # 行为事件写后缓冲：/behavior/log 的事件先进入内存，最早的事件等待满 FLUSH_INTERVAL_MS 或攒满 MAX_BATCH_SIZE 条时
+    # 在一个事务中批量写入；待写事件达到 MAX_PENDING 时请求最多阻塞 PUT_TIMEOUT_SECONDS，仍无空间时返回 503
+    EVENT_BUFFER_ENABLED: bool = True
+    EVENT_BUFFER_FLUSH_INTERVAL_MS: float = 250.0
+    EVENT_BUFFER_MAX_BATCH_SIZE: int = 200
+    EVENT_BUFFER_MAX_PENDING: int = 10000
+    EVENT_BUFFER_PUT_TIMEOUT_SECONDS: float = 0.5
+    # /behavior/log-batch 每个请求最多接收的事件数（前端 behavior_tracker 每批最多 50 条）
+    BEHAVIOR_BATCH_MAX_EVENTS: int = 200
+
+    # 行为事件解释总线：/behavior/log 只校验、持久化并入队，由 WORKERS 个线程按参与者保序地异步解释；
+    # 待解释事件达到 MAX_PENDING 时请求最多阻塞 PUT_TIMEOUT_SECONDS，仍无空间时退回请求内同步解释
+    EVENT_BUS_ENABLED: bool = True
+    EVENT_BUS_WORKERS: int = 4
+    EVENT_BUS_MAX_PENDING: int = 10000
+    EVENT_BUS_PUT_TIMEOUT_SECONDS: float = 0.5
+
+    # 服务注册表：导入 app 时不创建重量级服务，启动后在后台线程中按顺序预先构建（关闭时在首次使用时构建）
+    SERVICE_WARMUP_ON_STARTUP: bool = True
+    SERVICE_WARMUP: List[str] = ["llm_gateway", "prompt_generator", "sentiment"]
+
 # Create a single, globally accessible instance of the settings.
 # This will raise a validation error on startup if required settings are missing.
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,106 @@
+# backend/app/core/startup_profile.py
+"""
+启动耗时分析（python -m app.main --profile-startup）
+
+在新的子进程中用 python -X importtime 导入 app.main，解析每个模块的导入耗时，报告：
+- 导入 app.main 的总耗时
+- 自身耗时最多的模块、按顶层包汇总的耗时、app.* 各模块的累计耗时
+- 可选：依次构建服务注册表中的服务（情感分析模型、LLM 网关等）的耗时
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# import time:       self [us] |  cumulative | imported package
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+_RESULT_MARKER = "STARTUP_PROFILE_RESULT "
+
+_CHILD_CODE = """
+import json, time
+started = time.perf_counter()
+import {target}
+import_seconds = time.perf_counter() - started
+services = {{}}
+if {services!r}:
+    from app.config.dependency_injection import registry
+    services = registry.warm_up({services!r})
+print({marker!r} + json.dumps({{"import_seconds": import_seconds, "services": services}}))
+"""
+
+
+def parse_importtime(output: str) -> List[Dict[str, Any]]:
+    """解析 -X importtime 的输出（微秒），depth 为缩进层级（0 表示被顶层直接导入）"""
+    modules = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000.0,
+                "cumulative_ms": int(cumulative_us) / 1000.0,
+                "depth": max(0, (len(indent) - 1) // 2),
+            })
+    return modules
+
+
+def summarize_modules(modules: List[Dict[str, Any]], top: int = 20) -> Dict[str, Any]:
+    """按自身耗时排序的模块、按顶层包汇总的自身耗时、app.* 模块的累计耗时"""
+    by_package = defaultdict(float)
+    for module in modules:
+        by_package[module["module"].split(".")[0]] += module["self_ms"]
+    return {
+        "module_count": len(modules),
+        "slowest_modules": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:top],
+        "packages": sorted(
+            ({"package": name, "self_ms": round(ms, 1)} for name, ms in by_package.items()),
+            key=lambda p: p["self_ms"], reverse=True
+        )[:top],
+        "app_modules": sorted(
+            (m for m in modules if m["module"].startswith("app.")),
+            key=lambda m: m["cumulative_ms"], reverse=True
+        )[:top],
+    }
+
+
+def profile_startup(target: str = "app.main", services: Iterable[str] = (), top: int = 20) -> Dict[str, Any]:
+    """
+    在子进程中导入 target 并（可选）构建给定的服务
+
+    Returns:
+        dict: import_seconds、services（各服务构建秒数）及 summarize_modules 的结果
+    """
+    code = _CHILD_CODE.format(target=target, services=list(services), marker=_RESULT_MARKER)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    result_lines = [line for line in completed.stdout.splitlines() if line.startswith(_RESULT_MARKER)]
+    if completed.returncode != 0 or not result_lines:
+        raise RuntimeError(f"导入 {target} 失败:\n{completed.stderr[-2000:]}")
+    report = json.loads(result_lines[-1][len(_RESULT_MARKER):])
+    report.update(summarize_modules(parse_importtime(completed.stderr), top=top))
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"导入 app.main 用时 {report['import_seconds']:.3f}s（{report['module_count']} 个模块）", ""]
+    lines.append(f"{'package':<32}{'self_ms':>10}")
+    lines.extend(f"{p['package']:<32}{p['self_ms']:>10.1f}" for p in report["packages"])
+    lines.append("")
+    lines.append(f"{'app module':<48}{'self_ms':>10}{'cumul_ms':>10}")
+    lines.extend(f"{m['module']:<48}{m['self_ms']:>10.1f}{m['cumulative_ms']:>10.1f}" for m in report["app_modules"])
+    lines.append("")
+    lines.append(f"{'slowest module':<48}{'self_ms':>10}{'cumul_ms':>10}")
+    lines.extend(f"{m['module']:<48}{m['self_ms']:>10.1f}{m['cumulative_ms']:>10.1f}" for m in report["slowest_modules"])
+    if report.get("services"):
+        lines.append("")
+        lines.append(f"{'service':<32}{'build_s':>10}")
+        lines.extend(f"{name:<32}{seconds:>10.3f}" for name, seconds in report["services"].items())
+    return "\n".join(lines)
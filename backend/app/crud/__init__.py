@@ -3,4 +3,6 @@ from .crud_event import event
 from .crud_participant import participant
 from .crud_chat_history import chat_history
 from .crud_progress import progress
-from .crud_survey_result import survey_result
\ No newline at end of file
+from .crud_survey_result import survey_result
+from .crud_conversation_summary import conversation_summary
+from .crud_prompt_segment import prompt_segment
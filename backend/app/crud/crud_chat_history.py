@@ -1,4 +1,7 @@
+import json
+from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
+from app.crud.crud_prompt_segment import prompt_segment as crud_prompt_segment
 from app.models.chat_history import ChatHistory
 from app.schemas.chat import ChatHistoryCreate
 
@@ -6,12 +9,20 @@ from app.schemas.chat import ChatHistoryCreate
 def create_chat_history(db: Session, *, obj_in: ChatHistoryCreate) -> ChatHistory:
     """
     创建新的聊天历史记录。
+
+    完整Prompt不再直接写入 raw_prompt_to_llm，而是切分成片段按内容哈希存储，
+    行内只保存有序的片段哈希列表（读取用 get_raw_prompt）。
     """
+    prompt_segments = None
+    if obj_in.raw_prompt_to_llm:
+        prompt_segments = json.dumps(crud_prompt_segment.store(db, obj_in.raw_prompt_to_llm))
     db_obj = ChatHistory(
         participant_id=obj_in.participant_id,
         role=obj_in.role,
         message=obj_in.message,
-        raw_prompt_to_llm=obj_in.raw_prompt_to_llm,
+        prompt_segments=prompt_segments,
+        conversation_id=obj_in.conversation_id,
+        llm_route=obj_in.llm_route,
     )
     db.add(db_obj)
     db.commit()
@@ -32,4 +43,57 @@ class CRUDChatHistory:
         """根据参与者ID获取聊天历史记录"""
         return db.query(ChatHistory).filter(ChatHistory.participant_id == participant_id).all()
 
+    @staticmethod
+    def get_recent_by_conversation(db: Session, *, participant_id: str, conversation_id: str, limit: int) -> List[ChatHistory]:
+        """获取某个会话最近的 limit 条消息（按时间正序返回）"""
+        rows = (
+            db.query(ChatHistory)
+            .filter(ChatHistory.participant_id == participant_id, ChatHistory.conversation_id == conversation_id)
+            .order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+            .limit(limit)
+            .all()
+        )
+        return list(reversed(rows))
+
+    @staticmethod
+    def count_by_conversation(db: Session, *, participant_id: str, conversation_id: str) -> int:
+        """统计某个会话的消息总数"""
+        return (
+            db.query(ChatHistory)
+            .filter(ChatHistory.participant_id == participant_id, ChatHistory.conversation_id == conversation_id)
+            .count()
+        )
+
+    @staticmethod
+    def get_by_conversation_after(db: Session, *, participant_id: str, conversation_id: str, after_id: int = 0) -> List[ChatHistory]:
+        """获取某个会话中 id 大于 after_id 的消息（按时间正序）"""
+        return (
+            db.query(ChatHistory)
+            .filter(
+                ChatHistory.participant_id == participant_id,
+                ChatHistory.conversation_id == conversation_id,
+                ChatHistory.id > after_id,
+            )
+            .order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc())
+            .all()
+        )
+
+    @staticmethod
+    def get_raw_prompt(db: Session, row: ChatHistory) -> Optional[str]:
+        """还原AI消息当时发送给LLM的完整Prompt（兼容仍内联保存的旧数据）"""
+        if row.prompt_segments:
+            return crud_prompt_segment.load(db, json.loads(row.prompt_segments))
+        return row.raw_prompt_to_llm
+
+    @staticmethod
+    def get_raw_prompts(db: Session, rows: List[ChatHistory]) -> Dict[int, Optional[str]]:
+        """批量还原多条消息的完整Prompt（导出用：所有片段一次查询取回），返回 {chat_history.id: prompt}"""
+        hash_lists = {row.id: json.loads(row.prompt_segments) for row in rows if row.prompt_segments}
+        segments = crud_prompt_segment.get_many(db, (h for hashes in hash_lists.values() for h in hashes))
+        return {
+            row.id: "".join(segments[h] for h in hash_lists[row.id]) if row.id in hash_lists else row.raw_prompt_to_llm
+            for row in rows
+        }
+
+
 chat_history = CRUDChatHistory()
@@ -0,0 +1,24 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from app.crud.base import CRUDBase
+from app.models.conversation_summary import ConversationSummary
+from app.schemas.chat import ConversationSummaryCreate
+
+
+class CRUDConversationSummary(CRUDBase[ConversationSummary, ConversationSummaryCreate, ConversationSummaryCreate]):
+    def get_latest(self, db: Session, *, participant_id: str, conversation_id: str) -> Optional[ConversationSummary]:
+        """获取会话最新版本的摘要"""
+        return (
+            db.query(ConversationSummary)
+            .filter(
+                ConversationSummary.participant_id == participant_id,
+                ConversationSummary.conversation_id == conversation_id,
+            )
+            .order_by(ConversationSummary.version.desc())
+            .first()
+        )
+
+
+# 实例化并暴露给 API 层使用
+conversation_summary = CRUDConversationSummary(ConversationSummary)
@@ -1,6 +1,7 @@
 from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, UTC
 from app.crud.base_improved import CRUDBaseImproved, SortDirection
 from app.models.event import EventLog
 from app.schemas.behavior import BehaviorEvent
@@ -128,4 +129,38 @@ class CRUDEvent(CRUDBaseImproved[EventLog, BehaviorEvent, BehaviorEvent]):
         """
         return self.create(db, obj_in=obj_in)
 
+    @staticmethod
+    def behavior_to_row(obj_in: BehaviorEvent) -> Dict[str, Any]:
+        """把行为事件转换为 event_logs 的一行（未提供时间戳时使用当前时间）。
+        
+        Args:
+            obj_in: 行为事件数据
+            
+        Returns:
+            Dict[str, Any]: 列名到值的映射
+        """
+        data = obj_in.model_dump()
+        return {
+            "participant_id": data["participant_id"],
+            "timestamp": data["timestamp"] or datetime.now(UTC),
+            "event_type": getattr(obj_in.event_type, "value", obj_in.event_type),
+            "event_data": data["event_data"],
+        }
+
+    def create_many(self, db: Session, *, rows: List[Dict[str, Any]]) -> int:
+        """在一个事务中批量插入多条事件日志（一次 executemany + 一次 commit）。
+        
+        Args:
+            db: 数据库会话
+            rows: behavior_to_row 生成的行
+            
+        Returns:
+            int: 插入的行数
+        """
+        if not rows:
+            return 0
+        db.execute(insert(self.model), rows)
+        db.commit()
+        return len(rows)
+
 event = CRUDEvent(EventLog)
@@ -0,0 +1,112 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+import zstandard
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.prompt_segment import PromptSegment
+
+# 片段在空行之后切分，分隔符保留在前一个片段末尾，拼接后与原文逐字节一致
+_SEGMENT_BOUNDARY = re.compile(r"(?<=\n\n)")
+_COMPRESSION_LEVEL = 3
+_QUERY_BATCH_SIZE = 500
+
+
+def split_prompt(prompt: str) -> List[str]:
+    """把提示词切分成片段（基础提示词的各段、学习内容 JSON、检索片段等各自成段）"""
+    return [segment for segment in _SEGMENT_BOUNDARY.split(prompt) if segment]
+
+
+def segment_hash(segment: str) -> str:
+    return hashlib.sha256(segment.encode("utf-8")).hexdigest()
+
+
+class CRUDPromptSegment:
+    """内容寻址的提示词片段存储：哈希 -> zstd 压缩文本"""
+
+    def __init__(self, cache_size: int = 1024):
+        """
+        Args:
+            cache_size: 进程内缓存的解压后片段数（片段不可变，缓存无需失效）
+        """
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._compressor = threading.local()
+
+    def _compress(self, text: str) -> bytes:
+        # ZstdCompressor 不是线程安全的，每个线程一个
+        compressor = getattr(self._compressor, "instance", None)
+        if compressor is None:
+            compressor = self._compressor.instance = zstandard.ZstdCompressor(level=_COMPRESSION_LEVEL)
+        return compressor.compress(text.encode("utf-8"))
+
+    @staticmethod
+    def _decompress(data: bytes) -> str:
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+    def store(self, db: Session, prompt: str) -> List[str]:
+        """
+        保存提示词的各个片段（已存在的片段跳过），返回按顺序排列的片段哈希。
+        不提交事务，由调用方与聊天记录一起提交。
+        """
+        segments = split_prompt(prompt)
+        hashes = [segment_hash(segment) for segment in segments]
+        unique = dict(zip(hashes, segments))
+        # 只按数据库判断是否已存在：写入可能随调用方的事务回滚，不能依赖进程内缓存
+        existing = {
+            row[0] for row in db.query(PromptSegment.hash).filter(PromptSegment.hash.in_(list(unique))).all()
+        }
+        new_rows = [
+            {"hash": h, "data": self._compress(s), "size": len(s.encode("utf-8"))}
+            for h, s in unique.items() if h not in existing
+        ]
+        if new_rows:
+            # 并发写入同一片段时以先写入者为准
+            db.execute(sqlite_insert(PromptSegment).values(new_rows).on_conflict_do_nothing(index_elements=["hash"]))
+        return hashes
+
+    def load(self, db: Session, hashes: List[str]) -> str:
+        """按片段哈希还原完整提示词"""
+        segments = self.get_many(db, hashes)
+        return "".join(segments[h] for h in hashes)
+
+    def get_many(self, db: Session, hashes: Iterable[str]) -> Dict[str, str]:
+        """批量读取片段文本（一次查询取回所有未缓存的片段）"""
+        wanted = set(hashes)
+        with self._lock:
+            found = {h: self._cache[h] for h in wanted if h in self._cache}
+        missing = wanted - found.keys()
+        if missing:
+            missing_list = sorted(missing)
+            loaded = {}
+            # 分批查询，避免导出大量消息时超出 SQLite 的参数个数上限
+            for start in range(0, len(missing_list), _QUERY_BATCH_SIZE):
+                batch = missing_list[start:start + _QUERY_BATCH_SIZE]
+                for row in db.query(PromptSegment).filter(PromptSegment.hash.in_(batch)).all():
+                    loaded[row.hash] = self._decompress(row.data)
+            unknown = missing - loaded.keys()
+            if unknown:
+                raise KeyError(f"Prompt segments not found: {sorted(unknown)[:3]}")
+            self._remember(loaded)
+            found.update(loaded)
+        return found
+
+    def _remember(self, segments: Dict[str, str]):
+        with self._lock:
+            for h, text in segments.items():
+                self._cache[h] = text
+                self._cache.move_to_end(h)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+
+prompt_segment = CRUDPromptSegment()
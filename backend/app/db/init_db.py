@@ -19,6 +19,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.db.base_class import Base
 from app.core.config import settings
+from app.db.migrations import upgrade_schema
 
 # 导入所有模型，确保它们被正确注册
 from app.models.participant import Participant
@@ -26,6 +27,8 @@ from app.models.event import EventLog
 from app.models.chat_history import ChatHistory
 from app.models.user_progress import UserProgress
 from app.models.survey_result import SurveyResult
+from app.models.conversation_summary import ConversationSummary
+from app.models.prompt_segment import PromptSegment
 
 def init_db():
     """初始化数据库，创建所有表"""
@@ -37,6 +40,8 @@ def init_db():
     
     # 创建所有表
     Base.metadata.create_all(bind=engine)
+    # 补齐已有表中缺少的列和索引
+    upgrade_schema(engine)
     print("数据库表创建成功！")
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+"""
+轻量数据库结构升级
+
+create_all 只会创建缺失的表，不会修改已有的表。这里补齐已有数据库中
+缺少的列和索引，启动时和 init_db 中都会执行，重复执行是安全的。
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from app.db.base_class import Base
+
+# 已有表上新增的列：(表名, 列名, 列定义)
+ADDED_COLUMNS = [
+    ("chat_history", "conversation_id", "VARCHAR"),
+    ("chat_history", "llm_route", "TEXT"),
+    ("chat_history", "prompt_segments", "TEXT"),
+]
+
+
+def _import_models():
+    """导入所有模型，确保它们注册到 Base.metadata"""
+    from app.models import participant, event, chat_history, user_progress, survey_result, conversation_summary, prompt_segment  # noqa: F401
+
+
+def upgrade_schema(engine: Engine) -> list:
+    """
+    创建缺失的表，补齐缺失的列和索引
+
+    Returns:
+        list: 本次执行的变更说明
+    """
+    _import_models()
+    Base.metadata.create_all(bind=engine)
+
+    changes = []
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table_name, column_name, column_type in ADDED_COLUMNS:
+            columns = {column["name"] for column in inspector.get_columns(table_name)}
+            if column_name not in columns:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+                changes.append(f"added column {table_name}.{column_name}")
+
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn, checkfirst=True)
+                    changes.append(f"created index {index.name}")
+
+    for change in changes:
+        print(f"INFO: schema upgrade: {change}")
+    return changes
@@ -1,12 +1,58 @@
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.api import api_router
 from app.core.config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动/停止后台任务"""
+    background_tasks = []
+    # 补齐数据库中缺少的表、列和索引
+    from app.db.database import engine
+    from app.db.migrations import upgrade_schema
+    upgrade_schema(engine)
+
+    # 在后台线程中构建重量级服务（情感分析模型、LLM 网关等），不阻塞启动；
+    # 预热完成前到达的请求在首次使用时等待同一次构建
+    from app.config.dependency_injection import registry
+    if settings.SERVICE_WARMUP_ON_STARTUP:
+        background_tasks.append(asyncio.create_task(asyncio.to_thread(registry.warm_up, settings.SERVICE_WARMUP)))
+
+    # 预渲染各主题的提示词片段，聊天热路径只做字符串拼接
+    from app.config.dependency_injection import get_prompt_fragment_cache
+    background_tasks.append(asyncio.create_task(asyncio.to_thread(get_prompt_fragment_cache().warm)))
+
+    if settings.ENABLE_RAG_SERVICE and settings.RAG_WARMUP_ON_STARTUP:
+        # 在后台线程构建并预热 RAGService，不阻塞启动；就绪前的聊天请求不做检索
+        from app.config.dependency_injection import get_rag_service_loader
+        get_rag_service_loader().start()
+
+    if settings.ENABLE_RAG_SERVICE and settings.KB_WATCH_INTERVAL_SECONDS > 0:
+        from app.config.dependency_injection import get_rag_service
+        from app.services.vector_store import watch_for_new_versions
+        background_tasks.append(asyncio.create_task(
+            watch_for_new_versions(get_rag_service, settings.KB_WATCH_INTERVAL_SECONDS)
+        ))
+
+    yield
+
+    for task in background_tasks:
+        task.cancel()
+
+    # 关闭已构建的服务（LLM 共享连接池、情感分析批处理线程等）
+    await registry.aclose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set all CORS enabled origins
@@ -22,6 +68,18 @@ if settings.BACKEND_CORS_ORIGINS:
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="启动后端服务")
+    parser.add_argument("--profile-startup", action="store_true", help="报告导入 app.main 时各模块的耗时后退出")
+    parser.add_argument("--profile-services", action="store_true",
+                        help="与 --profile-startup 一起使用：同时报告 SERVICE_WARMUP 中各服务的构建耗时")
+    parser.add_argument("--top", type=int, default=20, help="每个列表显示的条数")
+    args = parser.parse_args()
+    if args.profile_startup:
+        from app.core.startup_profile import format_report, profile_startup
+        services = settings.SERVICE_WARMUP if args.profile_services else []
+        print(format_report(profile_startup(services=services, top=args.top)))
+        raise SystemExit(0)
+
     uvicorn.run(
         'app.main:app',
         host='0.0.0.0',
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
 from datetime import datetime, UTC
 from app.db.base_class import Base
 
@@ -10,16 +10,28 @@ class ChatHistory(Base):
     Attributes:
         id: 消息ID
         participant_id: 关联到participants.id
+        conversation_id: 会话ID（前端每次打开聊天生成），服务端据此重建对话历史；旧数据为空
         timestamp: 消息时间
         role: 'user' 或 'ai'
         message: 消息的文本内容
-        raw_prompt_to_llm: (仅对AI消息) 记录当时为了生成这条AI回答，我们实际发送给LLM的完整Prompt
+        raw_prompt_to_llm: (仅对AI消息) 记录当时为了生成这条AI回答，我们实际发送给LLM的完整Prompt；
+            新数据改为片段存储（见 prompt_segments），只有旧数据保存在这里
+        prompt_segments: (仅对AI消息) 完整Prompt的片段哈希列表（JSON），按顺序拼接 prompt_segments 表中的片段即为原文；
+            读取时使用 crud_chat_history.get_raw_prompt
+        llm_route: (仅对AI消息) 路由决定的JSON：回答的后端与模型、尝试顺序、是否对冲；缓存命中或旧数据为空
     """
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # 按参与者+会话取最近的若干条消息
+        Index("ix_chat_history_participant_conversation_timestamp", "participant_id", "conversation_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     participant_id = Column(String, index=True, nullable=False)
+    conversation_id = Column(String, nullable=True)
     timestamp = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'ai'
     message = Column(Text, nullable=False)
     raw_prompt_to_llm = Column(Text, nullable=True)
+    prompt_segments = Column(Text, nullable=True)
+    llm_route = Column(Text, nullable=True)
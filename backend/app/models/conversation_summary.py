@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, UniqueConstraint
+from datetime import datetime, UTC
+from app.db.base_class import Base
+
+class ConversationSummary(Base):
+    """会话滚动摘要模型
+
+    会话过长时，较早的消息被压缩成一段摘要。每次压缩生成一个新版本（不覆盖旧版本），
+    AI消息的 raw_prompt_to_llm 中带有所用摘要的版本号，便于审计模型当时看到的内容。
+
+    Attributes:
+        id: 摘要ID
+        participant_id: 关联到participants.id
+        conversation_id: 会话ID
+        version: 摘要版本号（同一会话内从 1 开始递增）
+        summary: 摘要文本（涵盖此前所有版本的内容）
+        covered_until_id: 摘要涵盖到的最后一条 chat_history.id
+        covered_message_count: 摘要涵盖的消息总数
+        created_at: 生成时间
+    """
+    __tablename__ = "conversation_summaries"
+    __table_args__ = (
+        UniqueConstraint("participant_id", "conversation_id", "version", name="uq_conversation_summary_version"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    participant_id = Column(String, index=True, nullable=False)
+    conversation_id = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    summary = Column(Text, nullable=False)
+    covered_until_id = Column(Integer, nullable=False)
+    covered_message_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from datetime import datetime, UTC
+from app.db.base_class import Base
+
+class PromptSegment(Base):
+    """提示词片段模型（内容寻址）
+
+    发送给LLM的系统提示词按空行切分成片段，每个片段按内容哈希只保存一次（zstd 压缩）。
+    基础提示词、学习内容 JSON 等在各轮对话之间重复的部分因此只存一份，
+    chat_history.prompt_segments 按顺序记录片段哈希，拼接即可还原完整提示词。
+
+    Attributes:
+        hash: 片段文本（UTF-8）的 SHA-256 十六进制摘要
+        data: zstd 压缩后的片段文本
+        size: 未压缩的字节数
+        created_at: 首次写入时间
+    """
+    __tablename__ = "prompt_segments"
+
+    hash = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
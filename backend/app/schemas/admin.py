@@ -0,0 +1,84 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+
+class KnowledgeBaseStatus(BaseModel):
+    """知识库状态模型
+
+    当前生效的向量库版本信息。
+
+    Attributes:
+        version: 当前生效的知识库版本号（0 表示旧的平铺布局）
+        path: 版本目录路径
+        chunk_count: 文本块数量
+        embedding_dimension: 向量维度
+        loaded_at: 加载时间（Unix 时间戳）
+        in_flight: 正在使用该版本的查询数
+        available_versions: vector_store 下所有已发布的版本号
+        manifest: 版本 manifest 内容
+    """
+    version: int
+    path: str
+    chunk_count: int
+    embedding_dimension: int
+    loaded_at: float
+    in_flight: int
+    available_versions: List[int] = []
+    manifest: Dict[str, Any] = {}
+
+
+class KnowledgeBaseReloadRequest(BaseModel):
+    """知识库热加载请求模型
+
+    Attributes:
+        version: 要切换到的版本号，为空时切换到最新发布的版本
+        force: 目标版本与当前版本相同时是否仍然重新加载
+    """
+    version: Optional[int] = Field(None, ge=0, description="目标版本号，默认最新版本")
+    force: bool = False
+
+
+class KnowledgeBaseReloadResponse(BaseModel):
+    """知识库热加载响应模型
+
+    Attributes:
+        switched: 是否发生了版本切换
+        previous_version: 切换前的版本号
+        status: 切换后的知识库状态
+    """
+    switched: bool
+    previous_version: int
+    status: KnowledgeBaseStatus
+
+
+class ContentReloadResponse(BaseModel):
+    """内容重新加载响应模型
+
+    Attributes:
+        rendered: 重新渲染的主题数
+        fragments: 提示词片段缓存统计
+    """
+    rendered: int
+    fragments: Dict[str, int] = {}
+
+
+class BatchRetrieveRequest(BaseModel):
+    """批量检索请求模型
+
+    Attributes:
+        queries: 查询文本列表
+        k: 每条查询返回的文本块数量
+    """
+    queries: List[str] = Field(..., min_length=1, max_length=2000, description="查询文本列表")
+    k: int = Field(3, ge=1, le=50, description="每条查询返回的文本块数量")
+
+
+class BatchRetrieveResponse(BaseModel):
+    """批量检索响应模型
+
+    Attributes:
+        kb_version: 检索时使用的知识库版本
+        results: 与请求中 queries 一一对应的检索结果
+    """
+    kb_version: int
+    results: List[List[Any]]
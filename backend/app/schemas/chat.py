@@ -31,9 +31,12 @@ class ChatRequest(BaseModel):
         code_context: 代码上下文，用户当前正在编辑的代码内容
         mode: 模式，标识当前是学习模式还是测试模式 ('learning' 或 'test')
         content_id: 内容ID，学习内容或测试任务的ID
+        conversation_id: 会话ID。提供时服务端从 chat_history 重建对话历史，忽略 conversation_history
     """
     participant_id: str
     user_message: str
+    conversation_id: Optional[str] = Field(None, max_length=64)
+    # 兼容旧客户端：未提供 conversation_id 时使用客户端上传的历史
     conversation_history: Optional[List[ConversationMessage]] = []
     code_context: Optional[CodeContent] = None
     mode: Optional[str] = None  # "learning" 或 "test"
@@ -98,10 +101,35 @@ class ChatHistoryCreate(BaseModel):
         role: 消息角色，'user'表示用户消息，'ai'表示AI助手消息
         message: 消息内容，文本格式的对话内容
         raw_prompt_to_llm: 发送给LLM的完整Prompt，仅对AI消息有效
+        conversation_id: 会话ID（可选）
+        llm_route: 路由决定的JSON（回答的后端与模型），仅对AI消息有效
         timestamp: 时间戳，记录消息发送时间，默认为当前时间
     """
     participant_id: str
     role: str  # "user" 或 "assistant"
     message: str
     raw_prompt_to_llm: Optional[str] = None
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(UTC))
\ No newline at end of file
+    conversation_id: Optional[str] = None
+    llm_route: Optional[str] = None
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+
+class ConversationSummaryCreate(BaseModel):
+    """会话摘要创建模型
+
+    对应数据库模型 ConversationSummary，每次压缩写入一个新版本。
+
+    Attributes:
+        participant_id: 参与者ID
+        conversation_id: 会话ID
+        version: 摘要版本号
+        summary: 摘要文本
+        covered_until_id: 摘要涵盖到的最后一条 chat_history.id
+        covered_message_count: 摘要涵盖的消息总数
+    """
+    participant_id: str
+    conversation_id: str
+    version: int
+    summary: str
+    covered_until_id: int
+    covered_message_count: int
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Any, Dict
+
+
+class ReadinessStatus(BaseModel):
+    """就绪状态模型
+
+    后台初始化组件的就绪情况。
+
+    Attributes:
+        ready: 是否已完全就绪（所有已启用组件都完成初始化）
+        components: 各组件的状态详情，如 RAG 预热状态
+    """
+    ready: bool
+    components: Dict[str, Dict[str, Any]] = {}
@@ -119,6 +119,22 @@ class BehaviorInterpreterService:
             logger.info(f"BehaviorInterpreterService: 未处理的事件类型 {event_type}")
             return
 
+    def interpret_persisted(self, event, user_state_service=None, event_buffer=None):
+        """
+        解释一条已经提交持久化的事件（/behavior/log 的同步路径与解释总线共用，保证两条路径结果一致）
+
+        - 提交事件先 flush 写后缓冲，挫败检测读到的历史包含此前的所有事件（以及这次提交）
+        - 不使用请求的数据库会话：需要读取历史时由本服务自行创建会话
+
+        Args:
+            event: BehaviorEvent 实例
+            user_state_service: UserStateService 实例
+            event_buffer: 行为事件写后缓冲（未启用时为 None）
+        """
+        if event_buffer is not None and getattr(event, "event_type", None) == "test_submission":
+            event_buffer.flush()
+        self.interpret_event(event=event, user_state_service=user_state_service)
+
     def _handle_test_submission(self, participant_id, event_data, timestamp, 
                                user_state_service, db_session, crud_event, SessionLocal, is_replay):
         """处理测试提交事件"""
@@ -0,0 +1,239 @@
+# backend/app/services/chat_concurrency.py
+"""
+聊天请求的并发控制
+
+- InFlightCoalescer：单飞合并。双击、网络重试产生的重复请求（同一参与者、同一会话、
+  同一条消息、同一内容和同一份代码）不再各自执行情感分析、检索和 LLM 调用，而是等待第一个请求的结果；
+  chat_history 也只记录一次。刚完成的结果保留几秒，覆盖“请求已完成后才到达”的重试。
+- ParticipantGate：每个参与者同时只有一个生成中的请求，避免单个学生占满 LLM 连接池。
+  - queue：后来的请求排队等待（等待数和等待时间有上限，超出时 ChatBusyError）
+  - cancel：后来的请求取消正在生成的旧请求，旧请求以 ChatSupersededError 结束
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GATE_POLICIES = ("queue", "cancel")
+
+
+class ChatConcurrencyError(Exception):
+    """聊天并发控制相关错误的基类"""
+
+
+class ChatBusyError(ChatConcurrencyError):
+    """参与者已有请求在生成，且等待队列已满或等待超时"""
+
+
+class ChatCancelledError(ChatConcurrencyError):
+    """被合并的原请求已取消（例如客户端断开）"""
+
+
+class ChatSupersededError(ChatConcurrencyError):
+    """cancel 策略下请求被同一参与者的新请求取代"""
+
+
+def _code_hash(code_context: Any) -> str:
+    """代码上下文的哈希（逐字比较：重复请求携带的代码完全相同）"""
+    if code_context is None:
+        return ""
+    if hasattr(code_context, "model_dump"):
+        code_context = code_context.model_dump()
+    payload = json.dumps(code_context, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def request_key(
+    participant_id: str,
+    user_message: str,
+    content_id: Optional[str],
+    mode: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    code_context: Any = None,
+) -> str:
+    """
+    重复请求的判定键：参与者 + 会话 + 消息哈希 + 内容 + 代码哈希
+
+    会话或代码不同的请求即使消息相同也不是重复请求：复用的结果不会记入新会话，
+    修改代码后再问同一个问题也应该得到针对新代码的回答。
+    """
+    message_hash = hashlib.sha256(user_message.strip().encode("utf-8")).hexdigest()[:16]
+    return (
+        f"{participant_id}:{conversation_id or ''}:{mode or ''}:{content_id or ''}:"
+        f"{message_hash}:{_code_hash(code_context)}"
+    )
+
+
+def _retrieve_exception(future: asyncio.Future):
+    # 没有重复请求等待时，避免 “Future exception was never retrieved” 警告
+    if not future.cancelled():
+        future.exception()
+
+
+class InFlightCoalescer:
+    """按请求键合并正在执行（以及刚完成）的相同请求"""
+
+    def __init__(self, recent_ttl_seconds: float = 5.0):
+        """
+        Args:
+            recent_ttl_seconds: 完成后继续复用结果的秒数，0 表示只合并执行中的请求
+        """
+        self.recent_ttl_seconds = recent_ttl_seconds
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._recent: Dict[str, Tuple[float, Any]] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """相同请求正在执行或刚完成时返回其结果 Future，否则返回 None"""
+        future = self._in_flight.get(key)
+        if future is None:
+            recent = self._recent.get(key)
+            if recent is None or recent[0] <= time.monotonic():
+                return None
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(recent[1])
+        self._stats["coalesced"] += 1
+        return future
+
+    def lead(self, key: str) -> asyncio.Future:
+        """登记为该键的执行者，之后必须调用 finish"""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_exception)
+        self._in_flight[key] = future
+        self._stats["leaders"] += 1
+        return future
+
+    def finish(self, key: str, result: Any = None, error: Optional[BaseException] = None, remember: bool = True):
+        """
+        结束执行并唤醒等待者
+
+        Args:
+            error: 执行失败时的异常，等待者会收到同一个异常
+            remember: 是否在 recent_ttl_seconds 内继续复用结果（失败或兜底回复不应复用）
+        """
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            if error is not None:
+                if not isinstance(error, Exception):
+                    error = ChatCancelledError("The original request was cancelled")
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        now = time.monotonic()
+        if error is None and remember and self.recent_ttl_seconds > 0:
+            self._recent[key] = (now + self.recent_ttl_seconds, result)
+        for stale in [k for k, (expires_at, _) in self._recent.items() if expires_at <= now]:
+            del self._recent[stale]
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]], remember: Callable[[Any], bool] = lambda result: True) -> Any:
+        """执行 factory()；相同的键已在执行时等待其结果"""
+        shared = self.join(key)
+        if shared is not None:
+            return await asyncio.shield(shared)
+
+        self.lead(key)
+        try:
+            result = await factory()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result, remember=remember(result))
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "in_flight": len(self._in_flight)}
+
+
+@dataclass
+class _ParticipantState:
+    lock: asyncio.Lock
+    waiting: int = 0
+    holder: Optional[asyncio.Task] = None
+
+
+class ParticipantGate:
+    """每个参与者同时只允许一个生成中的请求"""
+
+    def __init__(self, policy: str = "queue", max_waiting: int = 2, wait_timeout_seconds: float = 120.0):
+        """
+        Args:
+            policy: "queue" 排队等待，"cancel" 取消正在生成的旧请求
+            max_waiting: queue 策略下每个参与者最多排队的请求数
+            wait_timeout_seconds: 排队等待的最长时间
+        """
+        if policy not in GATE_POLICIES:
+            raise ValueError(f"Unsupported participant gate policy: {policy}")
+        self.policy = policy
+        self.max_waiting = max_waiting
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self._states: Dict[str, _ParticipantState] = {}
+        # 被新请求取消的任务，用于区分“被取代”和其他原因的取消（客户端断开、服务关闭）
+        self._superseded: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self._stats = {"acquired": 0, "queued": 0, "rejected": 0, "cancelled": 0}
+
+    @asynccontextmanager
+    async def slot(self, participant_id: str):
+        """
+        占用参与者的生成名额，退出时释放
+
+        Raises:
+            ChatBusyError: queue 策略下等待队列已满或等待超时
+            ChatSupersededError: cancel 策略下占用名额期间被新请求取代
+        """
+        state = self._states.get(participant_id)
+        if state is None:
+            state = self._states[participant_id] = _ParticipantState(lock=asyncio.Lock())
+
+        if self.policy == "cancel" and state.holder is not None and not state.holder.done():
+            # 新请求取代旧请求
+            self._superseded.add(state.holder)
+            state.holder.cancel()
+            self._stats["cancelled"] += 1
+
+        if state.lock.locked():
+            if state.waiting >= self.max_waiting:
+                self._stats["rejected"] += 1
+                raise ChatBusyError(f"Participant {participant_id} already has {state.waiting} queued requests")
+            state.waiting += 1
+            self._stats["queued"] += 1
+            try:
+                await asyncio.wait_for(state.lock.acquire(), self.wait_timeout_seconds)
+            except asyncio.TimeoutError:
+                self._stats["rejected"] += 1
+                raise ChatBusyError(f"Timed out waiting for the previous request of participant {participant_id}")
+            finally:
+                state.waiting -= 1
+        else:
+            await state.lock.acquire()
+
+        task = state.holder = asyncio.current_task()
+        self._stats["acquired"] += 1
+        try:
+            yield
+        except asyncio.CancelledError:
+            if task not in self._superseded:
+                raise
+            # 被取代的请求撤销这次取消，以明确的错误结束，由调用方返回“已被取代”的回复
+            task.uncancel()
+            raise ChatSupersededError(f"Request of participant {participant_id} was superseded by a newer one") from None
+        finally:
+            self._superseded.discard(task)
+            state.holder = None
+            state.lock.release()
+            if not state.lock.locked() and state.waiting == 0:
+                self._states.pop(participant_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "policy": self.policy,
+            "active_participants": sum(1 for state in self._states.values() if state.lock.locked()),
+        }
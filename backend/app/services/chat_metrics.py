@@ -0,0 +1,70 @@
+# backend/app/services/chat_metrics.py
+"""
+聊天流水线的阶段耗时统计
+
+DynamicController 每处理一个请求记录一次各阶段耗时（profile、sentiment、retrieval、
+content、prompt、llm、log），管理接口和负载测试脚本据此查看各阶段的 p50/p95/p99。
+阶段超时、出错或因线程池已满被跳过而使用默认结果时按原因计数（fallbacks），
+这些请求的默认结果（例如中性情感）不是真实的分析结果。
+"""
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+
+
+def percentile(samples: Iterable[float], fraction: float) -> Optional[float]:
+    """最近邻分位数（fraction 取 0~1），没有样本时返回 None"""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 1)
+
+
+class StageMetrics:
+    """聊天流水线各阶段耗时的滑动窗口统计（每个阶段保留最近 window 个样本）"""
+
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._fallbacks: Dict[str, Dict[str, int]] = {}
+
+    def record(self, timings: Dict[str, float]):
+        """记录一次请求的各阶段耗时（毫秒），只包含实际执行的阶段"""
+        with self._lock:
+            for stage, ms in timings.items():
+                if stage not in self._samples:
+                    self._samples[stage] = deque(maxlen=self.window)
+                    self._counts[stage] = 0
+                self._samples[stage].append(ms)
+                self._counts[stage] += 1
+
+    def record_fallback(self, stage: str, reason: str):
+        """记录一次阶段降级（reason：timeout / error / saturated）"""
+        with self._lock:
+            reasons = self._fallbacks.setdefault(stage, {})
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            snapshot = {stage: list(samples) for stage, samples in self._samples.items()}
+            counts = dict(self._counts)
+            fallbacks = {stage: dict(reasons) for stage, reasons in self._fallbacks.items()}
+        return {
+            stage: {
+                "count": counts.get(stage, 0),
+                "p50_ms": percentile(samples, 0.50),
+                "p95_ms": percentile(samples, 0.95),
+                "p99_ms": percentile(samples, 0.99),
+                "max_ms": round(max(samples), 1) if samples else None,
+                "fallbacks": fallbacks.get(stage, {}),
+            }
+            for stage, samples in {**{stage: [] for stage in fallbacks}, **snapshot}.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._fallbacks.clear()
@@ -0,0 +1,142 @@
+# backend/app/services/conversation_memory.py
+"""
+服务端对话记忆
+
+客户端只上传会话ID和新消息，最近的对话历史由服务端从 chat_history 重建：
+
+- 内存中为每个（参与者, 会话）保留一个定长环形缓冲区（最近 max_messages 条消息）。
+- 缓冲区未命中（首次访问、重启或被淘汰）时从 chat_history 读取最近的消息填充。
+- 每轮对话在写库的同时追加到缓冲区，下一轮不必等待后台写库完成。
+- 会话较长时，较早的消息由 ConversationSummarizer 压缩成滚动摘要；
+  get_context 返回最新摘要和摘要之后的原始消息。
+
+会话按参与者隔离，客户端无法读取或篡改他人（或自己）的历史。
+"""
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.crud.crud_chat_history import chat_history as crud_chat_history
+from app.crud.crud_conversation_summary import conversation_summary as crud_conversation_summary
+
+
+@dataclass
+class ConversationContext:
+    """提示词所需的会话上下文：滚动摘要 + 摘要之后的原始消息"""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    summary: Optional[str] = None
+    summary_version: Optional[int] = None
+
+
+@dataclass
+class _Conversation:
+    messages: Deque[Dict[str, str]]
+    total_messages: int
+    summary: Optional[str] = None
+    summary_version: int = 0
+    summary_covers: int = 0
+
+
+class ConversationMemory:
+    """按（参与者, 会话）缓存最近消息的环形缓冲区，未命中时回源 chat_history"""
+
+    def __init__(self, max_messages: int = 20, max_conversations: int = 2000):
+        """
+        Args:
+            max_messages: 每个会话保留的最近消息数（用户和AI消息各算一条）
+            max_conversations: 内存中最多保留的会话数，超出时淘汰最久未使用的
+        """
+        self.max_messages = max_messages
+        self.max_conversations = max_conversations
+        self._buffers: "OrderedDict[Tuple[str, str], _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "loads": 0, "evictions": 0}
+
+    def get(self, db: Session, participant_id: str, conversation_id: str) -> List[Dict[str, str]]:
+        """获取会话中尚未被摘要涵盖的最近消息（按时间正序），格式为 [{"role", "content"}]"""
+        return self.get_context(db, participant_id, conversation_id).messages
+
+    def get_context(self, db: Session, participant_id: str, conversation_id: str) -> ConversationContext:
+        """获取会话的最新摘要，以及摘要之后的最近消息"""
+        key = (participant_id, conversation_id)
+        with self._lock:
+            conversation = self._buffers.get(key)
+            if conversation is not None:
+                self._buffers.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._context(conversation)
+
+        loaded = self._load(db, participant_id, conversation_id)
+        with self._lock:
+            # 并发请求可能已经填充过缓冲区，以先到者为准
+            conversation = self._buffers.setdefault(key, loaded)
+            self._buffers.move_to_end(key)
+            self._stats["loads"] += 1
+            self._evict()
+            return self._context(conversation)
+
+    def _load(self, db: Session, participant_id: str, conversation_id: str) -> _Conversation:
+        rows = crud_chat_history.get_recent_by_conversation(
+            db, participant_id=participant_id, conversation_id=conversation_id, limit=self.max_messages
+        )
+        conversation = _Conversation(
+            messages=deque(
+                ({"role": "assistant" if row.role in ("assistant", "ai") else "user", "content": row.message} for row in rows),
+                maxlen=self.max_messages
+            ),
+            total_messages=len(rows),
+        )
+        if len(rows) == self.max_messages:
+            # 缓冲区装满时才需要知道会话的真实长度
+            conversation.total_messages = crud_chat_history.count_by_conversation(
+                db, participant_id=participant_id, conversation_id=conversation_id
+            )
+        latest = crud_conversation_summary.get_latest(db, participant_id=participant_id, conversation_id=conversation_id)
+        if latest is not None:
+            conversation.summary = latest.summary
+            conversation.summary_version = latest.version
+            conversation.summary_covers = latest.covered_message_count
+        return conversation
+
+    @staticmethod
+    def _context(conversation: _Conversation) -> ConversationContext:
+        unsummarized = max(conversation.total_messages - conversation.summary_covers, 0)
+        messages = list(conversation.messages)
+        messages = messages[len(messages) - min(unsummarized, len(messages)):]
+        return ConversationContext(
+            messages=messages,
+            summary=conversation.summary,
+            summary_version=conversation.summary_version or None,
+        )
+
+    def append(self, participant_id: str, conversation_id: str, role: str, content: str):
+        """
+        追加一条消息。只更新已在内存中的会话：未缓存的会话下次 get 时会从数据库完整加载，
+        避免只含最新消息的残缺缓冲区遮住数据库中更早的历史。
+        """
+        with self._lock:
+            conversation = self._buffers.get((participant_id, conversation_id))
+            if conversation is not None:
+                conversation.messages.append({"role": role, "content": content})
+                conversation.total_messages += 1
+
+    def set_summary(self, participant_id: str, conversation_id: str, summary: str, version: int, covered_message_count: int):
+        """摘要生成后更新内存中的会话（只接受更新的版本）"""
+        with self._lock:
+            conversation = self._buffers.get((participant_id, conversation_id))
+            if conversation is not None and version > conversation.summary_version:
+                conversation.summary = summary
+                conversation.summary_version = version
+                conversation.summary_covers = covered_message_count
+
+    def _evict(self):
+        while len(self._buffers) > self.max_conversations:
+            self._buffers.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "conversations": len(self._buffers)}
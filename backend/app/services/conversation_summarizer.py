@@ -0,0 +1,161 @@
+# backend/app/services/conversation_summarizer.py
+"""
+会话滚动摘要
+
+长时间的辅导会话会让消息列表无限增长。每轮对话结束、回复发送之后，
+后台任务检查会话中尚未被摘要涵盖的消息：token 数超过阈值时，把除最近
+keep_recent_messages 条以外的消息和上一版摘要一起压缩成新摘要。
+
+- 摘要按版本保存在 conversation_summaries 表，不覆盖旧版本。
+- PromptGenerator 在系统提示词中写入摘要及其版本号，raw_prompt_to_llm 因此
+  记录了模型当时看到的确切内容。
+- 同一会话同时只有一个摘要任务；LLM 调用失败时保留旧摘要，下一轮再试。
+"""
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from app.crud.crud_chat_history import chat_history as crud_chat_history
+from app.crud.crud_conversation_summary import conversation_summary as crud_conversation_summary
+from app.schemas.chat import ConversationSummaryCreate
+from app.services.llm_scheduler import FALLBACK_RESPONSE_PREFIX, PRIORITY_BACKGROUND
+from app.services.prompt_budget import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a tutoring conversation between a student and an AI programming tutor.
+Update the previous summary with the new messages. Keep:
+- what the student is working on and the questions they asked
+- misconceptions, recurring errors and hints already given
+- what the student has already understood or solved
+Write in the language the student uses, as concise bullet points. Do not add advice of your own."""
+
+
+class ConversationSummarizer:
+    """会话超过 token 阈值时，把较早的消息压缩成滚动摘要"""
+
+    def __init__(
+        self,
+        llm_gateway,
+        session_factory: Callable,
+        conversation_memory=None,
+        token_counter: Optional[TokenCounter] = None,
+        trigger_tokens: int = 3000,
+        keep_recent_messages: int = 6,
+        max_summary_tokens: int = 600,
+    ):
+        """
+        Args:
+            llm_gateway: 生成摘要使用的 LLM 网关
+            session_factory: 创建数据库会话的函数（后台任务不复用请求的会话）
+            conversation_memory: 摘要生成后同步更新的对话记忆（可选）
+            trigger_tokens: 未被摘要涵盖的消息超过该 token 数时触发压缩
+            keep_recent_messages: 压缩时保留的最近原始消息数
+            max_summary_tokens: 摘要的最大 token 数
+        """
+        self.llm_gateway = llm_gateway
+        self.session_factory = session_factory
+        self.conversation_memory = conversation_memory
+        self.token_counter = token_counter or TokenCounter()
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.max_summary_tokens = max_summary_tokens
+        self._in_flight: Set[Tuple[str, str]] = set()
+
+    async def maybe_summarize(self, participant_id: str, conversation_id: str):
+        """
+        检查会话并在需要时生成新版本摘要（作为后台任务在回复发送后执行）
+
+        数据库读写是同步的 SQLAlchemy 调用，在线程池中执行，不阻塞事件循环上的流式回复。
+
+        Returns:
+            新生成的 ConversationSummary 记录；无需压缩或失败时返回 None
+        """
+        key = (participant_id, conversation_id)
+        if key in self._in_flight:
+            return None
+        self._in_flight.add(key)
+        try:
+            pending = await asyncio.to_thread(self._load_pending, participant_id, conversation_id)
+            if pending is None:
+                return None
+            latest, to_summarize, pending_tokens = pending
+
+            summary = await self._summarize(latest.summary if latest else None, to_summarize)
+            if not summary or summary.startswith(FALLBACK_RESPONSE_PREFIX):
+                logger.warning(f"ConversationSummarizer: {participant_id}/{conversation_id} 摘要生成失败，保留旧版本")
+                return None
+
+            record = await asyncio.to_thread(self._save_summary, ConversationSummaryCreate(
+                participant_id=participant_id,
+                conversation_id=conversation_id,
+                version=(latest.version if latest else 0) + 1,
+                summary=summary,
+                covered_until_id=to_summarize[-1].id,
+                covered_message_count=(latest.covered_message_count if latest else 0) + len(to_summarize),
+            ))
+            if self.conversation_memory is not None:
+                self.conversation_memory.set_summary(
+                    participant_id, conversation_id, record.summary, record.version, record.covered_message_count
+                )
+            logger.info(
+                f"ConversationSummarizer: {participant_id}/{conversation_id} v{record.version} "
+                f"压缩 {len(to_summarize)} 条消息（{pending_tokens} tokens 未摘要）"
+            )
+            return record
+        except Exception as e:
+            # 后台任务：失败只记录日志，下一轮再试
+            logger.warning(f"ConversationSummarizer: {participant_id}/{conversation_id} 摘要失败: {e}")
+            return None
+        finally:
+            self._in_flight.discard(key)
+
+    def _load_pending(self, participant_id: str, conversation_id: str) -> Optional[Tuple[Any, List, int]]:
+        """
+        读取最新摘要和其后的消息（在线程池中执行）
+
+        Returns:
+            (latest, to_summarize, pending_tokens)；不需要压缩时返回 None
+        """
+        db = self.session_factory()
+        try:
+            latest = crud_conversation_summary.get_latest(db, participant_id=participant_id, conversation_id=conversation_id)
+            pending = crud_chat_history.get_by_conversation_after(
+                db,
+                participant_id=participant_id,
+                conversation_id=conversation_id,
+                after_id=latest.covered_until_id if latest else 0
+            )
+            if len(pending) <= self.keep_recent_messages:
+                return None
+            pending_tokens = sum(self.token_counter.count(row.message) for row in pending)
+            if pending_tokens <= self.trigger_tokens:
+                return None
+            return latest, pending[:len(pending) - self.keep_recent_messages], pending_tokens
+        finally:
+            db.close()
+
+    def _save_summary(self, obj_in: ConversationSummaryCreate):
+        """保存新版本摘要（在线程池中执行）"""
+        db = self.session_factory()
+        try:
+            return crud_conversation_summary.create(db, obj_in=obj_in)
+        finally:
+            db.close()
+
+    async def _summarize(self, previous_summary: Optional[str], rows: List) -> str:
+        transcript = "\n".join(
+            f"{'Tutor' if row.role in ('assistant', 'ai') else 'Student'}: {row.message}" for row in rows
+        )
+        parts = []
+        if previous_summary:
+            parts.append(f"PREVIOUS SUMMARY:\n{previous_summary}")
+        parts.append(f"NEW MESSAGES:\n{transcript}")
+        summary = await self.llm_gateway.get_completion(
+            system_prompt=SUMMARY_SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": "\n\n".join(parts)}],
+            max_tokens=self.max_summary_tokens,
+            temperature=0.2,
+            priority=PRIORITY_BACKGROUND
+        )
+        return (summary or "").strip()
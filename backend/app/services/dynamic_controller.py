@@ -1,22 +1,56 @@
 # backend/app/services/dynamic_controller.py
 import json
-from typing import Any, Optional
+import time
+import asyncio
+import functools
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.schemas.chat import ChatRequest, ChatResponse, UserStateSummary, SentimentAnalysisResult
 from app.services.sentiment_analysis_service import SentimentAnalysisService
 from app.services.user_state_service import UserStateService
-from app.services.rag_service import RAGService
 from app.services.prompt_generator import PromptGenerator
-from app.services.llm_gateway import LLMGateway
-from app.services.content_loader import load_json_content  # 导入content_loader
+from app.services.llm_router import RoutingDecision, last_routing_decision
+from app.services.llm_scheduler import FALLBACK_RESPONSE_PREFIX, priority_for_mode
+from app.services.response_cache import CacheHit, SemanticResponseCache, ResponseCacheScope, code_fingerprint, hint_stage
+from app.services.prompt_fragments import PromptFragmentCache, PromptFragments, content_type_for_mode
+from app.services.conversation_memory import ConversationMemory, ConversationContext
+from app.services.conversation_summarizer import ConversationSummarizer
+from app.services.chat_concurrency import InFlightCoalescer, ParticipantGate, ChatBusyError, ChatSupersededError, request_key
+from app.services.chat_metrics import StageMetrics
+
+if TYPE_CHECKING:
+    # 仅用于类型注解：导入控制器时不加载 openai 客户端和 Annoy 索引相关模块
+    from app.services.llm_gateway import LLMGateway
+    from app.services.rag_service import RAGService
 from app.crud.crud_event import event as crud_event
 from app.crud.crud_chat_history import chat_history as crud_chat_history
+from app.crud.crud_participant import participant as crud_participant
 from app.schemas.chat import ChatHistoryCreate
 from app.schemas.behavior import BehaviorEvent
 # 准备事件数据
 from app.schemas.behavior import EventType, AiHelpRequestData
 from datetime import datetime, UTC
 
+# 内部错误时返回给学生的回复（不包含任何实现细节）
+CRITICAL_ERROR_RESPONSE = "I'm sorry, but a critical error occurred on our end. Please notify the research staff."
+BUSY_RESPONSE = "I'm still working on your previous question. Please wait for that answer before asking again."
+SUPERSEDED_RESPONSE = "This question was replaced by your newer message, so I stopped answering it."
+
+
+@dataclass
+class _CacheLookup:
+    """语义缓存查找结果；缓存不适用时 scope 为 None，未命中时 hit 为 None"""
+    scope: Optional[ResponseCacheScope] = None
+    question_vector: Optional[Any] = None
+    hit: Optional[CacheHit] = None
+    # 查找时已加载的 (content_title, content_fragments)，未命中时供提示词组装复用
+    content: Optional[Tuple[Optional[str], Optional[PromptFragments]]] = None
+
 
 class DynamicController:
     """动态控制器 - 编排各个服务的核心逻辑"""
@@ -24,9 +58,15 @@ class DynamicController:
     def __init__(self,
                  user_state_service: UserStateService,
                  sentiment_service: SentimentAnalysisService,
-                 rag_service: RAGService,
+                 rag_service: "RAGService",
                  prompt_generator: PromptGenerator,
-                 llm_gateway: LLMGateway,):
+                 llm_gateway: "LLMGateway",
+                 response_cache: Optional[SemanticResponseCache] = None,
+                 prompt_fragments: Optional[PromptFragmentCache] = None,
+                 conversation_memory: Optional[ConversationMemory] = None,
+                 conversation_summarizer: Optional[ConversationSummarizer] = None,
+                 coalescer: Optional[InFlightCoalescer] = None,
+                 participant_gate: Optional[ParticipantGate] = None):
         """
         初始化动态控制器
 
@@ -36,6 +76,12 @@ class DynamicController:
             rag_service: RAG服务
             prompt_generator: 提示词生成器
             llm_gateway: LLM网关服务
+            response_cache: 语义回复缓存（可选，默认不启用）
+            prompt_fragments: 提示词片段缓存（可选，默认按 prompt_generator 新建）
+            conversation_memory: 服务端对话记忆（可选，默认新建）
+            conversation_summarizer: 会话滚动摘要（可选，默认不启用）
+            coalescer: 重复请求合并（可选，默认不启用）
+            participant_gate: 每个参与者的生成并发限制（可选，默认不限制）
         """
         # 验证必需的服务
         if user_state_service is None:
@@ -50,6 +96,36 @@ class DynamicController:
         self.rag_service = rag_service
         self.prompt_generator = prompt_generator
         self.llm_gateway = llm_gateway
+        self.response_cache = response_cache
+        self.response_cache_modes = settings.SEMANTIC_CACHE_MODES
+        # 内容的 TOPIC / CONTENT DATA 段落按主题缓存，内容文件变化时自动重新渲染
+        self.prompt_fragments = prompt_fragments or PromptFragmentCache(prompt_generator)
+        # 带 conversation_id 的请求由服务端重建对话历史
+        self.conversation_memory = conversation_memory or ConversationMemory(
+            max_messages=settings.CONVERSATION_HISTORY_MAX_MESSAGES,
+            max_conversations=settings.CONVERSATION_MEMORY_MAX_CONVERSATIONS
+        )
+        self.conversation_summarizer = conversation_summarizer
+        self.coalescer = coalescer
+        self.participant_gate = participant_gate
+
+        # 步骤2-4 相互独立，并发执行；每个阶段有自己的截止时间，超时则使用默认结果
+        self.stage_timeouts = {
+            "sentiment": settings.CHAT_SENTIMENT_TIMEOUT_SECONDS,
+            "retrieval": settings.CHAT_RETRIEVAL_TIMEOUT_SECONDS,
+            "content": settings.CHAT_CONTENT_TIMEOUT_SECONDS,
+        }
+        # 各阶段耗时的滑动窗口统计（管理接口 /admin/chat/stats 与负载测试读取）
+        self.stage_metrics = StageMetrics()
+        # 情感分析是 CPU 密集的模型推理，放在独立的小线程池中，避免占满默认线程池
+        self._sentiment_executor = ThreadPoolExecutor(
+            max_workers=settings.SENTIMENT_EXECUTOR_WORKERS,
+            thread_name_prefix="sentiment"
+        )
+        # 已提交但尚未结束的推理数：超时的推理仍在线程中运行，达到线程数时不再提交新推理
+        self._sentiment_workers = settings.SENTIMENT_EXECUTOR_WORKERS
+        self._sentiment_in_flight = 0
+        self._sentiment_lock = threading.Lock()
 
     async def generate_adaptive_response(
         self,
@@ -60,6 +136,9 @@ class DynamicController:
         """
         生成自适应AI回复的核心流程
 
+        重复请求（同一参与者、同一会话、同一消息、同一内容和代码）合并为一次执行；
+        同一参与者同时只生成一个回复。
+
         Args:
             request: 聊天请求
             db: 数据库会话
@@ -67,99 +146,79 @@ class DynamicController:
 
         Returns:
             ChatResponse: AI回复
+
+        Raises:
+            ChatBusyError: 该参与者已有请求在生成，且等待队列已满或等待超时
+            ChatSupersededError: cancel 策略下被同一参与者的新请求取代
         """
+        if self.coalescer is None:
+            return await self._generate_with_slot(request, db, background_tasks)
+        return await self.coalescer.run(
+            self._request_key(request),
+            lambda: self._generate_with_slot(request, db, background_tasks),
+            remember=lambda response: self._is_reusable(response.ai_response)
+        )
+
+    @staticmethod
+    def _request_key(request: ChatRequest) -> str:
+        return request_key(request.participant_id, request.user_message, request.content_id, request.mode,
+                           conversation_id=request.conversation_id, code_context=request.code_context)
+
+    def _participant_slot(self, participant_id: str):
+        if self.participant_gate is None:
+            return nullcontext()
+        return self.participant_gate.slot(participant_id)
+
+    @staticmethod
+    def _is_reusable(ai_response: str) -> bool:
+        """出错或兜底的回复不能给重试的请求复用"""
+        return ai_response != CRITICAL_ERROR_RESPONSE and FALLBACK_RESPONSE_PREFIX not in ai_response
+
+    async def _generate_with_slot(self, request: ChatRequest, db: Session, background_tasks = None) -> ChatResponse:
+        async with self._participant_slot(request.participant_id):
+            return await self._generate(request, db, background_tasks)
+
+    async def _generate(
+        self,
+        request: ChatRequest,
+        db: Session,
+        background_tasks = None
+    ) -> ChatResponse:
+        """步骤1-8：生成回复并记录交互（出错时返回标准错误回复）"""
         try:
-            # 步骤1: 获取或创建用户档案（使用UserStateService）
-            profile, _ = self.user_state_service.get_or_create_profile(request.participant_id, db)
+            # 语义回复缓存：作用域相同且问题足够相似时复用历史回答，跳过步骤2-6
+            lookup = await self._lookup_cached_response(request, db)
+            cache_hit = lookup.hit
 
-            # 步骤2: 情感分析
-            if self.sentiment_service:
-                sentiment_result = self.sentiment_service.analyze_sentiment(
-                    request.user_message
-                )
+            llm_route = None
+            if cache_hit is not None:
+                system_prompt, content_title = None, lookup.content[0]
+                ai_response = cache_hit.response
             else:
-                # 如果情感分析服务未启用，创建一个默认的情感分析结果
-                from app.schemas.chat import SentimentAnalysisResult
-                sentiment_result = SentimentAnalysisResult(
-                    label="neutral",
-                    confidence=0.0,
-                    details={}
+                # 步骤1-5: 用户档案、情感分析、RAG检索、内容加载、生成提示词
+                system_prompt, messages, content_title = await self._prepare_prompts(
+                    request, db, query_vector=lookup.question_vector, content=lookup.content
                 )
 
-            # 构建用户状态摘要（同时更新用户情感状态）
-            user_state_summary = self._build_user_state_summary(profile, sentiment_result)
-
-            # 步骤3: RAG检索
-            retrieved_knowledge = []
-            if self.rag_service:
-                try:
-                    retrieved_knowledge = self.rag_service.retrieve(request.user_message)
-                except Exception as e:
-                    print(f"⚠️ RAG检索失败，使用空知识内容: {e}")
-                    retrieved_knowledge = []
-
-            # 步骤4: 加载内容（学习内容或测试任务）
-            content_title = None
-            loaded_content_json = None
-            if request.mode and request.content_id:
-                try:
-                    content_type = "learning_content" if request.mode == "learning" else "test_tasks"
-                    loaded_content = load_json_content(content_type, request.content_id)
-                    content_title = getattr(loaded_content, 'title', None) or getattr(loaded_content, 'topic_id', None)
-                    
-                    # 根据模式处理内容
-                    if request.mode == "test":
-                        loaded_content_json = loaded_content.model_dump_json()
-                    elif request.mode == "learning":
-                        # 移除sc_all字段
-                        learning_content_dict = loaded_content.model_dump()
-                        learning_content_dict.pop('sc_all', None)
-                        loaded_content_json = json.dumps(learning_content_dict)
-
-                except Exception as e:
-                    print(f"⚠️ 内容加载失败: {e}")
-                    loaded_content = None
-                    content_title = None
-            else:
-                loaded_content = None
-
-            # 步骤5: 生成提示词
-            # 将ConversationMessage转换为字典格式
-            conversation_history_dicts = []
-            if request.conversation_history:
-                for msg in request.conversation_history:
-                    conversation_history_dicts.append({
-                        'role': msg.role,
-                        'content': msg.content
-                    })
-            elif request.conversation_history is None:
-                # 确保即使conversation_history为None也传递空列表
-                conversation_history_dicts = []
-
-            retrieved_knowledge_content = [item['content'] for item in retrieved_knowledge if isinstance(item, dict) and 'content' in item]
-            system_prompt, messages = self.prompt_generator.create_prompts(
-                user_state=user_state_summary,
-                retrieved_context=retrieved_knowledge_content,
-                conversation_history=conversation_history_dicts,
-                user_message=request.user_message,
-                code_content=request.code_context,
-                mode=request.mode,
-                content_title=content_title,
-                content_json=loaded_content_json,  # 传递加载的内容JSON
-                test_results=request.test_results  # 传递测试结果
-            )
-
-            # 步骤6: 调用LLM
-            ai_response = await self.llm_gateway.get_completion(
-                system_prompt=system_prompt,
-                messages=messages
-            )
+                # 步骤6: 调用LLM
+                llm_started = time.perf_counter()
+                ai_response = await self.llm_gateway.get_completion(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    priority=priority_for_mode(request.mode)
+                )
+                self.stage_metrics.record({"llm": (time.perf_counter() - llm_started) * 1000})
+                llm_route = last_routing_decision()
+                self._store_cached_response(request, lookup, ai_response, llm_route)
 
             # 步骤7: 构建响应（只包含AI回复内容，符合TDD-II-10设计）
             response = ChatResponse(ai_response=ai_response)
 
             # 步骤8: 记录AI交互
-            self._log_ai_interaction(request, response, db, background_tasks, system_prompt, content_title)
+            log_started = time.perf_counter()
+            self._log_ai_interaction(request, response, db, background_tasks, system_prompt, content_title, llm_route,
+                                     cache_hit)
+            self.stage_metrics.record({"log": (time.perf_counter() - log_started) * 1000})
 
             return response
 
@@ -170,9 +229,448 @@ class DynamicController:
             # 返回一个标准的、用户友好的错误响应
             # 不包含任何可能泄露内部实现的细节
             return ChatResponse(
-                ai_response="I'm sorry, but a critical error occurred on our end. Please notify the research staff."
+                ai_response=CRITICAL_ERROR_RESPONSE
+            )
+
+    async def stream_adaptive_response(
+        self,
+        request: ChatRequest,
+        db: Session,
+        background_tasks = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式版本的自适应回复：与 generate_adaptive_response 使用相同的步骤1-5，
+        LLM 的增量文本一到达就产出，结束时拼出完整回复并记录到 chat_history。
+
+        重复请求等待原请求完成后整段返回；参与者已有请求在生成且无法排队时返回 error 事件，
+        被同一参与者的新请求取代时返回 superseded 事件。
+
+        Args:
+            request: 聊天请求
+            db: 数据库会话
+            background_tasks: 后台任务处理器（可选）
+
+        Yields:
+            dict: {"type": "delta", "content": ...} 增量片段；
+                  最后一条为 {"type": "done", "ai_response": 完整回复, "ttft_ms": 首字延迟}
+        """
+        key = None
+        if self.coalescer is not None:
+            key = self._request_key(request)
+            shared = self.coalescer.join(key)
+            if shared is not None:
+                async for event in self._stream_shared(shared):
+                    yield event
+                return
+            self.coalescer.lead(key)
+
+        final_response = None
+        error = None
+        try:
+            async with self._participant_slot(request.participant_id):
+                async for event in self._stream(request, db, background_tasks):
+                    if event["type"] == "done":
+                        final_response = ChatResponse(ai_response=event["ai_response"])
+                    yield event
+        except ChatBusyError as e:
+            error = e
+            yield {"type": "error", "ai_response": BUSY_RESPONSE}
+        except ChatSupersededError as e:
+            error = e
+            yield {"type": "superseded", "ai_response": SUPERSEDED_RESPONSE}
+        except BaseException as e:
+            # 客户端断开
+            error = e
+            raise
+        finally:
+            if key is not None:
+                if final_response is None and error is None:
+                    error = RuntimeError("stream ended without a response")
+                self.coalescer.finish(
+                    key,
+                    final_response,
+                    error=error,
+                    remember=final_response is not None and self._is_reusable(final_response.ai_response)
+                )
+
+    @staticmethod
+    async def _stream_shared(shared: "asyncio.Future") -> AsyncIterator[Dict[str, Any]]:
+        """重复的流式请求：等待原请求完成，整段回答作为一个增量发送"""
+        try:
+            response = await asyncio.shield(shared)
+        except ChatBusyError:
+            yield {"type": "error", "ai_response": BUSY_RESPONSE}
+            return
+        except ChatSupersededError:
+            yield {"type": "superseded", "ai_response": SUPERSEDED_RESPONSE}
+            return
+        except Exception:
+            yield {"type": "error", "ai_response": CRITICAL_ERROR_RESPONSE}
+            return
+        yield {"type": "delta", "content": response.ai_response}
+        yield {"type": "done", "ai_response": response.ai_response, "ttft_ms": None}
+
+    async def _stream(
+        self,
+        request: ChatRequest,
+        db: Session,
+        background_tasks = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式步骤1-8（出错时产出 error 事件）"""
+        started = time.perf_counter()
+        try:
+            lookup = await self._lookup_cached_response(request, db)
+            cache_hit = lookup.hit
+            if cache_hit is not None:
+                # 缓存命中时不组装提示词，整段回答作为一个增量发送
+                system_prompt, content_title = None, lookup.content[0]
+                deltas = self._single_delta(cache_hit.response)
+            else:
+                system_prompt, messages, content_title = await self._prepare_prompts(
+                    request, db, query_vector=lookup.question_vector, content=lookup.content
+                )
+                deltas = self.llm_gateway.stream_completion(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    priority=priority_for_mode(request.mode)
+                )
+
+            parts = []
+            ttft_ms = None
+            async for delta in deltas:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                    print(f"INFO: time to first token for {request.participant_id}: {ttft_ms:.0f} ms")
+                parts.append(delta)
+                yield {"type": "delta", "content": delta}
+
+            # 完整回复在流结束后统一记录，chat_history 中保存的是完整消息
+            response = ChatResponse(ai_response="".join(parts))
+            llm_route = None
+            if cache_hit is None:
+                llm_route = last_routing_decision()
+                self._store_cached_response(request, lookup, response.ai_response, llm_route)
+            self._log_ai_interaction(request, response, db, background_tasks, system_prompt, content_title, llm_route,
+                                     cache_hit)
+
+            total_ms = (time.perf_counter() - started) * 1000
+            print(f"INFO: streamed response for {request.participant_id} finished in {total_ms:.0f} ms")
+            yield {"type": "done", "ai_response": response.ai_response, "ttft_ms": ttft_ms}
+
+        except Exception as e:
+            print(f"❌ CRITICAL ERROR in stream_adaptive_response: {e}")
+            import traceback
+            traceback.print_exc()
+            yield {
+                "type": "error",
+                "ai_response": CRITICAL_ERROR_RESPONSE
+            }
+
+    async def _lookup_cached_response(self, request: ChatRequest, db: Session) -> _CacheLookup:
+        """
+        查找语义回复缓存（在情感分析、检索和提示词组装之前执行，命中时这些阶段都不再执行）
+
+        只加载确定作用域所需的数据（参与者分组、提问计数和内容标题）并计算一次问题 embedding；
+        未命中时 embedding 和已加载的内容交给 _prepare_prompts 复用，检索不再重复计算 embedding。
+        """
+        if self.response_cache is None or request.mode not in self.response_cache_modes or not request.content_id:
+            return _CacheLookup()
+        try:
+            # 不同实验分组之间绝不共享；分组未知时不使用缓存
+            participant = crud_participant.get(db, request.participant_id)
+            group = getattr(participant, "group", None)
+            if not group:
+                return _CacheLookup()
+
+            profile, _ = self.user_state_service.get_or_create_profile(request.participant_id, db)
+            question_vector, content = await asyncio.gather(
+                asyncio.to_thread(self.response_cache.embed, request.user_message),
+                self._run_stage(
+                    "content", self._load_content, request.mode, request.content_id,
+                    default=(None, None), timings={}
+                )
             )
 
+            scope = ResponseCacheScope(
+                group=group,
+                topic=request.content_id,
+                mode=request.mode,
+                hint_stage=hint_stage(profile.behavior_counters, content[0], request.mode),
+                code_fingerprint=code_fingerprint(request.code_context)
+            )
+            if question_vector is None:
+                return _CacheLookup(content=content)
+            return _CacheLookup(scope, question_vector, self.response_cache.find(scope, question_vector), content)
+        except Exception as e:
+            print(f"⚠️ 语义缓存查找失败，直接调用LLM: {e}")
+            return _CacheLookup()
+
+    def _store_cached_response(
+        self,
+        request: ChatRequest,
+        lookup: _CacheLookup,
+        ai_response: str,
+        llm_route: Optional[RoutingDecision] = None
+    ):
+        """
+        把新生成的回答写入语义缓存（兜底回复或中途出错的流式回复不缓存）。
+        同时记录回答的来源（原始对话和 LLM 路由），命中时写入审计记录的 cached_from。
+        """
+        scope, question_vector = lookup.scope, lookup.question_vector
+        if scope is None or question_vector is None or not ai_response:
+            return
+        if FALLBACK_RESPONSE_PREFIX in ai_response:
+            return
+        origin = {
+            "participant_id": request.participant_id,
+            "conversation_id": request.conversation_id,
+            "llm_route": llm_route.to_dict() if llm_route is not None else None,
+        }
+        self.response_cache.store(scope, question_vector, ai_response, origin=origin)
+
+    @staticmethod
+    def _route_record(llm_route: Optional[RoutingDecision], cache_hit: Optional[CacheHit]) -> Optional[str]:
+        """
+        chat_history.llm_route 的内容：LLM 回答时为路由决定；
+        语义缓存命中时明确标记来源（命中时不组装提示词，raw_prompt_to_llm 为空），回答生成于 cached_from 所指的较早请求
+        """
+        if cache_hit is not None:
+            record = {
+                "source": "semantic_cache",
+                "similarity": round(cache_hit.similarity, 4),
+                "cached_from": {
+                    "cache_entry_id": cache_hit.entry_id,
+                    "stored_at": datetime.fromtimestamp(cache_hit.stored_at, UTC).isoformat(),
+                    **cache_hit.origin,
+                },
+            }
+        elif llm_route is not None:
+            record = llm_route.to_dict()
+        else:
+            return None
+        return json.dumps(record, ensure_ascii=False)
+
+    @staticmethod
+    async def _single_delta(text: str) -> AsyncIterator[str]:
+        yield text
+
+    async def _prepare_prompts(
+        self,
+        request: ChatRequest,
+        db: Session,
+        query_vector: Optional[Any] = None,
+        content: Optional[Tuple[Optional[str], Optional[PromptFragments]]] = None
+    ) -> Tuple[str, List[Dict[str, str]], Optional[str]]:
+        """
+        执行调用LLM之前的步骤1-5，供普通回复和流式回复共用。
+        情感分析、RAG检索、内容加载互不依赖，并发执行。
+
+        Args:
+            query_vector: 语义缓存已算好的问题 embedding，检索时直接使用
+            content: 语义缓存查找时已加载的 (content_title, content_fragments)
+
+        Returns:
+            tuple: (system_prompt, messages, content_title)
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+
+        # 步骤1: 获取或创建用户档案（使用UserStateService；数据库会话不跨线程使用）
+        profile, _ = self.user_state_service.get_or_create_profile(request.participant_id, db)
+        timings["profile"] = (time.perf_counter() - started) * 1000
+
+        # 步骤2-4: 情感分析（CPU线程池）、RAG检索、加载内容（学习内容或测试任务）并发执行
+        default_sentiment = SentimentAnalysisResult(label="neutral", confidence=0.0, details={})
+        fast_sentiment = None
+        if isinstance(self.sentiment_service, SentimentAnalysisService) and not self.sentiment_service.batching:
+            # 缓存/词典能判断的消息不占用线程池
+            fast_sentiment = self.sentiment_service.fast_path(request.user_message)
+        if fast_sentiment is not None:
+            sentiment_stage = self._await_stage(
+                "sentiment", self._constant(fast_sentiment), default=self._degraded_sentiment, timings=timings
+            )
+        elif isinstance(self.sentiment_service, SentimentAnalysisService) and self.sentiment_service.batching:
+            # 微批处理：直接等待批处理线程的 Future（快速层命中时 Future 已完成），不占用线程池
+            sentiment_stage = self._await_stage(
+                "sentiment", asyncio.wrap_future(self.sentiment_service.submit(request.user_message)),
+                default=self._degraded_sentiment, timings=timings
+            )
+        elif self.sentiment_service:
+            job = self._submit_sentiment(request.user_message)
+            if job is not None:
+                sentiment_stage = self._await_stage(
+                    "sentiment", job, default=self._degraded_sentiment, timings=timings
+                )
+            else:
+                # 线程池被仍在运行的超时推理占满：不再排队，直接降级
+                self.stage_metrics.record_fallback("sentiment", "saturated")
+                sentiment_stage = self._constant(self._degraded_sentiment("saturated"))
+        else:
+            sentiment_stage = self._constant(default_sentiment)
+        retrieval_args = (request.user_message,)
+        if query_vector is not None:
+            retrieval_args += (3, query_vector.tolist() if hasattr(query_vector, "tolist") else query_vector)
+        retrieval_stage = (
+            self._run_stage(
+                "retrieval", self.rag_service.retrieve, *retrieval_args,
+                default=[], timings=timings
+            )
+            if self.rag_service else self._constant([])
+        )
+        if content is not None:
+            content_stage = self._constant(content)
+        elif request.mode and request.content_id:
+            content_stage = self._run_stage(
+                "content", self._load_content, request.mode, request.content_id,
+                default=(None, None), timings=timings
+            )
+        else:
+            content_stage = self._constant((None, None))
+        sentiment_result, retrieved_knowledge, (content_title, content_fragments) = await asyncio.gather(
+            sentiment_stage, retrieval_stage, content_stage
+        )
+
+        # 构建用户状态摘要（同时更新用户情感状态）
+        user_state_summary = self._build_user_state_summary(profile, sentiment_result)
+
+        # 步骤5: 生成提示词
+        prompt_started = time.perf_counter()
+        conversation = self._get_conversation_context(request, db)
+
+        retrieved_knowledge_content = [item['content'] for item in retrieved_knowledge if isinstance(item, dict) and 'content' in item]
+        system_prompt, messages = self.prompt_generator.create_prompts(
+            user_state=user_state_summary,
+            retrieved_context=retrieved_knowledge_content,
+            conversation_history=conversation.messages,
+            user_message=request.user_message,
+            code_content=request.code_context,
+            mode=request.mode,
+            content_title=content_title,
+            content_fragments=content_fragments,  # 预先渲染好的内容段落
+            conversation_summary=conversation.summary,
+            summary_version=conversation.summary_version,
+            test_results=request.test_results  # 传递测试结果
+        )
+        timings["prompt"] = (time.perf_counter() - prompt_started) * 1000
+        timings["total"] = (time.perf_counter() - started) * 1000
+        self.stage_metrics.record(timings)
+
+        print(
+            f"INFO: chat stages for {request.participant_id}: "
+            + ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+        )
+        return system_prompt, messages, content_title
+
+    def _get_conversation_context(self, request: ChatRequest, db: Session) -> ConversationContext:
+        """
+        获取对话历史：带 conversation_id 时由服务端重建（滚动摘要 + 之后的消息），忽略客户端上传的历史；
+        否则（旧客户端）使用请求中的 conversation_history
+        """
+        if request.conversation_id:
+            return self.conversation_memory.get_context(db, request.participant_id, request.conversation_id)
+
+        # 将ConversationMessage转换为字典格式
+        conversation_history_dicts = []
+        if request.conversation_history:
+            for msg in request.conversation_history:
+                conversation_history_dicts.append({
+                    'role': msg.role,
+                    'content': msg.content
+                })
+        return ConversationContext(messages=conversation_history_dicts)
+
+    async def _run_stage(
+        self,
+        name: str,
+        func: Callable,
+        *args,
+        default: Any,
+        timings: Dict[str, float],
+        executor: Optional[ThreadPoolExecutor] = None
+    ) -> Any:
+        """
+        在线程池中执行一个同步阶段，超过截止时间或出错时返回默认结果
+
+        Args:
+            name: 阶段名称（对应 stage_timeouts 的键，也用于耗时日志）
+            func: 同步函数
+            default: 超时或失败时的默认结果；可调用时以降级原因（"timeout" / "error"）调用得到默认结果
+            timings: 记录各阶段耗时（毫秒）
+            executor: 线程池，None 表示使用默认线程池
+        """
+        loop = asyncio.get_running_loop()
+        return await self._await_stage(
+            name, loop.run_in_executor(executor, functools.partial(func, *args)),
+            default=default, timings=timings
+        )
+
+    async def _await_stage(
+        self,
+        name: str,
+        awaitable: Any,
+        *,
+        default: Any,
+        timings: Dict[str, float]
+    ) -> Any:
+        """等待一个阶段的结果，超过截止时间或出错时返回默认结果并计入降级统计（参数同 _run_stage）"""
+        started = time.perf_counter()
+        timeout = self.stage_timeouts.get(name)
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {name} 阶段超过 {timeout}s 未完成，使用默认结果")
+            reason = "timeout"
+        except Exception as e:
+            print(f"⚠️ {name} 阶段失败，使用默认结果: {e}")
+            reason = "error"
+        finally:
+            timings[name] = (time.perf_counter() - started) * 1000
+        self.stage_metrics.record_fallback(name, reason)
+        return default(reason) if callable(default) else default
+
+    def _submit_sentiment(self, text: str) -> Optional["asyncio.Future"]:
+        """
+        在情感分析线程池中提交一次推理，返回可等待的 Future。
+        线程无法中断，超时的推理会继续占用线程；已提交未结束的推理达到线程数时返回 None（不再排队）。
+        """
+        with self._sentiment_lock:
+            if self._sentiment_in_flight >= self._sentiment_workers:
+                return None
+            self._sentiment_in_flight += 1
+        try:
+            future = self._sentiment_executor.submit(self.sentiment_service.analyze_sentiment, text)
+        except Exception:
+            self._sentiment_finished(None)
+            raise
+        future.add_done_callback(self._sentiment_finished)
+        return asyncio.wrap_future(future)
+
+    def _sentiment_finished(self, _future: Any):
+        with self._sentiment_lock:
+            self._sentiment_in_flight -= 1
+
+    @staticmethod
+    def _degraded_sentiment(reason: str) -> SentimentAnalysisResult:
+        """情感分析未能按时完成时的中性结果，details 中标记为降级，避免与真实的中性判断混淆"""
+        return SentimentAnalysisResult(
+            label="neutral", confidence=0.0, details={"tier": "fallback", "degraded": True, "reason": reason}
+        )
+
+    @staticmethod
+    async def _constant(value: Any) -> Any:
+        """未启用的阶段直接返回默认结果"""
+        return value
+
+    def _load_content(self, mode: str, content_id: str) -> Tuple[Optional[str], Optional[PromptFragments]]:
+        """
+        加载学习内容或测试任务已渲染好的提示词片段
+
+        Returns:
+            tuple: (content_title, content_fragments)
+        """
+        fragments = self.prompt_fragments.get(content_type_for_mode(mode), content_id)
+        return fragments.title, fragments
+
     @staticmethod
     def _build_user_state_summary(
         profile: Any,
@@ -214,12 +712,14 @@ class DynamicController:
         db: Session,
         background_tasks: Optional[Any] = None,
         system_prompt: Optional[str] = None,
-        content_title: Optional[str] = None
+        content_title: Optional[str] = None,
+        llm_route: Optional[RoutingDecision] = None,
+        cache_hit: Optional[CacheHit] = None
     ):
         """
         根据TDD-I规范，异步记录AI交互。
         1. 在 event_logs 中记录一个 "ai_chat" 事件。
-        2. 在 chat_history 中记录用户和AI的完整消息。
+        2. 在 chat_history 中记录用户和AI的完整消息（AI消息附带回答它的后端与模型；语义缓存命中时记录命中来源）。
         3. 更新用户状态中的提问计数器。
         """
         try:
@@ -237,7 +737,8 @@ class DynamicController:
             user_chat = ChatHistoryCreate(
                 participant_id=request.participant_id,
                 role="user",
-                message=request.user_message
+                message=request.user_message,
+                conversation_id=request.conversation_id
             )
 
             # 准备AI聊天记录
@@ -245,14 +746,26 @@ class DynamicController:
                 participant_id=request.participant_id,
                 role="assistant",
                 message=response.ai_response,
-                raw_prompt_to_llm=system_prompt
+                raw_prompt_to_llm=system_prompt,
+                conversation_id=request.conversation_id,
+                llm_route=self._route_record(llm_route, cache_hit)
             )
 
+            # 同步追加到对话记忆，下一轮不必等待后台写库
+            if request.conversation_id:
+                self.conversation_memory.append(request.participant_id, request.conversation_id, "user", request.user_message)
+                self.conversation_memory.append(request.participant_id, request.conversation_id, "assistant", response.ai_response)
+
             if background_tasks:
                 # 异步执行
                 background_tasks.add_task(crud_event.create_from_behavior, db=db, obj_in=event)
                 background_tasks.add_task(crud_chat_history.create, db=db, obj_in=user_chat)
                 background_tasks.add_task(crud_chat_history.create, db=db, obj_in=ai_chat)
+                # 消息写库之后检查是否需要压缩较早的对话（回复已经发送，不占用请求时间）
+                if self.conversation_summarizer is not None and request.conversation_id:
+                    background_tasks.add_task(
+                        self.conversation_summarizer.maybe_summarize, request.participant_id, request.conversation_id
+                    )
                 print(f"INFO: AI interaction for {request.participant_id} logged asynchronously.")
             else:
                 # 同步执行 (备用)
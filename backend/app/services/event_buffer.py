@@ -0,0 +1,215 @@
+# backend/app/services/event_buffer.py
+"""
+行为事件的写后缓冲（write-behind）
+
+前端每 2 秒防抖上报一次代码编辑、焦点变化、闲置等事件。逐条写入时每个事件都是一次
+add + commit + refresh，SQLite 为每条事件做一次落盘事务。EventWriteBuffer 把事件先放进内存，
+由专用线程攒批后在一个事务里多行插入：
+
+- 最早的待写事件等待满 flush_interval_ms，或待写事件达到 max_batch_size 时写入一批
+- 待写事件达到 max_pending 时，submit 最多阻塞 put_timeout_seconds 等待写入腾出空间（背压），
+  仍然没有空间时抛出 EventBufferFullError，由调用方让前端稍后重试
+- submit_many() 把一组事件整体入队（批量上报接口），空间不足时整组拒绝
+- flush() 等待此前提交的事件全部写完（读取历史事件前调用）；close() 写完剩余事件后停止线程
+- 批量写入失败时逐条重试，只丢弃确实写不进去的事件
+- stats() 提供批大小、写入延迟（p50/p95/max）、队列深度、背压拒绝数等指标
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.services.chat_metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class EventBufferFullError(Exception):
+    """缓冲区已满且在等待时间内没有腾出空间"""
+
+
+class EventWriteBuffer:
+    """把逐条提交的事件攒批后在一个事务中写入"""
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[Any]], Any],
+        flush_interval_ms: float = 250.0,
+        max_batch_size: int = 200,
+        max_pending: int = 10000,
+        put_timeout_seconds: float = 0.5,
+        metrics_window: int = 1024,
+        name: str = "event-writer",
+    ):
+        """
+        Args:
+            write_batch: 在一个事务中写入一批事件的函数（失败时应抛出异常且不写入任何一条）
+            flush_interval_ms: 最早的待写事件最多等待多少毫秒
+            max_batch_size: 每批最多条数（达到时立即写入）
+            max_pending: 待写事件上限，超过时 submit 阻塞（背压）
+            put_timeout_seconds: submit 在缓冲区满时最多等待多少秒
+            metrics_window: 写入延迟和批大小统计保留的最近批次数
+            name: 写入线程名称
+        """
+        if max_batch_size < 1 or max_pending < 1:
+            raise ValueError("max_batch_size and max_pending must be >= 1")
+        self.write_batch = write_batch
+        self.flush_interval_seconds = max(0.0, flush_interval_ms) / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.put_timeout_seconds = put_timeout_seconds
+        self.name = name
+
+        # 待写事件：(序号, 入队时间, 事件)
+        self._pending: Deque[Tuple[int, float, Any]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._flush_waiters = 0
+        self._submitted_seq = 0
+        self._done_seq = 0
+
+        self._flush_ms: Deque[float] = deque(maxlen=metrics_window)
+        self._batch_sizes: Deque[int] = deque(maxlen=metrics_window)
+        self._stats = {"submitted": 0, "written": 0, "failed": 0, "batches": 0, "max_batch": 0, "rejected": 0,
+                       "retried_batches": 0}
+
+    def submit(self, item: Any):
+        """
+        提交一条事件（写入线程在首次提交时启动）
+
+        Raises:
+            EventBufferFullError: 缓冲区已满且在 put_timeout_seconds 内没有腾出空间
+            RuntimeError: 缓冲区已关闭
+        """
+        self.submit_many([item])
+
+    def submit_many(self, items: List[Any]):
+        """
+        一次提交多条事件：要么全部入队且彼此相邻（通常在同一批中写入），要么一条都不入队
+
+        超过 max_pending 的一组事件只在缓冲区为空时入队，不会永远等待。
+
+        Raises:
+            EventBufferFullError: 在 put_timeout_seconds 内没有腾出足够空间
+            RuntimeError: 缓冲区已关闭
+        """
+        if not items:
+            return
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            deadline = time.monotonic() + self.put_timeout_seconds
+            while self._pending and len(self._pending) + len(items) > self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    self._stats["rejected"] += len(items)
+                    raise EventBufferFullError(f"{self.name}: {len(self._pending)} events pending")
+                self._cond.wait(remaining)
+            was_empty = not self._pending
+            now = time.monotonic()
+            for item in items:
+                self._submitted_seq += 1
+                self._pending.append((self._submitted_seq, now, item))
+            self._stats["submitted"] += len(items)
+            if was_empty or len(self._pending) >= self.max_batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """等待此前提交的事件全部处理完（写入或确认失败），返回是否在超时前完成"""
+        with self._cond:
+            target = self._submitted_seq
+            if self._done_seq >= target:
+                return True
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._done_seq >= target, timeout)
+            finally:
+                self._flush_waiters -= 1
+
+    def _ready(self) -> bool:
+        if not self._pending:
+            return self._closed
+        if self._closed or self._flush_waiters or len(self._pending) >= self.max_batch_size:
+            return True
+        return time.monotonic() - self._pending[0][1] >= self.flush_interval_seconds
+
+    def _next_batch(self) -> Optional[List[Tuple[int, float, Any]]]:
+        """等到可以写入一批；缓冲区已关闭且没有待写事件时返回 None"""
+        with self._cond:
+            while not self._ready():
+                timeout = None
+                if self._pending:
+                    timeout = max(0.0, self._pending[0][1] + self.flush_interval_seconds - time.monotonic())
+                self._cond.wait(timeout)
+            if not self._pending:
+                return None
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+            # 唤醒因缓冲区满而等待的提交方
+            self._cond.notify_all()
+            return batch
+
+    def _write(self, items: List[Any]) -> Tuple[int, int]:
+        """写入一批，失败时逐条重试；返回 (成功条数, 失败条数)"""
+        try:
+            self.write_batch(items)
+            return len(items), 0
+        except Exception as e:
+            logger.warning(f"{self.name}: 批量写入 {len(items)} 条事件失败，逐条重试: {e}")
+        with self._cond:
+            self._stats["retried_batches"] += 1
+        written = 0
+        for item in items:
+            try:
+                self.write_batch([item])
+                written += 1
+            except Exception as e:
+                logger.error(f"{self.name}: 丢弃无法写入的事件: {e}")
+        return written, len(items) - written
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            written, failed = self._write([item for _, _, item in batch])
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._cond:
+                self._done_seq = batch[-1][0]
+                self._stats["batches"] += 1
+                self._stats["written"] += written
+                self._stats["failed"] += failed
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                self._flush_ms.append(elapsed_ms)
+                self._batch_sizes.append(len(batch))
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending)
+            stats["oldest_pending_ms"] = (
+                round((time.monotonic() - self._pending[0][1]) * 1000, 1) if self._pending else 0.0
+            )
+            flush_ms = list(self._flush_ms)
+            batch_sizes = list(self._batch_sizes)
+        stats["avg_batch"] = round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else 0.0
+        stats["flush_p50_ms"] = percentile(flush_ms, 0.50)
+        stats["flush_p95_ms"] = percentile(flush_ms, 0.95)
+        stats["flush_max_ms"] = round(max(flush_ms), 1) if flush_ms else None
+        return stats
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """停止接收新事件，写完剩余事件后停止写入线程"""
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
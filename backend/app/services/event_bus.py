@@ -0,0 +1,219 @@
+# backend/app/services/event_bus.py
+"""
+按参与者保序的进程内事件总线
+
+/behavior/log 原先在请求线程中同步解释事件（提交事件还要读取历史做挫败检测），解释耗时全部算在请求上。
+OrderedEventBus 让端点只做校验和入队，由若干解释线程异步处理：
+
+- 每个 key（参与者）一个 FIFO 队列：同一参与者的事件严格按发布顺序、一次一条地处理，
+  不同参与者的事件由多个线程并行处理；每个线程处理完一条后把该参与者排到就绪队列末尾（轮转，避免饿死）
+- 待处理事件达到 max_pending 时，publish 最多阻塞 put_timeout_seconds，仍然没有空间时抛出 EventBusFullError
+- drain() 等待此前发布的事件全部处理完；close() 处理完剩余事件后停止线程
+- 处理函数抛出的异常只记录日志，不影响同一参与者后续事件
+- stats() 提供队列积压、排队延迟（发布到开始处理，p50/p95/max）以及按事件类型统计的处理耗时
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from app.services.chat_metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class EventBusFullError(Exception):
+    """待处理事件已满且在等待时间内没有腾出空间"""
+
+
+class OrderedEventBus:
+    """按 key 分组保序、跨 key 并行地把事件交给处理函数"""
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Any],
+        key: Callable[[Any], Hashable],
+        kind: Optional[Callable[[Any], str]] = None,
+        workers: int = 4,
+        max_pending: int = 10000,
+        put_timeout_seconds: float = 0.5,
+        metrics_window: int = 1024,
+        name: str = "event-bus",
+    ):
+        """
+        Args:
+            handler: 处理单条事件的函数（在解释线程中调用）
+            key: 返回事件分组键的函数，同一分组内的事件按发布顺序处理
+            kind: 返回事件类别的函数，用于按类别统计处理耗时（默认统一记为 "event"）
+            workers: 解释线程数
+            max_pending: 待处理事件上限，超过时 publish 阻塞（背压）
+            put_timeout_seconds: publish 在总线已满时最多等待多少秒
+            metrics_window: 排队延迟和处理耗时统计保留的最近事件数
+            name: 线程名称前缀
+        """
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be >= 1")
+        self.handler = handler
+        self.key = key
+        self.kind = kind or (lambda item: "event")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.put_timeout_seconds = put_timeout_seconds
+        self.metrics_window = metrics_window
+        self.name = name
+
+        # 每个 key 的待处理事件：(发布时间, 事件)；_ready 为有待处理事件且没有线程在处理的 key
+        self._queues: Dict[Hashable, Deque[Tuple[float, Any]]] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._busy: Set[Hashable] = set()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+        self._lag_ms: Deque[float] = deque(maxlen=metrics_window)
+        self._handler_ms: Dict[str, Deque[float]] = {}
+        self._handler_counts: Dict[str, int] = {}
+        self._stats = {"published": 0, "handled": 0, "failed": 0, "rejected": 0}
+
+    def publish(self, item: Any):
+        """
+        发布一条事件（解释线程在首次发布时启动）
+
+        Raises:
+            EventBusFullError: 总线已满且在 put_timeout_seconds 内没有腾出空间
+            RuntimeError: 总线已关闭
+        """
+        self.publish_many([item])
+
+    def publish_many(self, items: List[Any]):
+        """
+        一次发布多条事件：要么全部入队，要么一条都不入队；同一 key 的事件按列表顺序处理
+
+        超过 max_pending 的一组事件只在总线为空时入队，不会永远等待。
+
+        Raises:
+            EventBusFullError: 在 put_timeout_seconds 内没有腾出足够空间
+            RuntimeError: 总线已关闭
+        """
+        if not items:
+            return
+        keyed = [(self.key(item), item) for item in items]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if not self._threads:
+                self._start_workers()
+            deadline = time.monotonic() + self.put_timeout_seconds
+            while self._pending and self._pending + len(items) > self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    self._stats["rejected"] += len(items)
+                    raise EventBusFullError(f"{self.name}: {self._pending} events pending")
+                self._cond.wait(remaining)
+            now = time.monotonic()
+            for key, item in keyed:
+                queue = self._queues.get(key)
+                if queue is None:
+                    queue = self._queues[key] = deque()
+                if not queue and key not in self._busy:
+                    self._ready.append(key)
+                queue.append((now, item))
+            self._pending += len(items)
+            self._stats["published"] += len(items)
+            self._cond.notify_all()
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next(self) -> Optional[Tuple[Hashable, float, Any]]:
+        """取出下一条可处理的事件；总线已关闭且没有待处理事件时返回 None"""
+        with self._cond:
+            while not self._ready:
+                if self._closed and self._pending == 0:
+                    return None
+                self._cond.wait()
+            key = self._ready.popleft()
+            self._busy.add(key)
+            published_at, item = self._queues[key].popleft()
+            self._pending -= 1
+            # 唤醒因总线已满而等待的发布方
+            self._cond.notify_all()
+            return key, published_at, item
+
+    def _run(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            key, published_at, item = task
+            started = time.monotonic()
+            failed = False
+            try:
+                self.handler(item)
+            except Exception as e:
+                failed = True
+                logger.error(f"{self.name}: 处理事件失败（{key}）: {e}", exc_info=True)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            try:
+                kind = str(self.kind(item))
+            except Exception:
+                kind = "unknown"
+            with self._cond:
+                self._busy.discard(key)
+                if self._queues[key]:
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                self._stats["failed" if failed else "handled"] += 1
+                self._lag_ms.append((started - published_at) * 1000)
+                if kind not in self._handler_ms:
+                    self._handler_ms[kind] = deque(maxlen=self.metrics_window)
+                    self._handler_counts[kind] = 0
+                self._handler_ms[kind].append(elapsed_ms)
+                self._handler_counts[kind] += 1
+                self._cond.notify_all()
+
+    def drain(self, timeout: Optional[float] = 5.0) -> bool:
+        """等待当前所有待处理和处理中的事件处理完，返回是否在超时前完成"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0 and not self._busy, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._pending
+            stats["in_flight"] = len(self._busy)
+            stats["keys_pending"] = len(self._queues)
+            heads = [queue[0][0] for queue in self._queues.values() if queue]
+            stats["oldest_pending_ms"] = round((time.monotonic() - min(heads)) * 1000, 1) if heads else 0.0
+            lag_ms = list(self._lag_ms)
+            handler_ms = {kind: list(values) for kind, values in self._handler_ms.items()}
+            handler_counts = dict(self._handler_counts)
+        stats["lag_p50_ms"] = percentile(lag_ms, 0.50)
+        stats["lag_p95_ms"] = percentile(lag_ms, 0.95)
+        stats["lag_max_ms"] = round(max(lag_ms), 1) if lag_ms else None
+        stats["handlers"] = {
+            kind: {
+                "count": handler_counts[kind],
+                "p50_ms": percentile(values, 0.50),
+                "p95_ms": percentile(values, 0.95),
+                "max_ms": round(max(values), 1),
+            }
+            for kind, values in sorted(handler_ms.items())
+        }
+        return stats
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """停止接收新事件，处理完剩余事件后停止解释线程"""
+        with self._cond:
+            self._closed = True
+            threads = list(self._threads)
+            self._cond.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
@@ -1,14 +1,24 @@
 # backend/app/services/llm_gateway.py
 import os
-import asyncio
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from app.core.config import settings
+from app.services.llm_router import LLMBackend, LLMRouter, set_routing_decision
+from app.services.llm_scheduler import (
+    AdmissionScheduler,
+    CircuitBreaker,
+    FALLBACK_RESPONSE_PREFIX,
+    LLMAdmissionError,
+    LLMQueueTimeoutError,
+    PRIORITY_LEARNING,
+)
 
 
 class LLMGateway:
     """LLM网关服务"""
-    
+
     def __init__(self):
         # 从环境变量或配置中获取API配置
         self.api_key = os.getenv('TUTOR_OPENAI_API_KEY', settings.TUTOR_OPENAI_API_KEY)
@@ -17,62 +27,227 @@ class LLMGateway:
 
         self.max_tokens = int(os.getenv('LLM_MAX_TOKENS', settings.LLM_MAX_TOKENS))
         self.temperature = float(os.getenv('LLM_TEMPERATURE', settings.LLM_TEMPERATURE))
-        
-        # 初始化OpenAI客户端（兼容魔搭API）
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_base
+
+        # 原生异步客户端（兼容魔搭API）：所有请求共享一个 httpx 连接池，
+        # 连接保持 keep-alive 复用；等待响应时不占用线程
+        self.timeout = httpx.Timeout(
+            connect=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+            read=settings.LLM_READ_TIMEOUT_SECONDS,
+            write=settings.LLM_WRITE_TIMEOUT_SECONDS,
+            pool=settings.LLM_POOL_TIMEOUT_SECONDS
+        )
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=self.timeout
+        )
+
+        # 多后端路由：未配置 LLM_BACKENDS 时只有 TUTOR_OPENAI_* 指定的一个后端。
+        # 每个后端有独立的熔断器和延迟统计，所有后端共享上面的连接池
+        self.router = LLMRouter(
+            backends=self._build_backends(),
+            hedge_delay_seconds=settings.LLM_HEDGE_DELAY_SECONDS,
+            fallback_load_threshold=settings.LLM_FALLBACK_LOAD_THRESHOLD,
+            fallback_min_priority=settings.LLM_FALLBACK_MIN_PRIORITY
+        )
+        self.client = self.router.backends[0].client
+
+        # 准入控制：全局在途上限 + 优先级队列（排队有截止时间），
+        # 超过上限的请求在这里按优先级排队，而不是占用线程；熔断按后端进行
+        self.max_concurrent_requests = settings.LLM_MAX_CONCURRENT_REQUESTS
+        self.scheduler = AdmissionScheduler(
+            max_in_flight=self.max_concurrent_requests,
+            queue_timeout_seconds=settings.LLM_QUEUE_TIMEOUT_SECONDS
         )
-    
+
+    def _build_backends(self) -> List[LLMBackend]:
+        configs = settings.LLM_BACKENDS or [
+            {"name": "primary", "api_base": self.api_base, "api_key": self.api_key, "model": self.model}
+        ]
+        backends = []
+        for config in configs:
+            client = AsyncOpenAI(
+                api_key=config.get("api_key") or self.api_key,
+                base_url=config.get("api_base") or self.api_base,
+                timeout=self.timeout,
+                max_retries=settings.LLM_MAX_RETRIES,
+                http_client=self.http_client
+            )
+            backends.append(LLMBackend(
+                name=config.get("name") or config.get("model") or self.model,
+                model=config.get("model") or self.model,
+                client=client,
+                fallback=bool(config.get("fallback", False)),
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                    recovery_seconds=settings.LLM_CIRCUIT_RECOVERY_SECONDS
+                )
+            ))
+        return backends
+
+    def _load(self) -> float:
+        """全局负载：（在途 + 排队）/ 并发上限"""
+        return (self.scheduler.in_flight + self.scheduler.queue_depth) / max(self.max_concurrent_requests, 1)
+
     async def get_completion(
-        self, 
-        system_prompt: str, 
+        self,
+        system_prompt: str,
         messages: List[Dict[str, str]],
         max_tokens: Optional[int] = None,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        priority: int = PRIORITY_LEARNING
     ) -> str:
         """
         获取LLM完成结果
-        
+
         Args:
             system_prompt: 系统提示词
             messages: 消息列表
             max_tokens: 最大token数
             temperature: 温度参数
-            
+            priority: 排队优先级（数值越小越先），见 app.services.llm_scheduler
+
         Returns:
-            str: LLM生成的回复
+            str: LLM生成的回复（由哪个后端回答见 llm_router.last_routing_decision()）
         """
+        set_routing_decision(None)
         try:
             # 构建完整的消息列表
             full_messages = [{"role": "system", "content": system_prompt}] + messages
-            
+
             # 使用传入的参数或默认值
             max_tokens = max_tokens or self.max_tokens
             temperature = temperature or self.temperature
-            
-            # 调用LLM API - OpenAI客户端是同步的
-            # 使用 asyncio.to_thread 来在异步环境中运行同步代码
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.model,
-                messages=full_messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-            
+
+            # 调用LLM API
+            async with self.scheduler.admit(priority):
+                started = time.monotonic()
+                try:
+                    response, decision = await self.router.complete(
+                        priority,
+                        self._load(),
+                        messages=full_messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                except LLMAdmissionError:
+                    raise
+                except Exception:
+                    self.scheduler.record_upstream(time.monotonic() - started, ok=False)
+                    raise
+                self.scheduler.record_upstream(time.monotonic() - started, ok=True)
+            set_routing_decision(decision)
+
             # 提取回复内容
             if response.choices and len(response.choices) > 0:
                 return response.choices[0].message.content
             else:
-                return "I apologize, but I couldn't generate a response at this time."
-                
+                return f"{FALLBACK_RESPONSE_PREFIX}I couldn't generate a response at this time."
+
+        except LLMAdmissionError as e:
+            # 熔断或排队超时：快速失败，不调用上游
+            print(f"WARNING: LLM request not admitted: {e}")
+            return self._unavailable_response(e)
+
         except Exception as e:
             print(f"Error calling LLM API: {e}")
-            return f"I apologize, but I encountered an error: {str(e)}"
-    
-    
+            return f"{FALLBACK_RESPONSE_PREFIX}I encountered an error: {str(e)}"
+
+    async def stream_completion(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        priority: int = PRIORITY_LEARNING
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式获取LLM完成结果，逐段产出增量文本
+
+        参数与 get_completion 相同。出错时与 get_completion 一样产出一段致歉文本，
+        调用方无需区分成功与失败即可拼出完整回复。
+
+        Yields:
+            str: 增量文本片段
+        """
+        set_routing_decision(None)
+        full_messages = [{"role": "system", "content": system_prompt}] + messages
+        max_tokens = max_tokens or self.max_tokens
+        temperature = temperature or self.temperature
+
+        try:
+            # 整个流期间都占用一个并发名额
+            async with self.scheduler.admit(priority):
+                started = time.monotonic()
+                stream = None
+                backend = None
+                opened_seconds = 0.0
+                recorded = False
+                try:
+                    stream, backend, decision = await self.router.open_stream(
+                        priority,
+                        self._load(),
+                        messages=full_messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                    # 后端的延迟统计使用建立流的耗时（与回复长度无关）
+                    opened_seconds = time.monotonic() - started
+
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            yield delta
+                    backend.record(opened_seconds, ok=True)
+                    self.scheduler.record_upstream(time.monotonic() - started, ok=True)
+                    recorded = True
+                    set_routing_decision(decision)
+
+                except LLMAdmissionError:
+                    raise
+                except Exception as e:
+                    if backend is not None:
+                        backend.record(opened_seconds, ok=False)
+                    self.scheduler.record_upstream(time.monotonic() - started, ok=False)
+                    recorded = True
+                    print(f"Error streaming from LLM API: {e}")
+                    yield f"{FALLBACK_RESPONSE_PREFIX}I encountered an error: {str(e)}"
+                finally:
+                    if not recorded:
+                        # 客户端中途断开（GeneratorExit / CancelledError）或没有可用后端：没有得到上游结果，
+                        # 归还后端熔断器和调度器熔断器的探测机会，否则半开状态会一直等待这次探测
+                        if backend is not None:
+                            backend.release()
+                        if self.scheduler.breaker is not None:
+                            self.scheduler.breaker.release_probe()
+                    # 客户端中途断开时关闭上游连接，不再继续生成
+                    if stream is not None:
+                        await stream.close()
+
+        except LLMAdmissionError as e:
+            print(f"WARNING: LLM stream not admitted: {e}")
+            yield self._unavailable_response(e)
+
+    @staticmethod
+    def _unavailable_response(error: LLMAdmissionError) -> str:
+        if isinstance(error, LLMQueueTimeoutError):
+            return f"{FALLBACK_RESPONSE_PREFIX}the tutor is very busy right now. Please try again in a moment."
+        return f"{FALLBACK_RESPONSE_PREFIX}the tutor is temporarily unavailable. Please try again in a moment."
 
+    def status(self) -> Dict[str, Any]:
+        """当前并发、队列与上游延迟情况，用于监控"""
+        return {
+            "model": self.model,
+            "max_concurrent_requests": self.max_concurrent_requests,
+            **self.scheduler.stats(),
+            "routing": self.router.stats(),
+        }
 
-# 创建单例实例
-llm_gateway = LLMGateway()
+    async def aclose(self):
+        """关闭共享连接池（应用关闭时调用）"""
+        await self.client.close()
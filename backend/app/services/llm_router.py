@@ -0,0 +1,307 @@
+# backend/app/services/llm_router.py
+"""
+多后端 LLM 路由
+
+LLMGateway 可以配置多个 OpenAI 兼容后端（LLM_BACKENDS），路由层负责选择由谁回答：
+
+- 每个后端记录滚动延迟（EWMA）和最近 window 次调用的错误率，并有独立的熔断器。
+- 请求发往当前最快的健康后端（错误率越高，有效延迟越大；未调用过的后端优先试探）。
+- 对冲：请求在 hedge_delay_seconds 内没有返回时，再向下一个后端发送同一请求，
+  先返回者胜出，另一个被取消。流式请求不对冲（已经开始输出的流无法切换）。
+- 降级：全局负载超过阈值时，低优先级请求优先发往标记为 fallback 的较小模型。
+- 失败转移：后端出错时依次尝试下一个候选后端。
+
+每次调用的路由决定（后端、模型、尝试顺序、是否对冲）保存在当前协程上下文中，
+调用方通过 last_routing_decision() 读取并随 chat_history 的 AI 消息一起记录。
+"""
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.services.llm_scheduler import (
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    LLMUnavailableError,
+    PRIORITY_LEARNING,
+)
+
+ROUTE_FASTEST = "fastest"
+ROUTE_FALLBACK_UNDER_LOAD = "fallback_under_load"
+ROUTE_HEDGE = "hedge"
+ROUTE_FAILOVER = "failover"
+
+
+@dataclass
+class RoutingDecision:
+    """一次 LLM 调用的路由结果"""
+    backend: str
+    model: str
+    reason: str
+    attempts: List[str] = field(default_factory=list)
+    hedged: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+_last_decision: ContextVar[Optional[RoutingDecision]] = ContextVar("llm_routing_decision", default=None)
+
+
+def last_routing_decision() -> Optional[RoutingDecision]:
+    """当前协程上下文中最近一次 LLM 调用的路由决定（没有调用或调用失败时为 None）"""
+    return _last_decision.get()
+
+
+def set_routing_decision(decision: Optional[RoutingDecision]):
+    _last_decision.set(decision)
+
+
+class LLMBackend:
+    """一个 OpenAI 兼容后端及其健康统计"""
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        client,
+        fallback: bool = False,
+        breaker: Optional[CircuitBreaker] = None,
+        window: int = 50,
+        ewma_alpha: float = 0.3,
+    ):
+        """
+        Args:
+            name: 后端名称（记录在路由决定中）
+            model: 请求使用的模型名
+            client: AsyncOpenAI 客户端
+            fallback: 是否为降级用的较小模型（只在负载高时承接低优先级请求，或作为失败转移的最后选择）
+            breaker: 该后端的熔断器
+            window: 错误率统计的最近调用数
+            ewma_alpha: 延迟 EWMA 的平滑系数
+        """
+        self.name = name
+        self.model = model
+        self.client = client
+        self.fallback = fallback
+        self.breaker = breaker
+        self.ewma_alpha = ewma_alpha
+        self.latency_ewma: Optional[float] = None
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._stats = {"requests": 0, "errors": 0}
+
+    @property
+    def available(self) -> bool:
+        """熔断器未打开（半开状态可以接收探测请求）"""
+        return self.breaker is None or self.breaker.state != CIRCUIT_OPEN
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def effective_latency(self) -> float:
+        """路由排序用的有效延迟：未调用过的后端为 0（优先试探），错误率越高越靠后"""
+        if self.latency_ewma is None:
+            return 0.0
+        return self.latency_ewma / max(1.0 - self.error_rate, 0.1)
+
+    def acquire(self) -> bool:
+        return self.breaker is None or self.breaker.allow()
+
+    def release(self):
+        """调用被取消、没有结果时归还熔断器的探测机会"""
+        if self.breaker is not None:
+            self.breaker.release_probe()
+
+    def record(self, latency_seconds: float, ok: bool):
+        self._stats["requests"] += 1
+        self._outcomes.append(ok)
+        if ok:
+            self.latency_ewma = latency_seconds if self.latency_ewma is None else (
+                self.ewma_alpha * latency_seconds + (1 - self.ewma_alpha) * self.latency_ewma
+            )
+            if self.breaker is not None:
+                self.breaker.record_success()
+        else:
+            self._stats["errors"] += 1
+            if self.breaker is not None:
+                self.breaker.record_failure()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "model": self.model,
+            "fallback": self.fallback,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "circuit": self.breaker.stats() if self.breaker is not None else None,
+        }
+
+
+class LLMRouter:
+    """按延迟和健康状况在多个后端之间路由请求"""
+
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        hedge_delay_seconds: float = 0.0,
+        fallback_load_threshold: float = 0.8,
+        fallback_min_priority: int = PRIORITY_LEARNING,
+    ):
+        """
+        Args:
+            backends: 后端列表（至少一个）
+            hedge_delay_seconds: 请求多久未返回时向下一个后端对冲，0 表示不对冲
+            fallback_load_threshold: 全局负载（在途 + 排队）/ 上限 达到该比例时启用降级
+            fallback_min_priority: 优先级数值不小于该值的请求在高负载时发往 fallback 后端
+        """
+        if not backends:
+            raise ValueError("LLMRouter requires at least one backend")
+        self.backends = backends
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.fallback_load_threshold = fallback_load_threshold
+        self.fallback_min_priority = fallback_min_priority
+        self._stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0, "fallback_under_load": 0}
+
+    def candidates(self, priority: int, load: float) -> Tuple[List[LLMBackend], str]:
+        """按尝试顺序排列的可用后端，以及首选后端的选择原因"""
+        primaries = [b for b in self.backends if not b.fallback]
+        fallbacks = [b for b in self.backends if b.fallback]
+        under_load = bool(fallbacks) and load >= self.fallback_load_threshold and priority >= self.fallback_min_priority
+        preferred, rest = (fallbacks, primaries) if under_load else (primaries, fallbacks)
+        ordered = sorted(preferred, key=LLMBackend.effective_latency) + sorted(rest, key=LLMBackend.effective_latency)
+        return [b for b in ordered if b.available], ROUTE_FALLBACK_UNDER_LOAD if under_load else ROUTE_FASTEST
+
+    async def complete(self, priority: int, load: float, **request) -> Tuple[Any, RoutingDecision]:
+        """
+        非流式调用：选择后端、必要时对冲和失败转移
+
+        Raises:
+            LLMUnavailableError: 所有后端都处于熔断状态
+            Exception: 所有候选后端都失败时，抛出最后一个错误
+        """
+        candidates, reason = self.candidates(priority, load)
+        attempts: List[str] = []
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+
+        def launch() -> bool:
+            while candidates:
+                backend = candidates.pop(0)
+                if not backend.acquire():
+                    continue
+                attempts.append(backend.name)
+                pending[asyncio.create_task(self._call(backend, request))] = backend
+                return True
+            return False
+
+        if not launch():
+            raise LLMUnavailableError("All LLM backends are unhealthy (circuits open)")
+        if reason == ROUTE_FALLBACK_UNDER_LOAD:
+            self._stats["fallback_under_load"] += 1
+
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                can_hedge = self.hedge_delay_seconds > 0 and not hedged and candidates
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay_seconds if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首选后端太慢：向下一个后端对冲
+                    hedged = True
+                    if launch():
+                        self._stats["hedged"] += 1
+                    continue
+
+                winner = None
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = (task, backend)
+
+                if winner is not None:
+                    task, backend = winner
+                    if backend.name != attempts[0]:
+                        reason = ROUTE_HEDGE if hedged else ROUTE_FAILOVER
+                        self._stats["hedge_wins" if hedged else "failovers"] += 1
+                    decision = RoutingDecision(
+                        backend=backend.name, model=backend.model, reason=reason,
+                        attempts=list(attempts), hedged=hedged
+                    )
+                    return task.result(), decision
+
+                if not pending:
+                    # 失败转移到下一个后端
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def open_stream(self, priority: int, load: float, **request) -> Tuple[Any, LLMBackend, RoutingDecision]:
+        """
+        流式调用：按顺序尝试后端直到成功建立流（不对冲）。
+        流结束后调用方需要用 backend.record() 记录结果。
+
+        Returns:
+            tuple: (stream, backend, decision)
+        """
+        candidates, reason = self.candidates(priority, load)
+        attempts: List[str] = []
+        last_error: Optional[BaseException] = None
+        for backend in candidates:
+            if not backend.acquire():
+                continue
+            attempts.append(backend.name)
+            started = time.monotonic()
+            try:
+                stream = await backend.client.chat.completions.create(model=backend.model, stream=True, **request)
+            except asyncio.CancelledError:
+                backend.release()
+                raise
+            except Exception as e:
+                backend.record(time.monotonic() - started, ok=False)
+                last_error = e
+                continue
+            if len(attempts) > 1:
+                reason = ROUTE_FAILOVER
+                self._stats["failovers"] += 1
+            elif reason == ROUTE_FALLBACK_UNDER_LOAD:
+                self._stats["fallback_under_load"] += 1
+            return stream, backend, RoutingDecision(backend=backend.name, model=backend.model, reason=reason, attempts=attempts)
+
+        if last_error is None:
+            raise LLMUnavailableError("All LLM backends are unhealthy (circuits open)")
+        raise last_error
+
+    @staticmethod
+    async def _call(backend: LLMBackend, request: Dict[str, Any]):
+        started = time.monotonic()
+        try:
+            response = await backend.client.chat.completions.create(model=backend.model, **request)
+        except asyncio.CancelledError:
+            # 对冲中落败被取消：不计入错误
+            backend.release()
+            raise
+        except Exception:
+            backend.record(time.monotonic() - started, ok=False)
+            raise
+        backend.record(time.monotonic() - started, ok=True)
+        return response
+
+    @property
+    def circuit_states(self) -> Dict[str, str]:
+        return {b.name: b.breaker.state if b.breaker is not None else "closed" for b in self.backends}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "backends": {b.name: b.stats() for b in self.backends}}
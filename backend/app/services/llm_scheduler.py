@@ -0,0 +1,246 @@
+# backend/app/services/llm_scheduler.py
+"""
+LLM 网关的准入控制
+
+上游模型变慢时，请求不应无限排队，错误也不应每次都等到超时才发现：
+
+- AdmissionScheduler：全局在途请求上限 + 优先级队列。名额用完时请求按优先级
+  （数值越小越先）和到达顺序排队，测试模式的提示排在学习模式的闲聊之前，
+  后台摘要排在最后。排队超过 queue_timeout_seconds 的请求直接放弃（LLMQueueTimeoutError）。
+- CircuitBreaker：连续失败达到阈值后熔断（open），recovery_seconds 内的请求直接失败
+  （LLMUnavailableError），不再占用连接等待超时；之后放行一个探测请求（half_open），
+  成功则恢复（closed），失败则继续熔断。
+- 指标：队列深度、在途数、排队等待时间与上游延迟的 p50/p95（最近 metrics_window 个样本）。
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.services.chat_metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先获得名额
+PRIORITY_TEST_HINT = 0
+PRIORITY_LEARNING = 1
+PRIORITY_BACKGROUND = 2
+
+# 调用失败、未被准入或没有结果时 LLMGateway 返回的兜底回复前缀
+# （调用方据此判断是否为真实回答，例如不缓存兜底回复；定义在这里，判断时无需导入 openai）
+FALLBACK_RESPONSE_PREFIX = "I apologize, but "
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class LLMAdmissionError(Exception):
+    """请求未被准入（未调用上游）的错误基类"""
+
+
+class LLMUnavailableError(LLMAdmissionError):
+    """熔断器打开，上游被判定为不健康"""
+
+
+class LLMQueueTimeoutError(LLMAdmissionError):
+    """排队等待超过截止时间"""
+
+
+def priority_for_mode(mode: Optional[str]) -> int:
+    """按聊天模式确定优先级：测试模式的提示优先"""
+    return PRIORITY_TEST_HINT if mode == "test" else PRIORITY_LEARNING
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后熔断，0 表示不熔断
+            recovery_seconds: 熔断后多久放行一个探测请求
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._state = CIRCUIT_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+            return CIRCUIT_HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """是否放行请求；半开状态下同时只放行一个探测请求"""
+        state = self.state
+        if state == CIRCUIT_CLOSED:
+            return True
+        if state == CIRCUIT_HALF_OPEN and not self._probe_in_flight:
+            self._state = CIRCUIT_HALF_OPEN
+            self._probe_in_flight = True
+            return True
+        self._stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        if self._state != CIRCUIT_CLOSED:
+            logger.info("CircuitBreaker: 上游恢复，熔断关闭")
+        self._state = CIRCUIT_CLOSED
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        self._probe_in_flight = False
+        if self._state == CIRCUIT_HALF_OPEN:
+            # 探测失败：继续熔断
+            self._state = CIRCUIT_OPEN
+            self._opened_at = time.monotonic()
+        elif self._state == CIRCUIT_CLOSED and 0 < self.failure_threshold <= self._consecutive_failures:
+            self._state = CIRCUIT_OPEN
+            self._opened_at = time.monotonic()
+            self._stats["opened"] += 1
+            logger.warning(f"CircuitBreaker: 连续失败 {self._consecutive_failures} 次，熔断 {self.recovery_seconds}s")
+
+    def release_probe(self):
+        """探测请求没有得到上游结果（例如被取消）时归还探测机会"""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "state": self.state, "consecutive_failures": self._consecutive_failures}
+
+
+class AdmissionScheduler:
+    """全局在途上限 + 优先级队列 + 熔断的准入控制"""
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        queue_timeout_seconds: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None,
+        metrics_window: int = 512,
+    ):
+        """
+        Args:
+            max_in_flight: 同时调用上游的请求上限
+            queue_timeout_seconds: 排队等待的截止时间，超时的请求放弃调用上游
+            breaker: 熔断器，None 表示不熔断
+            metrics_window: 等待时间与延迟分位数使用的最近样本数
+        """
+        self.max_in_flight = max_in_flight
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.breaker = breaker
+        self._in_flight = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wait_ms: Deque[float] = deque(maxlen=metrics_window)
+        self._upstream_ms: Deque[float] = deque(maxlen=metrics_window)
+        self._stats = {"admitted": 0, "queued": 0, "queue_timeouts": 0, "circuit_rejected": 0,
+                       "upstream_ok": 0, "upstream_errors": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, waiter in self._queue if not waiter.done())
+
+    @asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_LEARNING):
+        """
+        获取一个上游调用名额，退出时释放
+
+        Raises:
+            LLMUnavailableError: 熔断器打开
+            LLMQueueTimeoutError: 排队超过 queue_timeout_seconds
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            self._stats["circuit_rejected"] += 1
+            raise LLMUnavailableError("LLM upstream is unhealthy (circuit open)")
+
+        started = time.monotonic()
+        try:
+            if self._in_flight < self.max_in_flight and self.queue_depth == 0:
+                self._in_flight += 1
+            else:
+                await self._wait_for_slot(priority)
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.release_probe()
+            raise
+
+        self._stats["admitted"] += 1
+        self._wait_ms.append((time.monotonic() - started) * 1000)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._wake_next()
+
+    async def _wait_for_slot(self, priority: int):
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        self._stats["queued"] += 1
+        # 队列中可能只剩已放弃的等待者，此时立即获得名额
+        self._wake_next()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 超时的同时刚好被唤醒：名额已经转交给本请求，照常执行
+                return
+            waiter.cancel()
+            self._stats["queue_timeouts"] += 1
+            raise LLMQueueTimeoutError(f"Waited more than {self.queue_timeout_seconds}s for an LLM slot")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 已获得名额但调用方被取消：把名额交给下一个
+                self._in_flight -= 1
+                self._wake_next()
+            else:
+                waiter.cancel()
+            raise
+
+    def _wake_next(self):
+        # 有空闲名额时按优先级唤醒等待者，已放弃（超时或取消）的等待者跳过
+        while self._queue and self._in_flight < self.max_in_flight:
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.done():
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def record_upstream(self, latency_seconds: float, ok: bool):
+        """记录一次上游调用的延迟与结果（同时更新熔断器）"""
+        self._upstream_ms.append(latency_seconds * 1000)
+        if ok:
+            self._stats["upstream_ok"] += 1
+            if self.breaker is not None:
+                self.breaker.record_success()
+        else:
+            self._stats["upstream_errors"] += 1
+            if self.breaker is not None:
+                self.breaker.record_failure()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "wait_ms_p50": percentile(self._wait_ms, 0.5),
+            "wait_ms_p95": percentile(self._wait_ms, 0.95),
+            "upstream_ms_p50": percentile(self._upstream_ms, 0.5),
+            "upstream_ms_p95": percentile(self._upstream_ms, 0.95),
+            "circuit": self.breaker.stats() if self.breaker is not None else None,
+        }
@@ -0,0 +1,140 @@
+# backend/app/services/micro_batcher.py
+"""
+动态微批处理执行器
+
+并发到达的推理请求先进入队列，专用工作线程取到第一条后最多再等待 max_wait_ms 毫秒
+（或凑满 max_batch_size 条），把这一批作为一次调用交给 infer_batch。每个调用方立即拿到一个
+concurrent.futures.Future，结果按提交顺序一一对应。
+
+模型推理在单个工作线程中串行执行，线程数固定（由 thread_init 设置，如 torch.set_num_threads），
+并发越高每批越大，吞吐量随并发增长而不是逐条排队。
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """把并发的单条请求合并为批量调用"""
+
+    def __init__(
+        self,
+        infer_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        thread_init: Optional[Callable[[], None]] = None,
+        name: str = "micro-batcher",
+    ):
+        """
+        Args:
+            infer_batch: 批量推理函数，输入列表，返回等长的结果列表
+            max_batch_size: 每批最多条数
+            max_wait_ms: 取到第一条后最多等待多少毫秒凑批
+            thread_init: 工作线程启动时执行一次（设置推理线程数等）
+            name: 工作线程名称
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.infer_batch = infer_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max(0.0, max_wait_ms) / 1000.0
+        self.thread_init = thread_init
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"submitted": 0, "batches": 0, "items": 0, "max_batch": 0, "errors": 0, "busy_seconds": 0.0}
+
+    def submit(self, item: Any) -> Future:
+        """提交一条请求，返回结果的 Future（工作线程在首次提交时启动）"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._stats["submitted"] += 1
+        self._queue.put((item, future))
+        return future
+
+    def _next_batch(self) -> Optional[list]:
+        """阻塞取第一条，然后在截止时间内尽量凑满一批；收到停止信号时返回 None"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # 先处理已取出的这一批，再退出
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        if self.thread_init is not None:
+            try:
+                self.thread_init()
+            except Exception as e:
+                logger.warning(f"{self.name}: 工作线程初始化失败: {e}")
+
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # 调用方已取消（如阶段超时）的请求不再推理
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = self.infer_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"infer_batch returned {len(results)} results for {len(batch)} inputs")
+            except Exception as e:
+                logger.warning(f"{self.name}: 批量推理失败（{len(batch)} 条）: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self._stats["batches"] += 1
+                    self._stats["items"] += len(batch)
+                    self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                    self._stats["busy_seconds"] += time.perf_counter() - started
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["busy_seconds"] = round(stats["busy_seconds"], 3)
+        return stats
+
+    def close(self, timeout: Optional[float] = None):
+        """停止工作线程（已排队的请求先处理完）"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
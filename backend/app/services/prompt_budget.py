@@ -0,0 +1,102 @@
+# backend/app/services/prompt_budget.py
+"""
+提示词 token 预算
+
+- TokenCounter：统计/截断 token。models/prompt_tokenizer 目录存在时使用该目录下的
+  HuggingFace tokenizer（与对话模型一致的分词器），否则使用保守的字符估算
+  （中日韩字符每字 1 个 token，其余约每 3 个字符 1 个 token）。
+- PromptBudget：总预算与各部分的预算上限，PromptGenerator 据此打包上下文。
+"""
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRUNCATION_MARKER = "\n...[truncated]"
+
+
+def _is_cjk(ch: str) -> bool:
+    return '\u4e00' <= ch <= '\u9fff' or '\u3040' <= ch <= '\u30ff' or '\uac00' <= ch <= '\ud7af'
+
+
+class TokenCounter:
+    """token 计数器：优先使用本地 tokenizer，缺失时退化为字符估算"""
+
+    # 估算模式下每个 token 对应的非 CJK 字符数（偏保守，宁可多估）
+    CHARS_PER_TOKEN = 3
+
+    def __init__(self, tokenizer_dir: Optional[str] = None):
+        self.tokenizer = None
+        if tokenizer_dir and os.path.exists(tokenizer_dir):
+            try:
+                # 只在 tokenizer 文件存在时才导入 transformers
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir, local_files_only=True)
+                logger.info(f"TokenCounter: 使用 tokenizer {tokenizer_dir}")
+            except Exception as e:
+                logger.warning(f"TokenCounter: tokenizer 加载失败，使用字符估算: {e}")
+                self.tokenizer = None
+
+    @property
+    def backend(self) -> str:
+        return "tokenizer" if self.tokenizer is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        cjk = sum(1 for ch in text if _is_cjk(ch))
+        other = len(text) - cjk
+        return cjk + -(-other // self.CHARS_PER_TOKEN)
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        # 每条消息额外计 4 个 token 的角色/分隔开销
+        return sum(self.count(m.get("content", "")) + 4 for m in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断到不超过 max_tokens（保留开头，末尾加截断标记）"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        budget = max_tokens - self.count(TRUNCATION_MARKER)
+        if budget <= 0:
+            return ""
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[:budget]
+            return self.tokenizer.decode(ids) + TRUNCATION_MARKER
+        # 估算模式：二分查找满足预算的最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low] + TRUNCATION_MARKER
+
+
+@dataclass
+class PromptBudget:
+    """
+    提示词预算（单位：token）
+
+    total 是系统提示词 + 全部消息的上限；sections 是各部分各自的上限。
+    超出总预算时按优先级让出空间：先丢最早的历史消息，再丢排名靠后的检索片段。
+    """
+    total: int = 24000
+    sections: Dict[str, int] = field(default_factory=lambda: {
+        "content_data": 6000,
+        "student_info": 400,
+        "conversation_summary": 800,
+        "reference_knowledge": 3000,
+        "test_results": 1500,
+        "current_message": 6000,
+        "history": 8000,
+    })
+
+    def section(self, name: str) -> int:
+        return self.sections.get(name, self.total)
@@ -0,0 +1,137 @@
+# backend/app/services/prompt_fragments.py
+"""
+提示词片段缓存
+
+学习内容和测试任务只在部署时变化，但每轮对话都要把内容模型序列化、再解析、
+再格式化成 CONTENT DATA 段落。这里按 (content_type, topic_id) 缓存渲染好的
+TOPIC 与 CONTENT DATA 段落，热路径只做字符串拼接。
+
+- 启动时 warm() 预先渲染全部内容；未预热的主题在首次请求时渲染。
+- 每次读取只比较一次 JSON 文件的修改时间，文件变化后重新渲染
+  （同时清空 load_json_content 的 LRU 缓存，避免拿到旧的内容模型）。
+- invalidate() 用于内容重新加载（管理接口）。
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from app.services import content_loader
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = ("learning_content", "test_tasks")
+
+
+@dataclass(frozen=True)
+class PromptFragments:
+    """一个主题渲染好的提示词片段"""
+    content_type: str
+    topic_id: str
+    title: Optional[str]
+    topic_section: Optional[str]
+    content_section: Optional[str]
+    source_mtime_ns: int
+
+
+def content_type_for_mode(mode: Optional[str]) -> str:
+    return "learning_content" if mode == "learning" else "test_tasks"
+
+
+class PromptFragmentCache:
+    """按 (content_type, topic_id) 缓存渲染好的 TOPIC / CONTENT DATA 段落"""
+
+    def __init__(self, prompt_generator, data_dir: Optional[str] = None, loader: Optional[Callable] = None):
+        """
+        Args:
+            prompt_generator: 负责渲染段落的 PromptGenerator（保证与未缓存时的输出一致）
+            data_dir: 内容目录，默认与 content_loader 相同
+            loader: 加载内容模型的函数，默认 content_loader.load_json_content
+        """
+        self.prompt_generator = prompt_generator
+        self.data_dir = Path(data_dir) if data_dir else content_loader.DATA_DIR
+        self._loader = loader
+        self._fragments: Dict[Tuple[str, str], PromptFragments] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "renders": 0, "invalidations": 0}
+
+    def _source_path(self, content_type: str, topic_id: str) -> Path:
+        return self.data_dir / content_type / f"{topic_id}.json"
+
+    def get(self, content_type: str, topic_id: str) -> PromptFragments:
+        """
+        获取主题的提示词片段；文件修改时间变化时重新渲染
+
+        Raises:
+            与 load_json_content 相同（主题不存在时抛出 HTTPException 404）
+        """
+        key = (content_type, topic_id)
+        try:
+            mtime_ns = os.stat(self._source_path(content_type, topic_id)).st_mtime_ns
+        except OSError:
+            mtime_ns = -1
+
+        cached = self._fragments.get(key)
+        if cached is not None and cached.source_mtime_ns == mtime_ns:
+            self._stats["hits"] += 1
+            return cached
+
+        if cached is not None:
+            # 内容文件已更新：旧的内容模型也不能再用
+            content_loader.load_json_content.cache_clear()
+            self._stats["invalidations"] += 1
+            logger.info(f"PromptFragmentCache: {content_type}/{topic_id} 已更新，重新渲染")
+
+        fragments = self._render(content_type, topic_id, mtime_ns)
+        with self._lock:
+            self._fragments[key] = fragments
+            self._stats["renders"] += 1
+        return fragments
+
+    def _render(self, content_type: str, topic_id: str, mtime_ns: int) -> PromptFragments:
+        loader = self._loader or content_loader.load_json_content
+        loaded_content = loader(content_type, topic_id)
+        title = getattr(loaded_content, 'title', None) or getattr(loaded_content, 'topic_id', None)
+
+        content_data = loaded_content.model_dump(mode="json")
+        if content_type == "learning_content":
+            # sc_all 是给前端的选择器清单，与答疑无关
+            content_data.pop('sc_all', None)
+
+        topic_section, content_section = self.prompt_generator.render_content_sections(title, content_data)
+        return PromptFragments(
+            content_type=content_type,
+            topic_id=topic_id,
+            title=title,
+            topic_section=topic_section,
+            content_section=content_section,
+            source_mtime_ns=mtime_ns,
+        )
+
+    def warm(self) -> int:
+        """预先渲染全部内容，返回渲染的主题数；单个主题失败不影响其他主题"""
+        count = 0
+        for content_type in CONTENT_TYPES:
+            directory = self.data_dir / content_type
+            if not directory.is_dir():
+                continue
+            for path in sorted(directory.glob("*.json")):
+                try:
+                    self.get(content_type, path.stem)
+                    count += 1
+                except Exception as e:
+                    logger.warning(f"PromptFragmentCache: 预渲染 {content_type}/{path.stem} 失败: {e}")
+        logger.info(f"PromptFragmentCache: 已预渲染 {count} 个主题")
+        return count
+
+    def invalidate(self):
+        """清空全部片段（以及内容模型缓存），下次请求时重新渲染"""
+        with self._lock:
+            self._fragments.clear()
+            self._stats["invalidations"] += 1
+        content_loader.load_json_content.cache_clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "entries": len(self._fragments)}
@@ -1,14 +1,30 @@
 # backend/app/services/prompt_generator.py
 import json
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from ..schemas.chat import UserStateSummary, SentimentAnalysisResult
 from ..schemas.content import CodeContent
+from .prompt_budget import PromptBudget, TokenCounter
+from .prompt_fragments import PromptFragments
+from ..core.config import settings
 
 
 class PromptGenerator:
-    """提示词生成器"""
-
-    def __init__(self):
+    """
+    提示词生成器
+
+    系统提示词分为两部分：
+    - 静态前缀：基础提示词、模式、主题、内容数据。同一知识点的多轮对话中逐字节相同，
+      便于服务商的前缀缓存命中。
+    - 动态部分：情感策略、学生信息、分阶段提示、检索片段、测试结果，每轮可能变化。
+    各部分和对话历史按 PromptBudget 限制 token 数。
+    """
+
+    def __init__(self, budget: Optional[PromptBudget] = None, token_counter: Optional[TokenCounter] = None):
+        self.budget = budget or PromptBudget(
+            total=settings.PROMPT_TOKEN_BUDGET,
+            sections=dict(settings.PROMPT_SECTION_BUDGETS)
+        )
+        self.token_counter = token_counter or TokenCounter(settings.PROMPT_TOKENIZER_DIR)
         self.base_system_prompt = """
 "You are 'Alex', a world-class AI programming tutor. Your goal is to help a student master a specific topic by providing personalized, empathetic, and insightful guidance. You must respond in Markdown format.
 
@@ -33,7 +49,10 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
         mode: str = None,
         content_title: str = None,
         content_json: str = None,
-        test_results: List[Dict[str, Any]] = None
+        test_results: List[Dict[str, Any]] = None,
+        content_fragments: Optional[PromptFragments] = None,
+        conversation_summary: Optional[str] = None,
+        summary_version: Optional[int] = None
     ) -> Tuple[str, List[Dict[str, str]]]:
         """
         创建完整的提示词和消息列表
@@ -47,25 +66,41 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
             mode: 模式 ("learning" 或 "test")
             content_title: 内容标题
             content_json: 内容的JSON字符串
+            content_fragments: 预先渲染好的 TOPIC / CONTENT DATA 段落，提供时不再使用 content_title/content_json 渲染
+            conversation_summary: 较早对话的滚动摘要（conversation_history 只包含摘要之后的消息）
+            summary_version: 摘要版本号，写入提示词便于审计
 
         Returns:
             Tuple[str, List[Dict[str, str]]]: (system_prompt, messages)
         """
-        # 构建系统提示词
+        # 先构建当前用户消息：它必须保留，其余部分在剩余预算内打包
+        current_message = self._build_current_message(code_content, user_message)
+        current_tokens = self.token_counter.count_messages(current_message)
+
+        # 构建系统提示词（检索片段只使用扣除当前消息后的剩余预算）
         system_prompt = self._build_system_prompt(
             user_state=user_state,
             retrieved_context=retrieved_context,
             mode=mode,
             content_title=content_title,
             content_json=content_json,
-            test_results=test_results
+            test_results=test_results,
+            reserved_tokens=current_tokens,
+            content_fragments=content_fragments,
+            conversation_summary=conversation_summary,
+            summary_version=summary_version
         )
 
-        # 构建消息列表
+        # 对话历史使用最后剩下的预算，超出时从最早的消息开始丢弃
+        history_budget = min(
+            self.budget.section("history"),
+            self.budget.total - self.token_counter.count(system_prompt) - current_tokens
+        )
         messages = self._build_message_history(
             conversation_history=conversation_history,
             code_context=code_content,
-            user_message=user_message
+            user_message=user_message,
+            history_token_budget=max(history_budget, 0)
         )
 
         return system_prompt, messages
@@ -77,10 +112,26 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
         mode: str = None,
         content_title: str = None,
         content_json: str = None,
-        test_results: List[Dict[str, Any]] = None
+        test_results: List[Dict[str, Any]] = None,
+        reserved_tokens: int = 0,
+        content_fragments: Optional[PromptFragments] = None,
+        conversation_summary: Optional[str] = None,
+        summary_version: Optional[int] = None
     ) -> str:
-        """构建系统提示词"""
-        prompt_parts = [self.base_system_prompt]
+        """
+        构建系统提示词
+
+        Args:
+            reserved_tokens: 需要为消息预留的 token 数，检索片段只使用剩余的预算
+            content_fragments: 预先渲染好的 TOPIC / CONTENT DATA 段落
+            conversation_summary: 较早对话的滚动摘要
+            summary_version: 摘要版本号
+        """
+        if content_fragments is not None:
+            content_title = content_fragments.title
+
+        # 静态前缀（同一知识点内不变）在前，动态部分在后
+        prompt_parts = self._build_static_prefix(mode, content_title, content_json, content_fragments)
 
         # 添加情感策略
         emotion = user_state.emotion_state.get('current_sentiment', 'NEUTRAL')
@@ -88,66 +139,12 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
         prompt_parts.append(f"STRATEGY: {emotion_strategy}")
 
         # 添加用户状态信息
-        if user_state.is_new_user:
-            prompt_parts.append("STUDENT INFO: This is a new student. Start with basic concepts and be extra patient.")
-        else:
-            # 添加更多用户状态信息
-            student_info_parts = ["STUDENT INFO: This is an existing student. Build upon previous knowledge."]
-
-            # 添加学习进度信息
-            if hasattr(user_state, 'bkt_models') and user_state.bkt_models:
-                mastery_info = []
-                for topic_key, bkt_model in user_state.bkt_models.items():
-                    if isinstance(bkt_model, dict) and 'mastery_prob' in bkt_model:
-                        mastery_prob = bkt_model['mastery_prob']
-                    elif hasattr(bkt_model, 'mastery_prob'):
-                        mastery_prob = bkt_model.mastery_prob
-                    else:
-                        continue
-
-                    mastery_level = "beginner"
-                    if mastery_prob > 0.8:
-                        mastery_level = "advanced"
-                    elif mastery_prob > 0.5:
-                        mastery_level = "intermediate"
-                    
-                    mastery_info.append(f"{topic_key}: {mastery_level} (mastery: {mastery_prob:.2f})")
-                
-                if mastery_info:
-                    student_info_parts.append(f"LEARNING PROGRESS: Student's mastery levels - {', '.join(mastery_info)}")
-
-            # 添加行为计数器信息
-            if hasattr(user_state, 'behavior_counters') and user_state.behavior_counters:
-                behavior_info = []
-                counters = user_state.behavior_counters
-
-                # 错误计数
-                if 'error_count' in counters:
-                    behavior_info.append(f"errors: {counters['error_count']}")
-
-                # 提交时间戳
-                if 'submission_timestamps' in counters and counters['submission_timestamps']:
-                    submission_count = len(counters['submission_timestamps'])
-                    behavior_info.append(f"submissions: {submission_count}")
-
-                if behavior_info:
-                    student_info_parts.append(f"BEHAVIOR: Student has {', '.join(behavior_info)}")
-
-            prompt_parts.append("\n".join(student_info_parts))
-
-        # 添加RAG上下文 (在用户状态信息之后，任务上下文之前)
-        if retrieved_context:
-            formatted_context = "\n\n---\n\n".join(retrieved_context)
-            prompt_parts.append(f"REFERENCE KNOWLEDGE: Use the following information from the knowledge base to answer the user's question accurately.\n\n{formatted_context}")
-        else:
-            prompt_parts.append("REFERENCE KNOWLEDGE: No relevant knowledge was retrieved from the knowledge base. Answer based on your general knowledge.")
+        prompt_parts.append(self.token_counter.truncate(
+            self._build_student_info(user_state), self.budget.section("student_info")
+        ))
 
-        # 添加任务上下文和分阶段debug逻辑
-        if mode == "learning":
-            prompt_parts.append("MODE: The student is in learning mode. Provide detailed explanations and examples to help them understand the concepts.")
-        elif mode == "test":
-            prompt_parts.append("MODE: The student is in test mode. Guide them to find the answer themselves. Do not give the answer directly.")
-            # 分阶段debug逻辑
+        # 分阶段debug逻辑
+        if mode == "test":
             question_count = user_state.behavior_counters.get(f"question_count_{content_title}", 0)
             if question_count == 0:
                 prompt_parts.append("DEBUGGING STRATEGY: This is the first time the student is asking about this. Provide a small hint.")
@@ -157,32 +154,176 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
                 prompt_parts.append("DEBUGGING STRATEGY: The student is still stuck. Provide a code snippet with a small modification, but not the complete answer.")
             else:
                 prompt_parts.append("DEBUGGING STRATEGY: The student is asking multiple times. It's time to provide the correct answer, but also explain why it is correct.")
-        
-        # 添加内容标题
-        if content_title:
-            prompt_parts.append(f"TOPIC: The current topic is '{content_title}'. Focus your explanations on this specific topic.")
-            
-        # 添加内容JSON（如果提供）
-        if content_json:
-            # 确保JSON内容正确编码，避免Unicode转义序列问题
-            try:
-                # 解析JSON字符串
-                content_dict = json.loads(content_json)
-                # 重新序列化为格式化的JSON字符串，确保中文正确显示
-                formatted_content_json = json.dumps(content_dict, indent=2, ensure_ascii=False)
-                prompt_parts.append(f"CONTENT DATA: Here is the detailed content data for the current topic. Use this to provide more specific and accurate guidance.\n{formatted_content_json}")
-            except json.JSONDecodeError:
-                # 如果解析失败，使用原始内容
-                prompt_parts.append(f"CONTENT DATA: Here is the detailed content data for the current topic. Use this to provide more specific and accurate guidance.\n{content_json}")
-            
+
+        # 添加较早对话的滚动摘要（带版本号，raw_prompt_to_llm 据此可追溯）
+        if conversation_summary:
+            prompt_parts.append(self.token_counter.truncate(
+                f"CONVERSATION SUMMARY (v{summary_version or 0}): Summary of the earlier part of this conversation. The most recent messages follow in full.\n{conversation_summary}",
+                self.budget.section("conversation_summary")
+            ))
+
         # 添加测试结果（如果提供且在测试模式下）
+        test_results_part = None
         if mode == "test" and test_results:
             # 将测试结果转换为格式化的字符串
             test_results_str = json.dumps(test_results, indent=2, ensure_ascii=False)
-            prompt_parts.append(f"TEST RESULTS: Here are the test results for the student's current code. Use this information to help diagnose problems and provide targeted guidance.\n{test_results_str}")
+            test_results_part = self.token_counter.truncate(
+                f"TEST RESULTS: Here are the test results for the student's current code. Use this information to help diagnose problems and provide targeted guidance.\n{test_results_str}",
+                self.budget.section("test_results")
+            )
+
+        # 添加RAG上下文：按排名依次放入，超出预算时丢弃排名靠后的片段
+        used_tokens = self.token_counter.count("\n\n".join(prompt_parts + ([test_results_part] if test_results_part else [])))
+        knowledge_budget = min(
+            self.budget.section("reference_knowledge"),
+            self.budget.total - used_tokens - reserved_tokens
+        )
+        prompt_parts.append(self._build_reference_knowledge(retrieved_context, knowledge_budget))
+
+        if test_results_part:
+            prompt_parts.append(test_results_part)
 
         return "\n\n".join(prompt_parts)
 
+    def _build_static_prefix(
+        self,
+        mode: str = None,
+        content_title: str = None,
+        content_json: str = None,
+        content_fragments: Optional[PromptFragments] = None
+    ) -> List[str]:
+        """基础提示词、模式、主题和内容数据：只取决于知识点和模式，多轮对话中保持不变"""
+        prompt_parts = [self.base_system_prompt]
+
+        if mode == "learning":
+            prompt_parts.append("MODE: The student is in learning mode. Provide detailed explanations and examples to help them understand the concepts.")
+        elif mode == "test":
+            prompt_parts.append("MODE: The student is in test mode. Guide them to find the answer themselves. Do not give the answer directly.")
+
+        if content_fragments is not None:
+            # 已缓存的段落，直接拼接
+            topic_section = content_fragments.topic_section
+            content_section = content_fragments.content_section
+        else:
+            content_data = None
+            if content_json:
+                # 确保JSON内容正确编码，避免Unicode转义序列问题
+                try:
+                    content_data = json.loads(content_json)
+                except json.JSONDecodeError:
+                    # 如果解析失败，使用原始内容
+                    content_data = content_json
+            topic_section, content_section = self.render_content_sections(content_title, content_data)
+
+        if topic_section:
+            prompt_parts.append(topic_section)
+        if content_section:
+            prompt_parts.append(content_section)
+
+        return prompt_parts
+
+    def render_content_sections(self, content_title: Optional[str], content_data: Any) -> Tuple[Optional[str], Optional[str]]:
+        """
+        渲染 TOPIC 与 CONTENT DATA 段落（PromptFragmentCache 预先渲染时也使用此方法）
+
+        Args:
+            content_title: 内容标题
+            content_data: 内容字典；无法解析的原始字符串原样放入
+
+        Returns:
+            tuple: (topic_section, content_section)，缺失的部分为 None
+        """
+        topic_section = None
+        if content_title:
+            topic_section = f"TOPIC: The current topic is '{content_title}'. Focus your explanations on this specific topic."
+
+        content_section = None
+        if content_data:
+            if isinstance(content_data, str):
+                formatted_content_json = content_data
+            else:
+                # 格式化为带缩进的JSON字符串，确保中文正确显示
+                formatted_content_json = json.dumps(content_data, indent=2, ensure_ascii=False)
+            content_section = self.token_counter.truncate(
+                f"CONTENT DATA: Here is the detailed content data for the current topic. Use this to provide more specific and accurate guidance.\n{formatted_content_json}",
+                self.budget.section("content_data")
+            )
+
+        return topic_section, content_section
+
+    @staticmethod
+    def _build_student_info(user_state: UserStateSummary) -> str:
+        """学生信息：新用户提示，或学习进度与行为统计"""
+        if user_state.is_new_user:
+            return "STUDENT INFO: This is a new student. Start with basic concepts and be extra patient."
+
+        # 添加更多用户状态信息
+        student_info_parts = ["STUDENT INFO: This is an existing student. Build upon previous knowledge."]
+
+        # 添加学习进度信息（按知识点排序，保证输出稳定）
+        if hasattr(user_state, 'bkt_models') and user_state.bkt_models:
+            mastery_info = []
+            for topic_key in sorted(user_state.bkt_models, key=str):
+                bkt_model = user_state.bkt_models[topic_key]
+                if isinstance(bkt_model, dict) and 'mastery_prob' in bkt_model:
+                    mastery_prob = bkt_model['mastery_prob']
+                elif hasattr(bkt_model, 'mastery_prob'):
+                    mastery_prob = bkt_model.mastery_prob
+                else:
+                    continue
+
+                mastery_level = "beginner"
+                if mastery_prob > 0.8:
+                    mastery_level = "advanced"
+                elif mastery_prob > 0.5:
+                    mastery_level = "intermediate"
+
+                mastery_info.append(f"{topic_key}: {mastery_level} (mastery: {mastery_prob:.2f})")
+
+            if mastery_info:
+                student_info_parts.append(f"LEARNING PROGRESS: Student's mastery levels - {', '.join(mastery_info)}")
+
+        # 添加行为计数器信息
+        if hasattr(user_state, 'behavior_counters') and user_state.behavior_counters:
+            behavior_info = []
+            counters = user_state.behavior_counters
+
+            # 错误计数
+            if 'error_count' in counters:
+                behavior_info.append(f"errors: {counters['error_count']}")
+
+            # 提交时间戳
+            if 'submission_timestamps' in counters and counters['submission_timestamps']:
+                submission_count = len(counters['submission_timestamps'])
+                behavior_info.append(f"submissions: {submission_count}")
+
+            if behavior_info:
+                student_info_parts.append(f"BEHAVIOR: Student has {', '.join(behavior_info)}")
+
+        return "\n".join(student_info_parts)
+
+    def _build_reference_knowledge(self, retrieved_context: List[str], token_budget: int) -> str:
+        """按排名放入检索片段直到用完预算；排名第一的片段过长时截断而不是丢弃"""
+        header = "REFERENCE KNOWLEDGE: Use the following information from the knowledge base to answer the user's question accurately.\n\n"
+        separator = "\n\n---\n\n"
+        remaining = token_budget - self.token_counter.count(header)
+
+        packed = []
+        for chunk in retrieved_context or []:
+            cost = self.token_counter.count(chunk) + (self.token_counter.count(separator) if packed else 0)
+            if cost <= remaining:
+                packed.append(chunk)
+                remaining -= cost
+            elif not packed and remaining > 0:
+                packed.append(self.token_counter.truncate(chunk, remaining))
+                break
+            else:
+                break
+
+        if packed:
+            return header + separator.join(packed)
+        return "REFERENCE KNOWLEDGE: No relevant knowledge was retrieved from the knowledge base. Answer based on your general knowledge."
+
     @staticmethod
     def _get_emotion_strategy(emotion: str) -> str:
         """根据情感获取教学策略"""
@@ -199,19 +340,41 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
         self,
         conversation_history: List[Dict[str, str]],
         code_context: CodeContent = None,
-        user_message: str = ""
+        user_message: str = "",
+        history_token_budget: Optional[int] = None
     ) -> List[Dict[str, str]]:
-        """构建消息历史"""
-        messages = []
+        """
+        构建消息历史
+
+        Args:
+            history_token_budget: 历史消息的 token 上限，超出时从最早的消息开始丢弃；None 表示不限制
+        """
+        history = []
 
         # 添加历史对话
-        for msg in conversation_history:
+        for msg in conversation_history or []:
             if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                messages.append({
+                history.append({
                     "role": msg['role'],
                     "content": msg['content']
                 })
 
+        # 从最新的消息往前保留，直到用完预算
+        if history_token_budget is not None:
+            kept = []
+            remaining = history_token_budget
+            for msg in reversed(history):
+                cost = self.token_counter.count_messages([msg])
+                if cost > remaining:
+                    break
+                kept.append(msg)
+                remaining -= cost
+            history = list(reversed(kept))
+
+        return history + self._build_current_message(code_context, user_message)
+
+    def _build_current_message(self, code_context: CodeContent = None, user_message: str = "") -> List[Dict[str, str]]:
+        """构建当前用户消息（含代码上下文），为空时返回空列表"""
         # 构建当前用户消息
         current_user_content = user_message
 
@@ -220,14 +383,20 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
             code_section = self._format_code_context(code_context)
             current_user_content = f"{code_section}\n\nMy question is: {user_message}"
 
-        # 添加当前用户消息
-        if current_user_content.strip():
-            messages.append({
-                "role": "user",
-                "content": current_user_content
-            })
+        if not current_user_content.strip():
+            return []
 
-        return messages
+        # 超出预算时只截断代码部分，问题本身放在最后始终保留
+        budget = self.budget.section("current_message")
+        if self.token_counter.count(current_user_content) > budget and code_context:
+            question = f"\n\nMy question is: {user_message}"
+            code_section = self.token_counter.truncate(code_section, budget - self.token_counter.count(question))
+            current_user_content = code_section + question
+
+        return [{
+            "role": "user",
+            "content": current_user_content
+        }]
 
     def _format_code_context(self, code_context: CodeContent) -> str:
         """格式化代码上下文"""
@@ -246,7 +415,3 @@ Above all: DO NOT DO THE USER'S WORK FOR THEM. Don't answer homework questions -
             return "Here is my current code:\n\n" + "\n\n".join(parts)
         else:
             return ""
-
-
-# 创建单例实例
-prompt_generator = PromptGenerator()
\ No newline at end of file
@@ -1,28 +1,25 @@
 # backend/app/services/rag_service.py
-import json
-import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from openai import OpenAI
-from annoy import AnnoyIndex
 from app.core.config import settings
 # 导入翻译服务类（不是实例）
 from app.services.translation_service import TranslationService
+from app.services.vector_store import VersionedKnowledgeBase, VectorStoreManager
+from app.services.result_cache import TieredCache, normalize_text
 
 class RAGService:
-	def __init__(self, translation_service: TranslationService = None):
-		# 在应用启动时加载索引和数据
-		self.embedding_dimension = 2560 # for Qwen/Qwen3-Embedding-4B-GGUF
-		self.index = AnnoyIndex(self.embedding_dimension, 'angular')
-		
-		# 使用配置中的路径
-		kb_ann_path = os.path.join(settings.VECTOR_STORE_DIR, settings.KB_ANN_FILENAME)
-		kb_chunks_path = os.path.join(settings.VECTOR_STORE_DIR, settings.KB_CHUNKS_FILENAME)
-		
-		# 使用内存映射加载索引，非常高效
-		self.index.load(kb_ann_path, prefault=False) 
-	  
-		with open(kb_chunks_path, "r", encoding="utf-8") as f:
-			self.chunks = json.load(f)
+	def __init__(
+		self,
+		translation_service: TranslationService = None,
+		store_manager: Optional[VectorStoreManager] = None,
+		retrieval_cache: Optional[TieredCache] = None
+	):
+		# 在应用启动时加载当前发布的知识库版本（vector_store/v<N>/，兼容旧的平铺布局）
+		# 索引使用内存映射加载，非常高效；新版本可通过 reload() 热切换
+		self.knowledge_base = VersionedKnowledgeBase(store_manager or VectorStoreManager(settings.VECTOR_STORE_DIR))
+		self.embedding_dimension = self.knowledge_base.current.embedding_dimension
 	  
 		# 使用OpenAI客户端连接ModelScope API
 		self.client = OpenAI(
@@ -35,6 +32,33 @@ class RAGService:
 		# 使用DI方式注入翻译服务
 		self.translation_service = translation_service
 
+		# 检索结果缓存：(规范化查询, k, 命名空间, 知识库版本) -> top-k 文本块 id
+		# 命名空间取 embedding 模型名，更换模型或发布新版本后旧条目自然失效
+		self.retrieval_cache = retrieval_cache
+		self.namespace = self.embedding_model
+
+		# 批量检索参数：每次 embedding 请求的最大条数，以及并行搜索的线程数
+		# （Annoy 搜索时会释放 GIL，多线程可以并行）
+		self.embedding_batch_size = settings.RAG_EMBEDDING_BATCH_SIZE
+		self._search_executor = ThreadPoolExecutor(
+			max_workers=settings.RAG_SEARCH_WORKERS,
+			thread_name_prefix="rag-search"
+		)
+
+	@property
+	def kb_version(self) -> int:
+		"""当前生效的知识库版本号，用于缓存键等需要区分版本的场景"""
+		return self.knowledge_base.version
+
+	def reload(self, version: Optional[int] = None, force: bool = False) -> bool:
+		"""
+		加载新的知识库版本并原子切换，不中断在途查询。
+		旧版本在最后一个引用它的查询结束后卸载。
+		"""
+		switched = self.knowledge_base.reload(version=version, force=force)
+		self.embedding_dimension = self.knowledge_base.current.embedding_dimension
+		return switched
+
 	def _is_chinese(self, text: str) -> bool:
 		"""检测文本是否包含中文字符"""
 		for ch in text:
@@ -73,27 +97,137 @@ class RAGService:
 			print(f"Error calling embedding API: {e}")
 			raise ValueError(f"Failed to get embedding from API: {str(e)}")
 
-	def retrieve(self, query_text: str, k: int = 3) -> list[str]:
+	def _get_embeddings(self, texts: list[str]) -> list[list[float]]:
+		"""
+		批量获取embedding，每个请求最多 embedding_batch_size 条。
+		若某批次的列表请求失败（部分 ModelScope 部署只接受字符串输入），该批次回退为逐条请求。
+		"""
+		embeddings: list[Optional[list[float]]] = [None] * len(texts)
+		# 空查询直接使用零向量，不发送请求
+		pending = []
+		for i, text in enumerate(texts):
+			if not text or not text.strip():
+				embeddings[i] = [0.0] * self.embedding_dimension
+			else:
+				pending.append(i)
+
+		for start in range(0, len(pending), self.embedding_batch_size):
+			batch = pending[start:start + self.embedding_batch_size]
+			try:
+				response = self.client.embeddings.create(
+					input=[texts[i] for i in batch],
+					model=self.embedding_model
+				)
+				data = sorted(response.data, key=lambda item: item.index)
+				if len(data) != len(batch) or not all(item.embedding for item in data):
+					raise ValueError("Incomplete batch embedding response")
+				for i, item in zip(batch, data):
+					embeddings[i] = item.embedding
+			except Exception as e:
+				print(f"Batch embedding failed, falling back to single requests: {e}")
+				for i in batch:
+					embeddings[i] = self._get_embedding(texts[i])
+		return embeddings
+
+	def _cache_key(self, query_text: str, k: int, kb_version: int) -> str:
+		return TieredCache.make_key(normalize_text(query_text), k, self.namespace, kb_version)
+
+	def _translate_if_needed(self, query_text: str) -> str:
+		"""如果翻译服务可用且查询包含中文，则先翻译成英文"""
+		if self.translation_service and self._is_chinese(query_text):
+			translated_query = self.translation_service.translate(query_text, "zh", "en")
+			print(f"Translated query: {query_text} -> {translated_query}")
+			return translated_query
+		return query_text
+
+	def embed_query(self, query_text: str) -> list[float]:
+		"""获取查询的 embedding（与检索时一致，必要时先翻译），供语义缓存等复用"""
+		return self._get_embedding(self._translate_if_needed(query_text))
+
+	def _cached_chunks(self, queries: list[str], k: int) -> tuple[list[Optional[list[str]]], list[int]]:
+		"""
+		在当前版本的检索缓存中查找各查询，返回 (命中的文本块, 未命中的下标)。
+		只在查缓存和取文本块时持有版本引用。
+		"""
+		results: list[Optional[list[str]]] = [None] * len(queries)
+		if self.retrieval_cache is None:
+			return results, list(range(len(queries)))
+		misses = []
+		with self.knowledge_base.acquire() as kb:
+			for i, query_text in enumerate(queries):
+				cached_ids = self.retrieval_cache.get(self._cache_key(query_text, k, kb.version))
+				if cached_ids is not None:
+					results[i] = [kb.chunks[j] for j in cached_ids]
+				else:
+					misses.append(i)
+		return results, misses
+
+	def retrieve(self, query_text: str, k: int = 3, query_vector: Optional[list[float]] = None) -> list[str]:
+		"""
+		检索与查询最相关的 k 个文本块
+
+		翻译和 embedding 是网络请求，在持有知识库版本引用之前完成；
+		版本引用只覆盖缓存查找、Annoy 搜索和取文本块，旧版本不必等待慢的上游请求才能卸载。
+
+		Args:
+			query_vector: 调用方已通过 embed_query 算好的查询向量（例如语义缓存），提供时不再翻译和请求 embedding
+		"""
 		try:
-			# 如果翻译服务可用且查询包含中文，则先翻译成英文
-			if self.translation_service and self._is_chinese(query_text):
-				translated_query = self.translation_service.translate(query_text, "zh", "en")
-				print(f"Translated query: {query_text} -> {translated_query}")
-				query_text = translated_query
-			
-			query_vector = self._get_embedding(query_text)
-			
+			cached, misses = self._cached_chunks([query_text], k)
+			if not misses:
+				return cached[0]
+
+			if query_vector is None:
+				query_vector = self._get_embedding(self._translate_if_needed(query_text))
+
 			if not query_vector:
 				raise ValueError("Empty embedding vector received")
-			
-			# 在Annoy中搜索
-			indices = self.index.get_nns_by_vector(query_vector, k)
-	  
-			return [self.chunks[i] for i in indices]
+
+			# 持有版本引用，保证缓存键中的版本与实际搜索的版本一致，且搜索期间该版本不会被卸载
+			with self.knowledge_base.acquire() as kb:
+				indices = kb.index.get_nns_by_vector(query_vector, k)
+				if self.retrieval_cache is not None:
+					self.retrieval_cache.set(self._cache_key(query_text, k, kb.version), indices)
+				return [kb.chunks[i] for i in indices]
 		except Exception as e:
 			# 记录详细的错误信息
 			print(f"Error in retrieve: {e}")
 			raise
 
+	def retrieve_many(self, queries: list[str], k: int = 3) -> list[list[str]]:
+		"""
+		批量检索：缓存命中的查询直接返回；其余查询批量获取embedding，并行搜索。
+		与 retrieve 相同，翻译和 embedding 在持有知识库版本引用之前完成。
+
+		Returns:
+			list[list[str]]: 与 queries 一一对应的检索结果
+		"""
+		if not queries:
+			return []
+		try:
+			results, misses = self._cached_chunks(queries, k)
+			if misses:
+				# 相同的查询只翻译、embedding和搜索一次
+				unique_texts = list(dict.fromkeys(queries[i] for i in misses))
+				search_texts = [self._translate_if_needed(text) for text in unique_texts]
+				vectors = self._get_embeddings(search_texts)
+
+				with self.knowledge_base.acquire() as kb:
+					indices_list = list(self._search_executor.map(
+						lambda vector: kb.index.get_nns_by_vector(vector, k),
+						vectors
+					))
+					indices_by_text = dict(zip(unique_texts, indices_list))
+					for i in misses:
+						ids = indices_by_text[queries[i]]
+						if self.retrieval_cache is not None:
+							self.retrieval_cache.set(self._cache_key(queries[i], k, kb.version), ids)
+						results[i] = [kb.chunks[j] for j in ids]
+
+			return results
+		except Exception as e:
+			print(f"Error in retrieve_many: {e}")
+			raise
+
 # 后面使用DI，而非使用单例
 # rag_service = RAGService()
@@ -0,0 +1,193 @@
+# backend/app/services/rag_warmup.py
+"""
+RAGService 的后台初始化与预热
+
+构建 RAGService 需要加载 Annoy 索引、解析文本块 JSON 并创建 OpenAI 客户端，
+首次搜索还会触发缺页。RAGServiceLoader 在后台线程中完成这些工作：
+
+1. LOADING：构建 RAGService（可选地预取索引文件到页缓存）
+2. WARMING：执行若干条合成查询，预热 embedding 连接、索引页面和结果缓存
+3. READY：之后的请求直接使用该实例
+
+在 READY 之前到达的聊天请求不会阻塞，而是降级为“不检索”（retrieve 返回空列表）。
+初始化失败（FAILED）时按指数退避重试最多 max_retries 次（例如知识库稍后才挂载、embedding 服务暂时不可用）。
+"""
+import logging
+import os
+import threading
+import time
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RAGWarmupState(str, Enum):
+    """RAG 初始化状态"""
+    PENDING = "pending"
+    LOADING = "loading"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class RAGServiceLoader:
+    """在后台构建并预热 RAGService，未就绪时检索降级为空结果"""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        warmup_queries: Optional[List[str]] = None,
+        prefault: bool = False,
+        max_retries: int = 0,
+        retry_base_seconds: float = 5.0,
+        retry_max_seconds: float = 300.0,
+    ):
+        """
+        Args:
+            factory: 构建 RAGService 实例的可调用对象
+            warmup_queries: 预热时执行的合成查询
+            prefault: 是否在预热前把索引文件读入页缓存
+            max_retries: 初始化失败后最多重试的次数（0 表示不重试）
+            retry_base_seconds: 第一次重试前等待的秒数，之后每次翻倍
+            retry_max_seconds: 两次重试之间最多等待的秒数
+        """
+        self._factory = factory
+        self.warmup_queries = warmup_queries or []
+        self.prefault = prefault
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+        self.state = RAGWarmupState.PENDING
+        self.error: Optional[str] = None
+        self._service = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._timings: Dict[str, float] = {}
+        self._started_at: Optional[float] = None
+        # 已失败的初始化次数，以及下一次重试的时间（time.time()）
+        self.failures = 0
+        self._next_retry_at: Optional[float] = None
+
+    def start(self) -> bool:
+        """启动后台初始化；已经启动过则不重复启动"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="rag-warmup", daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待初始化结束（用于脚本和测试），返回是否就绪"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.is_ready
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == RAGWarmupState.READY
+
+    @property
+    def service(self):
+        """就绪后返回 RAGService 实例，否则返回 None（不阻塞）"""
+        return self._service if self.is_ready else None
+
+    def get(self):
+        """非阻塞获取服务；首次调用时若尚未启动则在后台启动初始化"""
+        if self.state == RAGWarmupState.PENDING:
+            self.start()
+        return self.service
+
+    def retrieve(self, query_text: str, k: int = 3) -> list:
+        """就绪时委托给 RAGService.retrieve，否则降级为不检索"""
+        service = self.get()
+        if service is None:
+            logger.info(f"RAGServiceLoader: RAG 尚未就绪（{self.state.value}），本次请求跳过检索")
+            return []
+        return service.retrieve(query_text, k)
+
+    def retrieve_many(self, queries: List[str], k: int = 3) -> List[list]:
+        """就绪时委托给 RAGService.retrieve_many，否则每条查询都降级为空结果"""
+        service = self.get()
+        if service is None:
+            return [[] for _ in queries]
+        return service.retrieve_many(queries, k)
+
+    def embed_query(self, query_text: str) -> Optional[List[float]]:
+        """就绪时委托给 RAGService.embed_query，否则返回 None"""
+        service = self.get()
+        if service is None:
+            return None
+        return service.embed_query(query_text)
+
+    def _run(self):
+        while not self._load():
+            if self.failures > self.max_retries:
+                logger.error(f"RAGServiceLoader: 已重试 {self.max_retries} 次仍失败，聊天将不使用检索")
+                return
+            delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (self.failures - 1))
+            self._next_retry_at = time.time() + delay
+            logger.warning(f"RAGServiceLoader: {delay:.1f}s 后第 {self.failures} 次重试初始化")
+            time.sleep(delay)
+            self._next_retry_at = None
+
+    def _load(self) -> bool:
+        """构建并预热一次，返回是否成功"""
+        try:
+            self.state = RAGWarmupState.LOADING
+            started = time.perf_counter()
+            service = self._factory()
+            self._timings["load_seconds"] = time.perf_counter() - started
+
+            self.state = RAGWarmupState.WARMING
+            started = time.perf_counter()
+            if self.prefault:
+                self._prefault_index(service)
+            self._run_warmup_queries(service)
+            self._timings["warmup_seconds"] = time.perf_counter() - started
+
+            self._service = service
+            self.error = None
+            self.state = RAGWarmupState.READY
+            logger.info(f"RAGServiceLoader: RAG 服务就绪 {self._timings}")
+            return True
+        except Exception as e:
+            self.error = str(e)
+            self.failures += 1
+            self.state = RAGWarmupState.FAILED
+            logger.error(f"RAGServiceLoader: RAG 服务初始化失败，聊天将不使用检索: {e}", exc_info=True)
+            return False
+
+    @staticmethod
+    def _prefault_index(service):
+        """顺序读取索引文件，把它放进页缓存，避免首次搜索时的缺页"""
+        kb = service.knowledge_base.current
+        ann_path = os.path.join(kb.path, kb.manifest.get("ann_file", "kb.ann"))
+        with open(ann_path, "rb") as f:
+            while f.read(1 << 20):
+                pass
+
+    def _run_warmup_queries(self, service):
+        if not self.warmup_queries:
+            return
+        try:
+            service.retrieve_many(self.warmup_queries)
+        except Exception as e:
+            # 预热查询失败不影响就绪，真实请求会各自处理错误
+            logger.warning(f"RAGServiceLoader: 预热查询失败: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        status = {
+            "state": self.state.value,
+            "error": self.error,
+            "started_at": self._started_at,
+            "failures": self.failures,
+            "next_retry_at": self._next_retry_at,
+            **self._timings,
+        }
+        if self._service is not None:
+            status["kb_version"] = self._service.kb_version
+        return status
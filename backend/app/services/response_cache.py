@@ -0,0 +1,224 @@
+# backend/app/services/response_cache.py
+"""
+语义回复缓存（可选）
+
+测试模式下，很多学生会针对同一个任务、用相近的代码问几乎相同的问题。
+语义缓存在调用 LLM 之前查找“足够相似”的历史回答，命中时直接复用，跳过 LLM 调用。
+
+缓存条目按作用域严格隔离，只有作用域完全相同的条目才参与相似度比较：
+- 实验分组（不同分组之间绝不共享；分组未知时不使用缓存）
+- 知识点/任务（content_id）与模式
+- 分阶段提示的阶段（由 question_count_<title> 推出，与 PromptGenerator 的四个阶段一致）
+- 规范化后的代码指纹
+
+作用域内用问题 embedding 的余弦相似度匹配，达到阈值才算命中。
+每个（分组, 知识点）有容量上限（LRU 淘汰），条目带 TTL。命中时原样返回历史回答，
+find() 还返回相似度、条目编号和写入时记录的来源（生成该回答的 LLM 路由等），供审计记录使用。
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.services.result_cache import _cache_registry
+
+logger = logging.getLogger(__name__)
+
+# PromptGenerator 的分阶段提示：0/1/2 次之后都视为同一阶段
+MAX_HINT_STAGE = 3
+
+_COMMENT_PATTERN = re.compile(r"<!--.*?-->|/\*.*?\*/|(?<![:\"'])//[^\n]*", re.DOTALL)
+
+
+def code_fingerprint(code_context: Any) -> str:
+    """
+    代码指纹：去掉注释、合并空白后对 html/css/js 取哈希。
+    只改了缩进、空行或注释的代码得到相同指纹。
+    """
+    if code_context is None:
+        return "none"
+    parts = []
+    for field in ("html", "css", "js"):
+        code = getattr(code_context, field, None) or ""
+        code = _COMMENT_PATTERN.sub("", code)
+        parts.append(" ".join(code.split()))
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def hint_stage(behavior_counters: Dict[str, Any], content_title: Optional[str], mode: Optional[str]) -> int:
+    """与 PromptGenerator 一致的提示阶段；只有测试模式区分阶段"""
+    if mode != "test":
+        return 0
+    count = (behavior_counters or {}).get(f"question_count_{content_title}", 0)
+    return min(int(count), MAX_HINT_STAGE)
+
+
+@dataclass(frozen=True)
+class ResponseCacheScope:
+    """缓存作用域：只有作用域完全相同的条目才会相互命中"""
+    group: str
+    topic: str
+    mode: str
+    hint_stage: int
+    code_fingerprint: str
+
+
+@dataclass
+class _Entry:
+    scope: ResponseCacheScope
+    vector: np.ndarray
+    response: str
+    expires_at: float
+    stored_at: float
+    origin: Dict[str, Any]
+    hits: int = 0
+
+
+@dataclass(frozen=True)
+class CacheHit:
+    """一次缓存命中：复用的回答、相似度，以及该回答最初是如何生成的"""
+    response: str
+    similarity: float
+    entry_id: int
+    stored_at: float
+    origin: Dict[str, Any]
+
+
+class SemanticResponseCache:
+    """按作用域隔离、按问题 embedding 相似度匹配的回复缓存"""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Optional[List[float]]],
+        similarity_threshold: float = 0.92,
+        ttl_seconds: float = 6 * 3600,
+        max_entries_per_topic: int = 200,
+        namespace: str = "semantic-response",
+    ):
+        """
+        Args:
+            embed_fn: 计算问题 embedding 的函数；返回 None 表示暂不可用（跳过缓存）
+            similarity_threshold: 余弦相似度阈值，达到才算命中
+            ttl_seconds: 条目有效期
+            max_entries_per_topic: 每个（分组, 知识点）的条目上限
+        """
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_topic = max_entries_per_topic
+        self.namespace = namespace
+
+        # (group, topic) -> OrderedDict[entry_id, _Entry]，按最近使用排序
+        self._topics: Dict[tuple, "OrderedDict[int, _Entry]"] = defaultdict(OrderedDict)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "embedding_unavailable": 0}
+        self._topic_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+        _cache_registry[namespace] = self
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        """计算并归一化问题向量；embedding 不可用时返回 None"""
+        try:
+            vector = self.embed_fn(question)
+        except Exception as e:
+            logger.warning(f"SemanticResponseCache: 计算问题 embedding 失败，跳过缓存: {e}")
+            vector = None
+        if not vector:
+            with self._lock:
+                self._stats["embedding_unavailable"] += 1
+            return None
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else None
+
+    def lookup(self, scope: ResponseCacheScope, vector: np.ndarray) -> Optional[str]:
+        """在同一作用域内查找最相似的历史回答，相似度达到阈值时返回"""
+        hit = self.find(scope, vector)
+        return hit.response if hit is not None else None
+
+    def find(self, scope: ResponseCacheScope, vector: np.ndarray) -> Optional[CacheHit]:
+        """与 lookup 相同，但返回包含相似度和来源的 CacheHit"""
+        now = time.time()
+        with self._lock:
+            self._stats["lookups"] += 1
+            entries = self._topics.get((scope.group, scope.topic))
+            best_id, best_score = None, -1.0
+            if entries:
+                for entry_id, entry in list(entries.items()):
+                    if entry.expires_at <= now:
+                        del entries[entry_id]
+                        self._stats["expired"] += 1
+                        continue
+                    if entry.scope != scope or entry.vector.shape != vector.shape:
+                        continue
+                    score = float(np.dot(entry.vector, vector))
+                    if score > best_score:
+                        best_id, best_score = entry_id, score
+
+            if best_id is not None and best_score >= self.similarity_threshold:
+                entry = entries[best_id]
+                entries.move_to_end(best_id)
+                entry.hits += 1
+                self._stats["hits"] += 1
+                self._topic_stats[scope.topic]["hits"] += 1
+                logger.info(f"SemanticResponseCache: 命中 topic={scope.topic} stage={scope.hint_stage} similarity={best_score:.3f}")
+                return CacheHit(
+                    response=entry.response,
+                    similarity=best_score,
+                    entry_id=best_id,
+                    stored_at=entry.stored_at,
+                    origin=dict(entry.origin),
+                )
+
+            self._stats["misses"] += 1
+            self._topic_stats[scope.topic]["misses"] += 1
+            return None
+
+    def store(self, scope: ResponseCacheScope, vector: np.ndarray, response: str,
+              origin: Optional[Dict[str, Any]] = None):
+        """
+        保存一条回答；超出该知识点容量时淘汰最久未使用的条目
+
+        Args:
+            origin: 回答的来源（例如生成它的 LLM 路由），命中时原样放进 CacheHit
+        """
+        now = time.time()
+        with self._lock:
+            entries = self._topics[(scope.group, scope.topic)]
+            entries[self._next_id] = _Entry(
+                scope=scope,
+                vector=vector,
+                response=response,
+                expires_at=now + self.ttl_seconds,
+                stored_at=now,
+                origin=dict(origin or {}),
+            )
+            self._next_id += 1
+            self._stats["stores"] += 1
+            while len(entries) > self.max_entries_per_topic:
+                entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._topics.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                **self._stats,
+                "entries": sum(len(entries) for entries in self._topics.values()),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries_per_topic": self.max_entries_per_topic,
+                "topics": {topic: dict(counts) for topic, counts in self._topic_stats.items()},
+            }
@@ -0,0 +1,173 @@
+# backend/app/services/result_cache.py
+"""
+两级结果缓存（内存 LRU + SQLite 磁盘层）
+
+- 内存层：有界 LRU，条目带过期时间，命中即返回。
+- 磁盘层：SQLite 表，进程重启后仍然有效；内存未命中时查询，命中后回填内存层。
+- 每个缓存实例有自己的 namespace，多个实例可以共用同一个 SQLite 文件。
+- 记录内存命中、磁盘命中和未命中次数，用于计算命中率。
+
+缓存值必须可以 JSON 序列化。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 所有已创建的缓存实例，供管理接口汇总统计
+_cache_registry: Dict[str, "TieredCache"] = {}
+
+
+def normalize_text(text: str) -> str:
+    """缓存键用的文本规范化：全半角统一、去首尾空白、合并空白、小写"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split()).lower()
+
+
+class TieredCache:
+    """带 TTL、容量上限和命中率统计的两级缓存"""
+
+    # 每写入多少次磁盘条目做一次过期/超量清理
+    PRUNE_EVERY = 256
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int,
+        ttl_seconds: float,
+        db_path: Optional[str] = None,
+        max_disk_entries: Optional[int] = None,
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries or max_entries * 10
+
+        self._memory: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    " namespace TEXT NOT NULL,"
+                    " key TEXT NOT NULL,"
+                    " value TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL,"
+                    " PRIMARY KEY (namespace, key))"
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"ResultCache[{namespace}]: 磁盘缓存不可用，仅使用内存缓存: {e}")
+                self._db = None
+
+        _cache_registry[namespace] = self
+
+    @staticmethod
+    def make_key(*parts: Hashable) -> str:
+        raw = json.dumps(parts, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                        (self.namespace, key),
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"ResultCache[{self.namespace}]: 读取磁盘缓存失败: {e}")
+                    row = None
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._put_memory(key, row[1], value)
+                    self._stats["disk_hits"] += 1
+                    return value
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._put_memory(key, expires_at, value)
+            self._stats["sets"] += 1
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value, ensure_ascii=False), expires_at),
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= self.PRUNE_EVERY:
+                    self._prune_disk()
+            except sqlite3.Error as e:
+                logger.warning(f"ResultCache[{self.namespace}]: 写入磁盘缓存失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def _put_memory(self, key: str, expires_at: float, value: Any):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _prune_disk(self):
+        """删除过期条目，并把磁盘条目数限制在 max_disk_entries 以内（先删最早过期的）"""
+        self._writes_since_prune = 0
+        self._db.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, time.time()),
+        )
+        self._db.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache_entries WHERE namespace = ?"
+            " ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_disk_entries),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["max_entries"] = self.max_entries
+        stats["disk_enabled"] = self._db is not None
+        return stats
+
+
+def all_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """汇总所有缓存实例的统计信息"""
+    return {namespace: cache.stats() for namespace, cache in _cache_registry.items()}
@@ -509,7 +509,3 @@ class SandboxService:
         
         # 其他情况直接返回原值
         return color_value
-
-
-# 默认实例
-sandbox_service = SandboxService()
@@ -1,110 +1,169 @@
-import os
-import warnings
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
 from app.schemas.chat import SentimentAnalysisResult
+from app.services.micro_batcher import MicroBatcher
+from app.services.sentiment_backends import SENTIMENT_LABELS, create_sentiment_backend
+from app.services.sentiment_lexicon import LexiconSentimentClassifier, SentimentResultCache, normalize_text
+
+# 结果 details["tier"] 的取值：缓存命中 / 词典规则 / 模型推理 / 空文本或模型不可用时的中性结果
+SENTIMENT_TIERS = ("cache", "lexicon", "model", "fallback")
 
 class SentimentAnalysisService:
     def __init__(self):
         self.model_available = False
-        self.model = None
-        self.tokenizer = None
-        self.device = None
-        
-        # 检查模型文件是否存在
-        model_dir = 'models/sentiment_bert'
-        if os.path.exists(model_dir):
-            try:
-                # 只在模型文件存在时才导入相关库
-                import torch
-                from transformers import BertTokenizer, BertForSequenceClassification
-                from transformers.utils import logging
-                from safetensors.torch import load_file
-                
-                # 设置日志级别和警告
-                os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
-                os.environ["PYTHONWARNINGS"] = "ignore"
-                warnings.filterwarnings("ignore")
-                logging.set_verbosity_error()
-                
-                # 加载模型和tokenizer
-                self.tokenizer = BertTokenizer.from_pretrained(model_dir)
-                
-                # 加载模型
-                self.model = BertForSequenceClassification.from_pretrained(
-                    model_dir,
-                    local_files_only=True
-                )
-                
-                # 设置设备
-                self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-                self.model = self.model.to(self.device)
-                self.model.eval()
-                
-                self.model_available = True
-                print("✅ BERT情感分析模型加载成功")
-                
-            except Exception as e:
-                print(f"⚠️  BERT模型加载失败: {e}")
-                print("📝 将使用简化的情感分析功能")
-                self.model_available = False
-        else:
-            print("⚠️  未找到BERT模型文件，跳过模型加载")
+        # 推理后端：torch（全精度）或 onnx（量化，CPU），由 SENTIMENT_BACKEND 选择
+        self.backend = None
+        self.backend_name = settings.SENTIMENT_BACKEND
+
+        try:
+            self.backend = create_sentiment_backend(
+                settings.SENTIMENT_BACKEND,
+                model_dir=settings.SENTIMENT_MODEL_DIR,
+                onnx_dir=settings.SENTIMENT_ONNX_DIR,
+                num_threads=settings.SENTIMENT_INFERENCE_THREADS
+            )
+            self.model_available = True
+            print(f"✅ 情感分析模型加载成功（{self.backend_name} 后端）")
+        except FileNotFoundError as e:
+            print(f"⚠️  未找到情感分析模型文件（{self.backend_name} 后端）: {e}")
             print("📝 情感分析功能将返回中性结果")
-            self.model_available = False
-        
+        except Exception as e:
+            print(f"⚠️  情感分析模型加载失败（{self.backend_name} 后端）: {e}")
+            print("📝 将使用简化的情感分析功能")
+
         # 标签映射
-        self.label_map = {0: 'NEGATIVE', 1: 'NEUTRAL', 2: 'POSITIVE'}
-      
+        self.label_map = dict(SENTIMENT_LABELS)
+
+        # 快速层：模型结果的 LRU 缓存和规则/词典分类器，都无法判断时才调用模型
+        self.cache = (
+            SentimentResultCache(settings.SENTIMENT_CACHE_MAX_ENTRIES)
+            if settings.SENTIMENT_CACHE_MAX_ENTRIES > 0 else None
+        )
+        self.lexicon = (
+            LexiconSentimentClassifier(max_chars=settings.SENTIMENT_LEXICON_MAX_CHARS)
+            if settings.SENTIMENT_LEXICON_ENABLED else None
+        )
+        self._tier_counts = {tier: 0 for tier in SENTIMENT_TIERS}
+        self._counts_lock = threading.Lock()
+
+        # 动态微批处理：并发请求在专用线程中合并为一次前向计算（仅在模型可用时）
+        self.batcher = None
+        if self.model_available and settings.SENTIMENT_BATCHING_ENABLED:
+            self.batcher = MicroBatcher(
+                self._infer_batch,
+                max_batch_size=settings.SENTIMENT_BATCH_MAX_SIZE,
+                max_wait_ms=settings.SENTIMENT_BATCH_MAX_WAIT_MS,
+                name="sentiment-batcher"
+            )
+
+    @property
+    def batching(self) -> bool:
+        """是否通过微批处理执行推理（调用方可以直接等待 submit 返回的 Future）"""
+        return self.model_available and self.batcher is not None
+
+    def _count(self, tier: str, n: int = 1):
+        with self._counts_lock:
+            self._tier_counts[tier] += n
+
+    def _neutral(self, reason: str) -> SentimentAnalysisResult:
+        self._count("fallback")
+        return SentimentAnalysisResult(
+            label="NEUTRAL",
+            confidence=1.0,
+            details={"tier": "fallback", "reason": reason}
+        )
+
+    def fast_path(self, text: str) -> Optional[SentimentAnalysisResult]:
+        """
+        不经过模型的快速层：缓存 -> 词典 -> 中性兜底（空文本或模型不可用）。
+        返回 None 表示需要模型推理。
+        """
+        key = normalize_text(text)
+        if not key:
+            return self._neutral("empty")
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cache")
+                details = {**cached.details, "tier": "cache", "cached_tier": cached.details["tier"]}
+                return cached.model_copy(update={"details": details})
+        if self.lexicon is not None:
+            result = self.lexicon.classify(key)
+            if result is not None:
+                self._count("lexicon")
+                return result
+        if not self.model_available:
+            return self._neutral("model_unavailable")
+        return None
+
+    def submit(self, text: str) -> Future:
+        """
+        提交一条情感分析请求，返回结果的 Future。
+        快速层能判断时返回已完成的 Future；未启用批处理时在当前线程推理。
+        """
+        fast = self.fast_path(text)
+        if fast is not None:
+            future = Future()
+            future.set_result(fast)
+            return future
+        if self.batcher is not None:
+            return self.batcher.submit(text)
+        future = Future()
+        try:
+            future.set_result(self._infer_batch([text])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
     def analyze_sentiment(self, text: str) -> SentimentAnalysisResult:
         """
         Analyzes the sentiment of a given text.
         Returns a SentimentAnalysisResult object
         """
-        if not text.strip():
-            return SentimentAnalysisResult(
-                label="NEUTRAL",
-                confidence=1.0
-            )
-        
-        # 如果模型不可用，返回中性结果
-        if not self.model_available:
-            return SentimentAnalysisResult(
-                label="NEUTRAL",
-                confidence=1.0
+        fast = self.fast_path(text)
+        if fast is not None:
+            return fast
+
+        if self.batcher is not None:
+            return self.batcher.submit(text).result()
+        return self._infer_batch([text])[0]
+
+    def _infer_batch(self, texts: List[str]) -> List[SentimentAnalysisResult]:
+        """一次前向计算分析一批文本（按批内最长的文本动态填充），结果与输入顺序一致，并写入缓存"""
+        results = []
+        for text, probs in zip(texts, self.backend.predict(texts)):
+            pred = max(range(len(probs)), key=probs.__getitem__)
+            result = SentimentAnalysisResult(
+                label=self.label_map.get(pred, 'NEUTRAL'),
+                confidence=probs[pred],
+                details={"tier": "model", "backend": self.backend_name}
             )
-        
-        # 只在模型可用时才导入torch
-        import torch
-        
-        # 对输入文本进行编码
-        encoding = self.tokenizer.encode_plus(
-            text,
-            add_special_tokens=True,
-            max_length=128,
-            truncation=True,
-            padding='max_length',
-            return_attention_mask=True,
-            return_tensors='pt'
-        )
-        
-        # 将输入数据移动到指定设备
-        input_ids = encoding['input_ids'].to(self.device)
-        attention_mask = encoding['attention_mask'].to(self.device)
-        
-        # 模型推理
-        with torch.no_grad():
-            outputs = self.model(input_ids, attention_mask=attention_mask)
-            logits = outputs.logits
-            probs = torch.nn.functional.softmax(logits, dim=1)
-            score, pred = torch.max(probs, dim=1)
-            
-        # 返回结果
-        return SentimentAnalysisResult(
-            label=self.label_map.get(pred.item(), 'NEUTRAL'),
-            confidence=score.item()
-        )
+            if self.cache is not None:
+                self.cache.put(normalize_text(text), result)
+            results.append(result)
+        self._count("model", len(results))
+        return results
+
+    def close(self):
+        """停止微批处理线程（应用关闭时由服务注册表调用）"""
+        if self.batcher is not None:
+            self.batcher.close(timeout=1.0)
 
-# 创建单例实例
-sentiment_analysis_service = SentimentAnalysisService()
+    def stats(self) -> Dict[str, Any]:
+        """各层处理的消息数与占比、缓存条目数、微批处理统计"""
+        with self._counts_lock:
+            counts = dict(self._tier_counts)
+        total = sum(counts.values())
+        return {
+            "backend": self.backend_name,
+            "model_available": self.model_available,
+            "tiers": counts,
+            "tier_share": {tier: round(n / total, 4) if total else 0.0 for tier, n in counts.items()},
+            "cache_entries": len(self.cache) if self.cache is not None else 0,
+            "batcher": self.batcher.stats() if self.batcher is not None else None,
+        }
 
 if __name__ == "__main__":
     sentiment_analysis_service = SentimentAnalysisService()
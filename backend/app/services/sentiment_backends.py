@@ -0,0 +1,136 @@
+# backend/app/services/sentiment_backends.py
+"""
+情感分析推理后端（由 SENTIMENT_BACKEND 选择）
+
+- torch：transformers 全精度模型（SENTIMENT_MODEL_DIR，即 models/sentiment_bert）
+- onnx：scripts/export_sentiment_onnx.py 导出并做了动态 int8 量化的 ONNX 模型（SENTIMENT_ONNX_DIR），
+  用 ONNX Runtime 在 CPU 上推理；运行时只依赖 onnxruntime + tokenizers，不导入 torch / transformers
+
+两种后端的 predict 接口相同：输入一批文本，按批内最长文本动态填充后一次前向计算，
+返回每条文本各标签的概率（与输入顺序一致）。
+"""
+import os
+import warnings
+from typing import List
+
+# 与原实现一致：超过 128 个 token 的消息截断
+MAX_LENGTH = 128
+SENTIMENT_BACKENDS = ("torch", "onnx")
+# 模型输出下标 -> 标签
+SENTIMENT_LABELS = {0: 'NEGATIVE', 1: 'NEUTRAL', 2: 'POSITIVE'}
+
+ONNX_MODEL_FILENAME = "model.int8.onnx"
+ONNX_FP32_MODEL_FILENAME = "model.onnx"
+ONNX_TOKENIZER_FILENAME = "tokenizer.json"
+
+
+def _softmax(logits) -> List[List[float]]:
+    import numpy as np
+
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return (exp / exp.sum(axis=1, keepdims=True)).tolist()
+
+
+class TorchSentimentBackend:
+    """transformers + PyTorch 全精度推理"""
+
+    name = "torch"
+
+    def __init__(self, model_dir: str, num_threads: int = 0):
+        if not os.path.exists(model_dir):
+            raise FileNotFoundError(model_dir)
+        # 只在模型文件存在时才导入相关库
+        import torch
+        from transformers import BertTokenizer, BertForSequenceClassification
+        from transformers.utils import logging
+
+        # 设置日志级别和警告
+        os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+        os.environ["PYTHONWARNINGS"] = "ignore"
+        warnings.filterwarnings("ignore")
+        logging.set_verbosity_error()
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        self.tokenizer = BertTokenizer.from_pretrained(model_dir)
+        self.model = BertForSequenceClassification.from_pretrained(model_dir, local_files_only=True)
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = self.model.to(self.device)
+        self.model.eval()
+
+    def predict(self, texts: List[str]) -> List[List[float]]:
+        import torch
+
+        encoding = self.tokenizer(
+            texts,
+            add_special_tokens=True,
+            max_length=MAX_LENGTH,
+            truncation=True,
+            padding='longest',
+            return_attention_mask=True,
+            return_tensors='pt'
+        )
+        input_ids = encoding['input_ids'].to(self.device)
+        attention_mask = encoding['attention_mask'].to(self.device)
+        with torch.no_grad():
+            logits = self.model(input_ids, attention_mask=attention_mask).logits
+            return torch.nn.functional.softmax(logits, dim=1).tolist()
+
+
+class OnnxSentimentBackend:
+    """ONNX Runtime（CPU）推理量化后的模型"""
+
+    name = "onnx"
+
+    def __init__(self, onnx_dir: str, num_threads: int = 0, model_filename: str = ONNX_MODEL_FILENAME):
+        model_path = os.path.join(onnx_dir, model_filename)
+        tokenizer_path = os.path.join(onnx_dir, ONNX_TOKENIZER_FILENAME)
+        for path in (model_path, tokenizer_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(MAX_LENGTH)
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        # 不指定 length 时填充到批内最长的文本
+        self.tokenizer.enable_padding(pad_id=0 if pad_id is None else pad_id, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+    def predict(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self.session.run(None, feeds)[0]
+        return _softmax(logits)
+
+
+def create_sentiment_backend(name: str, model_dir: str, onnx_dir: str, num_threads: int = 0):
+    """
+    按名称创建推理后端
+
+    Raises:
+        ValueError: 未知的后端名称
+        FileNotFoundError: 模型文件不存在
+    """
+    if name == "torch":
+        return TorchSentimentBackend(model_dir, num_threads=num_threads)
+    if name == "onnx":
+        return OnnxSentimentBackend(onnx_dir, num_threads=num_threads)
+    raise ValueError(f"Unknown SENTIMENT_BACKEND '{name}', expected one of {SENTIMENT_BACKENDS}")
@@ -0,0 +1,144 @@
+# backend/app/services/sentiment_lexicon.py
+"""
+情感分析的快速层：结果缓存 + 规则/词典分类器
+
+聊天里大量消息很短（"ok"、"thanks"、"why?"、"还是不行"），不需要 BERT 前向计算。
+SentimentAnalysisService 按以下顺序分层处理：
+1. SentimentResultCache：规范化文本 -> 模型结果的有界 LRU 缓存
+2. LexiconSentimentClassifier：短消息或命中多个同向线索的消息直接给出标签（中英文的挫败、困惑、感谢等）
+3. 前两层都无法判断时才交给模型
+
+词典只输出与模型相同的标签集合（NEGATIVE / NEUTRAL / POSITIVE），线索类型（frustration、confusion 等）
+写在 details 中，便于核对快速层是否让实验数据产生偏差。
+"""
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.schemas.chat import SentimentAnalysisResult
+
+_WHITESPACE = re.compile(r"\s+")
+
+# 整条消息（去掉结尾标点后）完全匹配时的标签与置信度
+_EXACT_MESSAGES: Dict[str, Tuple[str, str, float]] = {}
+for _label, _cue, _confidence, _messages in (
+    ("NEUTRAL", "acknowledgement", 0.9, (
+        "ok", "okay", "k", "kk", "yes", "yeah", "yep", "sure", "alright", "fine", "next", "continue", "go on",
+        "i see", "hmm", "hm", "嗯", "嗯嗯", "好", "好的", "行", "可以", "收到", "继续", "下一步", "知道了",
+    )),
+    ("NEUTRAL", "question", 0.85, (
+        "why", "how", "what about", "and then", "then what", "really", "为什么", "为啥", "怎么做", "然后呢", "真的吗",
+    )),
+    ("POSITIVE", "gratitude", 0.9, (
+        "thanks", "thank you", "thx", "ty", "thanks a lot", "cool", "nice", "great", "awesome", "perfect",
+        "got it", "it works", "works now", "谢谢", "谢啦", "多谢", "太好了", "懂了", "明白了", "成功了", "可以了",
+    )),
+):
+    for _message in _messages:
+        _EXACT_MESSAGES[_message] = (_label, _cue, _confidence)
+
+# 出现在消息中任意位置的线索：(线索类型, 标签, 正则)
+_CUE_PATTERNS: List[Tuple[str, str, re.Pattern]] = [
+    ("frustration", "NEGATIVE", re.compile(
+        r"\bstuck\b|frustrat|\bgive up\b|\bgiving up\b|\bannoying\b|\bugh+\b|\bhate (this|it)\b|"
+        r"\b(does ?n[o']?t|did ?n[o']?t|still ?n[o']?t|not) work(ing)?\b|\bstill (wrong|broken|failing)\b|"
+        r"\bnothing works\b|还是不行|不行啊|卡住|卡在|好烦|烦死|崩溃|放弃|搞不定|又错|还是错|怎么还是"
+    )),
+    ("confusion", "NEGATIVE", re.compile(
+        r"\bconfus|\b(do ?n[o']?t|still do ?n[o']?t) (understand|get (it|this))\b|\bi'?m lost\b|\bno idea\b|"
+        r"\bmakes? no sense\b|\?\?+|不懂|不明白|看不懂|没看懂|没懂|听不懂|什么意思|啥意思|搞不懂|一头雾水"
+    )),
+    ("gratitude", "POSITIVE", re.compile(
+        r"\bthanks?\b|\bthank you\b|\bappreciate\b|\bhelpful\b|\bmakes sense( now)?\b|\bthat works\b|"
+        r"谢谢|感谢|有帮助|原来如此|终于(懂|明白|成功|好)了"
+    )),
+]
+
+# 出现否定词时正向线索不可靠（"not helpful"、"不太懂了"），交给模型
+_NEGATION = re.compile(r"\bnot\b|n't\b|\bno\b|\bnever\b|不|没")
+
+
+def normalize_text(text: str) -> str:
+    """缓存与词典使用的规范化形式：NFKC（全角转半角）、小写、合并空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+class LexiconSentimentClassifier:
+    """规则/词典分类器：只在有把握时给出结果，否则返回 None 交给模型"""
+
+    def __init__(self, max_chars: int = 24, min_cues_for_long_text: int = 2):
+        """
+        Args:
+            max_chars: 短消息的最大长度（规范化后的字符数），短消息命中单一方向的线索即可判断
+            min_cues_for_long_text: 长消息至少命中多少种同向线索（且没有反向线索）才直接判断
+        """
+        self.max_chars = max_chars
+        self.min_cues_for_long_text = min_cues_for_long_text
+
+    def classify(self, normalized: str) -> Optional[SentimentAnalysisResult]:
+        """
+        Args:
+            normalized: normalize_text 处理后的文本
+
+        Returns:
+            有把握时返回结果（details 中记录命中的线索），否则返回 None
+        """
+        if not normalized:
+            return None
+        exact = _EXACT_MESSAGES.get(normalized.rstrip(" .!?。！？~～…"))
+        if exact is not None:
+            label, cue, confidence = exact
+            return self._result(label, confidence, [cue])
+
+        cues = [(cue, label) for cue, label, pattern in _CUE_PATTERNS if pattern.search(normalized)]
+        labels = {label for _, label in cues}
+        if len(labels) != 1:
+            # 没有线索，或正负线索同时出现（"I was stuck but now it works, thanks"）
+            return None
+        label = labels.pop()
+        if label == "POSITIVE" and _NEGATION.search(normalized):
+            return None
+        if len(normalized) <= self.max_chars:
+            return self._result(label, 0.85, [cue for cue, _ in cues])
+        if len(cues) >= self.min_cues_for_long_text:
+            return self._result(label, 0.8, [cue for cue, _ in cues])
+        return None
+
+    @staticmethod
+    def _result(label: str, confidence: float, cues: List[str]) -> SentimentAnalysisResult:
+        return SentimentAnalysisResult(label=label, confidence=confidence, details={"tier": "lexicon", "cues": cues})
+
+
+class SentimentResultCache:
+    """规范化文本 -> 模型结果的有界 LRU 缓存（线程安全，模型固定时结果不会过期）"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, SentimentAnalysisResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[SentimentAnalysisResult]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: str, result: SentimentAnalysisResult):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,10 +1,12 @@
 # backend/app/services/translation_service.py
+from typing import Optional
 from openai import OpenAI
 from app.core.config import settings
+from app.services.result_cache import TieredCache, normalize_text
 import time
 
 class TranslationService:
-    def __init__(self):
+    def __init__(self, cache: Optional[TieredCache] = None):
         # 使用独立的翻译API配置
         self.client = OpenAI(
             api_key=settings.TUTOR_TRANSLATION_API_KEY,
@@ -12,6 +14,8 @@ class TranslationService:
             timeout=30.0  # 设置30秒超时
         )
         self.translation_model = settings.TUTOR_TRANSLATION_MODEL
+        # 翻译结果缓存，键为规范化后的原文（可选）
+        self.cache = cache
 
     def translate(self, text: str, source_lang: str = "zh", target_lang: str = "en") -> str:
         """
@@ -20,6 +24,13 @@ class TranslationService:
         # 处理空查询
         if not text or not text.strip():
             return ""
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = TieredCache.make_key(self.translation_model, source_lang, target_lang, normalize_text(text))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
             
         try:
             # 添加重试机制
@@ -39,7 +50,10 @@ class TranslationService:
                     )
                     
                     if response.choices and len(response.choices) > 0 and response.choices[0].message.content:
-                        return response.choices[0].message.content.strip()
+                        translated = response.choices[0].message.content.strip()
+                        if cache_key is not None:
+                            self.cache.set(cache_key, translated)
+                        return translated
                     else:
                         raise ValueError("Empty translation received from API")
                 except Exception as e:
@@ -0,0 +1,287 @@
+# backend/app/services/vector_store.py
+"""
+版本化向量库管理
+
+目录结构::
+
+    vector_store/
+        v1/
+            kb.ann
+            kb_chunks.json
+            manifest.json
+        v2/
+            ...
+
+- 每个版本目录在所有文件写完后最后写入 ``manifest.json``，因此没有 manifest 的目录
+  （构建中或中断的构建）永远不会被加载。
+- 版本号最大的、带 manifest 的目录即为“已发布”的当前版本。
+- 兼容旧布局：若不存在任何版本目录，则把 ``vector_store/`` 根目录下的
+  ``kb.ann`` / ``kb_chunks.json`` 视为版本 0。
+
+KnowledgeBaseVersion 通过引用计数跟踪正在使用它的检索请求；被替换下来的旧版本会在
+最后一个在途查询结束后才 ``unload()``（解除内存映射）。
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from annoy import AnnoyIndex
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+LEGACY_VERSION = 0
+DEFAULT_EMBEDDING_DIMENSION = 2560  # for Qwen/Qwen3-Embedding-4B-GGUF
+
+_VERSION_DIR_PATTERN = re.compile(r"^v(\d+)$")
+
+
+class KnowledgeBaseVersion:
+    """一个已加载到内存的知识库版本（Annoy 索引 + 文本块）"""
+
+    def __init__(self, version: int, path: str, manifest: Dict[str, Any], prefault: bool = False):
+        self.version = version
+        self.path = path
+        self.manifest = manifest
+        self.embedding_dimension = int(manifest.get("embedding_dimension", DEFAULT_EMBEDDING_DIMENSION))
+
+        ann_path = os.path.join(path, manifest.get("ann_file", settings.KB_ANN_FILENAME))
+        chunks_path = os.path.join(path, manifest.get("chunks_file", settings.KB_CHUNKS_FILENAME))
+
+        self.index = AnnoyIndex(self.embedding_dimension, manifest.get("metric", "angular"))
+        # 使用内存映射加载索引，非常高效
+        self.index.load(ann_path, prefault=prefault)
+
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            self.chunks = json.load(f)
+
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+        self._unloaded = False
+
+    def acquire(self) -> "KnowledgeBaseVersion":
+        with self._lock:
+            if self._unloaded:
+                raise RuntimeError(f"Knowledge base version {self.version} has already been unloaded")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            should_unload = self._retired and self._refs <= 0
+        if should_unload:
+            self._unload()
+
+    def retire(self):
+        """标记为已替换；没有在途查询时立即卸载，否则由最后一个 release() 卸载"""
+        with self._lock:
+            self._retired = True
+            should_unload = self._refs <= 0
+        if should_unload:
+            self._unload()
+
+    def _unload(self):
+        with self._lock:
+            if self._unloaded:
+                return
+            self._unloaded = True
+        self.index.unload()
+        logger.info(f"VectorStore: 已卸载知识库版本 v{self.version}")
+
+    @property
+    def in_flight(self) -> int:
+        return self._refs
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "chunk_count": len(self.chunks),
+            "embedding_dimension": self.embedding_dimension,
+            "loaded_at": self.loaded_at,
+            "in_flight": self._refs,
+            "manifest": self.manifest,
+        }
+
+
+class VectorStoreManager:
+    """负责发现、发布和加载 vector_store 下的版本目录"""
+
+    def __init__(self, root_dir: Optional[str] = None):
+        self.root_dir = root_dir or settings.VECTOR_STORE_DIR
+
+    def list_versions(self) -> List[int]:
+        """返回所有已发布（带 manifest）的版本号，升序"""
+        versions = []
+        if not os.path.isdir(self.root_dir):
+            return versions
+        for name in os.listdir(self.root_dir):
+            match = _VERSION_DIR_PATTERN.match(name)
+            if match and os.path.exists(os.path.join(self.root_dir, name, MANIFEST_FILENAME)):
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def latest_version(self) -> int:
+        """最新已发布版本；不存在版本目录时回退到旧布局（版本 0）"""
+        versions = self.list_versions()
+        if versions:
+            return versions[-1]
+        if os.path.exists(os.path.join(self.root_dir, settings.KB_ANN_FILENAME)):
+            return LEGACY_VERSION
+        raise FileNotFoundError(f"No published knowledge base found in {self.root_dir}")
+
+    def version_path(self, version: int) -> str:
+        if version == LEGACY_VERSION:
+            return self.root_dir
+        return os.path.join(self.root_dir, f"v{version}")
+
+    def read_manifest(self, version: int) -> Dict[str, Any]:
+        manifest_path = os.path.join(self.version_path(version), MANIFEST_FILENAME)
+        if version == LEGACY_VERSION and not os.path.exists(manifest_path):
+            return {
+                "version": LEGACY_VERSION,
+                "ann_file": settings.KB_ANN_FILENAME,
+                "chunks_file": settings.KB_CHUNKS_FILENAME,
+                "embedding_dimension": DEFAULT_EMBEDDING_DIMENSION,
+            }
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, version: Optional[int] = None, prefault: bool = False) -> KnowledgeBaseVersion:
+        """加载指定版本（默认最新版本）"""
+        if version is None:
+            version = self.latest_version()
+        manifest = self.read_manifest(version)
+        return KnowledgeBaseVersion(version, self.version_path(version), manifest, prefault=prefault)
+
+    def allocate_version_dir(self) -> tuple[int, str]:
+        """为新构建分配下一个版本目录（尚未发布，直到写入 manifest）"""
+        versions = self.list_versions()
+        next_version = (versions[-1] if versions else LEGACY_VERSION) + 1
+        # 跳过已存在但未发布（无 manifest）的目录，避免覆盖中断的构建
+        while os.path.exists(self.version_path(next_version)):
+            next_version += 1
+        path = self.version_path(next_version)
+        os.makedirs(path)
+        return next_version, path
+
+    def publish(self, version: int, **metadata) -> Dict[str, Any]:
+        """写入 manifest，使该版本对 RAGService 可见"""
+        path = self.version_path(version)
+        chunks_file = metadata.pop("chunks_file", settings.KB_CHUNKS_FILENAME)
+        chunk_count = metadata.pop("chunk_count", None)
+        if chunk_count is None:
+            with open(os.path.join(path, chunks_file), "r", encoding="utf-8") as f:
+                chunk_count = len(json.load(f))
+        manifest = {
+            "version": version,
+            "created_at": time.time(),
+            "ann_file": metadata.pop("ann_file", settings.KB_ANN_FILENAME),
+            "chunks_file": chunks_file,
+            "chunk_count": chunk_count,
+            "embedding_model": metadata.pop("embedding_model", settings.TUTOR_EMBEDDING_MODEL),
+            "embedding_dimension": metadata.pop("embedding_dimension", DEFAULT_EMBEDDING_DIMENSION),
+            "metric": metadata.pop("metric", "angular"),
+            **metadata,
+        }
+        # 先写临时文件再原子重命名，保证读者不会看到半个 manifest
+        tmp_path = os.path.join(path, MANIFEST_FILENAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(path, MANIFEST_FILENAME))
+        return manifest
+
+
+class VersionedKnowledgeBase:
+    """
+    持有“当前”知识库版本，并支持原子热切换。
+
+    检索方通过 ``with kb.acquire() as version:`` 取得一个版本的引用；
+    ``swap()`` 只替换指针，旧版本在引用归零后卸载。
+    """
+
+    def __init__(self, manager: Optional[VectorStoreManager] = None, prefault: bool = False):
+        self.manager = manager or VectorStoreManager()
+        self.prefault = prefault
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._current = self.manager.load(prefault=prefault)
+        logger.info(f"VectorStore: 已加载知识库版本 v{self._current.version}")
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    @property
+    def current(self) -> KnowledgeBaseVersion:
+        return self._current
+
+    @contextmanager
+    def acquire(self) -> Iterator[KnowledgeBaseVersion]:
+        with self._swap_lock:
+            kb_version = self._current.acquire()
+        try:
+            yield kb_version
+        finally:
+            kb_version.release()
+
+    def swap(self, new_version: KnowledgeBaseVersion) -> KnowledgeBaseVersion:
+        with self._swap_lock:
+            old_version, self._current = self._current, new_version
+        old_version.retire()
+        logger.info(f"VectorStore: 知识库已从 v{old_version.version} 切换到 v{new_version.version}")
+        return old_version
+
+    def reload(self, version: Optional[int] = None, force: bool = False) -> bool:
+        """
+        在调用线程中加载新版本并原子切换。
+
+        Returns:
+            bool: 是否发生了切换（目标版本与当前版本相同且未 force 时不切换）
+        """
+        with self._reload_lock:
+            target = self.manager.latest_version() if version is None else version
+            if target == self._current.version and not force:
+                return False
+            # 加载持有 _reload_lock（只串行化重载），查询只在 acquire 时短暂持有 _swap_lock，
+            # 因此加载期间查询继续使用旧版本，切换时才会短暂等待
+            new_version = self.manager.load(target, prefault=self.prefault)
+            self.swap(new_version)
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self._current.status(),
+            "available_versions": self.manager.list_versions(),
+        }
+
+
+async def watch_for_new_versions(get_rag_service, interval_seconds: float):
+    """
+    后台轮询 vector_store，发现新发布的版本后在工作线程中加载并切换。
+
+    Args:
+        get_rag_service: 返回当前 RAGService 实例（或 None）的可调用对象
+        interval_seconds: 轮询间隔（秒）
+    """
+    import asyncio
+
+    while True:
+        await asyncio.sleep(interval_seconds)
+        rag_service = get_rag_service()
+        if rag_service is None:
+            continue
+        try:
+            await asyncio.to_thread(rag_service.reload)
+        except Exception as e:
+            logger.error(f"VectorStore: 热加载新版本失败，继续使用 v{rag_service.kb_version}: {e}")
@@ -15,6 +15,7 @@ os.chdir(project_root)
 
 from app.core.config import settings
 from app.services.rag_knowledge_builder_impl import KnowledgeBaseBuilderImpl
+from app.services.vector_store import VectorStoreManager
 
 
 class ResumableKnowledgeBaseBuilder:
@@ -55,11 +56,19 @@ class ResumableKnowledgeBaseBuilder:
             print(f"从目录加载文档: {documents_dir}")
             self.builder.build_from_directory(documents_dir, recursive=True)
             
-            # 保存知识库
-            print(f"保存知识库到: {settings.VECTOR_STORE_DIR}")
-            self.builder.save(settings.VECTOR_STORE_DIR)
+            # 保存知识库到新的版本目录，写完所有文件后再写 manifest 发布
+            store_manager = VectorStoreManager(settings.VECTOR_STORE_DIR)
+            version, version_dir = store_manager.allocate_version_dir()
+            print(f"保存知识库到: {version_dir}")
+            self.builder.save(version_dir)
+            store_manager.publish(
+                version,
+                embedding_model=self.builder.embedding_model,
+                embedding_dimension=self.builder.embedding_dimension,
+                document_count=len(self.builder.documents),
+            )
             
-            print("知识库构建完成!")
+            print(f"知识库构建完成! 已发布版本 v{version}，可通过 POST /api/v1/admin/kb/reload 热加载。")
             return True
             
         except KeyboardInterrupt:
@@ -0,0 +1,503 @@
+# backend/scripts/chat_load_test.py
+"""
+/chat/ai/chat 端到端负载测试（离线）
+
+在进程内启动三个本地 OpenAI 兼容桩服务器（对话、embedding、翻译，见 scripts/stub_openai_server.py），
+用桩 embedding 构建一个临时知识库，用桩情感分析服务替换 BERT 模型，然后用 uvicorn 在本进程内
+启动完整的应用（临时 SQLite 数据库），按目标到达率（泊松到达、开环）回放聊天会话：
+
+- 会话来自 chat_history（--sessions-from，按参与者+会话分组的用户消息），或合成会话（含中文消息以触发翻译）
+- 每个会话模拟一个学生：同一会话的消息依次发送，上一条回复返回后才会被分配下一条
+- 可以依次测试多个到达率（--rates 2,4,8），每一档输出吞吐量、客户端 p50/p95/p99、错误率，
+  以及服务端各阶段（profile、sentiment、retrieval、content、prompt、llm、log）的 p50/p95/p99
+
+饱和点：第一档出现 p95 超过 --slo-p95-ms、错误率超过 --max-error-rate，或吞吐量低于到达率 90% 的到达率；
+报告中同时给出最后一档仍满足条件的到达率（单机可承受的最大请求速率）。
+
+错误包括非 200 响应（含 429 排队已满）、超时，以及网关兜底/内部错误的回复。
+
+用法:
+    python scripts/chat_load_test.py --rates 2,4,8,16 --duration 30
+    python scripts/chat_load_test.py --sessions-from sqlite:///./app/db/database.db --rates 5 --duration 60
+    python scripts/chat_load_test.py --chat-latency lognormal:800:0.5 --chat-tokens-per-second 40 \\
+        --sentiment-latency uniform:20:80 --output load_test.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from stub_openai_server import LatencyDistribution, StubState, start_stub_server
+
+DEFAULT_DOCUMENTS_DIR = os.path.join(BACKEND_DIR, "app", "data", "documents")
+LEARNING_CONTENT_DIR = os.path.join(BACKEND_DIR, "app", "data", "learning_content")
+ADMIN_TOKEN = "load-test"
+
+SYNTHETIC_MESSAGES = [
+    "What is a CSS selector?",
+    "How do I center an element with flexbox?",
+    "Why does my margin not work on an inline element?",
+    "How to add an event listener in JavaScript?",
+    "What is the difference between let and const?",
+    "Can you explain the box model?",
+    "My button click does nothing, what should I check?",
+    "How do I select all paragraphs inside a div?",
+    "我需要帮助理解CSS选择器",
+    "flex布局里 justify-content 和 align-items 有什么区别？",
+    "为什么我的JavaScript代码没有运行？",
+    "怎么给元素添加点击事件？",
+]
+
+
+# --- 会话 ---
+
+def synthetic_sessions(count: int, turns: int, seed: int = 0) -> List[List[str]]:
+    """生成合成会话：每个会话 turns 条消息，从常见问题（中英文）中抽取"""
+    rng = random.Random(seed)
+    return [[rng.choice(SYNTHETIC_MESSAGES) for _ in range(turns)] for _ in range(count)]
+
+
+def load_sessions_from_history(database_url: str, max_sessions: int = 0, max_turns: int = 0) -> List[List[str]]:
+    """
+    从 chat_history 读取用户消息，按 (participant_id, conversation_id) 分组、按时间排序，每组为一个会话
+    """
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    sessions: Dict[tuple, List[str]] = {}
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT participant_id, conversation_id, message FROM chat_history "
+                "WHERE role = 'user' ORDER BY participant_id, conversation_id, timestamp, id"
+            ))
+            for participant_id, conversation_id, message in rows:
+                if message and message.strip():
+                    sessions.setdefault((participant_id, conversation_id), []).append(message)
+    finally:
+        engine.dispose()
+
+    result = [turns[:max_turns] if max_turns else turns for turns in sessions.values()]
+    return result[:max_sessions] if max_sessions else result
+
+
+def _content_ids() -> List[str]:
+    if not os.path.isdir(LEARNING_CONTENT_DIR):
+        return []
+    return sorted(
+        name[:-len(".json")] for name in os.listdir(LEARNING_CONTENT_DIR)
+        if name.endswith(".json") and " " not in name
+    )
+
+
+class VirtualStudent:
+    """一个正在进行的会话：依次发送会话中的消息"""
+
+    def __init__(self, run_id: str, index: int, turns: List[str], content_id: Optional[str], mode: str):
+        self.participant_id = f"load-{run_id}-{index}"
+        self.conversation_id = uuid.uuid4().hex[:16]
+        self.turns = deque(turns)
+        self.content_id = content_id
+        self.mode = mode
+
+    def next_request(self) -> dict:
+        return {
+            "participant_id": self.participant_id,
+            "user_message": self.turns.popleft(),
+            "conversation_id": self.conversation_id,
+            "mode": self.mode if self.content_id else None,
+            "content_id": self.content_id,
+        }
+
+
+# --- 统计 ---
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)], 1)
+
+
+def summarize_step(rate: float, records: List[dict], elapsed: float) -> dict:
+    """
+    汇总一档到达率的客户端结果
+
+    吞吐量按第一个到最后一个成功回复之间的时间窗口计算：未饱和时该窗口约等于发送时长，
+    不受最后一批请求收尾时间的影响；饱和时请求积压，窗口被拉长，吞吐量低于到达率。
+    """
+    outcomes = Counter(record["outcome"] for record in records)
+    ok_latencies = [record["latency_ms"] for record in records if record["outcome"] == "ok"]
+    all_latencies = [record["latency_ms"] for record in records]
+    ok_done = sorted(record["done_at"] for record in records if record["outcome"] == "ok")
+    window = ok_done[-1] - ok_done[0] if len(ok_done) > 1 else 0.0
+    return {
+        "rate": rate,
+        "requests": len(records),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput": round((len(ok_done) - 1) / window, 3) if window > 0 else 0.0,
+        "error_rate": round(1 - outcomes["ok"] / len(records), 4) if records else 0.0,
+        "outcomes": dict(outcomes),
+        "p50_ms": _percentile(all_latencies, 50),
+        "p95_ms": _percentile(all_latencies, 95),
+        "p99_ms": _percentile(all_latencies, 99),
+        "ok_p95_ms": _percentile(ok_latencies, 95),
+    }
+
+
+def find_saturation(steps: List[dict], slo_p95_ms: float, max_error_rate: float) -> dict:
+    """
+    找出饱和点：按到达率从低到高，第一档 p95 超标、错误率超标或吞吐量跟不上到达率的档位
+
+    Returns:
+        dict: {"saturation_rate": 第一档不满足条件的到达率或 None, "max_sustainable_rate": 最后一档满足条件的到达率或 None,
+               "reason": 不满足的原因}
+    """
+    sustainable = None
+    for step in sorted(steps, key=lambda s: s["rate"]):
+        reasons = []
+        if step["p95_ms"] is None or step["p95_ms"] > slo_p95_ms:
+            reasons.append(f"p95 {step['p95_ms']}ms > {slo_p95_ms}ms")
+        if step["error_rate"] > max_error_rate:
+            reasons.append(f"error rate {step['error_rate']:.2%} > {max_error_rate:.2%}")
+        if step["throughput"] < 0.9 * step["offered_rate"]:
+            reasons.append(f"throughput {step['throughput']}/s < 90% of {step['offered_rate']}/s")
+        if reasons:
+            return {"saturation_rate": step["rate"], "max_sustainable_rate": sustainable, "reason": "; ".join(reasons)}
+        sustainable = step["rate"]
+    return {"saturation_rate": None, "max_sustainable_rate": sustainable, "reason": None}
+
+
+# --- 负载生成 ---
+
+def _classify(status_code: int, body: Optional[dict]) -> str:
+    from app.services.dynamic_controller import CRITICAL_ERROR_RESPONSE
+    from app.services.llm_gateway import FALLBACK_RESPONSE_PREFIX
+
+    if status_code == 429:
+        return "busy"
+    if status_code != 200 or not body:
+        return f"http_{status_code}"
+    reply = (body.get("data") or {}).get("ai_response") or ""
+    if reply == CRITICAL_ERROR_RESPONSE:
+        return "critical_error"
+    if FALLBACK_RESPONSE_PREFIX in reply:
+        return "fallback"
+    return "ok"
+
+
+async def run_step(
+    client: httpx.AsyncClient,
+    chat_url: str,
+    sessions: List[List[str]],
+    rate: float,
+    duration: float,
+    run_id: str,
+    seed: int = 0,
+    test_mode_ratio: float = 0.2,
+) -> List[dict]:
+    """
+    以 rate 个请求/秒（泊松到达）发送 duration 秒的请求，等待所有请求完成后返回每个请求的记录。
+
+    每个到达分配给一个空闲的学生（上一条回复已返回且会话还有消息）；没有空闲学生时从会话池开始一个新会话。
+    """
+    rng = random.Random(seed)
+    content_ids = _content_ids()
+    pool = itertools.cycle(sessions)
+    idle: deque = deque()
+    records: List[dict] = []
+    tasks = set()
+    student_count = itertools.count()
+
+    async def send(student: VirtualStudent):
+        payload = student.next_request()
+        started = time.perf_counter()
+        try:
+            response = await client.post(chat_url, json=payload)
+            body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+            outcome = _classify(response.status_code, body)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+        except httpx.HTTPError as e:
+            outcome = f"transport_error:{type(e).__name__}"
+        done_at = time.perf_counter()
+        records.append({
+            "latency_ms": (done_at - started) * 1000,
+            "done_at": done_at,
+            "outcome": outcome,
+            "participant_id": student.participant_id,
+        })
+        if student.turns:
+            idle.append(student)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    next_arrival = loop.time()
+    while True:
+        next_arrival += rng.expovariate(rate)
+        if next_arrival >= deadline:
+            break
+        await asyncio.sleep(max(0.0, next_arrival - loop.time()))
+        if idle:
+            student = idle.popleft()
+        else:
+            mode = "test" if rng.random() < test_mode_ratio else "learning"
+            content_id = rng.choice(content_ids) if content_ids else None
+            student = VirtualStudent(run_id, next(student_count), list(next(pool)), content_id, mode)
+        task = asyncio.create_task(send(student))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return records
+
+
+# --- 环境 ---
+
+class StubSentimentService:
+    """情感分析桩：按延迟分布占用线程（模拟 CPU 推理），返回中性结果"""
+
+    def __init__(self, latency: Optional[LatencyDistribution]):
+        self.latency = latency
+
+    def analyze_sentiment(self, text: str):
+        from app.schemas.chat import SentimentAnalysisResult
+
+        if self.latency:
+            time.sleep(self.latency.sample())
+        return SentimentAnalysisResult(label="NEUTRAL", confidence=1.0, details={"stub": True})
+
+
+def start_stubs(args) -> Dict[str, tuple]:
+    """启动对话、embedding、翻译三个桩服务器，返回 {名称: (state, server, base_url)}"""
+    specs = {
+        "chat": StubState(
+            dim=args.dim,
+            chat_latency=LatencyDistribution.parse(args.chat_latency, seed=args.seed),
+            chat_tokens_per_second=args.chat_tokens_per_second,
+            chat_reply_tokens=args.chat_reply_tokens,
+        ),
+        "embedding": StubState(dim=args.dim, embedding_latency=LatencyDistribution.parse(args.embedding_latency, seed=args.seed)),
+        "translation": StubState(
+            dim=args.dim,
+            chat_latency=LatencyDistribution.parse(args.translation_latency, seed=args.seed),
+            chat_tokens_per_second=args.translation_tokens_per_second,
+        ),
+    }
+    stubs = {}
+    for name, state in specs.items():
+        server, base_url = start_stub_server(state=state)
+        stubs[name] = (state, server, base_url)
+    return stubs
+
+
+def configure_environment(stubs: Dict[str, tuple], work_dir: str, args):
+    """在导入 app 模块之前设置环境变量：所有上游指向桩服务器，数据库与知识库使用临时目录"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'load_test.db')}",
+        "VECTOR_STORE_DIR": os.path.join(work_dir, "vector_store"),
+        "RESULT_CACHE_DB_PATH": os.path.join(work_dir, "result_cache.db"),
+        "ENABLE_RESULT_CACHE": "true" if args.result_cache else "false",
+        "ENABLE_RAG_SERVICE": "false" if args.no_rag else "true",
+        "ENABLE_TRANSLATION_SERVICE": "false" if args.no_rag else "true",
+        "ENABLE_SENTIMENT_ANALYSIS": "true",
+        "RAG_WARMUP_ON_STARTUP": "true",
+        "KB_WATCH_INTERVAL_SECONDS": "0",
+        "ADMIN_API_TOKEN": ADMIN_TOKEN,
+        "TUTOR_OPENAI_API_BASE": stubs["chat"][2],
+        "TUTOR_OPENAI_API_KEY": "stub",
+        "TUTOR_OPENAI_MODEL": "stub-chat",
+        "TUTOR_EMBEDDING_API_BASE": stubs["embedding"][2],
+        "TUTOR_EMBEDDING_API_KEY": "stub",
+        "TUTOR_EMBEDDING_MODEL": "stub-hashing-embedding",
+        "TUTOR_TRANSLATION_API_BASE": stubs["translation"][2],
+        "TUTOR_TRANSLATION_API_KEY": "stub",
+        "TUTOR_TRANSLATION_MODEL": "stub-translation",
+    })
+
+
+def build_knowledge_base(stubs: Dict[str, tuple], args):
+    """用桩 embedding 构建临时知识库（与查询时的 embedding 一致）"""
+    from openai import OpenAI
+    from app.core.config import settings
+    from rag_benchmark import build_store, load_corpus
+
+    chunks, _, document_count = load_corpus(args.documents_dir, set(), args.max_documents, 500, 50)
+    client = OpenAI(api_key="stub", base_url=stubs["embedding"][2], timeout=30.0)
+    # 建库不计入负载测试的 embedding 延迟
+    state = stubs["embedding"][0]
+    latency, state.embedding_latency = state.embedding_latency, None
+    try:
+        build_store(settings.VECTOR_STORE_DIR, chunks, document_count, args.dim, 10, 64, client, settings.TUTOR_EMBEDDING_MODEL)
+    finally:
+        state.embedding_latency = latency
+    return len(chunks)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(port: int, timeout: float = 60.0):
+    """在后台线程中用 uvicorn 启动应用，返回 (server, thread)"""
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, name="chat-load-test-app", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("application failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def _print_step(step: dict):
+    print(
+        f"{step['rate']:>7.2f}/s  n={step['requests']:<5} thr={step['throughput']:>7.2f}/s  "
+        f"p50={step['p50_ms']}ms p95={step['p95_ms']}ms p99={step['p99_ms']}ms  "
+        f"err={step['error_rate']:.2%} {step['outcomes']}"
+    )
+    for stage, stats in step["stages"].items():
+        print(f"    {stage:<10} n={stats['count']:<5} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms")
+
+
+async def run_load_test(base_url: str, sessions: List[List[str]], stubs: Dict[str, tuple], args) -> dict:
+    from app.core.config import settings
+    from app.config.dependency_injection import get_dynamic_controller, get_llm_gateway
+
+    controller = get_dynamic_controller()
+    chat_url = f"{base_url}{settings.API_V1_STR}/chat/ai/chat"
+    run_id = uuid.uuid4().hex[:6]
+    steps = []
+    timeout = httpx.Timeout(args.request_timeout)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        for index, rate in enumerate(args.rates):
+            controller.stage_metrics.reset()
+            for state, _, _ in stubs.values():
+                state.reset()
+            started = time.perf_counter()
+            records = await run_step(
+                client, chat_url, sessions, rate, args.duration, f"{run_id}{index}",
+                seed=args.seed + index, test_mode_ratio=args.test_mode_ratio
+            )
+            step = summarize_step(rate, records, time.perf_counter() - started)
+            step["offered_rate"] = round(len(records) / args.duration, 3)
+            step["stages"] = controller.stage_metrics.stats()
+            step["llm"] = get_llm_gateway().status()
+            step["stubs"] = {name: state.snapshot() for name, (state, _, _) in stubs.items()}
+            steps.append(step)
+            _print_step(step)
+            if args.pause:
+                await asyncio.sleep(args.pause)
+    return {"steps": steps, "saturation": find_saturation(steps, args.slo_p95_ms, args.max_error_rate)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat/ai/chat 端到端负载测试（离线，桩上游）")
+    parser.add_argument("--rates", default="1,2,4,8", help="依次测试的到达率（请求/秒），逗号分隔")
+    parser.add_argument("--duration", type=float, default=20.0, help="每一档发送请求的时长（秒）")
+    parser.add_argument("--pause", type=float, default=1.0, help="两档之间的间隔（秒）")
+    parser.add_argument("--sessions-from", default=None, help="从该数据库的 chat_history 回放会话，如 sqlite:///./app/db/database.db")
+    parser.add_argument("--max-sessions", type=int, default=0, help="最多回放的会话数（0 表示全部）")
+    parser.add_argument("--synthetic-sessions", type=int, default=200, help="合成会话数（未指定 --sessions-from 时）")
+    parser.add_argument("--turns", type=int, default=5, help="每个会话最多的消息数")
+    parser.add_argument("--test-mode-ratio", type=float, default=0.2, help="测试模式会话的比例")
+    parser.add_argument("--chat-latency", default="lognormal:600:0.5", help="对话模型首字延迟分布")
+    parser.add_argument("--chat-tokens-per-second", type=float, default=50.0, help="对话模型生成速度")
+    parser.add_argument("--chat-reply-tokens", type=int, default=120, help="对话回复的 token 数")
+    parser.add_argument("--embedding-latency", default="lognormal:40:0.4", help="embedding 延迟分布")
+    parser.add_argument("--translation-latency", default="lognormal:300:0.4", help="翻译模型首字延迟分布")
+    parser.add_argument("--translation-tokens-per-second", type=float, default=80.0, help="翻译模型生成速度")
+    parser.add_argument("--sentiment-latency", default="lognormal:30:0.3", help="情感分析（CPU 推理）耗时分布")
+    parser.add_argument("--no-rag", action="store_true", help="不启用 RAG 检索与翻译")
+    parser.add_argument("--result-cache", action="store_true", help="启用翻译/检索结果缓存")
+    parser.add_argument("--documents-dir", default=DEFAULT_DOCUMENTS_DIR, help="构建临时知识库的文档目录")
+    parser.add_argument("--max-documents", type=int, default=200, help="构建知识库最多使用的文档数（0 表示全部）")
+    parser.add_argument("--dim", type=int, default=256, help="哈希 embedding 维度")
+    parser.add_argument("--request-timeout", type=float, default=120.0, help="客户端请求超时（秒）")
+    parser.add_argument("--slo-p95-ms", type=float, default=5000.0, help="判断饱和的 p95 延迟上限（毫秒）")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="判断饱和的错误率上限")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="把完整结果写入 JSON 文件")
+    args = parser.parse_args()
+    args.rates = [float(rate) for rate in args.rates.split(",") if rate.strip()]
+
+    if args.sessions_from:
+        sessions = load_sessions_from_history(args.sessions_from, args.max_sessions, args.turns)
+        print(f"从 chat_history 读取 {len(sessions)} 个会话")
+    else:
+        sessions = synthetic_sessions(args.synthetic_sessions, args.turns, seed=args.seed)
+    if not sessions:
+        parser.error("没有可回放的会话")
+
+    stubs = start_stubs(args)
+    app_server = None
+    with tempfile.TemporaryDirectory(prefix="chat-load-test-") as work_dir:
+        try:
+            configure_environment(stubs, work_dir, args)
+            if not args.no_rag:
+                chunks = build_knowledge_base(stubs, args)
+                print(f"临时知识库构建完成：{chunks} 个文本块")
+
+            # 必须在创建 DynamicController 之前替换情感分析服务（替身不加载模型，也不会被后台预热覆盖）
+            from app.config import dependency_injection
+            dependency_injection.registry.override("sentiment", StubSentimentService(
+                LatencyDistribution.parse(args.sentiment_latency, seed=args.seed)
+            ))
+
+            port = _free_port()
+            app_server, _ = start_app(port)
+            loader = dependency_injection.get_rag_service_loader()
+            if loader is not None and not loader.wait(timeout=120):
+                print("WARNING: RAG 服务未在 120 秒内就绪，检索阶段将返回空结果")
+
+            print(f"{'rate':>9}  结果")
+            report = asyncio.run(run_load_test(f"http://127.0.0.1:{port}", sessions, stubs, args))
+        finally:
+            if app_server is not None:
+                app_server.should_exit = True
+                time.sleep(0.5)
+            for _, server, _ in stubs.values():
+                server.shutdown()
+                server.server_close()
+
+    saturation = report["saturation"]
+    print(f"\n最大可承受到达率: {saturation['max_sustainable_rate']}/s")
+    if saturation["saturation_rate"] is not None:
+        print(f"饱和点: {saturation['saturation_rate']}/s（{saturation['reason']}）")
+    else:
+        print("所有档位均未饱和，可以提高 --rates 继续测试")
+
+    if args.output:
+        report["config"] = vars(args)
+        report["sessions"] = len(sessions)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# backend/scripts/export_sentiment_onnx.py
+"""
+把情感分析模型导出为 ONNX 并做动态 int8 量化，然后与 PyTorch 后端做一致性与性能对比
+
+导出（需要 torch + transformers + onnxruntime）：
+1. 用 torch.onnx.export 导出 models/sentiment_bert（batch 与序列长度均为动态维度）
+2. 用 onnxruntime.quantization.quantize_dynamic 把权重量化为 int8
+3. 保存 tokenizers 格式的 tokenizer.json，运行时不需要 transformers
+
+对比（--check / --check-only）：两个后端分别在独立的子进程中加载（各自从零导入依赖），
+在带标注的样本上推理，报告：
+- 每个后端的准确率、两者预测标签的一致率、概率的最大/平均绝对差
+- 导入+加载耗时、峰值常驻内存（ru_maxrss）
+- 批大小 1 和 8 时每批延迟的 p50/p95 以及每秒处理条数
+
+一致率低于 --min-agreement 或 onnx 准确率比 torch 低超过 --max-accuracy-drop 时以非 0 状态退出，
+可以放在切换 SENTIMENT_BACKEND=onnx 之前的检查步骤里。
+
+用法:
+    python scripts/export_sentiment_onnx.py --check
+    python scripts/export_sentiment_onnx.py --check-only --report sentiment_backends.json
+    python scripts/export_sentiment_onnx.py --model-dir models/sentiment_bert --output-dir models/sentiment_bert_onnx
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.sentiment_backends import (
+    MAX_LENGTH,
+    ONNX_FP32_MODEL_FILENAME,
+    ONNX_MODEL_FILENAME,
+    ONNX_TOKENIZER_FILENAME,
+    SENTIMENT_LABELS,
+)
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sentiment_parity_sample.json")
+
+
+def export(model_dir: str, output_dir: str, opset: int = 14, keep_fp32: bool = False) -> Dict[str, int]:
+    """
+    导出并量化模型
+
+    Returns:
+        dict: 各文件大小（字节）
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoTokenizer, BertForSequenceClassification
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, ONNX_FP32_MODEL_FILENAME)
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILENAME)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+    model = BertForSequenceClassification.from_pretrained(model_dir, local_files_only=True)
+    model.eval()
+
+    sample = tokenizer(["export sample"], max_length=MAX_LENGTH, truncation=True, padding="longest", return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, ONNX_TOKENIZER_FILENAME))
+
+    sizes = {
+        "torch_weights_bytes": sum(
+            os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir)
+            if name.endswith((".safetensors", ".bin"))
+        ),
+        "onnx_fp32_bytes": os.path.getsize(fp32_path),
+        "onnx_int8_bytes": os.path.getsize(int8_path),
+    }
+    if not keep_fp32:
+        os.remove(fp32_path)
+    return sizes
+
+
+def load_sample(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        samples = json.load(f)["samples"]
+    return [item["text"] for item in samples], [item["label"] for item in samples]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)], 2)
+
+
+def _max_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure_backend(name: str, model_dir: str, onnx_dir: str, threads: int, texts: List[str],
+                    batch_sizes: List[int], repeat: int) -> dict:
+    """在当前进程中加载一个后端，返回预测概率、加载耗时、内存与延迟（应在新的子进程中调用）"""
+    rss_before = _max_rss_mb()
+    started = time.perf_counter()
+    from app.services.sentiment_backends import create_sentiment_backend
+    backend = create_sentiment_backend(name, model_dir=model_dir, onnx_dir=onnx_dir, num_threads=threads)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = _max_rss_mb()
+
+    probs = []
+    for start in range(0, len(texts), 8):
+        probs.extend(backend.predict(texts[start:start + 8]))
+
+    latency = {}
+    for batch_size in batch_sizes:
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        backend.predict(batches[0])  # 预热
+        samples, items = [], 0
+        run_started = time.perf_counter()
+        for _ in range(repeat):
+            for batch in batches:
+                batch_started = time.perf_counter()
+                backend.predict(batch)
+                samples.append((time.perf_counter() - batch_started) * 1000)
+                items += len(batch)
+        latency[f"batch_{batch_size}"] = {
+            "p50_ms": _percentile(samples, 50),
+            "p95_ms": _percentile(samples, 95),
+            "items_per_second": round(items / (time.perf_counter() - run_started), 1),
+        }
+
+    return {
+        "backend": name,
+        "load_seconds": round(load_seconds, 3),
+        "rss_before_mb": rss_before,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": _max_rss_mb(),
+        "latency": latency,
+        "probs": probs,
+    }
+
+
+def _measure_in_subprocess(args_tuple) -> dict:
+    return measure_backend(*args_tuple)
+
+
+def compare_predictions(labels: List[str], reference: List[List[float]], candidate: List[List[float]]) -> dict:
+    """比较两个后端在同一批样本上的预测：准确率、标签一致率、概率差"""
+    def predicted(probs):
+        return [SENTIMENT_LABELS.get(max(range(len(p)), key=p.__getitem__), "NEUTRAL") for p in probs]
+
+    reference_labels, candidate_labels = predicted(reference), predicted(candidate)
+    diffs = [abs(a - b) for ref, cand in zip(reference, candidate) for a, b in zip(ref, cand)]
+    total = len(labels)
+    return {
+        "samples": total,
+        "reference_accuracy": round(sum(p == l for p, l in zip(reference_labels, labels)) / total, 4),
+        "candidate_accuracy": round(sum(p == l for p, l in zip(candidate_labels, labels)) / total, 4),
+        "label_agreement": round(sum(a == b for a, b in zip(reference_labels, candidate_labels)) / total, 4),
+        "max_abs_prob_diff": round(max(diffs), 5) if diffs else 0.0,
+        "mean_abs_prob_diff": round(sum(diffs) / len(diffs), 5) if diffs else 0.0,
+        "disagreements": [
+            {"index": i, "label": labels[i], "reference": a, "candidate": b}
+            for i, (a, b) in enumerate(zip(reference_labels, candidate_labels)) if a != b
+        ],
+    }
+
+
+def check_parity(parity: dict, min_agreement: float, max_accuracy_drop: float) -> List[str]:
+    """返回不满足的条件（为空表示通过）"""
+    failures = []
+    if parity["label_agreement"] < min_agreement:
+        failures.append(f"label agreement {parity['label_agreement']:.2%} < {min_agreement:.2%}")
+    drop = parity["reference_accuracy"] - parity["candidate_accuracy"]
+    if drop > max_accuracy_drop:
+        failures.append(f"accuracy drop {drop:.2%} > {max_accuracy_drop:.2%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出量化的 ONNX 情感分析模型并与 PyTorch 后端对比")
+    parser.add_argument("--model-dir", default="models/sentiment_bert")
+    parser.add_argument("--output-dir", default="models/sentiment_bert_onnx")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--keep-fp32", action="store_true", help="保留未量化的 model.onnx")
+    parser.add_argument("--check", action="store_true", help="导出后执行一致性与性能对比")
+    parser.add_argument("--check-only", action="store_true", help="不导出，只对比已有的 ONNX 模型")
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE, help="带标注的样本 JSON")
+    parser.add_argument("--threads", type=int, default=2, help="两个后端的推理线程数")
+    parser.add_argument("--repeat", type=int, default=5, help="延迟测量时重复样本的轮数")
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    parser.add_argument("--report", default=None, help="把对比结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = {"config": vars(args)}
+    if not args.check_only:
+        if not os.path.isdir(args.model_dir):
+            parser.error(f"模型目录不存在: {args.model_dir}（先运行 scripts/download_models.py）")
+        started = time.perf_counter()
+        report["sizes"] = export(args.model_dir, args.output_dir, args.opset, args.keep_fp32)
+        print(f"导出完成，用时 {time.perf_counter() - started:.1f}s: {json.dumps(report['sizes'])}")
+    if not (args.check or args.check_only):
+        return
+
+    texts, labels = load_sample(args.sample)
+    jobs = [
+        (name, args.model_dir, args.output_dir, args.threads, texts, [1, 8], args.repeat)
+        for name in ("torch", "onnx")
+    ]
+    # 每个后端一个全新的子进程，导入耗时与内存互不影响
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for job in jobs:
+        with context.Pool(1) as pool:
+            results[job[0]] = pool.apply(_measure_in_subprocess, (job,))
+
+    parity = compare_predictions(labels, results["torch"]["probs"], results["onnx"]["probs"])
+    report["parity"] = parity
+    report["backends"] = {name: {k: v for k, v in result.items() if k != "probs"} for name, result in results.items()}
+
+    print(f"\n{'backend':<8}{'load_s':>8}{'rss_mb':>9}{'b1_p50':>9}{'b1_p95':>9}{'b8_p50':>9}{'b8_p95':>9}{'items/s(b8)':>13}")
+    for name, result in report["backends"].items():
+        b1, b8 = result["latency"]["batch_1"], result["latency"]["batch_8"]
+        print(
+            f"{name:<8}{result['load_seconds']:>8.2f}{result['rss_peak_mb']:>9.1f}{b1['p50_ms']:>9.2f}{b1['p95_ms']:>9.2f}"
+            f"{b8['p50_ms']:>9.2f}{b8['p95_ms']:>9.2f}{b8['items_per_second']:>13.1f}"
+        )
+    print(
+        f"\n准确率 torch={parity['reference_accuracy']:.2%} onnx={parity['candidate_accuracy']:.2%}，"
+        f"标签一致率 {parity['label_agreement']:.2%}，概率最大差 {parity['max_abs_prob_diff']}"
+    )
+
+    failures = check_parity(parity, args.min_agreement, args.max_accuracy_drop)
+    report["passed"] = not failures
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.report}")
+    if failures:
+        print("❌ 一致性检查未通过: " + "; ".join(failures))
+        sys.exit(1)
+    print("✅ 一致性检查通过，可以设置 SENTIMENT_BACKEND=onnx")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# backend/scripts/migrate_prompt_segments.py
+"""
+把 chat_history 中内联保存的 raw_prompt_to_llm 转换为内容寻址的片段存储
+
+按 id 分批读取仍有 raw_prompt_to_llm 的消息，切分片段写入 prompt_segments 表，
+在行内记录片段哈希列表并清空 raw_prompt_to_llm。每条消息都会先用片段还原一次、
+与原文逐字节比较，一致才清空原文；每批提交一次，中断后重新运行会从剩余的消息继续。
+
+SQLite 删除数据后文件不会自动变小，加 --vacuum 在转换后回收空间。
+
+用法:
+    python scripts/migrate_prompt_segments.py --dry-run
+    python scripts/migrate_prompt_segments.py --batch-size 500 --vacuum
+    python scripts/migrate_prompt_segments.py --database-url sqlite:///./app/db/database.db
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.crud.crud_prompt_segment import prompt_segment as crud_prompt_segment
+from app.db.migrations import upgrade_schema
+from app.models.chat_history import ChatHistory
+from app.models.prompt_segment import PromptSegment
+
+
+def migrate(session_factory, batch_size: int = 500, dry_run: bool = False) -> dict:
+    """
+    转换所有仍内联保存 Prompt 的消息
+
+    Returns:
+        dict: 统计信息（转换的消息数、原文与片段的字节数、新增片段数）
+    """
+    stats = {"rows": 0, "inline_bytes": 0, "segments_before": 0, "segments_after": 0, "mismatches": 0}
+    last_id = 0
+    with session_factory() as db:
+        stats["segments_before"] = db.query(func.count(PromptSegment.hash)).scalar()
+
+    while True:
+        with session_factory() as db:
+            rows = (
+                db.query(ChatHistory)
+                .filter(ChatHistory.id > last_id, ChatHistory.raw_prompt_to_llm.isnot(None))
+                .order_by(ChatHistory.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                last_id = row.id
+                prompt = row.raw_prompt_to_llm
+                hashes = crud_prompt_segment.store(db, prompt)
+                db.flush()
+                if crud_prompt_segment.load(db, hashes) != prompt:
+                    # 理论上不会发生；保留原文，不转换这一条
+                    stats["mismatches"] += 1
+                    print(f"WARNING: chat_history.id={row.id} 还原结果与原文不一致，跳过")
+                    continue
+                row.prompt_segments = json.dumps(hashes)
+                row.raw_prompt_to_llm = None
+                stats["rows"] += 1
+                stats["inline_bytes"] += len(prompt.encode("utf-8"))
+            if dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            print(f"INFO: 已处理到 chat_history.id={last_id}（累计转换 {stats['rows']} 条）")
+
+    with session_factory() as db:
+        stats["segments_after"] = db.query(func.count(PromptSegment.hash)).scalar()
+        stats["segment_bytes"] = db.query(func.coalesce(func.sum(func.length(PromptSegment.data)), 0)).scalar()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 raw_prompt_to_llm 转换为内容寻址的压缩片段")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="只统计并校验，不提交任何修改")
+    parser.add_argument("--vacuum", action="store_true", help="转换后执行 VACUUM 回收文件空间")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
+    session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    started = time.perf_counter()
+    stats = migrate(session_factory, batch_size=args.batch_size, dry_run=args.dry_run)
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    if args.dry_run:
+        # 演练模式下新片段随事务回滚，这里的片段统计不包含它们
+        stats["dry_run"] = True
+    elif args.vacuum:
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# backend/scripts/rag_benchmark.py
+"""
+RAG 检索质量与延迟基准
+
+在进程内启动本地 OpenAI 兼容桩服务器（scripts/stub_openai_server.py）提供 embedding，
+用文档目录构建一个临时的版本化知识库，然后把带标注的问题集逐条送入 RAGService.retrieve，
+输出每个知识点及总体的：
+
+- recall@k：top-k 结果中至少包含一篇相关文档的问题比例
+- MRR：第一篇相关文档排名倒数的平均值
+- p50 / p99 延迟（毫秒）
+- 每条查询的 embedding 请求数与输入条数（由桩服务器计数）
+
+全程不访问外网，可在 CI 等离线环境中运行；比较索引类型、切块或缓存的改动时，
+用同一份问题集和参数跑两次对比数字即可。哈希 embedding 只反映词面重合度，
+数字适合做相对比较；需要接近线上效果时可用 --vector-cache 提供真实向量。
+
+用法:
+    python scripts/rag_benchmark.py --max-documents 300 --repeat 2 --cache
+    python scripts/rag_benchmark.py --output benchmark.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Set
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai_server import StubState, start_stub_server
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rag_benchmark_questions.json")
+DEFAULT_DOCUMENTS_DIR = os.path.join(BACKEND_DIR, "app", "data", "documents")
+
+
+def _configure_environment(base_url: str):
+    """在导入 app 模块之前设置环境变量，让 settings 指向桩服务器且不调用翻译"""
+    os.environ["TUTOR_EMBEDDING_API_BASE"] = base_url
+    os.environ["TUTOR_EMBEDDING_API_KEY"] = "stub"
+    os.environ["TUTOR_EMBEDDING_MODEL"] = "stub-hashing-embedding"
+    os.environ["ENABLE_TRANSLATION_SERVICE"] = "false"
+
+
+def _doc_label(file_path: str, documents_dir: str) -> str:
+    """文档标签：相对文档目录的路径，去掉末尾的 index.md，与问题集中的 relevant 对应"""
+    rel = os.path.relpath(file_path, documents_dir).replace(os.sep, "/")
+    return rel[:-len("/index.md")] if rel.endswith("/index.md") else rel
+
+
+def _chunk(content: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """与 KnowledgeBaseBuilderImpl._chunk_documents 相同的定长重叠切块"""
+    if len(content) <= chunk_size:
+        return [content]
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = min(start + chunk_size, len(content))
+        chunks.append(content[start:end])
+        start += chunk_size - chunk_overlap
+        if end == len(content):
+            break
+    return chunks
+
+
+def load_questions(path: str) -> Dict[str, List[dict]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["topics"]
+
+
+def load_corpus(documents_dir: str, relevant: Set[str], max_documents: int, chunk_size: int, chunk_overlap: int):
+    """
+    加载文档并切块。限制文档数时优先保留问题集引用的相关文档，其余按路径顺序补足。
+
+    Returns:
+        tuple: (chunks, sources, document_count)，sources[i] 为第 i 个文本块所属文档的标签，
+        document_count 为加载的文档数（受 max_documents 限制，包括没有切出文本块的文档）
+    """
+    from app.services.markdown_loader import MarkdownLoader
+
+    documents = sorted(
+        MarkdownLoader().load_from_directory(documents_dir, recursive=True),
+        key=lambda doc: (_doc_label(doc.file_path, documents_dir) not in relevant, doc.file_path),
+    )
+    if max_documents:
+        documents = documents[:max_documents]
+
+    chunks, sources = [], []
+    for doc in documents:
+        label = _doc_label(doc.file_path, documents_dir)
+        for chunk in _chunk(doc.content, chunk_size, chunk_overlap):
+            chunks.append(chunk)
+            sources.append(label)
+    return chunks, sources, len(documents)
+
+
+def build_store(root_dir: str, chunks: List[str], document_count: int, dim: int, n_trees: int, batch_size: int,
+                client, model: str):
+    """用桩服务器的 embedding 构建 Annoy 索引，保存为一个已发布的知识库版本"""
+    from annoy import AnnoyIndex
+    from app.core.config import settings
+    from app.services.vector_store import VectorStoreManager
+
+    index = AnnoyIndex(dim, 'angular')
+    for start in range(0, len(chunks), batch_size):
+        response = client.embeddings.create(input=chunks[start:start + batch_size], model=model)
+        for item in sorted(response.data, key=lambda d: d.index):
+            index.add_item(start + item.index, item.embedding)
+    index.build(n_trees)
+
+    manager = VectorStoreManager(root_dir)
+    version, path = manager.allocate_version_dir()
+    index.save(os.path.join(path, settings.KB_ANN_FILENAME))
+    with open(os.path.join(path, settings.KB_CHUNKS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    manager.publish(version, embedding_model=model, embedding_dimension=dim, document_count=document_count)
+    return manager
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _summarize(records: List[dict], k: int) -> dict:
+    latencies = [r["latency_ms"] for r in records]
+    return {
+        "queries": len(records),
+        f"recall@{k}": round(sum(1 for r in records if r["rank"]) / len(records), 4) if records else 0.0,
+        "mrr": round(sum(1.0 / r["rank"] for r in records if r["rank"]) / len(records), 4) if records else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "embedding_calls_per_query": round(sum(r["embedding_requests"] for r in records) / len(records), 3) if records else 0.0,
+        "embedding_inputs_per_query": round(sum(r["embedding_inputs"] for r in records) / len(records), 3) if records else 0.0,
+    }
+
+
+def run_queries(service, stub_state: StubState, topics: Dict[str, List[dict]], chunk_sources: Dict[str, Set[str]], k: int) -> List[dict]:
+    """逐条执行问题，记录第一篇相关文档的排名、延迟和 embedding 调用次数"""
+    records = []
+    for topic_id, questions in topics.items():
+        for item in questions:
+            relevant = set(item["relevant"])
+            before = stub_state.snapshot()
+            started = time.perf_counter()
+            results = service.retrieve(item["question"], k=k)
+            latency_ms = (time.perf_counter() - started) * 1000
+            after = stub_state.snapshot()
+
+            rank = 0
+            for position, chunk in enumerate(results, start=1):
+                if chunk_sources.get(chunk, set()) & relevant:
+                    rank = position
+                    break
+            records.append({
+                "topic": topic_id,
+                "question": item["question"],
+                "rank": rank,
+                "latency_ms": latency_ms,
+                "embedding_requests": after.get("embedding_requests", 0) - before.get("embedding_requests", 0),
+                "embedding_inputs": after.get("embedding_inputs", 0) - before.get("embedding_inputs", 0),
+            })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 检索质量与延迟基准（离线）")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="带标注的问题集 JSON")
+    parser.add_argument("--documents-dir", default=DEFAULT_DOCUMENTS_DIR, help="文档目录")
+    parser.add_argument("--max-documents", type=int, default=0, help="最多加载的文档数（0 表示全部）")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=256, help="哈希 embedding 维度")
+    parser.add_argument("--n-trees", type=int, default=10, help="Annoy 树的数量")
+    parser.add_argument("--k", type=int, default=3, help="检索条数")
+    parser.add_argument("--repeat", type=int, default=1, help="重复执行问题集的轮数（用于观察缓存效果）")
+    parser.add_argument("--cache", action="store_true", help="启用内存检索结果缓存")
+    parser.add_argument("--vector-cache", default=None, help="JSON 文件：{文本: 向量}，桩服务器命中时返回真实向量")
+    parser.add_argument("--output", default=None, help="把完整结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    vector_cache = None
+    if args.vector_cache:
+        with open(args.vector_cache, "r", encoding="utf-8") as f:
+            vector_cache = json.load(f)
+    stub_state = StubState(dim=args.dim, vector_cache=vector_cache)
+    server, base_url = start_stub_server(state=stub_state)
+    _configure_environment(base_url)
+
+    from app.services.rag_service import RAGService
+    from app.services.result_cache import TieredCache
+
+    topics = load_questions(args.questions)
+    relevant = {label for questions in topics.values() for item in questions for label in item["relevant"]}
+
+    try:
+        started = time.perf_counter()
+        chunks, sources, document_count = load_corpus(args.documents_dir, relevant, args.max_documents, args.chunk_size, args.chunk_overlap)
+        chunk_sources = defaultdict(set)
+        for chunk, label in zip(chunks, sources):
+            chunk_sources[chunk].add(label)
+        print(f"加载 {document_count} 个文档，{len(chunks)} 个文本块")
+
+        with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as store_dir:
+            retrieval_cache = None
+            if args.cache:
+                retrieval_cache = TieredCache(namespace="rag-benchmark", max_entries=4096, ttl_seconds=3600)
+
+            # 建库直接请求桩服务器，embedding 与查询时一致
+            from openai import OpenAI
+            client = OpenAI(api_key="stub", base_url=base_url, timeout=30.0)
+            manager = build_store(store_dir, chunks, document_count, args.dim, args.n_trees, 64, client, os.environ["TUTOR_EMBEDDING_MODEL"])
+            build_seconds = time.perf_counter() - started
+            print(f"知识库构建完成，用时 {build_seconds:.1f}s")
+
+            service = RAGService(store_manager=manager, retrieval_cache=retrieval_cache)
+            rounds = []
+            for round_index in range(args.repeat):
+                records = run_queries(service, stub_state, topics, chunk_sources, args.k)
+                rounds.append(records)
+
+                by_topic = defaultdict(list)
+                for record in records:
+                    by_topic[record["topic"]].append(record)
+                print(f"\n第 {round_index + 1} 轮")
+                print(f"{'topic':<8}{'n':>4}{'recall@' + str(args.k):>11}{'mrr':>8}{'p50_ms':>10}{'p99_ms':>10}{'emb/q':>8}")
+                for topic_id, topic_records in list(by_topic.items()) + [("overall", records)]:
+                    summary = _summarize(topic_records, args.k)
+                    print(
+                        f"{topic_id:<8}{summary['queries']:>4}{summary[f'recall@{args.k}']:>11.3f}"
+                        f"{summary['mrr']:>8.3f}{summary['p50_ms']:>10.2f}{summary['p99_ms']:>10.2f}"
+                        f"{summary['embedding_calls_per_query']:>8.2f}"
+                    )
+
+        if args.output:
+            report = {
+                "config": vars(args),
+                "documents": len(set(sources)),
+                "chunks": len(chunks),
+                "build_seconds": round(build_seconds, 3),
+                "rounds": [
+                    {
+                        "overall": _summarize(records, args.k),
+                        "topics": {
+                            topic_id: _summarize([r for r in records if r["topic"] == topic_id], args.k)
+                            for topic_id in topics
+                        },
+                        "queries": records,
+                    }
+                    for records in rounds
+                ],
+            }
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n结果已写入 {args.output}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
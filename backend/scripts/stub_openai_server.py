@@ -0,0 +1,393 @@
+# backend/scripts/stub_openai_server.py
+"""
+本地 OpenAI 兼容桩服务器（离线测试/基准用）
+
+实现的接口：
+- POST /v1/embeddings：确定性的哈希 embedding（词袋特征哈希，L2 归一化），
+  也可以通过 --vector-cache 提供“文本 -> 真实向量”的缓存文件，命中时返回真实向量。
+- POST /v1/chat/completions：回显最后一条用户消息的确定性回复，支持 stream=True（SSE）。
+  可以配置固定延迟（--chat-delay）和错误状态码（--chat-error-status），
+  模拟上游变慢或不可用，用于测试 LLM 网关的排队与熔断。
+  负载测试时可以配置延迟分布（--chat-latency）、生成速度（--chat-tokens-per-second）
+  和回复长度（--chat-reply-tokens），模拟真实模型的首字延迟与逐 token 输出。
+- GET  /stats：请求计数（embedding 请求数、输入条数、chat 请求数、chat 峰值并发等）
+- POST /stats/reset：清零计数
+- POST /stub/config：运行时修改 chat_delay_seconds / chat_error_status / chat_latency /
+  chat_tokens_per_second / chat_reply_tokens / embedding_latency
+
+延迟分布的写法（单位毫秒）：fixed:200、uniform:100:400、lognormal:300:0.5（中位数 300ms，σ=0.5）
+
+只依赖标准库，既可以作为脚本独立运行，也可以在进程内通过 start_stub_server() 启动。
+
+用法:
+    python scripts/stub_openai_server.py --port 8765 --dim 256
+    # 然后设置 TUTOR_EMBEDDING_API_BASE=http://127.0.0.1:8765/v1
+    # 或 TUTOR_OPENAI_API_BASE=http://127.0.0.1:8765/v1（对话模型）
+    python scripts/stub_openai_server.py --chat-latency lognormal:400:0.6 --chat-tokens-per-second 40 --chat-reply-tokens 120
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+
+
+def hashing_embedding(text: str, dim: int) -> List[float]:
+    """
+    确定性哈希 embedding：英文按单词、中文按单字和相邻字二元组切分，
+    每个特征哈希到一个维度并带符号，词频取 1 + log(tf)，最后 L2 归一化。
+    """
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    cjk = [t for t in tokens if len(t) == 1 and '\u4e00' <= t <= '\u9fff']
+    features = Counter(tokens)
+    features.update(a + b for a, b in zip(cjk, cjk[1:]))
+
+    vector = [0.0] * dim
+    for feature, tf in features.items():
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        sign = 1.0 if value & 1 else -1.0
+        vector[(value >> 1) % dim] += sign * (1.0 + math.log(tf))
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        # 空文本：返回一个固定的单位向量，避免 angular 距离出现 NaN
+        vector[0] = 1.0
+        return vector
+    return [v / norm for v in vector]
+
+
+class LatencyDistribution:
+    """延迟分布，sample() 返回秒"""
+
+    KINDS = ("fixed", "uniform", "lognormal")
+
+    def __init__(self, kind: str, params: List[float], seed: Optional[int] = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', expected one of {self.KINDS}")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}[kind]
+        if len(params) != expected or any(p < 0 for p in params):
+            raise ValueError(f"Latency distribution '{kind}' takes {expected} non-negative parameter(s)")
+        self.kind = kind
+        self.params = params
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: Optional[str], seed: Optional[int] = None) -> Optional["LatencyDistribution"]:
+        """解析 fixed:MS / uniform:LO_MS:HI_MS / lognormal:MEDIAN_MS:SIGMA，空字符串返回 None"""
+        if not spec:
+            return None
+        kind, *params = spec.strip().split(":")
+        try:
+            values = [float(p) for p in params]
+        except ValueError:
+            raise ValueError(f"Invalid latency distribution '{spec}'")
+        return cls(kind, values, seed=seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                ms = self.params[0]
+            elif self.kind == "uniform":
+                ms = self._random.uniform(*sorted(self.params))
+            else:
+                median, sigma = self.params
+                ms = median * math.exp(self._random.gauss(0.0, sigma)) if median > 0 else 0.0
+        return ms / 1000.0
+
+    def __str__(self) -> str:
+        return ":".join([self.kind] + [f"{p:g}" for p in self.params])
+
+
+class StubState:
+    """桩服务器的配置与计数"""
+
+    def __init__(
+        self,
+        dim: int,
+        vector_cache: Optional[Dict[str, List[float]]] = None,
+        chat_delay_seconds: float = 0.0,
+        chat_error_status: int = 0,
+        chat_latency: Optional[LatencyDistribution] = None,
+        chat_tokens_per_second: float = 0.0,
+        chat_reply_tokens: int = 0,
+        embedding_latency: Optional[LatencyDistribution] = None,
+    ):
+        """
+        Args:
+            chat_delay_seconds: chat 请求返回前的固定延迟（流式时为首个分片前的延迟）
+            chat_error_status: 非 0 时 chat 请求返回该 HTTP 状态码
+            chat_latency: 在固定延迟之上叠加的首字延迟分布
+            chat_tokens_per_second: 生成速度，>0 时按回复的 token 数计算输出耗时（流式时逐个分片等待）
+            chat_reply_tokens: >0 时把回复补足到该 token 数（一个单词算一个 token）
+            embedding_latency: embedding 请求的延迟分布
+        """
+        self.dim = dim
+        self.vector_cache = vector_cache or {}
+        self.chat_delay_seconds = chat_delay_seconds
+        self.chat_error_status = chat_error_status
+        self.chat_latency = chat_latency
+        self.chat_tokens_per_second = chat_tokens_per_second
+        self.chat_reply_tokens = chat_reply_tokens
+        self.embedding_latency = embedding_latency
+        self._lock = threading.Lock()
+        self._chat_in_flight = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = Counter()
+            # 按到达顺序记录 chat 请求的最后一条用户消息，用于检查调度顺序
+            self.chat_messages = []
+
+    def count(self, **increments):
+        with self._lock:
+            self.counters.update(increments)
+
+    def chat_started(self, message: str):
+        with self._lock:
+            self._chat_in_flight += 1
+            self.counters["chat_requests"] += 1
+            self.counters["chat_peak_in_flight"] = max(self.counters["chat_peak_in_flight"], self._chat_in_flight)
+            self.chat_messages.append(message)
+
+    def chat_finished(self):
+        with self._lock:
+            self._chat_in_flight -= 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def first_token_delay(self) -> float:
+        """chat 请求的首字延迟（秒）"""
+        return self.chat_delay_seconds + (self.chat_latency.sample() if self.chat_latency else 0.0)
+
+    def token_interval(self) -> float:
+        """相邻两个 token 之间的间隔（秒），未配置生成速度时为 0"""
+        return 1.0 / self.chat_tokens_per_second if self.chat_tokens_per_second > 0 else 0.0
+
+    def reply_for(self, message: str) -> str:
+        reply = f"Stub reply to: {message}"
+        missing = self.chat_reply_tokens - len(reply.split())
+        if missing > 0:
+            reply += "".join(f" token{i}" for i in range(missing))
+        return reply
+
+    def config(self) -> dict:
+        return {
+            "chat_delay_seconds": self.chat_delay_seconds,
+            "chat_error_status": self.chat_error_status,
+            "chat_latency": str(self.chat_latency) if self.chat_latency else None,
+            "chat_tokens_per_second": self.chat_tokens_per_second,
+            "chat_reply_tokens": self.chat_reply_tokens,
+            "embedding_latency": str(self.embedding_latency) if self.embedding_latency else None,
+        }
+
+    def update_config(self, payload: dict):
+        self.chat_delay_seconds = float(payload.get("chat_delay_seconds", self.chat_delay_seconds))
+        self.chat_error_status = int(payload.get("chat_error_status", self.chat_error_status))
+        self.chat_tokens_per_second = float(payload.get("chat_tokens_per_second", self.chat_tokens_per_second))
+        self.chat_reply_tokens = int(payload.get("chat_reply_tokens", self.chat_reply_tokens))
+        if "chat_latency" in payload:
+            self.chat_latency = LatencyDistribution.parse(payload["chat_latency"])
+        if "embedding_latency" in payload:
+            self.embedding_latency = LatencyDistribution.parse(payload["embedding_latency"])
+
+    def embed(self, text: str) -> List[float]:
+        cached = self.vector_cache.get(text)
+        if cached is not None:
+            self.count(embedding_cache_hits=1)
+            return cached
+        return hashing_embedding(text, self.dim)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    state: StubState = None  # 由 make_server 注入
+
+    def log_message(self, format, *args):
+        # 基准测试时不打印每个请求
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(self.state.snapshot())
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path == "/stats/reset":
+            self.state.reset()
+            self._send_json({"ok": True})
+        elif path == "/stub/config":
+            try:
+                self.state.update_config(self._read_json())
+            except ValueError as e:
+                self._send_json({"error": {"message": str(e)}}, status=400)
+                return
+            self._send_json(self.state.config())
+        elif path.endswith("/chat/completions"):
+            self._handle_chat(self._read_json())
+        elif path.endswith("/embeddings"):
+            self._handle_embeddings(self._read_json())
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def _handle_embeddings(self, payload: dict):
+        inputs = payload.get("input", "")
+        texts = inputs if isinstance(inputs, list) else [inputs]
+        self.state.count(embedding_requests=1, embedding_inputs=len(texts))
+        if self.state.embedding_latency:
+            time.sleep(self.state.embedding_latency.sample())
+        data = [
+            {"object": "embedding", "index": i, "embedding": self.state.embed(text)}
+            for i, text in enumerate(texts)
+        ]
+        self._send_json({
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _handle_chat(self, payload: dict):
+        user_messages = [m.get("content") or "" for m in payload.get("messages", []) if m.get("role") == "user"]
+        last_message = user_messages[-1] if user_messages else ""
+        model = payload.get("model", "stub-chat")
+        self.state.chat_started(last_message)
+        try:
+            delay = self.state.first_token_delay()
+            if delay > 0:
+                time.sleep(delay)
+            if self.state.chat_error_status:
+                self.state.count(chat_errors=1)
+                self._send_json({"error": {"message": "stub upstream failure", "type": "server_error"}},
+                                status=self.state.chat_error_status)
+                return
+
+            reply = self.state.reply_for(last_message)
+            self.state.count(chat_tokens=len(reply.split()))
+            if payload.get("stream"):
+                self._send_chat_stream(model, reply)
+                return
+            # 非流式：等待整段回复“生成”完毕
+            interval = self.state.token_interval()
+            if interval > 0:
+                time.sleep(interval * len(reply.split()))
+            self._send_json({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        finally:
+            self.state.chat_finished()
+
+    def _send_chat_stream(self, model: str, reply: str):
+        # 每个单词一个 SSE 分片，最后发送 [DONE]；连接在响应结束后关闭
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        created = int(time.time())
+        interval = self.state.token_interval()
+        for position, word in enumerate(re.findall(r"\S+\s*", reply)):
+            if position and interval > 0:
+                time.sleep(interval)
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if interval > 0:
+                self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, state: Optional[StubState] = None) -> ThreadingHTTPServer:
+    """创建桩服务器（port=0 时自动选择空闲端口）"""
+    handler = type("BoundStubRequestHandler", (StubRequestHandler,), {"state": state or StubState(dim=256)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, state: Optional[StubState] = None):
+    """
+    在后台线程中启动桩服务器。
+
+    Returns:
+        tuple: (server, base_url)，base_url 形如 http://127.0.0.1:PORT/v1
+    """
+    server = make_server(host, port, state)
+    thread = threading.Thread(target=server.serve_forever, name="stub-openai-server", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=256, help="哈希 embedding 的维度")
+    parser.add_argument("--vector-cache", default=None, help="JSON 文件：{文本: 向量}，命中时返回真实向量")
+    parser.add_argument("--chat-delay", type=float, default=0.0, help="chat 请求的固定延迟（秒）")
+    parser.add_argument("--chat-error-status", type=int, default=0, help="非 0 时 chat 请求返回该 HTTP 状态码")
+    parser.add_argument("--chat-latency", default=None, help="chat 首字延迟分布，如 lognormal:400:0.6")
+    parser.add_argument("--chat-tokens-per-second", type=float, default=0.0, help="chat 生成速度（0 表示不限）")
+    parser.add_argument("--chat-reply-tokens", type=int, default=0, help="把回复补足到的 token 数")
+    parser.add_argument("--embedding-latency", default=None, help="embedding 延迟分布，如 uniform:20:60")
+    args = parser.parse_args()
+
+    vector_cache = None
+    if args.vector_cache:
+        with open(args.vector_cache, "r", encoding="utf-8") as f:
+            vector_cache = json.load(f)
+
+    server = make_server(args.host, args.port, StubState(
+        dim=args.dim,
+        vector_cache=vector_cache,
+        chat_delay_seconds=args.chat_delay,
+        chat_error_status=args.chat_error_status,
+        chat_latency=LatencyDistribution.parse(args.chat_latency),
+        chat_tokens_per_second=args.chat_tokens_per_second,
+        chat_reply_tokens=args.chat_reply_tokens,
+        embedding_latency=LatencyDistribution.parse(args.embedding_latency),
+    ))
+    print(f"Stub OpenAI server listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.chat_concurrency import (
+    ChatBusyError,
+    ChatSupersededError,
+    InFlightCoalescer,
+    ParticipantGate,
+    request_key,
+)
+
+
+def test_request_key_ignores_surrounding_whitespace():
+    assert request_key("p1", "why? ", "1_1", "test") == request_key("p1", "why?", "1_1", "test")
+    assert request_key("p1", "why?", "1_1") != request_key("p2", "why?", "1_1")
+    assert request_key("p1", "why?", "1_1") != request_key("p1", "why?", "1_2")
+
+
+def test_request_key_separates_conversations_and_code():
+    code = {"html": "<div></div>", "css": "", "js": ""}
+    key = request_key("p1", "why?", "1_1", "test", conversation_id="c1", code_context=code)
+    assert key == request_key("p1", "why?", "1_1", "test", conversation_id="c1", code_context=dict(code))
+    assert key != request_key("p1", "why?", "1_1", "test", conversation_id="c2", code_context=code)
+    assert key != request_key("p1", "why?", "1_1", "test", conversation_id="c1",
+                              code_context={**code, "css": "div { margin: 0 auto; }"})
+
+
+def test_concurrent_duplicates_share_one_execution():
+    coalescer = InFlightCoalescer(recent_ttl_seconds=0)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(coalescer.run("k", work) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["answer"] * 3
+    assert len(calls) == 1
+    assert coalescer.stats() == {"leaders": 1, "coalesced": 2, "in_flight": 0}
+
+
+def test_recent_result_reused_only_when_remembered():
+    coalescer = InFlightCoalescer(recent_ttl_seconds=60)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return f"answer-{len(calls)}"
+
+    async def main():
+        first = await coalescer.run("ok", work)
+        retry = await coalescer.run("ok", work)
+        failed = await coalescer.run("bad", work, remember=lambda result: False)
+        rerun = await coalescer.run("bad", work, remember=lambda result: False)
+        return first, retry, failed, rerun
+
+    assert asyncio.run(main()) == ("answer-1", "answer-1", "answer-2", "answer-3")
+
+
+def test_leader_failure_reaches_waiters():
+    coalescer = InFlightCoalescer()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(coalescer.run("k", work), coalescer.run("k", work), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_gate_queues_then_rejects():
+    gate = ParticipantGate(policy="queue", max_waiting=1)
+    order = []
+
+    async def generate(name, delay):
+        async with gate.slot("p1"):
+            order.append(f"start-{name}")
+            await asyncio.sleep(delay)
+            order.append(f"end-{name}")
+
+    async def main():
+        first = asyncio.create_task(generate("a", 0.05))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(generate("b", 0))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ChatBusyError):
+            await generate("c", 0)
+        # 其他参与者不受影响
+        async with gate.slot("p2"):
+            order.append("other")
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+    assert order == ["start-a", "other", "end-a", "start-b", "end-b"]
+    assert gate.stats()["rejected"] == 1
+
+
+def test_gate_cancel_policy_supersedes_running_request():
+    gate = ParticipantGate(policy="cancel")
+
+    async def generate(delay):
+        async with gate.slot("p1"):
+            await asyncio.sleep(delay)
+            return "done"
+
+    async def main():
+        old = asyncio.create_task(generate(10))
+        await asyncio.sleep(0.01)
+        new = await generate(0)
+        # 被取代的请求以明确的错误结束，而不是裸的 CancelledError
+        with pytest.raises(ChatSupersededError):
+            await old
+        assert not old.cancelled()
+        return new
+
+    assert asyncio.run(main()) == "done"
+    assert gate.stats()["cancelled"] == 1
+
+
+def test_gate_cancel_policy_keeps_other_cancellations():
+    gate = ParticipantGate(policy="cancel")
+
+    async def generate():
+        async with gate.slot("p1"):
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(generate())
+        await asyncio.sleep(0.01)
+        # 不是被新请求取代的取消（客户端断开、服务关闭）照常传播
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+
+def test_gate_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        ParticipantGate(policy="drop")
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from openai import OpenAI
+
+# 将 backend 目录和 scripts 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from app.services.chat_metrics import StageMetrics
+from app.services.dynamic_controller import CRITICAL_ERROR_RESPONSE
+from chat_load_test import find_saturation, run_step, summarize_step, synthetic_sessions
+from stub_openai_server import LatencyDistribution, StubState, start_stub_server
+
+
+def test_latency_distribution_specs():
+    assert LatencyDistribution.parse("fixed:250").sample() == 0.25
+    uniform = LatencyDistribution.parse("uniform:100:200", seed=1)
+    assert all(0.1 <= uniform.sample() <= 0.2 for _ in range(100))
+    lognormal = LatencyDistribution.parse("lognormal:300:0.5", seed=1)
+    samples = sorted(lognormal.sample() for _ in range(1001))
+    assert 0.25 < samples[500] < 0.35
+    assert str(lognormal) == "lognormal:300:0.5"
+    assert LatencyDistribution.parse("") is None
+    for spec in ("gamma:1:2", "fixed", "uniform:1", "fixed:abc", "fixed:-5"):
+        with pytest.raises(ValueError):
+            LatencyDistribution.parse(spec)
+
+
+def test_stub_chat_pads_reply_and_paces_tokens():
+    state = StubState(dim=8, chat_latency=LatencyDistribution.parse("fixed:50"),
+                      chat_tokens_per_second=200, chat_reply_tokens=20)
+    server, base_url = start_stub_server(state=state)
+    try:
+        client = OpenAI(api_key="stub", base_url=base_url, max_retries=0)
+        started = time.monotonic()
+        reply = client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+        elapsed = time.monotonic() - started
+        chunks = list(client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}], stream=True))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    text = reply.choices[0].message.content
+    assert text.startswith("Stub reply to: hi") and len(text.split()) == 20
+    # 50ms 首字延迟 + 20 个 token / 200 tok/s
+    assert elapsed >= 0.15
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == text
+    assert state.snapshot()["chat_tokens"] == 40
+
+
+def _step(rate, p95, error_rate=0.0, throughput=None):
+    return {"rate": rate, "offered_rate": rate, "p95_ms": p95, "error_rate": error_rate,
+            "throughput": rate if throughput is None else throughput}
+
+
+def test_saturation_is_first_rate_breaking_latency_errors_or_throughput():
+    steps = [_step(1, 800), _step(2, 900), _step(4, 6000), _step(8, 9000, 0.2)]
+    result = find_saturation(steps, slo_p95_ms=5000, max_error_rate=0.01)
+    assert (result["max_sustainable_rate"], result["saturation_rate"]) == (2, 4)
+    assert "p95" in result["reason"]
+
+    result = find_saturation([_step(1, 500), _step(2, 500, throughput=1.5)], 5000, 0.01)
+    assert result["saturation_rate"] == 2 and "throughput" in result["reason"]
+    assert find_saturation([_step(1, 500)], 5000, 0.01) == {"saturation_rate": None, "max_sustainable_rate": 1, "reason": None}
+
+
+def test_summary_throughput_ignores_drain_time():
+    records = [{"latency_ms": 100.0, "outcome": "ok", "done_at": 10.0 + i * 0.5} for i in range(11)]
+    records.append({"latency_ms": 30000.0, "outcome": "timeout", "done_at": 40.0})
+    summary = summarize_step(2.0, records, elapsed=40.0)
+    assert summary["throughput"] == 2.0
+    assert summary["error_rate"] == round(1 / 12, 4)
+    assert summary["outcomes"] == {"ok": 11, "timeout": 1}
+
+
+def test_run_step_replays_each_session_sequentially():
+    app = FastAPI()
+    active, seen = set(), []
+
+    @app.post("/chat")
+    async def chat(payload: dict):
+        participant = payload["participant_id"]
+        # 同一学生的下一条消息必须在上一条回复之后才发送
+        assert participant not in active
+        active.add(participant)
+        seen.append((participant, payload["user_message"], payload["conversation_id"]))
+        await asyncio.sleep(0.03)
+        active.discard(participant)
+        reply = CRITICAL_ERROR_RESPONSE if payload["user_message"] == "boom" else "ok"
+        return {"code": 200, "message": "ok", "data": {"ai_response": reply}}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run_step(client, "/chat", [["a1", "a2", "a3"], ["b1", "boom"]], rate=100, duration=0.3, run_id="t")
+
+    records = asyncio.run(scenario())
+
+    assert len(records) == len(seen) > 10
+    assert {r["outcome"] for r in records} == {"ok", "critical_error"}
+    by_participant = {}
+    for participant, message, conversation_id in seen:
+        by_participant.setdefault(participant, []).append((message, conversation_id))
+    for turns in by_participant.values():
+        messages = [message for message, _ in turns]
+        assert messages in (["a1", "a2", "a3"][:len(messages)], ["b1", "boom"][:len(messages)])
+        assert len({conversation_id for _, conversation_id in turns}) == 1
+
+
+def test_synthetic_sessions_are_deterministic():
+    assert synthetic_sessions(3, 4, seed=7) == synthetic_sessions(3, 4, seed=7)
+    assert [len(s) for s in synthetic_sessions(3, 4)] == [4, 4, 4]
+
+
+def test_stage_metrics_percentiles_and_reset():
+    metrics = StageMetrics(window=100)
+    for ms in range(1, 101):
+        metrics.record({"llm": float(ms), "prompt": 1.0})
+    stats = metrics.stats()
+    assert stats["llm"]["count"] == 100
+    assert (stats["llm"]["p50_ms"], stats["llm"]["p95_ms"], stats["llm"]["p99_ms"]) == (51.0, 96.0, 100.0)
+    assert stats["prompt"]["max_ms"] == 1.0
+    assert stats["llm"]["fallbacks"] == {}
+    metrics.record_fallback("sentiment", "timeout")
+    metrics.record_fallback("sentiment", "timeout")
+    # 只有降级、没有耗时样本的阶段也出现在统计中
+    assert metrics.stats()["sentiment"] == {
+        "count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None, "fallbacks": {"timeout": 2},
+    }
+    metrics.reset()
+    assert metrics.stats() == {}
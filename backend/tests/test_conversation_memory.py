@@ -0,0 +1,95 @@
+import os
+import sys
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db.migrations import upgrade_schema
+from app.models.chat_history import ChatHistory
+from app.services.conversation_memory import ConversationMemory
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _add(db, participant_id, conversation_id, messages):
+    start = datetime.now(UTC)
+    for offset, (role, message) in enumerate(messages):
+        db.add(ChatHistory(
+            participant_id=participant_id,
+            conversation_id=conversation_id,
+            role=role,
+            message=message,
+            timestamp=start + timedelta(seconds=offset),
+        ))
+    db.commit()
+
+
+def test_loads_recent_messages_from_chat_history(db):
+    _add(db, "p1", "c1", [("user", f"q{i}") if i % 2 == 0 else ("assistant", f"a{i}") for i in range(6)])
+    _add(db, "p1", "other", [("user", "elsewhere")])
+    _add(db, "p2", "c1", [("user", "not mine")])
+
+    memory = ConversationMemory(max_messages=4)
+    history = memory.get(db, "p1", "c1")
+
+    assert [m["content"] for m in history] == ["q2", "a3", "q4", "a5"]
+    assert history[1]["role"] == "assistant"
+    assert memory.get(db, "p2", "c1") == [{"role": "user", "content": "not mine"}]
+
+
+def test_buffer_serves_later_turns_without_database(db):
+    memory = ConversationMemory(max_messages=3)
+    assert memory.get(db, "p1", "c1") == []
+
+    memory.append("p1", "c1", "user", "first")
+    memory.append("p1", "c1", "assistant", "reply")
+    memory.append("p1", "c1", "user", "second")
+    memory.append("p1", "c1", "assistant", "reply 2")
+
+    # 环形缓冲区只保留最近 3 条，且不再访问数据库
+    assert [m["content"] for m in memory.get(None, "p1", "c1")] == ["reply", "second", "reply 2"]
+    assert memory.stats() == {"hits": 1, "loads": 1, "evictions": 0, "conversations": 1}
+
+
+def test_append_ignores_unbuffered_conversations_and_evicts_lru(db):
+    memory = ConversationMemory(max_messages=5, max_conversations=1)
+    memory.append("p1", "c1", "user", "dropped")
+    assert memory.get(db, "p1", "c1") == []
+
+    memory.get(db, "p1", "c2")
+    assert memory.stats()["evictions"] == 1
+    assert memory.stats()["conversations"] == 1
+
+
+def test_upgrade_schema_adds_conversation_column(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE chat_history (id INTEGER NOT NULL PRIMARY KEY, participant_id VARCHAR NOT NULL, "
+            "timestamp DATETIME NOT NULL, role VARCHAR NOT NULL, message TEXT NOT NULL, raw_prompt_to_llm TEXT)"
+        ))
+
+    changes = upgrade_schema(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("chat_history")}
+    indexes = {index["name"] for index in inspect(engine).get_indexes("chat_history")}
+    assert "conversation_id" in columns
+    assert "ix_chat_history_participant_conversation_timestamp" in indexes
+    assert "added column chat_history.conversation_id" in changes
+    assert upgrade_schema(engine) == []
+    engine.dispose()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db.migrations import upgrade_schema
+from app.models.chat_history import ChatHistory
+from app.services.conversation_memory import ConversationMemory
+from app.services.conversation_summarizer import ConversationSummarizer
+from app.services.llm_gateway import FALLBACK_RESPONSE_PREFIX
+from app.services.prompt_budget import TokenCounter
+from app.services.prompt_generator import PromptGenerator
+from app.schemas.chat import UserStateSummary
+
+
+class FakeGateway:
+    def __init__(self, reply="- student is centering a button"):
+        self.reply = reply
+        self.calls = []
+
+    async def get_completion(self, system_prompt, messages, max_tokens=None, temperature=None, priority=None):
+        self.calls.append(messages[0]["content"])
+        return self.reply
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _add_turns(session_factory, count, start_index=0, size=60):
+    db = session_factory()
+    start = datetime.now(UTC) + timedelta(minutes=start_index)
+    for i in range(start_index, start_index + count):
+        for offset, role in enumerate(("user", "assistant")):
+            db.add(ChatHistory(
+                participant_id="p1", conversation_id="c1", role=role,
+                message=f"{role}-{i} " + "x" * size,
+                timestamp=start + timedelta(seconds=2 * (i - start_index) + offset),
+            ))
+    db.commit()
+    db.close()
+
+
+def _summarizer(session_factory, gateway, memory=None):
+    return ConversationSummarizer(
+        llm_gateway=gateway,
+        session_factory=session_factory,
+        conversation_memory=memory,
+        token_counter=TokenCounter(None),
+        trigger_tokens=100,
+        keep_recent_messages=2,
+    )
+
+
+def test_summarizes_older_turns_and_updates_memory(session_factory):
+    _add_turns(session_factory, 5)
+    memory = ConversationMemory(max_messages=20)
+    db = session_factory()
+    assert len(memory.get(db, "p1", "c1")) == 10
+
+    record = asyncio.run(_summarizer(session_factory, FakeGateway(), memory).maybe_summarize("p1", "c1"))
+
+    assert record.version == 1
+    assert record.covered_message_count == 8
+    context = memory.get_context(db, "p1", "c1")
+    assert context.summary_version == 1
+    assert [m["content"].split()[0] for m in context.messages] == ["user-4", "assistant-4"]
+
+    # 新的对话内存加载时也能拿到摘要
+    fresh = ConversationMemory(max_messages=20).get_context(db, "p1", "c1")
+    assert fresh.summary == "- student is centering a button"
+    assert len(fresh.messages) == 2
+    db.close()
+
+
+def test_below_threshold_is_skipped_and_versions_chain(session_factory):
+    gateway = FakeGateway()
+    summarizer = _summarizer(session_factory, gateway)
+    _add_turns(session_factory, 1, size=5)
+    assert asyncio.run(summarizer.maybe_summarize("p1", "c1")) is None
+    assert gateway.calls == []
+
+    _add_turns(session_factory, 4, start_index=1)
+    first = asyncio.run(summarizer.maybe_summarize("p1", "c1"))
+    _add_turns(session_factory, 4, start_index=5)
+    second = asyncio.run(summarizer.maybe_summarize("p1", "c1"))
+
+    assert (first.version, second.version) == (1, 2)
+    assert second.covered_message_count == 16
+    # 新版本基于上一版摘要生成
+    assert "PREVIOUS SUMMARY" in gateway.calls[1]
+
+
+def test_failed_summary_keeps_previous_version(session_factory):
+    _add_turns(session_factory, 5)
+    gateway = FakeGateway(reply=f"{FALLBACK_RESPONSE_PREFIX}I encountered an error: timeout")
+    assert asyncio.run(_summarizer(session_factory, gateway).maybe_summarize("p1", "c1")) is None
+
+
+def test_database_work_runs_off_the_event_loop_thread(session_factory):
+    _add_turns(session_factory, 5)
+    threads = []
+
+    def tracking_factory():
+        threads.append(threading.get_ident())
+        return session_factory()
+
+    record = asyncio.run(_summarizer(tracking_factory, FakeGateway()).maybe_summarize("p1", "c1"))
+
+    assert record.version == 1
+    # 读取历史和保存摘要各开一个会话，都不在事件循环所在的线程
+    assert len(threads) == 2 and threading.get_ident() not in threads
+
+
+def test_prompt_includes_versioned_summary():
+    generator = PromptGenerator(token_counter=TokenCounter(None))
+    state = UserStateSummary(participant_id="p1", emotion_state={}, behavior_counters={}, bkt_models={}, is_new_user=True)
+
+    system_prompt, _ = generator.create_prompts(
+        user_state=state, retrieved_context=[], conversation_history=[], user_message="hi",
+        conversation_summary="- asked about flexbox", summary_version=3,
+    )
+
+    assert "CONVERSATION SUMMARY (v3)" in system_prompt
+    assert "- asked about flexbox" in system_prompt
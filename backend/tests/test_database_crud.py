@@ -21,18 +21,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 在导入项目模块前设置测试环境
 os.environ["APP_ENV"] = "testing"
-# 使用绝对路径确保在任何目录下运行测试都能找到数据库文件
-import os
-current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-db_path = os.path.join(current_dir, "app", "db", "database.db")
-os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
 os.environ["TUTOR_OPENAI_API_KEY"] = "test-key"
 os.environ["TUTOR_EMBEDDING_API_KEY"] = "test-key"
 os.environ["TUTOR_TRANSLATION_API_KEY"] = "test-key"
 
 # 导入项目模块
 from app.db.base_class import Base
-from app.db.database import engine, SessionLocal
+from app.db.migrations import upgrade_schema
 from app.models.participant import Participant
 from app.models.event import EventLog
 from app.models.chat_history import ChatHistory
@@ -47,10 +42,12 @@ from app.crud import participant, event, chat_history, progress, survey_result
 
 
 @pytest.fixture(scope="function")
-def db() -> Generator[Session, None, None]:
-    """创建测试数据库会话，使用事务回滚确保测试数据不持久化"""
+def db(tmp_path) -> Generator[Session, None, None]:
+    """创建测试数据库会话，使用临时数据库和事务回滚，不触碰项目数据库文件"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'crud.db'}", connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
     # 创建数据库会话
-    db = SessionLocal()
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
     # 开始一个事务
     db.begin()
     try:
@@ -59,6 +56,7 @@ def db() -> Generator[Session, None, None]:
         # 回滚事务，确保测试数据不会真正写入数据库
         db.rollback()
         db.close()
+        engine.dispose()
 
 
 def test_participant_crud(db: Session):
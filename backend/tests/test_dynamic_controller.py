@@ -21,9 +21,11 @@ DynamicController 测试文件
 
 import pytest
 import asyncio
+import json
 from unittest.mock import AsyncMock, MagicMock, patch, call
 from datetime import datetime, UTC
 from fastapi import BackgroundTasks
+import threading
 import time
 
 # 正常导入所有需要的模块
@@ -38,7 +40,7 @@ from app.models.chat_history import ChatHistory
 from app.crud.crud_chat_history import chat_history as crud_chat_history
 
 # 导入数据库相关模块
-from app.db.database import SessionLocal
+from app.db.migrations import upgrade_schema
 from app.core.config import settings
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -46,14 +48,16 @@ from sqlalchemy.orm import sessionmaker
 # --- 测试夹具 ---
 
 @pytest.fixture(scope="session")
-def db_engine():
-    """创建测试数据库引擎"""
-    # 使用项目中的实际数据库
+def db_engine(tmp_path_factory):
+    """创建测试数据库引擎（临时数据库文件，不触碰项目数据库）"""
+    db_path = tmp_path_factory.mktemp("dynamic_controller") / "test.db"
     engine = create_engine(
-        settings.DATABASE_URL,
+        f"sqlite:///{db_path}",
         connect_args={"check_same_thread": False}
     )
+    upgrade_schema(engine)
     yield engine
+    engine.dispose()
 
 @pytest.fixture
 def db_session(db_engine):
@@ -199,6 +203,11 @@ class TestDynamicController:
         )
         dynamic_controller.llm_gateway.get_completion.assert_called_once()
 
+        # 各阶段耗时进入统计（供 /admin/chat/stats 和负载测试读取）
+        stages = dynamic_controller.stage_metrics.stats()
+        assert {"profile", "sentiment", "retrieval", "prompt", "llm", "log"} <= set(stages)
+        assert all(stats["count"] == 1 for stats in stages.values())
+
     @pytest.mark.asyncio
     async def test_generate_adaptive_response_without_sentiment_service(
         self,
@@ -840,9 +849,10 @@ class TestDynamicController:
         
         await controller.generate_adaptive_response(sample_chat_request, db_session)
         
-        # 验证TDD-II-10规定的调用顺序
-        expected_order = ['user_state', 'sentiment', 'rag', 'prompt_generator', 'llm_gateway']
-        assert call_order == expected_order, f"服务调用顺序不符合TDD-II-10规范: {call_order}"
+        # 验证TDD-II-10规定的调用顺序：情感分析与RAG检索并发执行，二者之间不规定先后
+        assert call_order[0] == 'user_state', f"服务调用顺序不符合TDD-II-10规范: {call_order}"
+        assert set(call_order[1:3]) == {'sentiment', 'rag'}, f"服务调用顺序不符合TDD-II-10规范: {call_order}"
+        assert call_order[3:] == ['prompt_generator', 'llm_gateway'], f"服务调用顺序不符合TDD-II-10规范: {call_order}"
 
         # 验证 create_prompts 被调用
         prompt_generator.create_prompts.assert_called_once()
@@ -1489,5 +1499,366 @@ class TestDynamicController:
         
         assert controller.rag_service is None
 
+    @pytest.mark.asyncio
+    async def test_stream_adaptive_response_logs_full_message(
+        self,
+        dynamic_controller,
+        sample_chat_request,
+        mock_db_session
+    ):
+        """测试流式回复：逐段产出增量，结束时记录完整的AI消息"""
+        async def fake_stream(system_prompt, messages, priority=None):
+            for delta in ["这是", "一个", "AI回复"]:
+                yield delta
+
+        dynamic_controller.llm_gateway.stream_completion = fake_stream
+        background_tasks = BackgroundTasks()
+
+        events = [
+            event async for event in dynamic_controller.stream_adaptive_response(
+                sample_chat_request, mock_db_session, background_tasks=background_tasks
+            )
+        ]
+
+        assert [e["content"] for e in events if e["type"] == "delta"] == ["这是", "一个", "AI回复"]
+        assert events[-1]["type"] == "done"
+        assert events[-1]["ai_response"] == "这是一个AI回复"
+        assert events[-1]["ttft_ms"] is not None
+
+        # chat_history 中记录的是拼接后的完整回复
+        ai_chat = background_tasks.tasks[-1].kwargs["obj_in"]
+        assert ai_chat.role == "assistant"
+        assert ai_chat.message == "这是一个AI回复"
+        dynamic_controller.rag_service.retrieve.assert_called_once_with(sample_chat_request.user_message)
+
+    @pytest.mark.asyncio
+    async def test_independent_stages_run_concurrently(
+        self,
+        dynamic_controller,
+        sample_chat_request,
+        mock_db_session
+    ):
+        """测试情感分析与RAG检索并发执行：总耗时接近单个阶段而不是二者之和"""
+        def slow_sentiment(message):
+            time.sleep(0.3)
+            return SentimentAnalysisResult(label="positive", confidence=0.8, details={})
+
+        def slow_retrieve(message):
+            time.sleep(0.3)
+            return [{"content": "相关知识"}]
+
+        dynamic_controller.sentiment_service.analyze_sentiment.side_effect = slow_sentiment
+        dynamic_controller.rag_service.retrieve.side_effect = slow_retrieve
+
+        started = time.perf_counter()
+        response = await dynamic_controller.generate_adaptive_response(sample_chat_request, mock_db_session)
+        elapsed = time.perf_counter() - started
+
+        assert response.ai_response == "这是一个AI回复"
+        assert elapsed < 0.55
+
+    @pytest.mark.asyncio
+    async def test_stage_missing_deadline_degrades_to_default(
+        self,
+        dynamic_controller,
+        sample_chat_request,
+        mock_db_session
+    ):
+        """测试超过截止时间的阶段降级为默认结果，不影响回复"""
+        def stuck_retrieve(message):
+            time.sleep(0.5)
+            return [{"content": "迟到的知识"}]
+
+        dynamic_controller.rag_service.retrieve.side_effect = stuck_retrieve
+        dynamic_controller.stage_timeouts["retrieval"] = 0.05
+        dynamic_controller.prompt_generator = MagicMock()
+        dynamic_controller.prompt_generator.create_prompts.return_value = ("system", [])
+
+        response = await dynamic_controller.generate_adaptive_response(sample_chat_request, mock_db_session)
+
+        assert response.ai_response == "这是一个AI回复"
+        kwargs = dynamic_controller.prompt_generator.create_prompts.call_args.kwargs
+        assert kwargs["retrieved_context"] == []
+        assert kwargs["user_state"].emotion_state["current_sentiment"] == "positive"
+
+    @pytest.mark.asyncio
+    async def test_sentiment_timeouts_are_counted_and_saturated_pool_is_skipped(
+        self,
+        dynamic_controller,
+        sample_chat_request,
+        mock_db_session
+    ):
+        """测试情感分析超时计入降级统计、结果标记为降级；超时推理占满线程池时不再提交"""
+        release = threading.Event()
+
+        def stuck_sentiment(message):
+            release.wait(5)
+            return SentimentAnalysisResult(label="positive", confidence=0.8, details={})
+
+        dynamic_controller.sentiment_service.analyze_sentiment.side_effect = stuck_sentiment
+        dynamic_controller.stage_timeouts["sentiment"] = 0.05
+        dynamic_controller._sentiment_workers = 1
+        dynamic_controller.prompt_generator = MagicMock()
+        dynamic_controller.prompt_generator.create_prompts.return_value = ("system", [])
+
+        try:
+            await dynamic_controller.generate_adaptive_response(sample_chat_request, mock_db_session)
+            first = dynamic_controller.prompt_generator.create_prompts.call_args.kwargs["user_state"].emotion_state
+            await dynamic_controller.generate_adaptive_response(sample_chat_request, mock_db_session)
+            second = dynamic_controller.prompt_generator.create_prompts.call_args.kwargs["user_state"].emotion_state
+        finally:
+            release.set()
+
+        assert first["current_sentiment"] == "neutral"
+        assert first["details"] == {"tier": "fallback", "degraded": True, "reason": "timeout"}
+        assert second["details"]["reason"] == "saturated"
+        # 第二次请求没有再把推理提交到仍被占用的线程池
+        assert dynamic_controller.sentiment_service.analyze_sentiment.call_count == 1
+        assert dynamic_controller.stage_metrics.stats()["sentiment"]["fallbacks"] == {"timeout": 1, "saturated": 1}
+
+    @pytest.mark.asyncio
+    async def test_semantic_response_cache_skips_llm_on_hit(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试语义回复缓存：同一分组的相似问题复用回答，其他分组不共享"""
+        from app.services.response_cache import SemanticResponseCache
+
+        dynamic_controller.response_cache = SemanticResponseCache(
+            embed_fn=lambda question: [1.0, 0.0], namespace="test-controller-semantic"
+        )
+        dynamic_controller.response_cache_modes = ["test"]
+        request = ChatRequest(participant_id="test_user_123", user_message="为什么按钮不居中？", mode="test", content_id="4_3")
+
+        with patch('app.services.dynamic_controller.crud_participant') as mock_crud_participant, \
+             patch.object(dynamic_controller.prompt_fragments, 'get', side_effect=FileNotFoundError), \
+             patch.object(dynamic_controller.prompt_generator, 'create_prompts', wraps=dynamic_controller.prompt_generator.create_prompts) as mock_create_prompts:
+            mock_crud_participant.get.return_value = MagicMock(group="experimental")
+            first = await dynamic_controller.generate_adaptive_response(request, mock_db_session)
+            second = await dynamic_controller.generate_adaptive_response(request, mock_db_session)
+
+            mock_crud_participant.get.return_value = MagicMock(group="control")
+            await dynamic_controller.generate_adaptive_response(request, mock_db_session)
+
+        assert first.ai_response == second.ai_response == "这是一个AI回复"
+        # 第二次命中缓存，control 组不共享 experimental 组的条目
+        assert dynamic_controller.llm_gateway.get_completion.call_count == 2
+        assert dynamic_controller.response_cache.stats()["hits"] == 1
+        # 命中时不再执行情感分析、检索和提示词组装；未命中时检索复用缓存算好的问题向量
+        assert dynamic_controller.sentiment_service.analyze_sentiment.call_count == 2
+        assert mock_create_prompts.call_count == 2
+        assert [c.args for c in dynamic_controller.rag_service.retrieve.call_args_list] == [
+            ("为什么按钮不居中？", 3, [1.0, 0.0])
+        ] * 2
+
+    @pytest.mark.asyncio
+    async def test_semantic_cache_hit_is_recorded_in_chat_history(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试语义缓存命中时 chat_history.llm_route 标明来源，而不是看起来像 LLM 回答了本轮提示词"""
+        import json
+        from app.services.llm_router import RoutingDecision
+        from app.services.response_cache import SemanticResponseCache
+
+        dynamic_controller.response_cache = SemanticResponseCache(
+            embed_fn=lambda question: [1.0, 0.0], namespace="test-controller-semantic-audit"
+        )
+        dynamic_controller.response_cache_modes = ["test"]
+        first_request = ChatRequest(participant_id="student_a", user_message="为什么按钮不居中？", mode="test",
+                                    content_id="4_3")
+        second_request = ChatRequest(participant_id="student_b", user_message="按钮为什么不居中", mode="test",
+                                     content_id="4_3")
+        route = RoutingDecision(backend="primary", model="gpt-test", reason="lowest_latency")
+
+        with patch('app.services.dynamic_controller.crud_participant') as mock_crud_participant, \
+             patch('app.services.dynamic_controller.crud_chat_history') as mock_crud_chat_history, \
+             patch('app.services.dynamic_controller.crud_event'), \
+             patch('app.services.dynamic_controller.last_routing_decision', return_value=route), \
+             patch.object(dynamic_controller.prompt_fragments, 'get', side_effect=FileNotFoundError):
+            mock_crud_participant.get.return_value = MagicMock(group="experimental")
+            await dynamic_controller.generate_adaptive_response(first_request, mock_db_session)
+            await dynamic_controller.generate_adaptive_response(second_request, mock_db_session)
+
+        assert dynamic_controller.llm_gateway.get_completion.call_count == 1
+        ai_rows = [c.kwargs["obj_in"] for c in mock_crud_chat_history.create.call_args_list
+                   if c.kwargs["obj_in"].role == "assistant"]
+        assert json.loads(ai_rows[0].llm_route) == route.to_dict()
+
+        cached = json.loads(ai_rows[1].llm_route)
+        assert cached["source"] == "semantic_cache" and cached["similarity"] == 1.0
+        assert cached["cached_from"]["participant_id"] == "student_a"
+        assert cached["cached_from"]["llm_route"] == route.to_dict()
+        assert "cache_entry_id" in cached["cached_from"] and "stored_at" in cached["cached_from"]
+
+
+    @pytest.mark.asyncio
+    async def test_conversation_id_uses_server_side_history(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试带 conversation_id 时服务端重建历史，忽略客户端上传的历史"""
+        stored = [MagicMock(role="user", message="之前的问题"), MagicMock(role="assistant", message="之前的回答")]
+        request = ChatRequest(
+            participant_id="test_user_123",
+            user_message="新的问题",
+            conversation_id="conv-1",
+            conversation_history=[ConversationMessage(role="user", content="伪造的历史")]
+        )
+
+        with patch('app.services.conversation_memory.crud_chat_history') as mock_memory_crud, \
+             patch('app.services.conversation_memory.crud_conversation_summary') as mock_summary_crud, \
+             patch('app.services.dynamic_controller.crud_event'), \
+             patch('app.services.dynamic_controller.crud_chat_history') as mock_crud_chat_history, \
+             patch.object(dynamic_controller.prompt_generator, 'create_prompts', wraps=dynamic_controller.prompt_generator.create_prompts) as mock_create_prompts:
+            mock_memory_crud.get_recent_by_conversation.return_value = stored
+            mock_summary_crud.get_latest.return_value = None
+            await dynamic_controller.generate_adaptive_response(request, mock_db_session)
+            await dynamic_controller.generate_adaptive_response(request.model_copy(update={"user_message": "第三个问题"}), mock_db_session)
+
+        first_history = mock_create_prompts.call_args_list[0].kwargs['conversation_history']
+        second_history = mock_create_prompts.call_args_list[1].kwargs['conversation_history']
+        assert [m['content'] for m in first_history] == ["之前的问题", "之前的回答"]
+        # 第二轮直接使用内存中的环形缓冲区（包含上一轮），只回源数据库一次
+        assert [m['content'] for m in second_history] == ["之前的问题", "之前的回答", "新的问题", "这是一个AI回复"]
+        assert mock_memory_crud.get_recent_by_conversation.call_count == 1
+        user_chat = mock_crud_chat_history.create.call_args_list[0][1]['obj_in']
+        assert user_chat.conversation_id == "conv-1"
+
+
+    @pytest.mark.asyncio
+    async def test_duplicate_requests_are_coalesced(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试重复提交的相同请求只生成和记录一次"""
+        from app.services.chat_concurrency import InFlightCoalescer, ParticipantGate
+
+        dynamic_controller.coalescer = InFlightCoalescer()
+        dynamic_controller.participant_gate = ParticipantGate()
+
+        async def slow_completion(**kwargs):
+            await asyncio.sleep(0.05)
+            return "这是一个AI回复"
+
+        dynamic_controller.llm_gateway.get_completion = AsyncMock(side_effect=slow_completion)
+        request = ChatRequest(participant_id="test_user_123", user_message="为什么按钮不居中？")
+
+        with patch('app.services.dynamic_controller.crud_event'), \
+             patch('app.services.dynamic_controller.crud_chat_history') as mock_crud_chat_history:
+            responses = await asyncio.gather(
+                dynamic_controller.generate_adaptive_response(request, mock_db_session),
+                dynamic_controller.generate_adaptive_response(request, mock_db_session),
+            )
+            events = [event async for event in dynamic_controller.stream_adaptive_response(request, mock_db_session)]
+
+        assert [r.ai_response for r in responses] == ["这是一个AI回复", "这是一个AI回复"]
+        # 刚完成的结果被重试的流式请求直接复用
+        assert events[-1] == {"type": "done", "ai_response": "这是一个AI回复", "ttft_ms": None}
+        assert dynamic_controller.llm_gateway.get_completion.call_count == 1
+        assert mock_crud_chat_history.create.call_count == 2
+
+
+    @pytest.mark.asyncio
+    async def test_edited_code_is_not_coalesced_with_earlier_request(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试修改代码后重发同一条消息会重新生成，而不是复用刚完成的回答"""
+        from app.schemas.content import CodeContent
+        from app.services.chat_concurrency import InFlightCoalescer
+
+        dynamic_controller.coalescer = InFlightCoalescer(recent_ttl_seconds=60)
+        dynamic_controller.llm_gateway.get_completion = AsyncMock(side_effect=["第一次回答", "第二次回答"])
+        before = ChatRequest(participant_id="test_user_123", user_message="为什么按钮不居中？",
+                             code_context=CodeContent(html="<button>OK</button>", css="", js=""))
+        after = before.model_copy(update={"code_context": CodeContent(html="<button>OK</button>",
+                                                                      css="button { margin: 0 auto; }", js="")})
+
+        with patch('app.services.dynamic_controller.crud_event'), \
+             patch('app.services.dynamic_controller.crud_chat_history'):
+            first = await dynamic_controller.generate_adaptive_response(before, mock_db_session)
+            second = await dynamic_controller.generate_adaptive_response(after, mock_db_session)
+
+        assert (first.ai_response, second.ai_response) == ("第一次回答", "第二次回答")
+        assert dynamic_controller.llm_gateway.get_completion.call_count == 2
+
+
+    @pytest.mark.asyncio
+    async def test_superseded_request_ends_with_explicit_result(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试 cancel 策略下被取代的请求以 ChatSupersededError / superseded 事件结束"""
+        from app.services.chat_concurrency import ChatSupersededError, ParticipantGate
+
+        dynamic_controller.participant_gate = ParticipantGate(policy="cancel")
+
+        async def slow_completion(**kwargs):
+            await asyncio.sleep(10)
+            return "旧回答"
+
+        async def slow_stream(**kwargs):
+            await asyncio.sleep(10)
+            yield "旧回答"
+
+        dynamic_controller.llm_gateway.get_completion = AsyncMock(side_effect=slow_completion)
+        dynamic_controller.llm_gateway.stream_completion = MagicMock(side_effect=slow_stream)
+        old = ChatRequest(participant_id="test_user_123", user_message="第一个问题")
+        new = ChatRequest(participant_id="test_user_123", user_message="第二个问题")
+
+        async def collect(request):
+            return [event async for event in dynamic_controller.stream_adaptive_response(request, mock_db_session)]
+
+        with patch('app.services.dynamic_controller.crud_event'), \
+             patch('app.services.dynamic_controller.crud_chat_history'):
+            old_task = asyncio.create_task(dynamic_controller.generate_adaptive_response(old, mock_db_session))
+            await asyncio.sleep(0.05)
+            stream_task = asyncio.create_task(collect(new))
+            with pytest.raises(ChatSupersededError):
+                await old_task
+            await asyncio.sleep(0.05)
+            dynamic_controller.llm_gateway.get_completion = AsyncMock(return_value="新回答")
+            await dynamic_controller.generate_adaptive_response(old, mock_db_session)
+            events = await stream_task
+
+        assert events[-1]["type"] == "superseded"
+
+
+    @pytest.mark.asyncio
+    async def test_routing_decision_is_logged_with_ai_message(
+        self,
+        dynamic_controller,
+        mock_db_session
+    ):
+        """测试网关的路由决定随 AI 消息写入 chat_history"""
+        from app.services.llm_router import RoutingDecision, set_routing_decision
+
+        async def routed_completion(**kwargs):
+            set_routing_decision(RoutingDecision(backend="small", model="tiny-model", reason="fallback_under_load", attempts=["small"]))
+            return "这是一个AI回复"
+
+        dynamic_controller.llm_gateway.get_completion = AsyncMock(side_effect=routed_completion)
+        request = ChatRequest(participant_id="test_user_123", user_message="什么是盒模型？")
+
+        with patch('app.services.dynamic_controller.crud_event'), \
+             patch('app.services.dynamic_controller.crud_chat_history') as mock_crud_chat_history:
+            await dynamic_controller.generate_adaptive_response(request, mock_db_session)
+
+        user_chat = mock_crud_chat_history.create.call_args_list[0][1]['obj_in']
+        ai_chat = mock_crud_chat_history.create.call_args_list[1][1]['obj_in']
+        assert user_chat.llm_route is None
+        assert json.loads(ai_chat.llm_route) == {
+            "backend": "small", "model": "tiny-model", "reason": "fallback_under_load",
+            "attempts": ["small"], "hedged": False,
+        }
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
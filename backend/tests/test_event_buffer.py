@@ -0,0 +1,253 @@
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 将 backend 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.api.endpoints import behavior as behavior_module
+from app.crud.crud_event import event as crud_event
+from app.models.event import EventLog
+from app.schemas.behavior import BehaviorEvent
+from app.services.event_buffer import EventBufferFullError, EventWriteBuffer
+
+
+def _recording_writer(batches):
+    def write_batch(items):
+        batches.append(list(items))
+    return write_batch
+
+
+def test_events_are_written_in_batches_and_in_order():
+    batches = []
+    buffer = EventWriteBuffer(_recording_writer(batches), flush_interval_ms=50, max_batch_size=20)
+    for i in range(50):
+        buffer.submit(i)
+    assert buffer.flush(timeout=5)
+    buffer.close(timeout=1)
+
+    assert [item for batch in batches for item in batch] == list(range(50))
+    assert all(len(batch) <= 20 for batch in batches) and len(batches) <= 5
+    stats = buffer.stats()
+    assert (stats["submitted"], stats["written"], stats["batches"]) == (50, 50, len(batches))
+    assert stats["max_batch"] == 20 and stats["flush_p95_ms"] is not None
+
+
+def test_single_event_is_written_after_flush_interval():
+    batches = []
+    buffer = EventWriteBuffer(_recording_writer(batches), flush_interval_ms=50, max_batch_size=100)
+    try:
+        buffer.submit("only")
+        time.sleep(0.02)
+        assert batches == []
+        time.sleep(0.2)
+        assert batches == [["only"]]
+    finally:
+        buffer.close(timeout=1)
+
+
+def test_full_buffer_applies_backpressure_and_close_drains_pending():
+    batches = []
+    buffer = EventWriteBuffer(_recording_writer(batches), flush_interval_ms=10_000, max_batch_size=100,
+                              max_pending=2, put_timeout_seconds=0.05)
+    buffer.submit("a")
+    buffer.submit("b")
+    started = time.monotonic()
+    with pytest.raises(EventBufferFullError):
+        buffer.submit("c")
+    assert time.monotonic() - started >= 0.05
+    assert buffer.stats()["rejected"] == 1 and buffer.stats()["queue_depth"] == 2
+
+    buffer.close(timeout=1)
+    assert batches == [["a", "b"]]
+    with pytest.raises(RuntimeError):
+        buffer.submit("after close")
+
+
+def test_blocked_producer_resumes_when_writer_frees_space():
+    release, batches = threading.Event(), []
+
+    def slow_writer(items):
+        release.wait(5)
+        batches.append(list(items))
+
+    buffer = EventWriteBuffer(slow_writer, flush_interval_ms=0, max_batch_size=1, max_pending=1, put_timeout_seconds=2)
+    try:
+        buffer.submit(1)          # 写入线程取走后阻塞在 slow_writer
+        time.sleep(0.05)
+        buffer.submit(2)          # 占满缓冲区
+        threading.Timer(0.05, release.set).start()
+        buffer.submit(3)          # 等待写入线程腾出空间
+        assert buffer.flush(timeout=5)
+    finally:
+        buffer.close(timeout=1)
+    assert batches == [[1], [2], [3]]
+
+
+def test_failed_batch_is_retried_one_by_one():
+    written = []
+
+    def write_batch(items):
+        if "bad" in items:
+            raise ValueError("constraint failed")
+        written.extend(items)
+
+    buffer = EventWriteBuffer(write_batch, flush_interval_ms=10_000, max_batch_size=10)
+    for item in ("a", "bad", "b"):
+        buffer.submit(item)
+    assert buffer.flush(timeout=5)
+    buffer.close(timeout=1)
+
+    assert written == ["a", "b"]
+    stats = buffer.stats()
+    assert (stats["written"], stats["failed"], stats["retried_batches"]) == (2, 1, 1)
+
+
+def test_rows_are_inserted_in_one_transaction(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}", connect_args={"check_same_thread": False})
+    EventLog.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+
+    def write_batch(rows):
+        db = Session()
+        try:
+            crud_event.create_many(db, rows=rows)
+        finally:
+            db.close()
+
+    buffer = EventWriteBuffer(write_batch, flush_interval_ms=10_000, max_batch_size=100)
+    stamp = datetime(2026, 1, 1, 12, 0, 0)
+    buffer.submit(crud_event.behavior_to_row(BehaviorEvent(
+        participant_id="p1", event_type="code_edit", event_data={"editor_name": "js", "new_length": 42}, timestamp=stamp
+    )))
+    buffer.submit(crud_event.behavior_to_row(BehaviorEvent(
+        participant_id="p1", event_type="page_focus_change", event_data={"status": "blur"}
+    )))
+    buffer.close(timeout=5)
+
+    db = Session()
+    try:
+        rows = crud_event.get_by_participant(db, participant_id="p1")
+    finally:
+        db.close()
+    assert [r.event_type for r in rows] == ["code_edit", "page_focus_change"]
+    assert rows[0].event_data == {"editor_name": "js", "new_length": 42} and rows[0].timestamp == stamp
+    assert rows[1].timestamp is not None
+    assert buffer.stats()["batches"] == 1
+
+
+def test_submit_many_enqueues_all_or_nothing():
+    batches = []
+    buffer = EventWriteBuffer(_recording_writer(batches), flush_interval_ms=10_000, max_batch_size=100,
+                              max_pending=4, put_timeout_seconds=0.05)
+    buffer.submit("a")
+    buffer.submit_many(["b", "c"])
+    with pytest.raises(EventBufferFullError):
+        buffer.submit_many(["d", "e"])
+    assert buffer.stats()["rejected"] == 2 and buffer.stats()["queue_depth"] == 3
+    assert buffer.flush(timeout=5)
+    # 超过 max_pending 的一组事件在缓冲区为空时整体入队
+    buffer.submit_many(list("vwxyz"))
+    buffer.close(timeout=1)
+    assert batches == [["a", "b", "c"], ["v", "w", "x", "y", "z"]]
+
+
+class StubBuffer:
+    def __init__(self, full=False):
+        self.full = full
+        self.calls = []
+
+    def flush(self, timeout=5.0):
+        self.calls.append("flush")
+        return True
+
+    def submit(self, row):
+        if self.full:
+            raise EventBufferFullError("full")
+        self.calls.append(row["event_type"])
+
+    def submit_many(self, rows):
+        if self.full:
+            raise EventBufferFullError("full")
+        self.calls.append([row["event_type"] for row in rows])
+
+
+def _client(buffer, bus=None):
+    app = FastAPI()
+    app.dependency_overrides[behavior_module.get_db] = lambda: MagicMock()
+    app.dependency_overrides[behavior_module.get_user_state_service] = lambda: MagicMock()
+    app.dependency_overrides[behavior_module.get_event_buffer] = lambda: buffer
+    app.dependency_overrides[behavior_module.get_event_bus] = lambda: bus
+    app.include_router(behavior_module.router, prefix="/behavior")
+    return TestClient(app)
+
+
+def test_log_endpoint_buffers_events_and_flushes_before_interpreting_submissions(monkeypatch):
+    monkeypatch.setattr(behavior_module.behavior_interpreter_service, "interpret_event", MagicMock())
+    buffer = StubBuffer()
+    client = _client(buffer)
+
+    edit = {"participant_id": "p1", "event_type": "code_edit", "event_data": {"editor_name": "js", "new_length": 3}}
+    submission = {"participant_id": "p1", "event_type": "test_submission",
+                  "event_data": {"topic_id": "t1", "code": {"html": "", "css": "", "js": ""}}}
+    assert client.post("/behavior/log", json=edit).status_code == 202
+    assert client.post("/behavior/log", json=submission).status_code == 202
+    assert buffer.calls == ["code_edit", "test_submission", "flush"]
+
+
+def test_log_endpoint_returns_503_when_buffer_is_full(monkeypatch):
+    monkeypatch.setattr(behavior_module.behavior_interpreter_service, "interpret_event", MagicMock())
+    client = _client(StubBuffer(full=True))
+    response = client.post("/behavior/log", json={
+        "participant_id": "p1", "event_type": "user_idle", "event_data": {"duration_ms": 1000}
+    })
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+
+
+def test_log_batch_validates_orders_and_buffers_events_in_one_submit(monkeypatch):
+    interpret = MagicMock()
+    monkeypatch.setattr(behavior_module.behavior_interpreter_service, "interpret_event", interpret)
+    buffer = StubBuffer()
+    client = _client(buffer)
+
+    events = [
+        {"participant_id": "p1", "event_type": "test_submission", "timestamp": "2026-01-01T12:00:03Z",
+         "event_data": {"topic_id": "t1", "code": {"html": "", "css": "", "js": ""}}},
+        {"participant_id": "p1", "event_type": "code_edit", "timestamp": "2026-01-01T12:00:01Z",
+         "event_data": {"editor_name": "js", "new_length": 3}},
+        {"participant_id": "p1", "event_type": "user_idle", "event_data": {"duration_ms": -1}},
+        {"participant_id": "p1", "event_type": "page_focus_change", "timestamp": "2026-01-01T12:00:02Z",
+         "event_data": {"status": "blur"}},
+    ]
+    response = client.post("/behavior/log-batch", json=events)
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["accepted"] == 3 and [r["index"] for r in body["rejected"]] == [2]
+    assert buffer.calls == [["code_edit", "page_focus_change", "test_submission"], "flush"]
+    interpreted = [c.kwargs["event"].event_type.value for c in interpret.call_args_list]
+    assert interpreted == ["code_edit", "page_focus_change", "test_submission"]
+
+
+def test_log_batch_rejects_whole_batch_when_buffer_is_full_or_batch_too_large(monkeypatch):
+    interpret = MagicMock()
+    monkeypatch.setattr(behavior_module.behavior_interpreter_service, "interpret_event", interpret)
+    edit = {"participant_id": "p1", "event_type": "code_edit", "event_data": {"editor_name": "js", "new_length": 3}}
+
+    response = _client(StubBuffer(full=True)).post("/behavior/log-batch", json=[edit, edit])
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+    assert interpret.call_count == 0
+
+    monkeypatch.setattr(behavior_module.settings, "BEHAVIOR_BATCH_MAX_EVENTS", 2)
+    buffer = StubBuffer()
+    assert _client(buffer).post("/behavior/log-batch", json=[edit] * 3).status_code == 413
+    assert buffer.calls == []
@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# 将 backend 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.api.endpoints import behavior as behavior_module
+from app.services.event_bus import EventBusFullError, OrderedEventBus
+
+
+def test_events_of_one_key_are_handled_in_order_across_workers():
+    handled, lock = [], threading.Lock()
+
+    def handler(item):
+        time.sleep(0.001)
+        with lock:
+            handled.append(item)
+
+    bus = OrderedEventBus(handler, key=lambda item: item[0], kind=lambda item: item[0], workers=4)
+    for i in range(30):
+        for key in ("a", "b", "c"):
+            bus.publish((key, i))
+    assert bus.drain(timeout=5)
+    bus.close(timeout=1)
+
+    for key in ("a", "b", "c"):
+        assert [i for k, i in handled if k == key] == list(range(30))
+    stats = bus.stats()
+    assert (stats["published"], stats["handled"], stats["queue_depth"]) == (90, 90, 0)
+    assert set(stats["handlers"]) == {"a", "b", "c"} and stats["handlers"]["a"]["count"] == 30
+    assert stats["lag_p95_ms"] is not None
+
+
+def test_slow_key_does_not_block_other_keys():
+    release, handled = threading.Event(), []
+
+    def handler(item):
+        if item == ("slow", 1):
+            release.wait(5)
+        handled.append(item)
+
+    bus = OrderedEventBus(handler, key=lambda item: item[0], workers=2)
+    try:
+        bus.publish_many([("slow", 1), ("slow", 2), ("fast", 1)])
+        time.sleep(0.1)
+        assert handled == [("fast", 1)]
+        assert bus.stats()["in_flight"] == 1 and bus.stats()["queue_depth"] == 1
+        release.set()
+        assert bus.drain(timeout=5)
+    finally:
+        bus.close(timeout=1)
+    assert handled == [("fast", 1), ("slow", 1), ("slow", 2)]
+
+
+def test_handler_failure_is_isolated_and_close_drains_pending():
+    handled = []
+
+    def handler(item):
+        if item == "bad":
+            raise ValueError("boom")
+        handled.append(item)
+
+    bus = OrderedEventBus(handler, key=lambda item: "p1", workers=1)
+    bus.publish_many(["a", "bad", "b"])
+    bus.close(timeout=5)
+
+    assert handled == ["a", "b"]
+    assert (bus.stats()["handled"], bus.stats()["failed"]) == (2, 1)
+    with pytest.raises(RuntimeError):
+        bus.publish("after close")
+
+
+def test_full_bus_rejects_whole_group():
+    release = threading.Event()
+    bus = OrderedEventBus(lambda item: release.wait(5), key=lambda item: item, workers=1,
+                          max_pending=2, put_timeout_seconds=0.05)
+    try:
+        bus.publish("running")            # 解释线程取走后阻塞
+        time.sleep(0.05)
+        bus.publish_many(["x", "y"])
+        with pytest.raises(EventBusFullError):
+            bus.publish("z")
+        assert bus.stats()["rejected"] == 1 and bus.stats()["queue_depth"] == 2
+    finally:
+        release.set()
+        bus.close(timeout=1)
+
+
+class StubBuffer:
+    def __init__(self):
+        self.calls = []
+
+    def flush(self, timeout=5.0):
+        self.calls.append("flush")
+        return True
+
+    def submit(self, row):
+        self.calls.append(row["event_type"])
+
+    def submit_many(self, rows):
+        self.calls.append([row["event_type"] for row in rows])
+
+
+class StubBus:
+    def __init__(self, full=False):
+        self.full = full
+        self.published = []
+
+    def publish_many(self, events):
+        if self.full:
+            raise EventBusFullError("full")
+        self.published.extend(events)
+
+
+def _client(buffer, bus):
+    app = FastAPI()
+    app.dependency_overrides[behavior_module.get_db] = lambda: MagicMock()
+    app.dependency_overrides[behavior_module.get_user_state_service] = lambda: MagicMock()
+    app.dependency_overrides[behavior_module.get_event_buffer] = lambda: buffer
+    app.dependency_overrides[behavior_module.get_event_bus] = lambda: bus
+    app.include_router(behavior_module.router, prefix="/behavior")
+    return TestClient(app)
+
+
+def test_log_endpoint_only_enqueues_when_bus_is_enabled(monkeypatch):
+    interpret = MagicMock()
+    monkeypatch.setattr(behavior_module.behavior_interpreter_service, "interpret_event", interpret)
+    buffer, bus = StubBuffer(), StubBus()
+    client = _client(buffer, bus)
+
+    submission = {"participant_id": "p1", "event_type": "test_submission",
+                  "event_data": {"topic_id": "t1", "code": {"html": "", "css": "", "js": ""}}}
+    assert client.post("/behavior/log", json=submission).status_code == 202
+
+    # 解释提交前的 flush 由解释线程负责，请求中只持久化和入队
+    assert buffer.calls == ["test_submission"]
+    assert [e.event_type.value for e in bus.published] == ["test_submission"]
+    assert interpret.call_count == 0
+
+
+def test_endpoints_interpret_inline_when_bus_is_full(monkeypatch):
+    interpret = MagicMock()
+    monkeypatch.setattr(behavior_module.behavior_interpreter_service, "interpret_event", interpret)
+    buffer = StubBuffer()
+    client = _client(buffer, StubBus(full=True))
+
+    edit = {"participant_id": "p1", "event_type": "code_edit", "event_data": {"editor_name": "js", "new_length": 3}}
+    submission = {"participant_id": "p1", "event_type": "test_submission",
+                  "event_data": {"topic_id": "t1", "code": {"html": "", "css": "", "js": ""}}}
+    assert client.post("/behavior/log", json=edit).status_code == 202
+    assert client.post("/behavior/log-batch", json=[edit, submission]).status_code == 202
+    assert interpret.call_count == 3
+    # 退回同步解释时与解释线程一样：提交事件先 flush，且不使用请求的数据库会话
+    assert buffer.calls == ["code_edit", ["code_edit", "test_submission"], "flush"]
+    assert all("db_session" not in c.kwargs for c in interpret.call_args_list)
+
+
+def test_inline_and_bus_paths_produce_the_same_outcome(monkeypatch, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.config import dependency_injection
+    from app.crud.crud_event import event as crud_event
+    from app.db import database
+    from app.models.event import EventLog
+    from app.services.event_buffer import EventWriteBuffer
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}", connect_args={"check_same_thread": False})
+    EventLog.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    # 挫败检测需要读取历史时自行创建会话
+    monkeypatch.setattr(database, "SessionLocal", Session)
+
+    def write_batch(rows):
+        db = Session()
+        try:
+            crud_event.create_many(db, rows=rows)
+        finally:
+            db.close()
+
+    def events(participant_id):
+        return [
+            {"participant_id": participant_id, "event_type": "code_edit", "timestamp": "2026-01-01T12:00:00",
+             "event_data": {"editor_name": "js", "new_length": 3}},
+            {"participant_id": participant_id, "event_type": "ai_help_request", "timestamp": "2026-01-01T12:00:01",
+             "event_data": {"message": "help"}},
+        ] + [
+            {"participant_id": participant_id, "event_type": "test_submission", "timestamp": f"2026-01-01T12:00:0{i}",
+             "event_data": {"topic_id": "t1", "code": {"html": "", "css": "", "js": ""}, "is_correct": False}}
+            for i in (2, 4, 6)
+        ]
+
+    def run(participant_id, use_bus):
+        user_state_service = MagicMock()
+        buffer = EventWriteBuffer(write_batch, flush_interval_ms=10_000)
+        bus = None
+        if use_bus:
+            monkeypatch.setattr(dependency_injection, "get_user_state_service", lambda: user_state_service)
+            dependency_injection.registry.override("event_buffer", buffer)
+            bus = dependency_injection._build_event_bus()
+        app = FastAPI()
+        app.dependency_overrides[behavior_module.get_db] = lambda: MagicMock()
+        app.dependency_overrides[behavior_module.get_user_state_service] = lambda: user_state_service
+        app.dependency_overrides[behavior_module.get_event_buffer] = lambda: buffer
+        app.dependency_overrides[behavior_module.get_event_bus] = lambda: bus
+        app.include_router(behavior_module.router, prefix="/behavior")
+        try:
+            client = TestClient(app)
+            for event in events(participant_id):
+                assert client.post("/behavior/log", json=event).status_code == 202
+            if bus is not None:
+                assert bus.drain(timeout=5)
+        finally:
+            if bus is not None:
+                bus.close(timeout=1)
+                dependency_injection.registry.reset("event_buffer")
+            buffer.close(timeout=1)
+        return [(name, args[1:], kwargs) for name, args, kwargs in user_state_service.method_calls]
+
+    inline_calls = run("p-inline", use_bus=False)
+    bus_calls = run("p-bus", use_bus=True)
+    assert inline_calls and inline_calls == bus_calls
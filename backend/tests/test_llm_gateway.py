@@ -2,7 +2,7 @@ import os
 import sys
 import types
 import asyncio
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -15,8 +15,11 @@ if backend_path not in sys.path:
 
 def _import_llm_gateway_with_fake_openai():
     """在替换掉 openai 与 app.core.config 后再导入目标模块，避免真实依赖与 Pydantic 校验。"""
-    # 伪造 openai 模块
-    fake_openai_module = types.SimpleNamespace(OpenAI=MagicMock())
+    # 伪造 openai 模块（异步客户端与共享连接池）
+    fake_openai_module = types.SimpleNamespace(
+        AsyncOpenAI=MagicMock(),
+        DefaultAsyncHttpxClient=MagicMock(),
+    )
 
     # 伪造 app.core.config.settings，按当前环境变量构造
     fake_settings = types.SimpleNamespace(
@@ -25,6 +28,22 @@ def _import_llm_gateway_with_fake_openai():
         TUTOR_OPENAI_MODEL=os.getenv("TUTOR_OPENAI_MODEL", "gpt-test"),
         LLM_MAX_TOKENS=int(os.getenv("LLM_MAX_TOKENS", "65536")),
         LLM_TEMPERATURE=float(os.getenv("LLM_TEMPERATURE", "0.7")),
+        LLM_MAX_CONCURRENT_REQUESTS=2,
+        LLM_MAX_CONNECTIONS=8,
+        LLM_MAX_KEEPALIVE_CONNECTIONS=4,
+        LLM_KEEPALIVE_EXPIRY_SECONDS=30.0,
+        LLM_CONNECT_TIMEOUT_SECONDS=5.0,
+        LLM_READ_TIMEOUT_SECONDS=60.0,
+        LLM_WRITE_TIMEOUT_SECONDS=10.0,
+        LLM_POOL_TIMEOUT_SECONDS=10.0,
+        LLM_QUEUE_TIMEOUT_SECONDS=5.0,
+        LLM_MAX_RETRIES=0,
+        LLM_CIRCUIT_FAILURE_THRESHOLD=3,
+        LLM_CIRCUIT_RECOVERY_SECONDS=30.0,
+        LLM_BACKENDS=[],
+        LLM_HEDGE_DELAY_SECONDS=0.0,
+        LLM_FALLBACK_LOAD_THRESHOLD=0.8,
+        LLM_FALLBACK_MIN_PRIORITY=1,
     )
     fake_config_module = types.ModuleType("app.core.config")
     setattr(fake_config_module, "settings", fake_settings)
@@ -33,6 +52,8 @@ def _import_llm_gateway_with_fake_openai():
         "openai": fake_openai_module,
         "app.core.config": fake_config_module,
     }):
+        # 其他测试可能已经导入过真实模块，这里强制重新导入；退出时 patch.dict 会恢复原模块
+        sys.modules.pop("app.services.llm_gateway", None)
         from app.services.llm_gateway import LLMGateway  # type: ignore
     return LLMGateway, fake_openai_module
 
@@ -42,6 +63,13 @@ def _run(coro):
     return asyncio.run(coro)
 
 
+def _client_with_create(fake_openai, **create_kwargs):
+    """配置 AsyncOpenAI 实例的 chat.completions.create 为 AsyncMock"""
+    client_instance = fake_openai.AsyncOpenAI.return_value
+    client_instance.chat.completions.create = AsyncMock(**create_kwargs)
+    return client_instance
+
+
 def test_get_completion_success_uses_env_and_returns_content(monkeypatch):
     # 1) 准备：设置环境变量
     monkeypatch.setenv("TUTOR_OPENAI_API_KEY", "test-key")
@@ -65,31 +93,31 @@ def test_get_completion_success_uses_env_and_returns_content(monkeypatch):
     response_mock.choices = [choice_mock]
 
     # 4) 获取 client mock 并配置 create 返回值
-    client_instance = fake_openai.OpenAI.return_value
-    client_instance.chat.completions.create.return_value = response_mock
+    client_instance = _client_with_create(fake_openai, return_value=response_mock)
 
-    # 5) 将 asyncio.to_thread 改为同步执行，便于断言参数
-    def sync_to_thread(func, *args, **kwargs):
-        return func(*args, **kwargs)
+    # 5) 直接运行协程：异步客户端不再经过 asyncio.to_thread
+    gateway = LLMGateway()
 
-    with patch("asyncio.to_thread", side_effect=sync_to_thread):
-        gateway = LLMGateway()
-
-        result = _run(
-            gateway.get_completion(
-                system_prompt="You are a tutor",
-                messages=[{"role": "user", "content": "Hi"}],
-            )
+    result = _run(
+        gateway.get_completion(
+            system_prompt="You are a tutor",
+            messages=[{"role": "user", "content": "Hi"}],
         )
+    )
 
     # 6) 断言返回值
     assert result == "Hello from LLM"
 
-    # 7) 断言客户端初始化参数包含期望值（导入时模块级也会实例化一次，因此不限定调用次数）
-    assert any(
-        call.kwargs == {"api_key": "test-key", "base_url": "https://fake.base"}
-        for call in fake_openai.OpenAI.call_args_list
-    )
+    # 7) 断言客户端初始化参数：共享连接池与显式超时
+    client_kwargs = fake_openai.AsyncOpenAI.call_args.kwargs
+    assert client_kwargs["api_key"] == "test-key"
+    assert client_kwargs["base_url"] == "https://fake.base"
+    assert client_kwargs["http_client"] is fake_openai.DefaultAsyncHttpxClient.return_value
+    assert client_kwargs["timeout"].connect == 5.0
+    assert client_kwargs["timeout"].read == 60.0
+    pool_limits = fake_openai.DefaultAsyncHttpxClient.call_args.kwargs["limits"]
+    assert pool_limits.max_connections == 8
+    assert pool_limits.max_keepalive_connections == 4
 
     # 8) 断言调用 create 的参数（包含 system 提示词，默认 max_tokens/temperature）
     call_kwargs = client_instance.chat.completions.create.call_args.kwargs
@@ -113,22 +141,17 @@ def test_get_completion_empty_choices_returns_default(monkeypatch):
     response_mock = MagicMock()
     response_mock.choices = []  # 空结果分支
 
-    client_instance = fake_openai.OpenAI.return_value
-    client_instance.chat.completions.create.return_value = response_mock
-
-    def sync_to_thread(func, *args, **kwargs):
-        return func(*args, **kwargs)
+    client_instance = _client_with_create(fake_openai, return_value=response_mock)
 
-    with patch("asyncio.to_thread", side_effect=sync_to_thread):
-        gateway = LLMGateway()
-        result = _run(
-            gateway.get_completion(
-                system_prompt="S",
-                messages=[{"role": "user", "content": "Hi"}],
-                max_tokens=5,
-                temperature=0.1,
-            )
+    gateway = LLMGateway()
+    result = _run(
+        gateway.get_completion(
+            system_prompt="S",
+            messages=[{"role": "user", "content": "Hi"}],
+            max_tokens=5,
+            temperature=0.1,
         )
+    )
 
     # 返回默认提示
     assert "couldn't generate a response" in result
@@ -148,22 +171,121 @@ def test_get_completion_exception_returns_error_message(monkeypatch):
 
     LLMGateway, fake_openai = _import_llm_gateway_with_fake_openai()
 
-    client_instance = fake_openai.OpenAI.return_value
-    client_instance.chat.completions.create.side_effect = Exception("boom")
-
-    def sync_to_thread(func, *args, **kwargs):
-        return func(*args, **kwargs)
+    _client_with_create(fake_openai, side_effect=Exception("boom"))
 
-    with patch("asyncio.to_thread", side_effect=sync_to_thread):
-        gateway = LLMGateway()
-        result = _run(
-            gateway.get_completion(
-                system_prompt="S",
-                messages=[{"role": "user", "content": "Hi"}],
-            )
+    gateway = LLMGateway()
+    result = _run(
+        gateway.get_completion(
+            system_prompt="S",
+            messages=[{"role": "user", "content": "Hi"}],
         )
+    )
 
     assert "I apologize" in result
     assert "boom" in result
 
 
+
+
+def _stream_chunk(content):
+    delta = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+
+
+async def _collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+def test_stream_completion_yields_deltas_and_closes_stream(monkeypatch):
+    monkeypatch.setenv("TUTOR_OPENAI_MODEL", "gpt-test")
+    monkeypatch.setenv("TUTOR_EMBEDDING_API_KEY", "embed-key")
+    monkeypatch.setenv("TUTOR_TRANSLATION_API_KEY", "trans-key")
+
+    LLMGateway, fake_openai = _import_llm_gateway_with_fake_openai()
+
+    class FakeAsyncStream:
+        def __init__(self, chunks):
+            self._chunks = iter(chunks)
+            self.close = AsyncMock()
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self._chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    stream = FakeAsyncStream([
+        _stream_chunk("Hel"),
+        types.SimpleNamespace(choices=[]),  # 部分服务商会发送无 choices 的分片
+        _stream_chunk(None),
+        _stream_chunk("lo"),
+    ])
+    client_instance = _client_with_create(fake_openai, return_value=stream)
+
+    gateway = LLMGateway()
+    deltas = _run(_collect(gateway.stream_completion(
+        system_prompt="S",
+        messages=[{"role": "user", "content": "Hi"}],
+    )))
+
+    assert deltas == ["Hel", "lo"]
+    call_kwargs = client_instance.chat.completions.create.call_args.kwargs
+    assert call_kwargs["stream"] is True
+    assert call_kwargs["messages"][0] == {"role": "system", "content": "S"}
+    stream.close.assert_awaited_once()
+    assert gateway.status()["in_flight"] == 0
+
+
+def test_stream_completion_exception_yields_error_message(monkeypatch):
+    monkeypatch.setenv("TUTOR_EMBEDDING_API_KEY", "embed-key")
+    monkeypatch.setenv("TUTOR_TRANSLATION_API_KEY", "trans-key")
+
+    LLMGateway, fake_openai = _import_llm_gateway_with_fake_openai()
+    _client_with_create(fake_openai, side_effect=Exception("boom"))
+
+    gateway = LLMGateway()
+    deltas = _run(_collect(gateway.stream_completion(
+        system_prompt="S",
+        messages=[{"role": "user", "content": "Hi"}],
+    )))
+
+    assert len(deltas) == 1
+    assert "I apologize" in deltas[0] and "boom" in deltas[0]
+
+
+def test_concurrency_is_limited_by_semaphore(monkeypatch):
+    monkeypatch.setenv("TUTOR_EMBEDDING_API_KEY", "embed-key")
+    monkeypatch.setenv("TUTOR_TRANSLATION_API_KEY", "trans-key")
+
+    LLMGateway, fake_openai = _import_llm_gateway_with_fake_openai()
+
+    active = 0
+    peak = 0
+
+    async def slow_create(**kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        message = types.SimpleNamespace(content="ok")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+    _client_with_create(fake_openai, side_effect=slow_create)
+
+    async def run_many():
+        gateway = LLMGateway()
+        return await asyncio.gather(*[
+            gateway.get_completion(system_prompt="S", messages=[{"role": "user", "content": str(i)}])
+            for i in range(6)
+        ])
+
+    results = _run(run_many())
+
+    assert results == ["ok"] * 6
+    # LLM_MAX_CONCURRENT_REQUESTS=2：同时在途的请求不超过准入上限
+    assert peak == 2
+
@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+from openai import AsyncOpenAI
+
+# 将 backend 目录和 scripts 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from app.core.config import settings
+from app.services.llm_gateway import LLMGateway
+from app.services.llm_router import LLMBackend, LLMRouter, last_routing_decision
+from app.services.llm_scheduler import CircuitBreaker, PRIORITY_BACKGROUND, PRIORITY_LEARNING, PRIORITY_TEST_HINT
+from stub_openai_server import StubState, start_stub_server
+
+
+@pytest.fixture
+def stubs():
+    """两个独立的桩后端：slow 和 fast"""
+    servers = {}
+    for name in ("slow", "fast"):
+        state = StubState(dim=8)
+        server, base_url = start_stub_server(state=state)
+        servers[name] = (state, server, base_url)
+    try:
+        yield {name: (state, base_url) for name, (state, _, base_url) in servers.items()}
+    finally:
+        for _, server, _ in servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+def _backend(name, base_url, fallback=False):
+    client = AsyncOpenAI(api_key="stub", base_url=base_url, max_retries=0)
+    return LLMBackend(name=name, model=f"{name}-model", client=client, fallback=fallback,
+                      breaker=CircuitBreaker(failure_threshold=2, recovery_seconds=30))
+
+
+def _request(text):
+    return {"messages": [{"role": "user", "content": text}], "max_tokens": 16, "temperature": 0.1}
+
+
+def _reply(response):
+    return response.choices[0].message.content
+
+
+def test_routes_to_fastest_backend_after_probing(stubs):
+    slow_state, slow_url = stubs["slow"]
+    fast_state, fast_url = stubs["fast"]
+    slow_state.chat_delay_seconds = 0.1
+
+    async def scenario():
+        router = LLMRouter([_backend("slow", slow_url), _backend("fast", fast_url)])
+        return [await router.complete(PRIORITY_LEARNING, 0.0, **_request(f"q{i}")) for i in range(4)]
+
+    results = asyncio.run(scenario())
+
+    # 未调用过的后端先被试探一次，之后都发往延迟更低的后端
+    assert [decision.backend for _, decision in results] == ["slow", "fast", "fast", "fast"]
+    assert all(decision.reason == "fastest" and not decision.hedged for _, decision in results)
+    assert _reply(results[1][0]) == "Stub reply to: q1"
+    assert slow_state.chat_messages == ["q0"]
+
+
+def test_slow_request_is_hedged_to_second_backend(stubs):
+    slow_state, slow_url = stubs["slow"]
+    _, fast_url = stubs["fast"]
+    slow_state.chat_delay_seconds = 0.5
+
+    async def scenario():
+        router = LLMRouter([_backend("slow", slow_url), _backend("fast", fast_url)], hedge_delay_seconds=0.05)
+        started = time.monotonic()
+        response, decision = await router.complete(PRIORITY_TEST_HINT, 0.0, **_request("hint"))
+        return response, decision, time.monotonic() - started, router.stats()
+
+    response, decision, elapsed, stats = asyncio.run(scenario())
+
+    assert _reply(response) == "Stub reply to: hint"
+    assert (decision.backend, decision.reason, decision.hedged) == ("fast", "hedge", True)
+    assert decision.attempts == ["slow", "fast"]
+    assert elapsed < 0.4
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    # 落败的慢请求被取消，不计为错误
+    assert stats["backends"]["slow"]["errors"] == 0
+
+
+def test_failing_backend_fails_over_and_opens_its_circuit(stubs):
+    broken_state, broken_url = stubs["slow"]
+    _, fast_url = stubs["fast"]
+    broken_state.chat_error_status = 503
+
+    async def scenario():
+        router = LLMRouter([_backend("broken", broken_url), _backend("fast", fast_url)])
+        decisions = [(await router.complete(PRIORITY_LEARNING, 0.0, **_request(f"q{i}")))[1] for i in range(3)]
+        return decisions, router
+
+    decisions, router = asyncio.run(scenario())
+
+    # 第一次：broken 未试探过排在前面，失败后转移；之后 broken 的错误率使其排到后面
+    assert (decisions[0].backend, decisions[0].reason, decisions[0].attempts) == ("fast", "failover", ["broken", "fast"])
+    assert [d.backend for d in decisions[1:]] == ["fast", "fast"]
+    assert router.stats()["backends"]["broken"]["error_rate"] == 1.0
+
+
+def test_low_priority_traffic_uses_fallback_model_under_load():
+    main = LLMBackend(name="main", model="big", client=None)
+    small = LLMBackend(name="small", model="tiny", client=None, fallback=True)
+    router = LLMRouter([small, main], fallback_load_threshold=0.8)
+
+    ordered, reason = router.candidates(PRIORITY_LEARNING, load=0.2)
+    assert [b.name for b in ordered] == ["main", "small"] and reason == "fastest"
+
+    ordered, reason = router.candidates(PRIORITY_BACKGROUND, load=0.9)
+    assert [b.name for b in ordered] == ["small", "main"] and reason == "fallback_under_load"
+
+    # 测试模式的提示即使在高负载下也发往主模型
+    ordered, _ = router.candidates(PRIORITY_TEST_HINT, load=0.9)
+    assert ordered[0].name == "main"
+
+
+def test_gateway_records_routing_decision_for_configured_backends(stubs, monkeypatch):
+    _, slow_url = stubs["slow"]
+    fast_state, fast_url = stubs["fast"]
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LLM_BACKENDS", [
+        {"name": "main", "api_base": fast_url, "api_key": "stub", "model": "big"},
+        {"name": "small", "api_base": slow_url, "api_key": "stub", "model": "tiny", "fallback": True},
+    ])
+
+    async def scenario():
+        gateway = LLMGateway()
+        try:
+            reply = await gateway.get_completion(system_prompt="S", messages=[{"role": "user", "content": "hello"}])
+            decision = last_routing_decision()
+            deltas = [d async for d in gateway.stream_completion(system_prompt="S", messages=[{"role": "user", "content": "again"}])]
+            return reply, decision, "".join(deltas), last_routing_decision(), gateway.status()
+        finally:
+            await gateway.aclose()
+
+    reply, decision, streamed, stream_decision, status = asyncio.run(scenario())
+
+    assert reply == "Stub reply to: hello"
+    assert (decision.backend, decision.model) == ("main", "big")
+    assert streamed == "Stub reply to: again"
+    assert stream_decision.backend == "main"
+    assert fast_state.chat_messages == ["hello", "again"]
+    assert set(status["routing"]["backends"]) == {"main", "small"}
+
+
+def test_stream_disconnect_releases_half_open_probe(stubs, monkeypatch):
+    _, fast_url = stubs["fast"]
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LLM_BACKENDS", [{"name": "main", "api_base": fast_url, "api_key": "stub", "model": "big"}])
+
+    async def scenario():
+        gateway = LLMGateway()
+        breaker = gateway.router.backends[0].breaker
+        # 熔断已到恢复时间：下一次请求是半开探测
+        breaker._state, breaker._opened_at = "open", time.monotonic() - breaker.recovery_seconds
+        try:
+            stream = gateway.stream_completion(system_prompt="S", messages=[{"role": "user", "content": "hi"}])
+            first = await stream.__anext__()
+            assert breaker._probe_in_flight
+            await stream.aclose()          # 客户端中途断开
+            return first, breaker
+        finally:
+            await gateway.aclose()
+
+    first, breaker = asyncio.run(scenario())
+    assert first
+    assert breaker.state == "half_open" and not breaker._probe_in_flight
+    assert breaker.allow()
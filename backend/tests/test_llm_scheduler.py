@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+
+# 将 backend 目录和 scripts 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from app.core.config import settings
+from app.services.llm_gateway import FALLBACK_RESPONSE_PREFIX, LLMGateway
+from app.services.llm_scheduler import (
+    AdmissionScheduler,
+    CircuitBreaker,
+    LLMQueueTimeoutError,
+    LLMUnavailableError,
+    PRIORITY_BACKGROUND,
+    PRIORITY_LEARNING,
+    PRIORITY_TEST_HINT,
+)
+from stub_openai_server import StubState, start_stub_server
+
+
+def test_queued_requests_are_admitted_by_priority():
+    order = []
+
+    async def job(scheduler, name, priority, hold):
+        async with scheduler.admit(priority):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def scenario():
+        scheduler = AdmissionScheduler(max_in_flight=1, queue_timeout_seconds=5)
+        first = asyncio.create_task(job(scheduler, "first", PRIORITY_LEARNING, 0.05))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.create_task(job(scheduler, "background", PRIORITY_BACKGROUND, 0)),
+            asyncio.create_task(job(scheduler, "learning", PRIORITY_LEARNING, 0)),
+            asyncio.create_task(job(scheduler, "test-hint", PRIORITY_TEST_HINT, 0)),
+        ]
+        await asyncio.sleep(0.01)
+        assert scheduler.queue_depth == 3
+        await asyncio.gather(first, *queued)
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert order == ["first", "test-hint", "learning", "background"]
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+    assert stats["admitted"] == 4 and stats["queued"] == 3
+    assert stats["wait_ms_p95"] >= stats["wait_ms_p50"] >= 0
+
+
+def test_queue_deadline_and_cancelled_waiters_release_their_place():
+    async def scenario():
+        scheduler = AdmissionScheduler(max_in_flight=1, queue_timeout_seconds=0.05)
+        async with scheduler.admit():
+            with pytest.raises(LLMQueueTimeoutError):
+                async with scheduler.admit():
+                    pass
+            cancelled = asyncio.create_task(scheduler.admit().__aenter__())
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.gather(cancelled, return_exceptions=True)
+        # 超时和取消的等待者不占用名额
+        async with scheduler.admit():
+            assert scheduler.in_flight == 1
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queue_timeouts"] == 1
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers_with_probe():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=0.05)
+    scheduler = AdmissionScheduler(max_in_flight=4, breaker=breaker)
+
+    async def call(ok):
+        async with scheduler.admit():
+            scheduler.record_upstream(0.01, ok=ok)
+
+    async def scenario():
+        await call(False)
+        await call(True)  # 成功会清零连续失败计数
+        await call(False)
+        await call(False)
+        assert breaker.state == "open"
+        with pytest.raises(LLMUnavailableError):
+            await call(True)
+
+        await asyncio.sleep(0.06)
+        assert breaker.state == "half_open"
+        async with scheduler.admit():
+            # 半开状态只放行一个探测请求
+            with pytest.raises(LLMUnavailableError):
+                await call(True)
+            scheduler.record_upstream(0.01, ok=True)
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["circuit_rejected"] == 2
+    assert stats["circuit"]["opened"] == 1
+    assert stats["upstream_errors"] == 3 and stats["upstream_ok"] == 2
+
+
+@pytest.fixture
+def stub_gateway(monkeypatch):
+    """指向本地桩服务器的真实 LLMGateway（真实 openai 客户端与 HTTP 连接）"""
+    state = StubState(dim=8)
+    server, base_url = start_stub_server(state=state)
+    monkeypatch.setenv("TUTOR_OPENAI_API_BASE", base_url)
+    monkeypatch.setenv("TUTOR_OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(settings, "LLM_MAX_CONCURRENT_REQUESTS", 1)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_RECOVERY_SECONDS", 0.2)
+    try:
+        yield state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _ask(gateway, text, **kwargs):
+    return gateway.get_completion(system_prompt="S", messages=[{"role": "user", "content": text}], **kwargs)
+
+
+def test_gateway_against_stub_serves_test_hints_first(stub_gateway):
+    stub_gateway.chat_delay_seconds = 0.1
+
+    async def scenario():
+        gateway = LLMGateway()
+        try:
+            first = asyncio.create_task(_ask(gateway, "first"))
+            await asyncio.sleep(0.02)
+            learning = asyncio.create_task(_ask(gateway, "learning", priority=PRIORITY_LEARNING))
+            await asyncio.sleep(0)
+            hint = asyncio.create_task(_ask(gateway, "hint", priority=PRIORITY_TEST_HINT))
+            results = await asyncio.gather(first, learning, hint)
+            return results, gateway.status()
+        finally:
+            await gateway.aclose()
+
+    results, status = asyncio.run(scenario())
+
+    assert results == ["Stub reply to: first", "Stub reply to: learning", "Stub reply to: hint"]
+    assert stub_gateway.chat_messages == ["first", "hint", "learning"]
+    assert stub_gateway.snapshot()["chat_peak_in_flight"] == 1
+    assert status["upstream_ok"] == 3 and status["upstream_ms_p50"] >= 100
+
+
+def test_gateway_against_stub_fails_fast_while_circuit_is_open(stub_gateway):
+    stub_gateway.chat_error_status = 503
+
+    async def scenario():
+        gateway = LLMGateway()
+        try:
+            failures = [await _ask(gateway, "q1"), await _ask(gateway, "q2")]
+            started = time.monotonic()
+            rejected = await _ask(gateway, "q3")
+            rejected_seconds = time.monotonic() - started
+            stream_rejected = [delta async for delta in gateway.stream_completion(
+                system_prompt="S", messages=[{"role": "user", "content": "q4"}]
+            )]
+
+            stub_gateway.chat_error_status = 0
+            await asyncio.sleep(0.25)
+            recovered = [delta async for delta in gateway.stream_completion(
+                system_prompt="S", messages=[{"role": "user", "content": "q5"}]
+            )]
+            return failures, rejected, rejected_seconds, stream_rejected, recovered, gateway.status()
+        finally:
+            await gateway.aclose()
+
+    failures, rejected, rejected_seconds, stream_rejected, recovered, status = asyncio.run(scenario())
+
+    assert all(reply.startswith(FALLBACK_RESPONSE_PREFIX) for reply in failures)
+    assert rejected.startswith(FALLBACK_RESPONSE_PREFIX) and "temporarily unavailable" in rejected
+    assert rejected_seconds < 0.05
+    assert len(stream_rejected) == 1 and "temporarily unavailable" in stream_rejected[0]
+    # 熔断期间的请求没有到达上游
+    assert stub_gateway.chat_messages == ["q1", "q2", "q5"]
+    assert "".join(recovered) == "Stub reply to: q5"
+    primary = status["routing"]["backends"]["primary"]
+    assert primary["circuit"]["state"] == "closed"
+    assert primary["requests"] == 3
+    assert primary["errors"] == 2
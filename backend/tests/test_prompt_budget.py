@@ -0,0 +1,124 @@
+import os
+import sys
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.prompt_budget import TRUNCATION_MARKER, PromptBudget, TokenCounter
+from app.services.prompt_generator import PromptGenerator
+from app.schemas.chat import UserStateSummary
+from app.schemas.content import CodeContent
+
+
+def _user_state(emotion="NEUTRAL", behavior_counters=None, bkt_models=None):
+    return UserStateSummary(
+        participant_id="u1",
+        emotion_state={"current_sentiment": emotion},
+        behavior_counters=behavior_counters or {},
+        bkt_models=bkt_models or {},
+        is_new_user=False,
+    )
+
+
+def _generator(total=24000, **sections):
+    budget = PromptBudget(total=total)
+    budget.sections.update(sections)
+    return PromptGenerator(budget=budget, token_counter=TokenCounter(None))
+
+
+def test_token_counter_estimate_and_truncate():
+    counter = TokenCounter(None)
+    assert counter.backend == "estimate"
+    assert counter.count("") == 0
+    assert counter.count("abcdef") == 2
+    assert counter.count("你好") == 2
+
+    text = "x" * 300
+    truncated = counter.truncate(text, 20)
+    assert truncated.endswith(TRUNCATION_MARKER)
+    assert counter.count(truncated) <= 20
+    assert counter.truncate("short", 20) == "short"
+    assert counter.truncate(text, 0) == ""
+
+
+def test_history_drops_oldest_turns_first():
+    g = _generator(history=40)
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn-{i} " + "y" * 30} for i in range(10)]
+
+    messages = g._build_message_history(history, None, "latest question", history_token_budget=40)
+
+    # 当前问题始终保留在最后，保留下来的历史是最新的若干轮
+    assert messages[-1]["content"] == "latest question"
+    kept = [m["content"] for m in messages[:-1]]
+    assert kept, "should keep at least the newest turn"
+    assert kept[-1].startswith("turn-9")
+    assert not any(c.startswith("turn-0 ") for c in kept)
+    assert g.token_counter.count_messages(messages[:-1]) <= 40
+
+
+def test_knowledge_chunks_dropped_lowest_rank_first():
+    g = _generator(reference_knowledge=80)
+    chunks = ["first-chunk " + "a" * 90, "second-chunk " + "b" * 90, "third-chunk " + "c" * 90]
+
+    prompt = g._build_system_prompt(_user_state(), chunks, mode="learning", content_title="1_1")
+
+    assert "first-chunk" in prompt
+    assert "third-chunk" not in prompt
+
+
+def test_oversized_top_chunk_is_truncated_not_dropped():
+    g = _generator(reference_knowledge=60)
+    prompt = g._build_system_prompt(_user_state(), ["top-chunk " + "z" * 1000], mode="learning", content_title="1_1")
+
+    assert "top-chunk" in prompt
+    assert TRUNCATION_MARKER in prompt
+
+
+def test_total_budget_is_respected():
+    g = _generator(total=1500)
+    history = [{"role": "user", "content": "h" * 300} for _ in range(20)]
+    chunks = ["k" * 600 for _ in range(5)]
+    code = CodeContent(html="<div></div>", css="", js="")
+
+    system_prompt, messages = g.create_prompts(
+        user_state=_user_state(),
+        retrieved_context=chunks,
+        conversation_history=history,
+        user_message="why?",
+        code_content=code,
+        mode="learning",
+        content_title="1_1",
+    )
+
+    total = g.token_counter.count(system_prompt) + g.token_counter.count_messages(messages)
+    assert total <= 1500
+    assert messages[-1]["content"].endswith("My question is: why?")
+
+
+def test_static_prefix_identical_across_turns():
+    g = _generator()
+    content_json = '{"topic_id": "1_1", "title": "Tags"}'
+
+    first, _ = g.create_prompts(
+        user_state=_user_state(emotion="NEUTRAL", bkt_models={"1_1": {"mastery_prob": 0.3}}),
+        retrieved_context=["chunk one"],
+        conversation_history=[],
+        user_message="what is a tag?",
+        mode="learning",
+        content_title="1_1",
+        content_json=content_json,
+    )
+    second, _ = g.create_prompts(
+        user_state=_user_state(emotion="FRUSTRATED", bkt_models={"1_1": {"mastery_prob": 0.9}}),
+        retrieved_context=["other chunk", "more"],
+        conversation_history=[{"role": "user", "content": "earlier"}],
+        user_message="and attributes?",
+        mode="learning",
+        content_title="1_1",
+        content_json=content_json,
+    )
+
+    prefix = "\n\n".join(g._build_static_prefix("learning", "1_1", content_json))
+    assert first.startswith(prefix)
+    assert second.startswith(prefix)
+    assert first != second
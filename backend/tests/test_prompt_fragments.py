@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import sys
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.schemas.content import LearningContent
+from app.services.prompt_budget import TokenCounter
+from app.services.prompt_fragments import PromptFragmentCache
+from app.services.prompt_generator import PromptGenerator
+
+SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app', 'data', 'learning_content', '1_1.json'))
+
+
+def _setup(tmp_path):
+    directory = tmp_path / "learning_content"
+    directory.mkdir()
+    shutil.copy(SOURCE, directory / "1_1.json")
+
+    loads = []
+
+    def loader(content_type, topic_id):
+        loads.append((content_type, topic_id))
+        with open(tmp_path / content_type / f"{topic_id}.json", encoding="utf-8") as f:
+            return LearningContent(**json.load(f))
+
+    generator = PromptGenerator(token_counter=TokenCounter(None))
+    return generator, PromptFragmentCache(generator, data_dir=str(tmp_path), loader=loader), loads
+
+
+def test_fragments_match_uncached_rendering(tmp_path):
+    generator, cache, loads = _setup(tmp_path)
+
+    fragments = cache.get("learning_content", "1_1")
+    assert cache.get("learning_content", "1_1") is fragments
+    assert len(loads) == 1
+
+    # 与原来逐轮序列化 JSON 的结果逐字节一致
+    with open(SOURCE, encoding="utf-8") as f:
+        content = LearningContent(**json.load(f)).model_dump()
+    content.pop("sc_all", None)
+    uncached = generator._build_static_prefix("learning", fragments.title, json.dumps(content))
+    cached = generator._build_static_prefix("learning", content_fragments=fragments)
+    assert cached == uncached
+    assert '"sc_all"' not in fragments.content_section
+
+
+def test_fragments_rerendered_when_file_changes(tmp_path):
+    _, cache, loads = _setup(tmp_path)
+    path = tmp_path / "learning_content" / "1_1.json"
+
+    first = cache.get("learning_content", "1_1")
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["title"] = "Updated title"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, first.source_mtime_ns + 1_000_000))
+
+    second = cache.get("learning_content", "1_1")
+    assert second.title == "Updated title"
+    assert "Updated title" in second.topic_section
+    assert len(loads) == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_warm_and_invalidate(tmp_path):
+    _, cache, loads = _setup(tmp_path)
+
+    assert cache.warm() == 1
+    assert cache.stats()["entries"] == 1
+    cache.get("learning_content", "1_1")
+    assert len(loads) == 1
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+    cache.get("learning_content", "1_1")
+    assert len(loads) == 2
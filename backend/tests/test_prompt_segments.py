@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 将 backend 目录和 scripts 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from app.crud.crud_chat_history import chat_history as crud_chat_history
+from app.crud.crud_prompt_segment import prompt_segment as crud_prompt_segment, split_prompt
+from app.db.migrations import upgrade_schema
+from app.models.chat_history import ChatHistory
+from app.models.prompt_segment import PromptSegment
+from app.schemas.chat import ChatHistoryCreate
+from migrate_prompt_segments import migrate
+
+CONTENT_JSON = json.dumps({"topic": "flexbox", "sections": ["align-items: center;"] * 50}, indent=2)
+
+
+def _prompt(strategy):
+    return f"You are a tutor.\n\nTOPIC: Flexbox\n\nCONTENT:\n{CONTENT_JSON}\n\nSTRATEGY: {strategy}"
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
+    crud_prompt_segment.clear_cache()
+    try:
+        yield sessionmaker(bind=engine)
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.parametrize("prompt", ["", "single", "a\n\nb", "a\n\n\n\nb\n\n", "\n\nlead", "x\ny\n\n中文\n\n"])
+def test_split_prompt_round_trips_exactly(prompt):
+    assert "".join(split_prompt(prompt)) == prompt
+
+
+def test_ai_rows_store_shared_segments_once_and_rebuild_exact_prompt(session_factory):
+    with session_factory() as db:
+        for strategy in ("Be encouraging.", "Give a hint."):
+            crud_chat_history.create(db, obj_in=ChatHistoryCreate(
+                participant_id="p1", role="assistant", message="reply", raw_prompt_to_llm=_prompt(strategy)
+            ))
+        crud_chat_history.create(db, obj_in=ChatHistoryCreate(participant_id="p1", role="user", message="question"))
+
+    crud_prompt_segment.clear_cache()
+    with session_factory() as db:
+        rows = db.query(ChatHistory).order_by(ChatHistory.id).all()
+        assert all(row.raw_prompt_to_llm is None for row in rows)
+        assert rows[2].prompt_segments is None
+        # 3 个共享片段 + 2 个不同的 STRATEGY 片段
+        assert db.query(PromptSegment).count() == 5
+        content_segment = db.get(PromptSegment, json.loads(rows[0].prompt_segments)[2])
+        assert len(content_segment.data) < content_segment.size / 5
+
+        assert crud_chat_history.get_raw_prompt(db, rows[0]) == _prompt("Be encouraging.")
+        assert crud_chat_history.get_raw_prompts(db, rows) == {
+            rows[0].id: _prompt("Be encouraging."),
+            rows[1].id: _prompt("Give a hint."),
+            rows[2].id: None,
+        }
+
+
+def test_migration_converts_inline_prompts_and_is_resumable(session_factory):
+    with session_factory() as db:
+        db.add_all([
+            ChatHistory(participant_id="p1", role="assistant", message="r1", raw_prompt_to_llm=_prompt("A")),
+            ChatHistory(participant_id="p1", role="user", message="q"),
+            ChatHistory(participant_id="p2", role="assistant", message="r2", raw_prompt_to_llm=_prompt("B")),
+        ])
+        db.commit()
+
+    dry_run = migrate(session_factory, batch_size=2, dry_run=True)
+    assert dry_run["rows"] == 2 and dry_run["segments_after"] == 0
+
+    stats = migrate(session_factory, batch_size=2)
+    assert stats["rows"] == 2 and stats["mismatches"] == 0
+    assert stats["segments_after"] == 5
+    assert stats["segment_bytes"] < stats["inline_bytes"] / 4
+    # 再次运行没有需要转换的消息
+    assert migrate(session_factory)["rows"] == 0
+
+    crud_prompt_segment.clear_cache()
+    with session_factory() as db:
+        rows = db.query(ChatHistory).order_by(ChatHistory.id).all()
+        assert [crud_chat_history.get_raw_prompt(db, row) for row in rows] == [_prompt("A"), None, _prompt("B")]
+        assert all(row.raw_prompt_to_llm is None for row in rows)
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import types
+from unittest.mock import MagicMock
+
+import pytest
+from annoy import AnnoyIndex
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.rag_service import RAGService
+from app.services.result_cache import TieredCache
+from app.services.vector_store import VectorStoreManager
+
+DIM = 4
+CHUNKS = ["html chunk", "css chunk", "js chunk", "flex chunk"]
+
+
+def _unit(i):
+    vector = [0.0] * DIM
+    vector[i] = 1.0
+    return vector
+
+
+@pytest.fixture
+def store_manager(tmp_path):
+    manager = VectorStoreManager(str(tmp_path))
+    version, path = manager.allocate_version_dir()
+    index = AnnoyIndex(DIM, 'angular')
+    for i in range(len(CHUNKS)):
+        index.add_item(i, _unit(i))
+    index.build(2)
+    index.save(os.path.join(path, "kb.ann"))
+    with open(os.path.join(path, "kb_chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(CHUNKS, f)
+    manager.publish(version, embedding_dimension=DIM)
+    return manager
+
+
+def _embedding_response(vectors):
+    return types.SimpleNamespace(data=[
+        types.SimpleNamespace(index=i, embedding=vector) for i, vector in enumerate(vectors)
+    ])
+
+
+def _fake_embed(mapping):
+    """根据输入文本返回固定向量；输入为列表时模拟批量接口"""
+    def create(input, model):
+        texts = input if isinstance(input, list) else [input]
+        return _embedding_response([_unit(mapping[text]) for text in texts])
+    return create
+
+
+def test_retrieve_many_batches_embeddings_and_keeps_order(store_manager):
+    service = RAGService(store_manager=store_manager)
+    service.client = MagicMock()
+    service.client.embeddings.create.side_effect = _fake_embed({"css?": 1, "js?": 2, "html?": 0})
+
+    results = service.retrieve_many(["css?", "js?", "html?", "css?"], k=1)
+
+    assert results == [["css chunk"], ["js chunk"], ["html chunk"], ["css chunk"]]
+    # 去重后的三条查询在一次批量请求中完成
+    assert service.client.embeddings.create.call_count == 1
+    assert service.client.embeddings.create.call_args.kwargs["input"] == ["css?", "js?", "html?"]
+
+
+def test_retrieve_many_falls_back_to_single_requests(store_manager):
+    service = RAGService(store_manager=store_manager)
+    single = _fake_embed({"css?": 1, "flex?": 3})
+
+    def create(input, model):
+        if isinstance(input, list):
+            raise ValueError("input must be a string")
+        return single(input, model)
+
+    service.client = MagicMock()
+    service.client.embeddings.create.side_effect = create
+
+    assert service.retrieve_many(["css?", "flex?"], k=1) == [["css chunk"], ["flex chunk"]]
+
+
+def test_retrieve_many_uses_and_fills_retrieval_cache(store_manager):
+    cache = TieredCache(namespace="test-rag-batch", max_entries=16, ttl_seconds=60)
+    service = RAGService(store_manager=store_manager, retrieval_cache=cache)
+    service.client = MagicMock()
+    service.client.embeddings.create.side_effect = _fake_embed({"css?": 1, "js?": 2})
+
+    service.retrieve_many(["css?"], k=1)
+    service.client.embeddings.create.reset_mock()
+
+    # 已缓存的查询不再请求 embedding；单条 retrieve 与批量共享同一缓存键
+    assert service.retrieve("  CSS? ", k=1) == ["css chunk"]
+    assert service.retrieve_many(["css?", "js?"], k=1) == [["css chunk"], ["js chunk"]]
+    assert service.client.embeddings.create.call_args.kwargs["input"] == ["js?"]
+
+
+def test_retrieve_uses_precomputed_query_vector(store_manager):
+    service = RAGService(store_manager=store_manager)
+    service.client = MagicMock()
+
+    # 语义缓存已算好的向量（已归一化）直接用于搜索，不再请求 embedding
+    assert service.retrieve("flex?", k=1, query_vector=[0.0, 0.0, 0.0, 1.0]) == ["flex chunk"]
+    service.client.embeddings.create.assert_not_called()
+
+
+def test_network_calls_run_without_holding_the_knowledge_base(store_manager):
+    service = RAGService(store_manager=store_manager)
+    embed = _fake_embed({"css?": 1, "js?": 2})
+    held = []
+
+    def create(input, model):
+        # 翻译和 embedding 期间不持有版本引用，旧版本可以随时卸载
+        held.append(service.knowledge_base.current._refs)
+        return embed(input, model)
+
+    service.client = MagicMock()
+    service.client.embeddings.create.side_effect = create
+
+    assert service.retrieve("css?", k=1) == ["css chunk"]
+    assert service.retrieve_many(["js?"], k=1) == [["js chunk"]]
+    assert held == [0, 0]
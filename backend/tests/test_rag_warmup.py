@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.api.endpoints import health as health_module
+from app.config.service_registry import ServiceRegistry
+from app.services.rag_warmup import RAGServiceLoader, RAGWarmupState
+
+
+def test_retrieve_degrades_to_empty_until_ready():
+    release = threading.Event()
+    service = MagicMock()
+    service.retrieve.return_value = ["chunk"]
+    service.kb_version = 3
+
+    def slow_factory():
+        release.wait(5)
+        return service
+
+    loader = RAGServiceLoader(factory=slow_factory, warmup_queries=["warm me"])
+    loader.start()
+
+    # 初始化尚未完成：不阻塞，直接降级为不检索
+    assert loader.retrieve("question") == []
+    assert loader.get() is None
+    assert loader.state in (RAGWarmupState.LOADING, RAGWarmupState.PENDING)
+
+    release.set()
+    assert loader.wait(5) is True
+    assert loader.retrieve("question") == ["chunk"]
+    # 预热查询在就绪前批量执行过一次
+    service.retrieve_many.assert_called_once_with(["warm me"])
+    assert loader.status()["kb_version"] == 3
+
+
+def test_warmup_query_failure_does_not_block_readiness():
+    service = MagicMock()
+    service.retrieve_many.side_effect = ValueError("embedding down")
+    service.retrieve.return_value = ["ok"]
+
+    loader = RAGServiceLoader(factory=lambda: service, warmup_queries=["warm me"])
+    loader.start()
+
+    assert loader.wait(5) is True
+    assert loader.retrieve("question") == ["ok"]
+
+
+def test_factory_failure_marks_failed_and_stays_degraded():
+    def broken_factory():
+        raise FileNotFoundError("no kb.ann")
+
+    loader = RAGServiceLoader(factory=broken_factory)
+    loader.start()
+
+    assert loader.wait(5) is False
+    assert loader.state == RAGWarmupState.FAILED
+    assert "no kb.ann" in loader.status()["error"]
+    assert loader.retrieve("question") == []
+
+
+def test_get_starts_initialisation_lazily():
+    loader = RAGServiceLoader(factory=MagicMock())
+    assert loader.state == RAGWarmupState.PENDING
+
+    loader.get()
+    assert loader.wait(5) is True
+
+
+def test_retrieve_many_degrades_per_query_until_ready():
+    loader = RAGServiceLoader(factory=MagicMock())
+    loader.state = RAGWarmupState.LOADING
+
+    assert loader.retrieve_many(["a", "b"]) == [[], []]
+
+
+def test_factory_failure_is_retried_with_backoff():
+    attempts = []
+    service = MagicMock()
+
+    def flaky_factory():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise FileNotFoundError("kb not mounted yet")
+        return service
+
+    loader = RAGServiceLoader(factory=flaky_factory, max_retries=3, retry_base_seconds=0.01)
+    loader.start()
+
+    assert loader.wait(5) is True
+    assert len(attempts) == 3 and loader.failures == 2
+    assert loader.status()["error"] is None and loader.status()["next_retry_at"] is None
+
+
+def test_readiness_stays_ready_while_retrying(monkeypatch):
+    loader = RAGServiceLoader(factory=MagicMock())
+    loader.state, loader.failures = RAGWarmupState.LOADING, 1
+    registry = ServiceRegistry()
+    registry.register("llm_gateway", MagicMock)
+    registry.get("llm_gateway").router.circuit_states = {"primary": "closed"}
+    monkeypatch.setattr(health_module, "get_rag_service_loader", lambda: loader)
+    monkeypatch.setattr(health_module, "registry", registry)
+
+    app = FastAPI()
+    app.include_router(health_module.router)
+    response = TestClient(app).get("/ready")
+
+    assert response.status_code == 200
+    components = response.json()["data"]["components"]
+    assert components["rag"]["degraded"] is True
+
+    loader.failures = 0
+    assert TestClient(app).get("/ready").status_code == 503
+
+
+def test_readiness_does_not_build_llm_gateway(monkeypatch):
+    registry = ServiceRegistry()
+    registry.register("llm_gateway", lambda: pytest.fail("readiness must not build the gateway"))
+    monkeypatch.setattr(health_module, "get_rag_service_loader", lambda: None)
+    monkeypatch.setattr(health_module, "registry", registry)
+
+    app = FastAPI()
+    app.include_router(health_module.router)
+    response = TestClient(app).get("/ready")
+
+    assert response.status_code == 200
+    assert response.json()["data"]["components"]["llm"] == {"built": False}
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import types
+
+import numpy as np
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.response_cache import (
+    ResponseCacheScope,
+    SemanticResponseCache,
+    code_fingerprint,
+    hint_stage,
+)
+
+VECTORS = {
+    "why is my button not centered?": [1.0, 0.0, 0.0],
+    "why isn't my button centered": [0.99, 0.1, 0.0],
+    "how do i change the font?": [0.0, 1.0, 0.0],
+}
+
+
+def _cache(**kwargs):
+    return SemanticResponseCache(embed_fn=lambda q: VECTORS.get(q), **kwargs)
+
+
+def _scope(**overrides):
+    values = dict(group="experimental", topic="4_3", mode="test", hint_stage=0, code_fingerprint="abc")
+    values.update(overrides)
+    return ResponseCacheScope(**values)
+
+
+def test_similar_question_in_same_scope_hits():
+    cache = _cache(similarity_threshold=0.95)
+    scope = _scope()
+    cache.store(scope, cache.embed("why is my button not centered?"), "Try justify-content.")
+
+    assert cache.lookup(scope, cache.embed("why isn't my button centered")) == "Try justify-content."
+    assert cache.lookup(scope, cache.embed("how do i change the font?")) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["topics"]["4_3"] == {"hits": 1, "misses": 1}
+
+
+def test_find_reports_similarity_and_origin():
+    cache = _cache()
+    scope = _scope()
+    cache.store(scope, cache.embed("why is my button not centered?"), "Try justify-content.",
+                origin={"participant_id": "p1"})
+
+    hit = cache.find(scope, cache.embed("why isn't my button centered"))
+    assert hit.response == "Try justify-content." and 0.99 < hit.similarity < 1.0
+    assert hit.origin == {"participant_id": "p1"} and hit.stored_at <= time.time()
+    assert cache.find(scope, cache.embed("how do i change the font?")) is None
+
+
+def test_entries_are_never_shared_across_groups_or_stages():
+    cache = _cache(similarity_threshold=0.5)
+    vector = cache.embed("why is my button not centered?")
+    cache.store(_scope(), vector, "experimental answer")
+
+    assert cache.lookup(_scope(group="control"), vector) is None
+    assert cache.lookup(_scope(hint_stage=1), vector) is None
+    assert cache.lookup(_scope(code_fingerprint="other"), vector) is None
+    assert cache.lookup(_scope(), vector) == "experimental answer"
+
+
+def test_ttl_and_per_topic_capacity():
+    cache = _cache(ttl_seconds=0.01, max_entries_per_topic=2)
+    vector = cache.embed("why is my button not centered?")
+    cache.store(_scope(), vector, "old")
+    time.sleep(0.02)
+    assert cache.lookup(_scope(), vector) is None
+    assert cache.stats()["expired"] == 1
+
+    cache = _cache(max_entries_per_topic=2)
+    for i in range(3):
+        cache.store(_scope(code_fingerprint=str(i)), vector, f"answer {i}")
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup(_scope(code_fingerprint="0"), vector) is None
+    assert cache.lookup(_scope(code_fingerprint="2"), vector) == "answer 2"
+
+
+def test_embedding_unavailable_returns_none():
+    cache = _cache()
+    assert cache.embed("unknown question") is None
+    assert cache.stats()["embedding_unavailable"] == 1
+
+
+def test_code_fingerprint_ignores_whitespace_and_comments():
+    a = types.SimpleNamespace(html="<div>\n  <p>Hi</p>\n</div>", css="p { color: red; }", js="")
+    b = types.SimpleNamespace(html="<div><!-- note --> <p>Hi</p> </div>", css="/* x */ p {  color: red; }", js="// todo")
+    c = types.SimpleNamespace(html="<div><p>Bye</p></div>", css="", js="")
+    assert code_fingerprint(a) == code_fingerprint(b)
+    assert code_fingerprint(a) != code_fingerprint(c)
+
+
+def test_hint_stage_matches_prompt_generator_stages():
+    counters = {"question_count_Flexbox": 5}
+    assert hint_stage(counters, "Flexbox", "test") == 3
+    assert hint_stage({}, "Flexbox", "test") == 0
+    assert hint_stage(counters, "Flexbox", "learning") == 0
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.result_cache import TieredCache, normalize_text
+
+
+def test_normalize_text_collapses_whitespace_and_case():
+    assert normalize_text("  What IS\n a  Selector？ ") == "what is a selector?"
+
+
+def test_memory_hit_and_lru_eviction():
+    cache = TieredCache(namespace="test-lru", max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.set("c", 3)           # 淘汰 b
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = TieredCache(namespace="test-ttl", max_entries=8, ttl_seconds=0.01)
+    cache.set("k", "v")
+    time.sleep(0.02)
+    assert cache.get("k") is None
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    key = TieredCache.make_key("query", 3, "model", 1)
+
+    first = TieredCache(namespace="test-disk", max_entries=8, ttl_seconds=60, db_path=db_path)
+    first.set(key, [4, 2, 7])
+
+    # 模拟进程重启：新实例的内存层为空，从磁盘层命中
+    second = TieredCache(namespace="test-disk", max_entries=8, ttl_seconds=60, db_path=db_path)
+    assert second.get(key) == [4, 2, 7]
+    assert second.stats()["disk_hits"] == 1
+    # 磁盘命中后回填内存层
+    assert second.get(key) == [4, 2, 7]
+    assert second.stats()["memory_hits"] == 1
+
+
+def test_make_key_distinguishes_kb_version():
+    assert TieredCache.make_key("q", 3, "ns", 1) != TieredCache.make_key("q", 3, "ns", 2)
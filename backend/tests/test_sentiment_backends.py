@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 将 backend 目录和 scripts 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from app.core.config import settings
+from app.services import sentiment_analysis_service as sentiment_module
+from app.services.sentiment_analysis_service import SentimentAnalysisService
+from app.services.sentiment_backends import _softmax, create_sentiment_backend
+from export_sentiment_onnx import DEFAULT_SAMPLE, check_parity, compare_predictions, load_sample
+
+
+class FakeBackend:
+    """按关键词给出概率的假后端，记录每次调用的批"""
+
+    name = "onnx"
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, texts):
+        self.batches.append(list(texts))
+        return [[0.8, 0.1, 0.1] if "stuck" in text else [0.1, 0.2, 0.7] for text in texts]
+
+
+def test_backend_factory_validates_name_and_model_files(tmp_path):
+    with pytest.raises(ValueError):
+        create_sentiment_backend("tensorflow", model_dir=str(tmp_path), onnx_dir=str(tmp_path))
+    # 文件检查在导入 onnxruntime / torch 之前进行
+    with pytest.raises(FileNotFoundError):
+        create_sentiment_backend("onnx", model_dir=str(tmp_path), onnx_dir=str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        create_sentiment_backend("torch", model_dir=str(tmp_path / "missing"), onnx_dir=str(tmp_path))
+
+
+def test_service_uses_configured_backend(monkeypatch):
+    backend = FakeBackend()
+    created = {}
+
+    def fake_factory(name, **kwargs):
+        created.update(name=name, **kwargs)
+        return backend
+
+    monkeypatch.setattr(settings, "SENTIMENT_BACKEND", "onnx")
+    monkeypatch.setattr(settings, "SENTIMENT_BATCHING_ENABLED", False)
+    monkeypatch.setattr(sentiment_module, "create_sentiment_backend", fake_factory)
+
+    service = SentimentAnalysisService()
+
+    assert service.model_available and service.backend_name == "onnx"
+    assert created["name"] == "onnx" and created["onnx_dir"] == settings.SENTIMENT_ONNX_DIR
+    result = service.analyze_sentiment("my loop is stuck on the second exercise")
+    assert (result.label, result.confidence) == ("NEGATIVE", 0.8)
+    assert service.submit("this works").result().label == "POSITIVE"
+
+
+def test_service_falls_back_to_neutral_when_onnx_model_is_missing(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SENTIMENT_BACKEND", "onnx")
+    monkeypatch.setattr(settings, "SENTIMENT_ONNX_DIR", str(tmp_path))
+    service = SentimentAnalysisService()
+    assert not service.model_available and service.batcher is None
+    result = service.analyze_sentiment("my loop is stuck on the second exercise")
+    assert result.label == "NEUTRAL" and result.details == {"tier": "fallback", "reason": "model_unavailable"}
+
+
+def test_softmax_matches_reference():
+    probs = _softmax(np.array([[2.0, 1.0, 0.1], [1000.0, 1000.0, 1000.0]]))
+    assert np.allclose(probs[0], np.exp([2.0, 1.0, 0.1]) / np.exp([2.0, 1.0, 0.1]).sum())
+    assert np.allclose(probs[1], [1 / 3] * 3)
+
+
+def test_parity_report_and_thresholds():
+    texts, labels = load_sample(DEFAULT_SAMPLE)
+    assert len(texts) == len(labels) >= 30
+    assert set(labels) == {"NEGATIVE", "NEUTRAL", "POSITIVE"}
+
+    labels = ["NEGATIVE", "NEUTRAL", "POSITIVE", "POSITIVE"]
+    reference = [[0.9, 0.05, 0.05], [0.1, 0.8, 0.1], [0.1, 0.1, 0.8], [0.2, 0.3, 0.5]]
+    candidate = [[0.88, 0.07, 0.05], [0.1, 0.8, 0.1], [0.1, 0.1, 0.8], [0.2, 0.45, 0.35]]
+    parity = compare_predictions(labels, reference, candidate)
+
+    assert parity["reference_accuracy"] == 1.0 and parity["candidate_accuracy"] == 0.75
+    assert parity["label_agreement"] == 0.75
+    assert parity["max_abs_prob_diff"] == 0.15
+    assert parity["disagreements"] == [{"index": 3, "label": "POSITIVE", "reference": "POSITIVE", "candidate": "NEUTRAL"}]
+    failures = check_parity(parity, min_agreement=0.95, max_accuracy_drop=0.02)
+    assert len(failures) == 2
+    assert check_parity(compare_predictions(labels, reference, reference), 0.95, 0.02) == []
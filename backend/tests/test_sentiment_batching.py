@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+# 将 backend 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.schemas.chat import ChatRequest, SentimentAnalysisResult
+from app.services.dynamic_controller import DynamicController
+from app.services.micro_batcher import MicroBatcher
+from app.services.sentiment_analysis_service import SentimentAnalysisService
+
+
+def _fixed_cost_infer(calls, cost_seconds=0.02):
+    """模拟一次前向计算：耗时与批大小无关（CPU 上小批量推理的典型情况）"""
+    def infer(texts):
+        calls.append(list(texts))
+        time.sleep(cost_seconds)
+        return [text.upper() for text in texts]
+    return infer
+
+
+def test_concurrent_requests_are_batched_and_results_keep_order():
+    calls = []
+    batcher = MicroBatcher(_fixed_cost_infer(calls), max_batch_size=8, max_wait_ms=10)
+    try:
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(lambda i: batcher.submit(f"t{i}").result(timeout=5), range(32)))
+        elapsed = time.monotonic() - started
+    finally:
+        batcher.close(timeout=1)
+
+    assert results == [f"T{i}" for i in range(32)]
+    assert all(len(batch) <= 8 for batch in calls)
+    stats = batcher.stats()
+    assert stats["items"] == 32 and stats["batches"] == len(calls) < 32
+    assert stats["avg_batch"] > 1
+    # 逐条执行需要 32 × 20ms
+    assert elapsed < 0.32
+
+
+def test_failed_batch_fails_its_callers_and_worker_keeps_running():
+    def infer(texts):
+        if "bad" in texts:
+            raise ValueError("model exploded")
+        return texts
+
+    batcher = MicroBatcher(infer, max_batch_size=4, max_wait_ms=0)
+    try:
+        with pytest.raises(ValueError):
+            batcher.submit("bad").result(timeout=5)
+        assert batcher.submit("good").result(timeout=5) == "good"
+    finally:
+        batcher.close(timeout=1)
+    assert batcher.stats()["errors"] == 1
+
+
+def test_cancelled_requests_are_skipped_and_thread_init_runs_once_on_worker():
+    calls, init_threads = [], []
+    release = threading.Event()
+
+    def infer(texts):
+        calls.append(list(texts))
+        release.wait(5)
+        return texts
+
+    batcher = MicroBatcher(infer, max_batch_size=8, max_wait_ms=0,
+                           thread_init=lambda: init_threads.append(threading.current_thread().name), name="test-batcher")
+    try:
+        first = batcher.submit("first")
+        time.sleep(0.05)  # first 正在推理，后面的请求排队
+        cancelled = batcher.submit("cancelled")
+        kept = batcher.submit("kept")
+        assert cancelled.cancel()
+        release.set()
+        assert first.result(timeout=5) == "first" and kept.result(timeout=5) == "kept"
+    finally:
+        batcher.close(timeout=1)
+
+    assert calls == [["first"], ["kept"]]
+    assert init_threads == ["test-batcher"]
+    with pytest.raises(RuntimeError):
+        batcher.submit("after close")
+
+
+def test_service_without_model_returns_completed_neutral_future():
+    service = SentimentAnalysisService()
+    assert not service.batching
+    future = service.submit("my loop is stuck on the second exercise")
+    assert future.done() and future.result().label == "NEUTRAL"
+    assert service.analyze_sentiment("   ").label == "NEUTRAL"
+
+
+def _batched_service(calls):
+    """不加载 BERT 的情感分析服务：用假的批量推理替换模型"""
+    service = SentimentAnalysisService()
+    service.model_available = True
+    service.batcher = MicroBatcher(
+        lambda texts: calls.append(list(texts)) or [
+            SentimentAnalysisResult(label="NEGATIVE" if "stuck" in text else "POSITIVE", confidence=0.9)
+            for text in texts
+        ],
+        max_batch_size=16,
+        max_wait_ms=20
+    )
+    return service
+
+
+def test_service_batches_sync_callers():
+    calls = []
+    service = _batched_service(calls)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            labels = list(pool.map(
+                lambda text: service.analyze_sentiment(text).label,
+                ["my loop is stuck at step one", "this exercise went well", "my loop is stuck at step two", "printing the list now"]
+            ))
+    finally:
+        service.batcher.close(timeout=1)
+    assert labels == ["NEGATIVE", "POSITIVE", "NEGATIVE", "POSITIVE"]
+    assert len(calls) < 4
+
+
+def test_controller_awaits_batched_sentiment_without_executor_threads():
+    calls = []
+    service = _batched_service(calls)
+    profile = MagicMock(participant_id="p", emotion_state={}, behavior_counters={}, bkt_model={}, is_new_user=False)
+    user_state_service = MagicMock()
+    user_state_service.get_or_create_profile.return_value = (profile, False)
+    prompt_generator = MagicMock()
+    prompt_generator.create_prompts.return_value = ("system", [{"role": "user", "content": "q"}])
+    controller = DynamicController(
+        user_state_service=user_state_service,
+        sentiment_service=service,
+        rag_service=None,
+        prompt_generator=prompt_generator,
+        llm_gateway=MagicMock(get_completion=AsyncMock(return_value="reply"))
+    )
+    # 线程池只有 2 个线程：如果情感分析仍占用线程池，最多只能 2 条一批
+    messages = [f"my loop is stuck on exercise {i}" if i % 2 else f"this is great {i}" for i in range(8)]
+
+    async def scenario():
+        return await asyncio.gather(*[
+            controller._prepare_prompts(ChatRequest(participant_id=f"p{i}", user_message=text), MagicMock())
+            for i, text in enumerate(messages)
+        ])
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        service.batcher.close(timeout=1)
+
+    assert sorted(text for batch in calls for text in batch) == sorted(messages)
+    assert max(len(batch) for batch in calls) > 2
+    summaries = [c.kwargs["user_state"] for c in prompt_generator.create_prompts.call_args_list]
+    assert {s.emotion_state["current_sentiment"] for s in summaries} == {"NEGATIVE", "POSITIVE"}
+    assert controller.stage_metrics.stats()["sentiment"]["count"] == 8
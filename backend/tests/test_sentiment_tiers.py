@@ -0,0 +1,134 @@
+import os
+import sys
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+# 将 backend 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.schemas.chat import ChatRequest, SentimentAnalysisResult
+from app.services import sentiment_analysis_service as sentiment_module
+from app.services.dynamic_controller import DynamicController
+from app.services.sentiment_analysis_service import SentimentAnalysisService
+from app.services.sentiment_lexicon import LexiconSentimentClassifier, SentimentResultCache, normalize_text
+
+
+class FakeBackend:
+    name = "onnx"
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, texts):
+        self.batches.append(list(texts))
+        return [[0.8, 0.1, 0.1] if "stuck" in text else [0.1, 0.2, 0.7] for text in texts]
+
+
+@pytest.fixture
+def tiered_service(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(settings, "SENTIMENT_BATCHING_ENABLED", False)
+    monkeypatch.setattr(settings, "SENTIMENT_CACHE_MAX_ENTRIES", 16)
+    monkeypatch.setattr(settings, "SENTIMENT_LEXICON_ENABLED", True)
+    monkeypatch.setattr(sentiment_module, "create_sentiment_backend", lambda name, **kwargs: backend)
+    return SentimentAnalysisService(), backend
+
+
+@pytest.mark.parametrize("text, label, cue", [
+    ("ok", "NEUTRAL", "acknowledgement"),
+    ("  OK!! ", "NEUTRAL", "acknowledgement"),
+    ("why?", "NEUTRAL", "question"),
+    ("thanks", "POSITIVE", "gratitude"),
+    ("谢谢！", "POSITIVE", "gratitude"),
+    ("还是不行", "NEGATIVE", "frustration"),
+    ("it doesn't work", "NEGATIVE", "frustration"),
+    ("I'm so confused", "NEGATIVE", "confusion"),
+    ("什么意思？？", "NEGATIVE", "confusion"),
+])
+def test_lexicon_labels_short_messages(text, label, cue):
+    result = LexiconSentimentClassifier(max_chars=24).classify(normalize_text(text))
+    assert result.label == label and cue in result.details["cues"]
+    assert result.details["tier"] == "lexicon"
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "how do I reverse a list in python",
+    "my loop is stuck on the second exercise",            # 长消息只有一种线索
+    "I was stuck but now it works, thanks",                # 正负线索同时出现
+    "not helpful",                                         # 否定的正向线索
+])
+def test_lexicon_defers_when_unsure(text):
+    assert LexiconSentimentClassifier(max_chars=24).classify(normalize_text(text)) is None
+
+
+def test_lexicon_labels_long_message_with_several_cues():
+    text = "I have been stuck for an hour and I still don't understand what the error means"
+    result = LexiconSentimentClassifier(max_chars=24).classify(normalize_text(text))
+    assert result.label == "NEGATIVE" and result.details["cues"] == ["frustration", "confusion"]
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = SentimentResultCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, SentimentAnalysisResult(label="NEUTRAL", confidence=1.0))
+    assert cache.get("a") is not None
+    cache.put("c", SentimentAnalysisResult(label="NEUTRAL", confidence=1.0))
+    assert cache.get("b") is None and cache.get("a") is not None and len(cache) == 2
+
+
+def test_service_runs_model_only_when_fast_tiers_are_unsure(tiered_service):
+    service, backend = tiered_service
+
+    assert service.analyze_sentiment("还是不行").details["tier"] == "lexicon"
+    first = service.analyze_sentiment("My loop is stuck on the second exercise")
+    again = service.submit("  my loop is   STUCK on the second exercise ").result()
+
+    assert backend.batches == [["My loop is stuck on the second exercise"]]
+    assert first.details == {"tier": "model", "backend": service.backend_name}
+    assert (again.label, again.confidence) == (first.label, first.confidence)
+    assert again.details == {"tier": "cache", "cached_tier": "model", "backend": service.backend_name}
+    assert service.analyze_sentiment(" ").details == {"tier": "fallback", "reason": "empty"}
+
+    stats = service.stats()
+    assert stats["tiers"] == {"cache": 1, "lexicon": 1, "model": 1, "fallback": 1}
+    assert stats["tier_share"]["model"] == 0.25 and stats["cache_entries"] == 1
+
+
+def test_fast_tiers_can_be_disabled(tiered_service, monkeypatch):
+    monkeypatch.setattr(settings, "SENTIMENT_CACHE_MAX_ENTRIES", 0)
+    monkeypatch.setattr(settings, "SENTIMENT_LEXICON_ENABLED", False)
+    _, backend = tiered_service
+    service = SentimentAnalysisService()
+
+    for _ in range(2):
+        assert service.analyze_sentiment("ok").details["tier"] == "model"
+    assert backend.batches == [["ok"], ["ok"]]
+
+
+def test_controller_skips_executor_for_fast_path(tiered_service):
+    service, backend = tiered_service
+    profile = MagicMock(participant_id="p", emotion_state={}, behavior_counters={}, bkt_model={}, is_new_user=False)
+    user_state_service = MagicMock()
+    user_state_service.get_or_create_profile.return_value = (profile, False)
+    prompt_generator = MagicMock()
+    prompt_generator.create_prompts.return_value = ("system", [{"role": "user", "content": "q"}])
+    controller = DynamicController(
+        user_state_service=user_state_service,
+        sentiment_service=service,
+        rag_service=None,
+        prompt_generator=prompt_generator,
+        llm_gateway=MagicMock(get_completion=AsyncMock(return_value="reply"))
+    )
+    controller._sentiment_executor = MagicMock()  # 快速层命中时不应提交到线程池
+
+    asyncio.run(controller._prepare_prompts(ChatRequest(participant_id="p", user_message="还是不行"), MagicMock()))
+
+    summary = prompt_generator.create_prompts.call_args.kwargs["user_state"]
+    assert summary.emotion_state["current_sentiment"] == "NEGATIVE"
+    assert summary.emotion_state["details"]["tier"] == "lexicon"
+    assert not controller._sentiment_executor.method_calls and backend.batches == []
+    assert controller.stage_metrics.stats()["sentiment"]["count"] == 1
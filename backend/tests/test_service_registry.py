@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# 将 backend 目录添加到 sys.path 中
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.config.service_registry import ServiceRegistry
+from app.core.startup_profile import parse_importtime, summarize_modules
+
+
+def test_service_is_built_once_on_first_use_even_under_concurrency():
+    builds = []
+
+    def factory():
+        builds.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return object()
+
+    registry = ServiceRegistry()
+    registry.register("heavy", factory)
+    assert registry.peek("heavy") is None and builds == []
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: registry.get("heavy"), range(8)))
+
+    assert len(builds) == 1 and len({id(i) for i in instances}) == 1
+    status = registry.status()["heavy"]
+    assert status["built"] and status["build_seconds"] >= 0.05
+
+
+def test_disabled_service_is_never_built():
+    enabled = {"value": False}
+    registry = ServiceRegistry()
+    registry.register("sentiment", lambda: pytest.fail("factory must not run"), enabled=lambda: enabled["value"])
+
+    assert registry.get("sentiment") is None
+    assert registry.warm_up(["sentiment"]) == {}
+    assert registry.status()["sentiment"] == {"enabled": False, "built": False, "build_seconds": None, "error": None}
+
+
+def test_warm_up_isolates_failures_and_later_get_retries():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("model missing")
+        return "ok"
+
+    registry = ServiceRegistry()
+    registry.register("flaky", flaky)
+    registry.register("fine", lambda: "fine")
+
+    assert set(registry.warm_up(["flaky", "fine", "unknown"])) == {"fine"}
+    assert registry.status()["flaky"]["error"] == "model missing"
+    assert registry.get("flaky") == "ok" and registry.status()["flaky"]["error"] is None
+
+
+def test_override_and_close_in_reverse_build_order():
+    closed = []
+
+    class Service:
+        def __init__(self, name):
+            self.name = name
+
+        async def aclose(self):
+            closed.append(self.name)
+
+    registry = ServiceRegistry()
+    registry.register("a", lambda: Service("a"), close=lambda s: s.aclose())
+    registry.register("b", lambda: Service("b"), close=lambda s: closed.append(s.name))
+    registry.register("c", lambda: Service("c"), close=lambda s: closed.append(s.name))
+
+    registry.get("b")
+    registry.get("a")
+    registry.override("c", Service("stub"))
+    assert registry.get("c").name == "stub"
+
+    asyncio.run(registry.aclose())
+    assert closed == ["stub", "a", "b"]
+    assert registry.peek("a") is None
+
+
+def test_importing_app_does_not_load_heavy_dependencies():
+    code = (
+        "import json, sys\n"
+        "import app.main\n"
+        "from app.config.dependency_injection import registry\n"
+        "heavy = ['torch', 'transformers', 'onnxruntime', 'playwright', 'annoy', 'openai']\n"
+        "print(json.dumps({'loaded': [m for m in heavy if m in sys.modules],\n"
+        "                  'built': [n for n, s in registry.status().items() if s['built']]}))\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert json.loads(completed.stdout.strip().splitlines()[-1]) == {"loaded": [], "built": []}
+
+
+def test_parse_importtime_output():
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     app.schemas.chat",
+        "import time:      2000 |       2500 |   app.services.dynamic_controller",
+        "import time:       800 |       3300 | app.main",
+        "unrelated line",
+    ])
+    modules = parse_importtime(output)
+    assert [(m["module"], m["depth"]) for m in modules] == [
+        ("app.schemas.chat", 2), ("app.services.dynamic_controller", 1), ("app.main", 0)
+    ]
+    assert modules[1]["self_ms"] == 2.0 and modules[2]["cumulative_ms"] == 3.3
+
+    summary = summarize_modules(modules, top=2)
+    assert summary["module_count"] == 3
+    assert [m["module"] for m in summary["slowest_modules"]] == ["app.services.dynamic_controller", "app.main"]
+    assert summary["packages"] == [{"package": "app", "self_ms": 2.9}]
+    assert summary["app_modules"][0]["module"] == "app.main"
@@ -0,0 +1,43 @@
+import os
+import sys
+import math
+
+from openai import OpenAI
+
+# 将 backend 目录和 scripts 目录添加到 sys.path 中
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from stub_openai_server import StubState, hashing_embedding, start_stub_server
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_hashing_embedding_is_deterministic_and_normalized():
+    vector = hashing_embedding("How do I center a div with flexbox?", 64)
+    assert vector == hashing_embedding("How do I center a div with flexbox?", 64)
+    assert math.isclose(sum(v * v for v in vector), 1.0, rel_tol=1e-9)
+
+
+def test_hashing_embedding_reflects_word_overlap():
+    query = hashing_embedding("flex container justify content", 256)
+    related = hashing_embedding("The justify-content property aligns flex items in a flex container", 256)
+    unrelated = hashing_embedding("The audio element embeds sound content", 256)
+    assert _cosine(query, related) > _cosine(query, unrelated)
+
+
+def test_stub_server_serves_batch_embeddings_and_counts_requests():
+    state = StubState(dim=8, vector_cache={"cached": [1.0] + [0.0] * 7})
+    server, base_url = start_stub_server(state=state)
+    try:
+        client = OpenAI(api_key="stub", base_url=base_url)
+        response = client.embeddings.create(input=["cached", "other text"], model="stub")
+
+        assert [item.index for item in response.data] == [0, 1]
+        assert response.data[0].embedding == [1.0] + [0.0] * 7
+        assert response.data[1].embedding == hashing_embedding("other text", 8)
+        assert state.snapshot() == {"embedding_requests": 1, "embedding_inputs": 2, "embedding_cache_hits": 1}
+    finally:
+        server.shutdown()
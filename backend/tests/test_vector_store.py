@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+
+import pytest
+from annoy import AnnoyIndex
+
+# 将 backend 目录添加到 sys.path 中，便于按项目方式导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.vector_store import VectorStoreManager, VersionedKnowledgeBase, LEGACY_VERSION
+
+DIM = 4
+
+
+def _write_store(path, chunks):
+    """在 path 下写入一个小的 Annoy 索引和对应的文本块"""
+    os.makedirs(path, exist_ok=True)
+    index = AnnoyIndex(DIM, 'angular')
+    for i in range(len(chunks)):
+        vector = [0.0] * DIM
+        vector[i % DIM] = 1.0
+        index.add_item(i, vector)
+    index.build(2)
+    index.save(os.path.join(path, "kb.ann"))
+    with open(os.path.join(path, "kb_chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+
+
+def _publish(manager, chunks):
+    version, path = manager.allocate_version_dir()
+    _write_store(path, chunks)
+    manager.publish(version, embedding_dimension=DIM)
+    return version
+
+
+def test_legacy_layout_is_version_zero(tmp_path):
+    _write_store(str(tmp_path), ["legacy"])
+    manager = VectorStoreManager(str(tmp_path))
+
+    assert manager.list_versions() == []
+    assert manager.latest_version() == LEGACY_VERSION
+
+
+def test_unpublished_version_dir_is_ignored(tmp_path):
+    manager = VectorStoreManager(str(tmp_path))
+    v1 = _publish(manager, ["a", "b"])
+    # 分配了目录但尚未写 manifest（例如构建中断）
+    v2, path = manager.allocate_version_dir()
+    _write_store(path, ["half built"])
+
+    assert manager.list_versions() == [v1]
+    assert manager.latest_version() == v1
+    # 下一个分配的目录不会覆盖未发布的目录
+    assert manager.allocate_version_dir()[0] == v2 + 1
+
+
+def test_reload_switches_to_latest_version(tmp_path):
+    manager = VectorStoreManager(str(tmp_path))
+    v1 = _publish(manager, ["old-0", "old-1"])
+    kb = VersionedKnowledgeBase(manager)
+    assert kb.version == v1
+
+    # 没有新版本时不切换
+    assert kb.reload() is False
+
+    v2 = _publish(manager, ["new-0", "new-1", "new-2"])
+    assert kb.reload() is True
+    assert kb.version == v2
+    with kb.acquire() as current:
+        assert current.chunks[0] == "new-0"
+
+
+def test_retired_version_unloads_after_last_in_flight_query(tmp_path):
+    manager = VectorStoreManager(str(tmp_path))
+    _publish(manager, ["old"])
+    kb = VersionedKnowledgeBase(manager)
+
+    with kb.acquire() as old_version:
+        _publish(manager, ["new"])
+        kb.reload()
+        # 在途查询仍然持有旧版本，此时不能卸载
+        assert old_version._unloaded is False
+        assert old_version.index.get_nns_by_vector([1.0, 0.0, 0.0, 0.0], 1) == [0]
+
+    assert old_version._unloaded is True
+    with pytest.raises(RuntimeError):
+        old_version.acquire()
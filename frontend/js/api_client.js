@@ -48,6 +48,54 @@ async function post(endpoint, body) {
   return response.json();
 }
 
+/**
+ * 以流式方式 POST，逐行解析 NDJSON 响应
+ * @param {string} endpoint - 接口路径
+ * @param {Object} body - 请求体（自动注入 participant_id）
+ * @param {Function} onEvent - 每解析出一个 JSON 对象时调用
+ * @returns {Promise<Object|null>} 最后一个事件
+ */
+async function postStream(endpoint, body, onEvent) {
+  const participantId = getParticipantId();
+  if (!participantId) {
+        window.location.href = '/pages/index.html';
+        throw new Error("Session not found. Redirecting to login.");
+  }
+
+  const fullBody = { ...body, participant_id: participantId };
+
+  const response = await fetch(buildBackendUrl(endpoint), {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(fullBody),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let lastEvent = null;
+
+  const emit = (line) => {
+    if (!line.trim()) return;
+    lastEvent = JSON.parse(line);
+    onEvent(lastEvent);
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(emit);
+  }
+  emit(buffer + decoder.decode());
+  return lastEvent;
+}
+
 // ... 实现 get, put, delete 等方法
 async function get(endpoint, params = {}) {
   const participantId = getParticipantId();
@@ -73,6 +121,7 @@ async function get(endpoint, params = {}) {
 // 挂载到window对象上，以便全局访问
 window.apiClient = {
   post,
+  postStream,
   get,
   // --- 新增：暴露不带认证的方法 ---
   postWithoutAuth,
@@ -83,6 +132,7 @@ window.apiClient = {
 // 默认导出
 export default {
   post,
+  postStream,
   get,
   // --- 新增：导出不带认证的方法 ---
   postWithoutAuth,
@@ -5,8 +5,11 @@
  * 目标：
  * - 捕获 TDD-II-07 中规定的关键事件：
  *   code_edit（Monaco 编辑器防抖 2s）、ai_help_request（立即）、test_submission（立即，包含 code）、dom_element_select（立即，iframe 支持）、user_idle（60s）、page_focus_change（visibility）
- * - 组装标准化 payload 并可靠发送到后端 /api/v1/behavior/log
- * - 优先使用 navigator.sendBeacon；在不支持时 fallback 到 fetch(..., { keepalive: true })
+ * - 组装标准化 payload，攒批后发送到后端 /api/v1/behavior/log-batch（每批一个请求、后端一次事务写入）
+ *   发送时机：定时（flushIntervalMs）、攒满 maxBatchSize 条、ai_help_request / test_submission 立即发送、
+ *   页面隐藏（visibilitychange）或卸载（pagehide）时立即发送剩余事件
+ * - 使用 fetch(..., { keepalive: true }) 发送，能看到后端写入缓冲已满时的 503 并把整批放回队列重试；
+ *   只有页面卸载（pagehide）时使用 navigator.sendBeacon（看不到响应，但页面关闭后仍会送达）
  *
  * 注意：
  * - 本文件不修改现有 HTML。脚本提供自动初始化尝试（initAuto），但更可靠的方式是：在页面创建 Monaco 编辑器后显式调用 tracker.initEditors(...) 与 tracker.initTestActions(...)
@@ -23,33 +26,100 @@ class BehaviorTracker {
     // code_edit 防抖时长（ms）
     this.debounceMs = 2000;
     this.idleTimer = null;
+
+    // -------------------- 批量上报 --------------------
+    this.batchUrl = '/api/v1/behavior/log-batch';
+    // 最早的待发送事件最多等待多久（ms）
+    this.flushIntervalMs = 5000;
+    // 每批最多事件数（后端 BEHAVIOR_BATCH_MAX_EVENTS 默认 200）
+    this.maxBatchSize = 50;
+    // 每个请求体的字节上限：sendBeacon / keepalive 请求体总共约 64KB
+    this.maxRequestBytes = 60000;
+    // 需要后端立即处理的事件（AI 求助、提交触发的挫败检测）
+    this.urgentEventTypes = new Set(['ai_help_request', 'test_submission']);
+    this.queue = [];
+    this.flushTimer = null;
+    this._initLifecycle();
+  }
+
+  // 页面隐藏或卸载时立即发送剩余事件（pagehide 覆盖 bfcache 与移动端直接关闭的情况）
+  _initLifecycle() {
+    if (typeof document === 'undefined' || typeof window === 'undefined') return;
+    document.addEventListener('visibilitychange', () => {
+      if (document.visibilityState === 'hidden') this.flush();
+    });
+    window.addEventListener('pagehide', () => this.flush(true));
   }
 
   // -------------------- 核心发送函数 --------------------
-  // 优先使用 navigator.sendBeacon，否则使用 fetch keepalive（并在控制台打印错误）
-  _sendPayload(payload) {
-    const url = '/api/v1/behavior/log';
+  // 事件入队：紧急事件、攒满一批或页面已隐藏时立即发送，否则等待定时发送
+  _enqueue(payload) {
+    this.queue.push(payload);
+    const hidden = typeof document !== 'undefined' && document.visibilityState === 'hidden';
+    if (this.urgentEventTypes.has(payload.event_type) || hidden || this.queue.length >= this.maxBatchSize) {
+      this.flush();
+    } else if (!this.flushTimer) {
+      this.flushTimer = setTimeout(() => this.flush(), this.flushIntervalMs);
+    }
+  }
+
+  // 发送队列中的全部事件：按条数和字节数切成若干批，每批一个请求
+  // unloading 为 true 时（页面卸载）优先使用 sendBeacon
+  flush(unloading = false) {
+    clearTimeout(this.flushTimer);
+    this.flushTimer = null;
+    if (this.queue.length === 0) return;
+    const events = this.queue;
+    this.queue = [];
+
+    const encoder = new TextEncoder();
+    let chunk = [];
+    let chunkBytes = 2; // "[" 与 "]"
+    for (const event of events) {
+      const json = JSON.stringify(event);
+      const bytes = encoder.encode(json).length + 1; // 加上分隔的逗号
+      if (chunk.length > 0 && (chunk.length >= this.maxBatchSize || chunkBytes + bytes > this.maxRequestBytes)) {
+        this._sendBatch(chunk, chunkBytes, unloading);
+        chunk = [];
+        chunkBytes = 2;
+      }
+      chunk.push(json);
+      chunkBytes += bytes;
+    }
+    this._sendBatch(chunk, chunkBytes, unloading);
+  }
+
+  // 使用 fetch 发送，后端返回 503 时整批放回队列；页面卸载时优先使用 navigator.sendBeacon
+  _sendBatch(jsonEvents, bytes, unloading = false) {
+    const body = `[${jsonEvents.join(',')}]`;
     try {
-      if (navigator && typeof navigator.sendBeacon === 'function') {
-        const blob = new Blob([JSON.stringify(payload)], { type: 'application/json' });
-        navigator.sendBeacon(url, blob);
-      } else {
-        // fallback: fetch keepalive（注意：并非所有浏览器都支持 keepalive）
-        fetch(url, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify(payload),
-          keepalive: true
-        }).catch(err => {
-          console.warn('[BehaviorTracker] fetch fallback 发送失败：', err);
-        });
+      // sendBeacon 在浏览器排队后就返回 true，看不到后端的 503，只用于页面卸载（之后也无法重试）
+      if (unloading && navigator && typeof navigator.sendBeacon === 'function') {
+        const blob = new Blob([body], { type: 'application/json' });
+        // 超出浏览器的 beacon 配额时返回 false
+        if (navigator.sendBeacon(this.batchUrl, blob)) return;
       }
+      // fetch keepalive：页面隐藏或关闭后请求仍会完成（注意：超过约 64KB 的请求体不能使用 keepalive）
+      fetch(this.batchUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body,
+        keepalive: bytes <= this.maxRequestBytes
+      }).then(res => {
+        if (res.status === 503) {
+          // 后端写入缓冲已满：整批放回队列，稍后重试（后端整批拒绝，不会重复写入）
+          this.queue = jsonEvents.map(json => JSON.parse(json)).concat(this.queue);
+          if (!this.flushTimer) this.flushTimer = setTimeout(() => this.flush(), this.flushIntervalMs);
+        }
+      }).catch(err => {
+        console.warn('[BehaviorTracker] 发送日志失败：', err);
+      });
     } catch (e) {
       console.warn('[BehaviorTracker] 发送日志时异常：', e);
     }
   }
 
-  // 公共上报接口：组装标准 payload 并发送
+  // 公共上报接口：组装标准 payload 并加入发送队列
   logEvent(eventType, eventData = {}) {
     // 获取 participant_id（从 session.js 或 window 取）
     let participant_id = null;
@@ -77,7 +147,7 @@ class BehaviorTracker {
       timestamp: new Date().toISOString()
     };
 
-    this._sendPayload(payload);
+    this._enqueue(payload);
   }
 
   // -------------------- 编辑器（Monaco）相关 --------------------
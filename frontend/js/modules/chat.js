@@ -4,7 +4,7 @@
  *
  * 目标：
  * - 提供一个通用的聊天界面，供学习页面和测试页面使用
- * - 处理与后端 /api/v1/chat/ai/chat 端点的通信
+ * - 处理与后端 /api/v1/chat/ai/chat/stream 端点的通信（流式显示AI回复）
  * - 管理聊天UI的渲染和交互
  */
 
@@ -18,6 +18,7 @@ class ChatModule {
     this.inputElement = null;
     this.sendButton = null;
     this.isLoading = false;
+    this.conversationId = null;
   }
 
   /**
@@ -37,6 +38,9 @@ class ChatModule {
       return;
     }
 
+    // 每次打开聊天开始一个新会话，对话历史由后端按会话ID重建
+    this.conversationId = this.createConversationId();
+
     // 绑定事件监听器
     this.bindEvents(mode, contentId);
 
@@ -83,9 +87,10 @@ class ChatModule {
 
     try {
       // 构建请求体 (participant_id 会由 apiClient 自动注入)
+      // 只发送会话ID和新消息，不再上传完整的对话历史
       const requestBody = {
         user_message: message,
-        conversation_history: this.getConversationHistory(),
+        conversation_id: this.conversationId,
         code_context: this.getCodeContext(),
         mode: mode,
         content_id: contentId
@@ -99,15 +104,30 @@ class ChatModule {
         }
       }
 
-      // 使用封装的 apiClient 发送请求
-      const data = await window.apiClient.post('/chat/ai/chat', requestBody);
+      // 流式请求：收到第一段文本后移除加载指示器，之后逐段追加渲染
+      let streamingContent = null;
+      let text = '';
+      const finalEvent = await window.apiClient.postStream('/chat/ai/chat/stream', requestBody, (event) => {
+        if (event.type === 'delta') {
+          if (!streamingContent) {
+            // 只移除加载指示器，发送按钮保持禁用直到流结束
+            document.getElementById('ai-loading')?.remove();
+            streamingContent = this.addMessageToUI('ai', '');
+          }
+          text += event.content;
+          this.renderStreamingMessage(streamingContent, text);
+        }
+      });
 
-      if (data.code === 200 && data.data && typeof data.data.ai_response === 'string') {
-        // 添加AI回复到UI
-        this.addMessageToUI('ai', data.data.ai_response);
+      if (!finalEvent || typeof finalEvent.ai_response !== 'string') {
+        // 流意外结束，或最后一条不是完整回复
+        throw new Error('AI回复内容为空或格式不正确');
+      }
+      // 以服务器拼好的完整回复为准
+      if (!streamingContent) {
+        this.addMessageToUI('ai', finalEvent.ai_response);
       } else {
-        // 即使请求成功，但如果响应内容为空或格式不正确，也抛出错误
-        throw new Error(data.message || 'AI回复内容为空或格式不正确');
+        this.renderStreamingMessage(streamingContent, finalEvent.ai_response, true);
       }
     } catch (error) {
       console.error('[ChatModule] 发送消息时出错:', error);
@@ -152,6 +172,30 @@ class ChatModule {
 
     // 滚动到底部
     this.messagesContainer.scrollTop = this.messagesContainer.scrollHeight;
+
+    return messageElement.querySelector('.markdown-content');
+  }
+
+  /**
+   * 渲染流式AI消息，按动画帧合并多次更新
+   * @param {HTMLElement} contentElement - addMessageToUI 返回的内容元素
+   * @param {string} text - 目前为止的完整文本
+   * @param {boolean} immediate - 是否立即渲染（流结束时）
+   */
+  renderStreamingMessage(contentElement, text, immediate = false) {
+    contentElement.dataset.pendingText = text;
+    const render = () => {
+      contentElement.dataset.renderScheduled = '';
+      contentElement.innerHTML = marked(contentElement.dataset.pendingText);
+      this.messagesContainer.scrollTop = this.messagesContainer.scrollHeight;
+    };
+
+    if (immediate) {
+      render();
+    } else if (!contentElement.dataset.renderScheduled) {
+      contentElement.dataset.renderScheduled = '1';
+      requestAnimationFrame(render);
+    }
   }
 
   /**
@@ -240,53 +284,15 @@ class ChatModule {
   }
 
   /**
-   * 获取对话历史
-   * @returns {Array} 对话历史数组
+   * 生成会话ID
+   * @returns {string} 会话ID
    */
-  getConversationHistory() {
-    if (!this.messagesContainer) {
-      console.warn('[ChatModule] 消息容器未找到，无法获取对话历史');
-      return [];
+  createConversationId() {
+    if (window.crypto?.randomUUID) {
+      return window.crypto.randomUUID();
     }
-
-    const history = [];
-    // 获取所有消息元素（用户消息和AI消息，但不包括加载指示器）
-    const messageElements = this.messagesContainer.querySelectorAll('.user-message, .ai-message:not(#ai-loading)');
-
-    messageElements.forEach(element => {
-      const isUserMessage = element.classList.contains('user-message');
-      const isAiMessage = element.classList.contains('ai-message');
-
-      if (isUserMessage || isAiMessage) {
-        // 提取消息文本内容
-        let textContent = '';
-        const markdownContent = element.querySelector('.markdown-content');
-        
-        if (markdownContent) {
-          // 如果是AI消息，markdownContent包含HTML，需要提取纯文本
-          // 如果是用户消息，markdownContent是纯文本节点
-          if (isAiMessage) {
-            textContent = markdownContent.textContent || markdownContent.innerText || '';
-          } else {
-            textContent = markdownContent.textContent || markdownContent.innerText || '';
-          }
-        } else {
-          // 作为后备方案，尝试从其他内容元素获取文本
-          const contentElement = element.querySelector('.user-content, .ai-content');
-          if (contentElement) {
-            textContent = contentElement.textContent || contentElement.innerText || '';
-          }
-        }
-
-        // 添加到历史记录中
-        history.push({
-          role: isUserMessage ? 'user' : 'assistant',
-          content: textContent.trim()
-        });
-      }
-    });
-
-    return history;
+    // 非安全上下文（非 HTTPS/localhost）没有 randomUUID
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
   }
 
   /**